@@ -0,0 +1,76 @@
+import timeit
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+import zstandard as zstd
+
+from src.entities.bookmark import BookmarkEntity
+from src.entities.user import UserEntity
+from src.libs.cache import CacheSerializer, CompactSerializer, PickleSerializer
+from src.libs.enum import AuthorityEnum
+
+_REPEAT = 5
+_ZSTD_LEVEL = 3
+
+
+def _bookmark_page(size: int) -> list[BookmarkEntity]:
+    # 実データに近い長さの URL・メモ・タグを持つページを作る。
+    created_at = datetime(2024, 1, 1, tzinfo=UTC)
+    return [
+        BookmarkEntity(
+            hashed_id=f"{index:064x}",
+            url=f"https://example.com/articles/2024/{index}/cache-design-notes?ref=feed",
+            memo=f"Notes about query cache design, part {index}",
+            created_at=created_at + timedelta(minutes=index),
+            updated_at=created_at + timedelta(days=1, minutes=index),
+            tags=["python", "cache", f"topic-{index % 7}"],
+        )
+        for index in range(size)
+    ]
+
+
+def _user() -> UserEntity:
+    return UserEntity(
+        name="benchmark_user",
+        hashed_password="$2b$12$" + "x" * 53,
+        disabled=False,
+        authority=AuthorityEnum.READWRITE,
+    )
+
+
+def _measure(func: Callable[[], Any], number: int) -> float:
+    # 最速値を 1 回あたりのマイクロ秒で返す。
+    return min(timeit.repeat(func, number=number, repeat=_REPEAT)) / number * 1_000_000
+
+
+def _run_case(name: str, value: Any, serializer: CacheSerializer, number: int) -> None:
+    data = serializer.dumps(value)
+    compressed = zstd.ZstdCompressor(level=_ZSTD_LEVEL).compress(data)
+    encode_us = _measure(lambda: serializer.dumps(value), number)
+    decode_us = _measure(lambda: serializer.loads(data), number)
+    print(
+        f"{name:<22} {type(serializer).__name__:<18} "
+        f"encode {encode_us:9.1f}us  decode {decode_us:9.1f}us  "
+        f"bytes {len(data):7d}  zstd {len(compressed):7d}"
+    )
+
+
+def main() -> None:
+    compact = CompactSerializer()
+    compact.register(BookmarkEntity)
+    compact.register(UserEntity)
+    serializers: list[CacheSerializer] = [PickleSerializer(), compact]
+    cases = [
+        ("user detail", _user(), 20_000),
+        ("bookmark detail", _bookmark_page(1)[0], 20_000),
+        ("bookmark page x10", _bookmark_page(10), 2_000),
+        ("bookmark page x100", _bookmark_page(100), 200),
+    ]
+    for name, value, number in cases:
+        for serializer in serializers:
+            _run_case(name, value, serializer, number)
+
+
+if __name__ == "__main__":
+    main()
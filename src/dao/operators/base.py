@@ -1,8 +1,9 @@
 from typing import Any, Generic, Sequence, Type, TypeVar
 
-from sqlalchemy import Select, select
+from sqlalchemy import Select, inspect, select
 from sqlalchemy.orm.session import Session
 
+from ...libs.cache.identity_map import clear_lookups, memoize_lookup
 from ...libs.page import Page
 from ..models.base import BaseDao
 
@@ -44,7 +45,12 @@ class BaseDaoOperator(Generic[T]):
             取得したDAO、または見つからない場合はNone
         """
         statement = select(self.MAIN_DAO).where(getattr(self.MAIN_DAO, id_column) == id_value)
-        return self.session.execute(statement).scalars().one_or_none()
+        # 同一リクエスト内の同じ条件の取得は 1 回の SELECT にまとめる。
+        return memoize_lookup(
+            self.session,
+            (self.MAIN_DAO, id_column, id_value),
+            lambda: self.session.execute(statement).scalars().one_or_none(),
+        )
 
     def find_one_by_pkey(self, value: Any) -> T | None:
         """
@@ -59,29 +65,36 @@ class BaseDaoOperator(Generic[T]):
         # id以外の主キーの場合は継承先のクラスでオーバーライドする
         return self.find_one_by_id(value)
 
-    def find_all(self) -> list[T]:
+    def find_all(self, page: Page | None = None) -> list[T]:
         """
         全件のレコードを取得する。
 
+        Args:
+            page: 窓ごとに取得する場合のページ情報。省略時は初期化時のページ情報
+
         Returns:
-            取得したDAOのリスト
+            主キー順に並べたDAOのリスト
         """
         statement = select(self.MAIN_DAO)
-        statement = self.pagenation(statement)
+        statement = self.pagenation(statement, page)
         return list(self.session.execute(statement).scalars().all())
 
-    def pagenation(self, statement: Select) -> Select:
+    def pagenation(self, statement: Select, page: Page | None = None) -> Select:
         """
-        ページネーションを適用する。
+        主キー順に並べてからページネーションを適用する。
 
         Args:
             statement: SQLAlchemyのクエリステートメント
+            page: 窓ごとに取得する場合のページ情報。省略時は初期化時のページ情報
 
         Returns:
             ページネーションを適用したクエリステートメント
         """
-        if self.page:
-            statement = statement.limit(self.page.size).offset(self.page.offset)
+        # ページや窓をつなげたときに重複・欠落しないよう、ページ指定の有無によらず主キー順に並べる。
+        statement = statement.order_by(*inspect(self.MAIN_DAO).primary_key)
+        page = page or self.page
+        if page:
+            statement = statement.limit(page.size).offset(page.offset)
         return statement
 
     def save(self, d: BaseDao | Sequence[BaseDao]) -> None:
@@ -113,6 +126,8 @@ class BaseDaoOperator(Generic[T]):
             preprocess_insert_or_update(d)
         # INSERT, UPDATE の実行
         self.session.flush()
+        # 検索条件の値が変わりうるため、記録した取得結果を捨てる
+        clear_lookups(self.session)
 
     def delete(self, d: BaseDao | Sequence[BaseDao]) -> None:
         """
@@ -132,3 +147,4 @@ class BaseDaoOperator(Generic[T]):
             self.session.delete(d)
         # DELETE の実行
         self.session.flush()
+        clear_lookups(self.session)
@@ -1,5 +1,6 @@
 from sqlalchemy import select
 
+from ...libs.page import Page
 from ..models.bookmark import BookmarkDao
 from ..models.bookmark_tag import BookmarkTagDao
 from ..models.tag import TagDao
@@ -25,15 +26,29 @@ class BookmarkDaoOperator(BaseDaoOperator[BookmarkDao]):
         """
         return super().find_one_by_id(hashed_id, id_column="hashed_id")
 
-    def find_by_tags(self, tags: list[str]) -> list[BookmarkDao]:
+    def find_by_hashed_ids(self, hashed_ids: list[str]) -> list[BookmarkDao]:
+        """
+        ハッシュIDリストからブックマークDAOを複数件取得する。
+
+        Args:
+            hashed_ids: 検索対象のハッシュIDのリスト
+
+        Returns:
+            該当するブックマークDAOのリスト (順序は不定)
+        """
+        statement = select(BookmarkDao).where(BookmarkDao.hashed_id.in_(hashed_ids))
+        return list(self.session.scalars(statement).all())
+
+    def find_by_tags(self, tags: list[str], page: Page | None = None) -> list[BookmarkDao]:
         """
         タグ名リストからブックマークDAOを複数件取得する。
 
         Args:
             tags: 検索対象のタグ名のリスト
+            page: 窓ごとに取得する場合のページ情報。省略時は初期化時のページ情報
 
         Returns:
-            該当するブックマークDAOのリスト
+            主キー順に並べた、該当するブックマークDAOのリスト
         """
         statement = (
             select(BookmarkDao)
@@ -42,5 +57,5 @@ class BookmarkDaoOperator(BaseDaoOperator[BookmarkDao]):
             .where(TagDao.name.in_(tags))
             .distinct()
         )
-        statement = self.pagenation(statement)
+        statement = self.pagenation(statement, page)
         return list(self.session.scalars(statement).all())
@@ -3,6 +3,9 @@ from typing import Annotated, Iterator
 from fastapi import Depends
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 
+from ..libs.cache.degraded import is_degraded_session
+from ..libs.cache.identity_map import enable_identity_map, report_avoided_lookups
+from ..libs.config import get_config
 from .engine import Engine
 
 # Sessionの定義
@@ -19,10 +22,17 @@ def get_session() -> Iterator[Session]:
     """
 
     session = ScopedSession()
+    if get_config().cache_request_identity_map_enabled:
+        # 同一リクエスト内で同じリポジトリ・DAO の参照を繰り返さない。
+        enable_identity_map(session)
     try:
-        with session.begin():
+        with session.begin() as transaction:
             yield session
+            if is_degraded_session(session):
+                # DB 障害中に古いキャッシュ値で応答したリクエストは commit せずに巻き戻す。
+                transaction.rollback()
     finally:
+        report_avoided_lookups(session)
         ScopedSession.remove()
 
 
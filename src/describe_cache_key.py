@@ -0,0 +1,29 @@
+import argparse
+
+from .libs.cache.provider import get_query_cache_region
+
+
+def describe_cache_keys(keys: list[str]) -> None:
+    """
+    短縮したクエリキャッシュキーについて、保存済みの元のキーを出力する。
+
+    Args:
+        keys: 短縮後のキャッシュキー一覧
+    """
+    region = get_query_cache_region()
+    describe_key = getattr(region, "describe_key", None)
+    for key in keys:
+        original = describe_key(key) if describe_key is not None else None
+        # 対応が無いのは、CACHE_KEY_DEBUG_MAPPING が無効か期限切れの場合。
+        print(f"{key} -> {original if original is not None else '(unknown)'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show original keys of compacted cache keys")
+    parser.add_argument("keys", nargs="+")
+    args = parser.parse_args()
+    describe_cache_keys(args.keys)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from sqlalchemy.exc import IntegrityError, OperationalError
 
+from .libs.cache import QueryCacheLockTimeoutError
 from .libs.log import get_logger
 from .repositories.base import BaseRepository
 from .services.authority import AuthorityService
@@ -35,6 +36,14 @@ def add_error_handlers(app: FastAPI) -> None:
             content={"detail": str(exc)},
         )
 
+    @app.exception_handler(QueryCacheLockTimeoutError)
+    async def query_cache_lock_timeout_handler(request: Request, exc: QueryCacheLockTimeoutError):
+        logger.warning(str(exc))
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Service temporarily unavailable"},
+        )
+
     @app.exception_handler(AuthorityService.Error)
     async def authority_error_handler(request: Request, exc: AuthorityService.Error):
         return JSONResponse(
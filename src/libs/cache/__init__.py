@@ -1,14 +1,72 @@
-from .backends import ZstdMemoryBackend, ZstdRedisBackend
-from .decorator import query_cache
+from .backends import (
+    ZstdMemoryBackend,
+    ZstdRedisBackend,
+    ZstdRedisClusterBackend,
+    ZstdShardedRedisBackend,
+)
+from .circuit import CircuitBreaker, CircuitBreakerPolicy, CircuitState
+from .degraded import STALE_RESPONSE_HEADER, StaleReads, collect_stale_reads
+from .decorator import query_cache, query_cache_multi
+from .expiration import ExpirationPolicy
+from .key_compaction import KeyCompactor
+from .local import LocalCache, LocalCacheInvalidator
+from .locking import LockWaitStats, QueryCacheLockTimeoutError
+from .metrics import InMemoryMetricsSink, MetricsSink, get_metrics_sink, set_metrics_sink
 from .provider import get_query_cache_region
-from .region import NullCacheRegion, create_memory_region, create_redis_region
+from .region import (
+    NullCacheRegion,
+    QueryCacheRegion,
+    TwoTierCacheRegion,
+    create_memory_region,
+    create_redis_region,
+)
+from .serializers import (
+    CacheSerializer,
+    CompactSerializer,
+    PickleSerializer,
+    register_cache_model,
+)
+from .sharding import ConsistentHashRing
+from .versioned import VersionedCacheKey
+from .warmup import AccessTracker, CacheWarmer, WarmupPolicy, cache_warmer
 
 __all__ = [
     "get_query_cache_region",
     "query_cache",
+    "query_cache_multi",
     "create_memory_region",
     "create_redis_region",
+    "register_cache_model",
+    "CacheSerializer",
+    "CompactSerializer",
+    "PickleSerializer",
+    "LocalCache",
+    "LocalCacheInvalidator",
+    "LockWaitStats",
+    "CircuitBreaker",
+    "CircuitBreakerPolicy",
+    "CircuitState",
+    "STALE_RESPONSE_HEADER",
+    "StaleReads",
+    "collect_stale_reads",
+    "ExpirationPolicy",
+    "KeyCompactor",
+    "InMemoryMetricsSink",
+    "MetricsSink",
+    "get_metrics_sink",
+    "set_metrics_sink",
+    "QueryCacheLockTimeoutError",
     "NullCacheRegion",
+    "QueryCacheRegion",
+    "TwoTierCacheRegion",
+    "VersionedCacheKey",
+    "AccessTracker",
+    "CacheWarmer",
+    "WarmupPolicy",
+    "cache_warmer",
     "ZstdMemoryBackend",
     "ZstdRedisBackend",
+    "ZstdRedisClusterBackend",
+    "ZstdShardedRedisBackend",
+    "ConsistentHashRing",
 ]
@@ -1,18 +1,46 @@
-import pickle  # nosec B403
-from collections.abc import Iterable, Mapping, Sequence
-from typing import Any
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass, field
+from functools import partial
+from threading import Lock
+from time import monotonic
+from typing import Any, cast
 
 import zstandard as zstd
 from dogpile.cache.api import BytesBackend, NO_VALUE
-from dogpile.cache.backends.redis import RedisBackend
+from dogpile.cache.backends.redis import RedisBackend, _RedisLockWrapper
+from redis import Redis, RedisCluster
+from redis.cache import CacheConfig
 from redis.exceptions import RedisError
 
 from ..log import get_logger
+from . import metrics
+from .circuit import CircuitBreaker, CircuitBreakerPolicy, CircuitState
+from .dictionaries import ZstdDictionaryCodec, ZstdDictionarySource, ZstdDictionaryStore
+from .locking import BudgetedRedisLock, LockWaitRecorder, LockWaitStats
+from .serializers import CacheSerializer, compact_serializer
+from .sharding import ConsistentHashRing
+from .tinylfu import EvictionStats, WTinyLfuPolicy
 
 _logger = get_logger()
 _DEFAULT_ZSTD_LEVEL = 3
 _MIN_ZSTD_LEVEL = 1
 _MAX_ZSTD_LEVEL = 22
+_DEFAULT_MEMORY_MAX_BYTES = 64 * 1024 * 1024
+_DEFAULT_WINDOW_RATIO = 0.01
+_EXPECTED_ENTRY_BYTES = 512
+_DEFAULT_LOCK_WAIT_TIMEOUT = 5.0
+# client-side caching の対象にするキー (version 管理キー) の目印。
+_DEFAULT_CLIENT_SIDE_CACHE_KEY_MARKER = ":version:"
+_DEFAULT_CLIENT_SIDE_CACHE_RETRY_INTERVAL = 60.0
+# SPOP は件数が set の要素数以上なら全件を返してキーを削除する。
+_SPOP_ALL_COUNT = 2**31 - 1
+# 回路が開いている間に送れなかった無効化を、閉じた後に送り直すため保持する最大件数。
+_DEFERRED_INVALIDATION_MAX_ENTRIES = 10_000
+# 回路が開いている、または Redis に失敗して学習済み辞書を読めなかったことを表す値。
+_UNAVAILABLE = object()
+
+RedisClient = Redis | RedisCluster
+"キャッシュバックエンドが使う Redis クライアント。Redis Cluster 構成では RedisCluster"
 
 
 def _normalize_zstd_level(level: int) -> int:
@@ -36,42 +64,105 @@ def _normalize_zstd_level(level: int) -> int:
 
 
 class _ZstdSerializerMixin:
-    def _configure_serializers(self, zstd_level: int) -> None:
+    def _configure_serializers(
+        self,
+        zstd_level: int,
+        serializer: CacheSerializer | None = None,
+        dictionary_namespaces: Mapping[str, str] | None = None,
+        dictionary_source: ZstdDictionarySource | None = None,
+        dictionary_refresh_interval: float = 0,
+    ) -> None:
         """
-        zstd 圧縮付きのシリアライザを初期化する。
+        シリアライザと、キー単位で辞書を選ぶ zstd コーデックを初期化する。
+
+        dogpile.cache のシリアライザはキーを受け取れないため、値の直列化だけを行い、
+        zstd 圧縮・展開はキーが分かる backend の読み書き処理で行う。
 
         Args:
             zstd_level: zstd 圧縮レベル
+            serializer: 値の直列化に使うシリアライザ。省略時はコンパクト形式
+            dictionary_namespaces: キャッシュキーの prefix と辞書 namespace の対応
+            dictionary_source: 学習済み辞書の取得元
+            dictionary_refresh_interval: 現行辞書を再読み込みする間隔秒数
         """
-        normalized_level = _normalize_zstd_level(zstd_level)
-        self._compressor = zstd.ZstdCompressor(level=normalized_level)
-        self._decompressor = zstd.ZstdDecompressor()
+        self._codec = ZstdDictionaryCodec(
+            level=_normalize_zstd_level(zstd_level),
+            namespaces=dictionary_namespaces,
+            source=dictionary_source,
+            refresh_interval=dictionary_refresh_interval,
+        )
+        self._value_serializer = serializer or compact_serializer
         self.serializer = self._serialize
         self.deserializer = self._deserialize
 
+    @property
+    def codec(self) -> ZstdDictionaryCodec:
+        """
+        圧縮・展開に使う zstd コーデック。
+        """
+        return self._codec
+
     def _serialize(self, value: Any) -> bytes:
         """
-        値を pickle 化して zstd 圧縮する。
+        値をシリアライズする。
 
         Args:
             value: シリアライズ対象の値
 
         Returns:
-            圧縮済みバイト列
+            シリアライズしたバイト列
         """
-        return self._compressor.compress(pickle.dumps(value))
+        return self._value_serializer.dumps(value)
 
     def _deserialize(self, value: bytes) -> Any:
         """
-        zstd 圧縮済みデータを展開して復元する。
+        シリアライズ済みデータを復元する。
 
         Args:
-            value: 圧縮済みバイト列
+            value: シリアライズしたバイト列
 
         Returns:
             復元した値
+
+        Raises:
+            CacheDeserializationError: 復元に失敗
         """
-        return pickle.loads(self._decompressor.decompress(value))  # nosec B301
+        return self._value_serializer.loads(value)
+
+    def _compress(self, key: str, value: bytes) -> bytes:
+        """
+        キーの namespace に対応する辞書で保存用データを圧縮する。
+
+        Args:
+            key: キャッシュキー
+            value: シリアライズ済みの値
+
+        Returns:
+            圧縮済みバイト列
+        """
+        compressed = self._codec.compress(key, value)
+        metrics.observe("compressed_bytes", metrics.key_namespace(key), len(compressed))
+        return compressed
+
+    def _decompress(self, key: str, value: bytes | Any) -> bytes | Any:
+        """
+        保存済みデータを展開する。展開できない値はキャッシュミスとして扱う。
+
+        Args:
+            key: キャッシュキー
+            value: backend から取得した値
+
+        Returns:
+            展開したバイト列。未登録または展開失敗時は `NO_VALUE`
+        """
+        if value is NO_VALUE:
+            return value
+        try:
+            return self._codec.decompress(value)
+        except zstd.ZstdError as exc:
+            # 辞書が削除済みの旧エントリなどは作り直して上書きさせる。
+            _logger.warning("Failed to decompress query cache value %s: %s", key, exc)
+            return NO_VALUE
 
 
 class ZstdMemoryBackend(_ZstdSerializerMixin, BytesBackend):
@@ -79,12 +170,51 @@ class ZstdMemoryBackend(_ZstdSerializerMixin, BytesBackend):
         """
         zstd 圧縮対応のインメモリキャッシュバックエンドを初期化する。
 
+        保持量は圧縮後のバイト数で上限管理し、W-TinyLFU で保持対象を選ぶ。
+
         Args:
             arguments: dogpile.cache から渡される設定値
         """
         cache_arguments = dict(arguments)
         self._cache: dict[str, bytes] = cache_arguments.get("cache_dict", {})
-        self._configure_serializers(int(cache_arguments.get("zstd_level", _DEFAULT_ZSTD_LEVEL)))
+        self._expires_at: dict[str, float] = {}
+        expiration_time = cache_arguments.get("expiration_time")
+        self._expiration_time = float(expiration_time) if expiration_time else None
+        max_bytes = int(cache_arguments.get("max_bytes", _DEFAULT_MEMORY_MAX_BYTES))
+        self._policy = WTinyLfuPolicy(
+            max_bytes=max_bytes,
+            window_ratio=float(cache_arguments.get("window_ratio", _DEFAULT_WINDOW_RATIO)),
+            expected_entries=int(
+                cache_arguments.get("expected_entries", max_bytes // _EXPECTED_ENTRY_BYTES)
+            ),
+        )
+        self._indexes: dict[str, set[str]] = {}
+        self._index_expires_at: dict[str, float] = {}
+        self._lock = Lock()
+        self._configure_serializers(
+            int(cache_arguments.get("zstd_level", _DEFAULT_ZSTD_LEVEL)),
+            serializer=cache_arguments.get("serializer"),
+            dictionary_namespaces=cache_arguments.get("zstd_dictionary_namespaces"),
+        )
+        for namespace, dictionary in cache_arguments.get("zstd_dictionaries", {}).items():
+            self._codec.install(namespace, dictionary)
+        for key, value in list(self._cache.items()):
+            self._store(key, value)
+
+    @property
+    def stats(self) -> EvictionStats:
+        """
+        追い出し・拒否・期限切れの累計カウンタ。
+        """
+        return self._policy.stats
+
+    @property
+    def total_bytes(self) -> int:
+        """
+        現在保持している圧縮済みデータの合計バイト数。
+        """
+        with self._lock:
+            return self._policy.total_bytes
 
     def get_serialized(self, key: str) -> bytes | Any:
         """
@@ -96,7 +226,9 @@ class ZstdMemoryBackend(_ZstdSerializerMixin, BytesBackend):
         Returns:
             取得した値。未登録時は `NO_VALUE`
         """
-        return self._cache.get(key, NO_VALUE)
+        with self._lock:
+            value = self._load(key, monotonic())
+        return self._decompress(key, value)
 
     def get_serialized_multi(self, keys: Iterable[str]) -> Sequence[bytes | Any]:
         """
@@ -108,7 +240,11 @@ class ZstdMemoryBackend(_ZstdSerializerMixin, BytesBackend):
         Returns:
             各キーに対応する値一覧
         """
-        return [self._cache.get(key, NO_VALUE) for key in keys]
+        key_list = list(keys)
+        now = monotonic()
+        with self._lock:
+            values = [self._load(key, now) for key in key_list]
+        return [self._decompress(key, value) for key, value in zip(key_list, values)]
 
     def set_serialized(self, key: str, value: bytes) -> None:
         """
@@ -118,7 +254,9 @@ class ZstdMemoryBackend(_ZstdSerializerMixin, BytesBackend):
             key: キャッシュキー
             value: 保存する値
         """
-        self._cache[key] = value
+        compressed = self._compress(key, value)
+        with self._lock:
+            self._store(key, compressed)
 
     def set_serialized_multi(self, mapping: Mapping[str, bytes]) -> None:
         """
@@ -127,8 +265,10 @@ class ZstdMemoryBackend(_ZstdSerializerMixin, BytesBackend):
         Args:
             mapping: キャッシュキーと値の対応
         """
-        for key, value in mapping.items():
-            self._cache[key] = value
+        compressed = {key: self._compress(key, value) for key, value in mapping.items()}
+        with self._lock:
+            for key, value in compressed.items():
+                self._store(key, value)
 
     def delete(self, key: str) -> None:
         """
@@ -137,7 +277,8 @@ class ZstdMemoryBackend(_ZstdSerializerMixin, BytesBackend):
         Args:
             key: 削除対象のキャッシュキー
         """
-        self._cache.pop(key, None)
+        with self._lock:
+            self._discard(key)
 
     def delete_multi(self, keys: Iterable[str]) -> None:
         """
@@ -146,11 +287,206 @@ class ZstdMemoryBackend(_ZstdSerializerMixin, BytesBackend):
         Args:
             keys: 削除対象のキャッシュキー一覧
         """
-        for key in keys:
-            self._cache.pop(key, None)
+        with self._lock:
+            for key in keys:
+                self._discard(key)
+
+    def add_to_index(self, index_keys: Iterable[str], member: str) -> None:
+        """
+        逆引きインデックスへキャッシュキーを登録する。
+
+        Args:
+            index_keys: 登録先のインデックスキー一覧
+            member: 登録するキャッシュキー
+        """
+        now = monotonic()
+        with self._lock:
+            for index_key in index_keys:
+                members = self._indexes.get(index_key)
+                expires_at = self._index_expires_at.get(index_key)
+                if members is None or (expires_at is not None and expires_at <= now):
+                    members = self._indexes[index_key] = set()
+                members.add(member)
+                # 登録のたびに、キャッシュ値と同じ長さだけ保持期間を延ばす。
+                if self._expiration_time is not None:
+                    self._index_expires_at[index_key] = now + self._expiration_time
+
+    def pop_index_members(self, index_keys: Iterable[str]) -> set[str]:
+        """
+        逆引きインデックスに登録されたキャッシュキーを取り出し、インデックスを削除する。
+
+        Args:
+            index_keys: 対象のインデックスキー一覧
+
+        Returns:
+            登録されていたキャッシュキー一覧
+        """
+        now = monotonic()
+        popped: set[str] = set()
+        with self._lock:
+            for index_key in index_keys:
+                members = self._indexes.pop(index_key, set())
+                expires_at = self._index_expires_at.pop(index_key, None)
+                if expires_at is None or expires_at > now:
+                    popped.update(members)
+        return popped
+
+    def _load(self, key: str, now: float) -> bytes | Any:
+        """
+        期限切れを考慮してキャッシュ値を読み出す。呼び出し側でロックを保持すること。
+
+        Args:
+            key: キャッシュキー
+            now: 判定に使う現在時刻 (monotonic)
+
+        Returns:
+            取得した値。未登録・期限切れ時は `NO_VALUE`
+        """
+        value = self._cache.get(key)
+        if value is None:
+            return NO_VALUE
+
+        expires_at = self._expires_at.get(key)
+        if expires_at is not None and expires_at <= now:
+            self._discard(key)
+            self._policy.stats.expirations += 1
+            return NO_VALUE
+
+        self._policy.record_access(key)
+        return value
+
+    def _store(self, key: str, value: bytes) -> None:
+        """
+        キャッシュ値を保存し、ポリシーが追い出したキーを破棄する。呼び出し側でロックを保持すること。
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+        """
+        self._cache[key] = value
+        if self._expiration_time is not None:
+            self._expires_at[key] = monotonic() + self._expiration_time
+        else:
+            self._expires_at.pop(key, None)
+        for evicted_key in self._policy.add(key, len(value)):
+            self._cache.pop(evicted_key, None)
+            self._expires_at.pop(evicted_key, None)
+
+    def _discard(self, key: str) -> None:
+        """
+        キャッシュ値とポリシー上の管理情報を削除する。呼び出し側でロックを保持すること。
+
+        Args:
+            key: 削除対象のキャッシュキー
+        """
+        self._cache.pop(key, None)
+        self._expires_at.pop(key, None)
+        self._policy.remove(key)
+
+
+@dataclass
+class _DeferredInvalidations:
+    """
+    回路が開いていて Redis へ送れなかった無効化。回路が閉じた後にまとめて送り直す。
+    """
+
+    keys: set[str] = field(default_factory=set)
+    "削除するキャッシュキー"
+    mapping: dict[str, bytes] = field(default_factory=dict)
+    "保存する version 管理キーと値の対応。同じキーは後の値で上書きする"
+    index_keys: set[str] = field(default_factory=set)
+    "登録されたキャッシュキーごと削除する逆引きインデックスキー"
+    messages: list[tuple[str, str]] = field(default_factory=list)
+    "PUBLISH する無効化通知のチャネル名と本文"
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self.mapping) + len(self.index_keys) + len(self.messages)
+
+
+class _DictionaryUnavailableError(RedisError):
+    """
+    回路が開いている、または Redis に失敗したため学習済み辞書を読めないことを表す例外。
+    """
+
+
+class _CircuitDictionarySource:
+    """
+    サーキットブレーカーを通して学習済み辞書を読み込む取得元。
+
+    辞書の再読み込みは圧縮・展開の中で行われるため、Redis の障害中に応答を待たせないよう
+    他の操作と同じ回路で判定する。読めない場合は `RedisError` とし、辞書なしの圧縮を続けさせる。
+    """
+
+    def __init__(self, store: ZstdDictionarySource, call: Callable[..., Any]) -> None:
+        """
+        取得元を初期化する。
+
+        Args:
+            store: 学習済み辞書を保持する取得元
+            call: 送り先のクライアントを束縛した `ZstdRedisBackend._call`
+        """
+        self._store = store
+        self._call = call
+
+    def load_current(self) -> dict[str, int]:
+        """
+        namespace ごとの現行辞書 ID を読み込む。
+
+        Returns:
+            namespace と辞書 ID の対応
+
+        Raises:
+            _DictionaryUnavailableError: 回路が開いている、または Redis に失敗した
+        """
+        return self._unwrap(
+            self._call("load_dictionaries", (), _UNAVAILABLE, self._store.load_current)
+        )
+
+    def load(self, dict_id: int) -> bytes | None:
+        """
+        辞書 ID に対応する辞書を読み込む。
+
+        Args:
+            dict_id: 辞書 ID
+
+        Returns:
+            辞書のバイト列。削除済みなら None
+
+        Raises:
+            _DictionaryUnavailableError: 回路が開いている、または Redis に失敗した
+        """
+        return self._unwrap(
+            self._call("load_dictionary", (), _UNAVAILABLE, self._store.load, dict_id)
+        )
+
+    @staticmethod
+    def _unwrap(result: Any) -> Any:
+        """
+        `_call` の戻り値のうち、読めなかったことを表す値を例外に変換する。
+
+        Args:
+            result: `_call` の戻り値
+
+        Returns:
+            読み込んだ値
+
+        Raises:
+            _DictionaryUnavailableError: 読めなかった
+        """
+        # 削除済みの辞書 (None) と区別するため、読めなかった場合は専用の値で受け取る。
+        if result is _UNAVAILABLE:
+            raise _DictionaryUnavailableError("query cache dictionaries are unavailable")
+        return result
 
 
 class ZstdRedisBackend(_ZstdSerializerMixin, RedisBackend):
+    # dogpile の RedisBackend は Redis として扱うが、Redis Cluster 構成では RedisCluster を置く。
+    # どちらも同じコマンドを受け付け、基底クラスの処理はこのクラスで上書きした読み書きしか使わない。
+    writer_client: RedisClient  # type: ignore[bad-override-mutable-attribute]
+    "書き込みと無効化通知に使う Redis クライアント"
+    reader_client: RedisClient  # type: ignore[bad-override-mutable-attribute]
+    "読み込みに使う Redis クライアント"
+
     def __init__(self, arguments: Mapping[str, Any]) -> None:
         """
         zstd 圧縮対応の Redis キャッシュバックエンドを初期化する。
@@ -160,26 +496,439 @@ class ZstdRedisBackend(_ZstdSerializerMixin, RedisBackend):
         """
         backend_arguments = dict(arguments)
         zstd_level = int(backend_arguments.pop("zstd_level", _DEFAULT_ZSTD_LEVEL))
+        serializer = backend_arguments.pop("serializer", None)
+        dictionary_namespaces = backend_arguments.pop("zstd_dictionary_namespaces", None)
+        dictionary_refresh_interval = float(
+            backend_arguments.pop("zstd_dictionary_refresh_interval", 0)
+        )
         expiration_time = int(backend_arguments.pop("expiration_time", 3600))
         backend_arguments.setdefault("redis_expiration_time", expiration_time)
+        self._lock_wait_timeout = float(
+            backend_arguments.pop("lock_wait_timeout", _DEFAULT_LOCK_WAIT_TIMEOUT)
+        )
+        self._lock_fallback_to_db = bool(backend_arguments.pop("lock_fallback_to_db", True))
+        self._lock_recorder = LockWaitRecorder()
+        client_side_cache_max_entries = int(
+            backend_arguments.pop("client_side_cache_max_entries", 0)
+        )
+        self._client_side_cache_key_marker = str(
+            backend_arguments.pop(
+                "client_side_cache_key_marker", _DEFAULT_CLIENT_SIDE_CACHE_KEY_MARKER
+            )
+        )
+        self._client_side_cache_retry_interval = float(
+            backend_arguments.pop(
+                "client_side_cache_retry_interval", _DEFAULT_CLIENT_SIDE_CACHE_RETRY_INTERVAL
+            )
+        )
+        circuit_breaker_policy: CircuitBreakerPolicy | None = backend_arguments.pop(
+            "circuit_breaker_policy", None
+        )
         super().__init__(backend_arguments)
-        self._configure_serializers(zstd_level)
+        self._breakers: dict[int, CircuitBreaker] = {}
+        self._deferred: dict[str, _DeferredInvalidations] = {}
+        self._deferred_lock = Lock()
+        if circuit_breaker_policy is not None:
+            self._create_breakers(circuit_breaker_policy)
+        self.tracking_client: RedisClient | None = (
+            self._create_tracking_client(client_side_cache_max_entries)
+            if client_side_cache_max_entries > 0
+            else None
+        )
+        "version 管理キーの参照に使う、RESP3 client-side caching 有効の Redis クライアント"
+        self._tracking_retry_at = 0.0
+        self._configure_serializers(
+            zstd_level,
+            serializer=serializer,
+            dictionary_namespaces=dictionary_namespaces,
+            dictionary_source=(
+                _CircuitDictionarySource(
+                    ZstdDictionaryStore(self.writer_client), partial(self._call, self.writer_client)
+                )
+                if dictionary_namespaces
+                else None
+            ),
+            dictionary_refresh_interval=dictionary_refresh_interval,
+        )
 
-    def get_serialized(self, key: str) -> bytes | Any:
+    def _create_tracking_client(self, max_entries: int) -> RedisClient:
         """
-        Redis からシリアライズ済みキャッシュ値を取得する。
+        RESP3 の client-side caching (CLIENT TRACKING) を有効にした Redis クライアントを生成する。
+
+        取得結果はプロセス内に保持され、Redis からの invalidate push で破棄される。
+
+        Args:
+            max_entries: プロセス内に保持する最大件数
+
+        Returns:
+            Redis クライアント。接続は最初の参照時に行う
+        """
+        arguments = self._client_arguments()
+        arguments["protocol"] = 3
+        arguments["cache_config"] = CacheConfig(max_size=max_entries)
+        if self.url is not None:
+            return Redis.from_url(self.url, **arguments)
+        return Redis(
+            host=self.host,
+            port=self.port,
+            db=self.db,
+            username=self.username,
+            password=self.password,
+            **arguments,
+        )
+
+    def _client_arguments(self) -> dict[str, Any]:
+        """
+        dogpile の接続設定から、追加で生成する Redis クライアントの引数を組み立てる。
+
+        Returns:
+            Redis クライアントへ渡す引数
+        """
+        arguments: dict[str, Any] = dict(self.connection_kwargs)
+        if self.socket_timeout is not None:
+            arguments["socket_timeout"] = self.socket_timeout
+        if self.socket_connect_timeout is not None:
+            arguments["socket_connect_timeout"] = self.socket_connect_timeout
+        return arguments
+
+    def _tracking_client_for(self, key: str) -> RedisClient:
+        """
+        キャッシュキーの取得に使う追跡用クライアントを返す。
 
         Args:
             key: キャッシュキー
 
         Returns:
-            取得した値。取得失敗時は `NO_VALUE`
+            追跡用クライアント
         """
+        del key
+        return cast(RedisClient, self.tracking_client)
+
+    def _get_tracked(self, keys: Sequence[str]) -> dict[int, Any]:
+        """
+        client-side caching の対象キーを、追跡用クライアントから取得する。
+
+        追跡用クライアントが使えない (RESP3 や CLIENT TRACKING に未対応、接続失敗など) 場合は
+        `client_side_cache_retry_interval` 秒間使わず、通常のクライアントから取得させる。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            対象キーの位置と取得した値の対応。取得しなかったキーは含まない
+        """
+        if self.tracking_client is None or monotonic() < self._tracking_retry_at:
+            return {}
+        # 回路が開いているノードのキーは、プロセス内に保持した値があっても使わない。
+        indexes = [
+            index
+            for index, key in enumerate(keys)
+            if self._client_side_cache_key_marker in key
+            and not self._circuit_open(self._client_for(key))
+        ]
+        if not indexes:
+            return {}
         try:
-            return super().get_serialized(key)
+            # キー単位で保持させ、version 管理キーの組み合わせが違う参照でも共有する。
+            values = [self._tracking_client_for(keys[index]).get(keys[index]) for index in indexes]
         except RedisError as exc:
-            self._log_redis_error("get", exc)
-            return NO_VALUE
+            _logger.warning("Redis client-side caching is unavailable: %s", exc)
+            self._tracking_retry_at = monotonic() + self._client_side_cache_retry_interval
+            return {}
+        return {
+            index: NO_VALUE if value is None else value for index, value in zip(indexes, values)
+        }
+
+    def _named_clients(self) -> list[tuple[str, RedisClient]]:
+        """
+        サーキットブレーカーを付ける Redis クライアントと、計測値に使う名前の一覧を返す。
+
+        Returns:
+            名前と Redis クライアントの組の一覧
+        """
+        clients: list[tuple[str, RedisClient]] = [("redis", self.writer_client)]
+        if self.reader_client is not self.writer_client:
+            clients.append(("redis:reader", self.reader_client))
+        return clients
+
+    def _create_breakers(self, policy: CircuitBreakerPolicy) -> None:
+        """
+        Redis クライアントごとにサーキットブレーカーを生成する。
+
+        Args:
+            policy: 判定条件
+        """
+        for name, client in self._named_clients():
+            self._breakers[id(client)] = CircuitBreaker(
+                name, policy, on_close=lambda name=name: self._replay_deferred(name)
+            )
+
+    @property
+    def circuit_states(self) -> dict[str, CircuitState]:
+        """
+        Redis クライアントごとのサーキットブレーカーの状態を返す。
+
+        Returns:
+            ノード名と状態の対応。サーキットブレーカーが無効なら空
+        """
+        return {breaker.name: breaker.state for breaker in self._breakers.values()}
+
+    def _circuit_open(self, client: RedisClient) -> bool:
+        """
+        Redis クライアントの回路が開いているか判定する。試しの呼び出し枠は消費しない。
+
+        Args:
+            client: Redis クライアント
+
+        Returns:
+            開いていれば True
+        """
+        breaker = self._breakers.get(id(client))
+        return breaker is not None and breaker.state is CircuitState.OPEN
+
+    def _call(
+        self,
+        client: RedisClient,
+        operation: str,
+        keys: Sequence[str],
+        default: Any,
+        func: Callable[..., Any],
+        *args: Any,
+        on_reject: Callable[[], None] | None = None,
+    ) -> Any:
+        """
+        サーキットブレーカーを通して Redis を呼び出す。
+
+        回路が開いていれば Redis を待たずに `default` を返す。
+        RedisError は警告ログに記録し、呼び出しの成否と所要時間をサーキットブレーカーへ渡す。
+
+        Args:
+            client: 送り先の Redis クライアント
+            operation: ログ・計測値に使う操作名
+            keys: 操作対象のキャッシュキー一覧
+            default: 呼び出さなかった、または失敗した場合の戻り値
+            func: Redis を呼び出す関数
+            args: `func` へ渡す引数
+            on_reject: 回路が開いていて呼び出さなかった場合に呼ぶ関数
+
+        Returns:
+            `func` の戻り値、または `default`
+        """
+        breaker = self._breakers.get(id(client))
+        if breaker is not None and not breaker.allow():
+            if on_reject is not None:
+                on_reject()
+            return default
+        started = monotonic()
+        try:
+            result = func(*args)
+        except RedisError as exc:
+            if breaker is not None:
+                breaker.record_failure()
+            self._log_redis_error(operation, exc, keys)
+            return default
+        except Exception:
+            # Redis 以外の例外でも記録し、半開状態の試しの呼び出し枠を返す。
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        if breaker is not None:
+            breaker.record_success(monotonic() - started)
+        return result
+
+    def _defer(
+        self,
+        client: RedisClient,
+        keys: Iterable[str] = (),
+        mapping: Mapping[str, bytes] | None = None,
+        index_keys: Iterable[str] = (),
+        message: tuple[str, str] | None = None,
+    ) -> None:
+        """
+        回路が開いていて送れなかった無効化を、回路が閉じるまで保持する。
+
+        保持件数が上限を超える分は捨て、有効期限切れまで古い値が残ることを警告する。
+
+        Args:
+            client: 送れなかった送り先の Redis クライアント
+            keys: 削除するキャッシュキー一覧
+            mapping: 保存する version 管理キーと値の対応
+            index_keys: 登録されたキャッシュキーごと削除する逆引きインデックスキー一覧
+            message: PUBLISH する無効化通知のチャネル名と本文
+        """
+        name = self._breakers[id(client)].name
+        key_list = list(keys)
+        index_key_list = list(index_keys)
+        size = len(key_list) + len(mapping or ()) + len(index_key_list) + (message is not None)
+        with self._deferred_lock:
+            deferred = self._deferred.setdefault(name, _DeferredInvalidations())
+            if len(deferred) + size > _DEFERRED_INVALIDATION_MAX_ENTRIES:
+                dropped = True
+            else:
+                dropped = False
+                deferred.keys.update(key_list)
+                deferred.mapping.update(mapping or {})
+                deferred.index_keys.update(index_key_list)
+                if message is not None:
+                    deferred.messages.append(message)
+        if dropped:
+            _logger.warning(
+                "Dropped deferred query cache invalidation for %s: %s", name, key_list[:10]
+            )
+            for namespace in metrics.keys_namespaces([*key_list, *(mapping or ())]):
+                metrics.increment("circuit_deferred_dropped", namespace)
+
+    def _replay_deferred(self, name: str) -> None:
+        """
+        回路が閉じたノードへ、開いている間に送れなかった無効化を送り直す。
+
+        Args:
+            name: 回路が閉じたノード名
+        """
+        with self._deferred_lock:
+            deferred = self._deferred.pop(name, None)
+        if deferred is None:
+            return
+        _logger.info("Replaying deferred query cache invalidation for %s", name)
+        members = self.pop_index_members(deferred.index_keys) if deferred.index_keys else set()
+        keys = sorted(deferred.keys | members)
+        if keys or deferred.mapping:
+            self.invalidate_multi(keys, deferred.mapping)
+        for message in deferred.messages:
+            self._call(
+                self.writer_client,
+                "publish",
+                [],
+                None,
+                self.writer_client.publish,
+                *message,
+                on_reject=lambda message=message: self._defer(self.writer_client, message=message),
+            )
+
+    @property
+    def lock_stats(self) -> LockWaitStats:
+        """
+        キャッシュ再生成ロックの待機状況を返す。
+
+        Returns:
+            ロック待機状況のカウンタ
+        """
+        return self._lock_recorder.stats
+
+    def get_mutex(self, key: str) -> _RedisLockWrapper | None:
+        """
+        キャッシュ再生成を 1 プロセスに絞るための Redis ロックを返す。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            分散ロック。`distributed_lock` が無効、またはロックキーの回路が開いていれば None
+            (dogpile がプロセス内 mutex を使う)
+        """
+        if not self.distributed_lock:
+            return None
+        lock_key = self.lock_template.format(key)
+        client = self._client_for(lock_key)
+        if self._circuit_open(client):
+            # 回路が開いている間は Redis のロックを待たず、プロセス内 mutex に任せる。
+            return None
+        return _RedisLockWrapper(
+            BudgetedRedisLock(
+                client.lock(
+                    lock_key,
+                    timeout=self.lock_timeout,
+                    sleep=self.lock_sleep,
+                    thread_local=self.thread_local_lock,
+                ),
+                key,
+                wait_timeout=self._lock_wait_timeout,
+                fallback_to_db=self._lock_fallback_to_db,
+                recorder=self._lock_recorder,
+            )
+        )
+
+    def _client_for(self, key: str) -> RedisClient:
+        """
+        キャッシュキーの書き込みに使う Redis クライアントを返す。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            Redis クライアント
+        """
+        del key
+        return self.writer_client
+
+    def _groups(self, keys: Sequence[str]) -> list[tuple[RedisClient, list[int]]]:
+        """
+        複数キーの書き込みを、送り先の Redis クライアントごとにまとめる。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            Redis クライアントと、そのクライアントへ送るキーの位置一覧の組
+        """
+        if not keys:
+            return []
+        return [(self.writer_client, list(range(len(keys))))]
+
+    def _mset(self, client: RedisClient, mapping: Mapping[str, bytes]) -> None:
+        """
+        有効期限なしで複数の値を保存する。
+
+        Args:
+            client: 送り先の Redis クライアント
+            mapping: キャッシュキーと圧縮済みの値の対応
+        """
+        client.mset(mapping)
+
+    def _pipeline_delete(self, pipe: Any, keys: Sequence[str]) -> None:
+        """
+        pipeline へ複数キーの削除を積む。
+
+        Args:
+            pipe: Redis pipeline
+            keys: 削除するキャッシュキー一覧
+        """
+        pipe.delete(*keys)
+
+    def _pop_sets(self, client: RedisClient, keys: Sequence[str]) -> list[Any]:
+        """
+        Redis の set を取り出して削除する。
+
+        取得と削除は MULTI/EXEC で行い、間に登録されたメンバーを取りこぼさない。
+
+        Args:
+            client: 送り先の Redis クライアント
+            keys: set のキー一覧
+
+        Returns:
+            キーごとのメンバー一覧
+        """
+        pipe = client.pipeline()
+        for key in keys:
+            pipe.smembers(key)
+        pipe.delete(*keys)
+        return pipe.execute()[: len(keys)]
+
+    def get_serialized(self, key: str) -> bytes | Any:
+        """
+        Redis からシリアライズ済みキャッシュ値を取得する。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            取得した値。取得失敗時や回路が開いている場合は `NO_VALUE`
+        """
+        tracked = self._get_tracked([key])
+        if tracked:
+            return self._decompress(key, tracked[0])
+        value = self._call(self.reader_client, "get", [key], NO_VALUE, super().get_serialized, key)
+        return self._decompress(key, value)
 
     def get_serialized_multi(self, keys: Any) -> list[Any]:
         """
@@ -189,14 +938,26 @@ class ZstdRedisBackend(_ZstdSerializerMixin, RedisBackend):
             keys: キャッシュキー一覧
 
         Returns:
-            取得した値一覧。取得失敗時はすべて `NO_VALUE`
+            取得した値一覧。取得失敗時や回路が開いている場合はすべて `NO_VALUE`
         """
         key_list = list(keys)
-        try:
-            return list(super().get_serialized_multi(key_list))
-        except RedisError as exc:
-            self._log_redis_error("get_multi", exc)
-            return [NO_VALUE for _ in key_list]
+        tracked = self._get_tracked(key_list)
+        # version 管理キー以外だけを 1 回の MGET で取得する。
+        untracked = [key for index, key in enumerate(key_list) if index not in tracked]
+        fetched = iter(
+            self._call(
+                self.reader_client,
+                "get_multi",
+                untracked,
+                [NO_VALUE for _ in untracked],
+                super().get_serialized_multi,
+                untracked,
+            )
+        )
+        values = [
+            tracked[index] if index in tracked else next(fetched) for index in range(len(key_list))
+        ]
+        return [self._decompress(key, value) for key, value in zip(key_list, values)]
 
     def set_serialized(self, key: str, value: bytes) -> None:
         """
@@ -206,13 +967,14 @@ class ZstdRedisBackend(_ZstdSerializerMixin, RedisBackend):
             key: キャッシュキー
             value: 保存する値
         """
-        try:
-            if self.redis_expiration_time:
-                self.writer_client.set(key, value, ex=self.redis_expiration_time)
-            else:
-                self.writer_client.set(key, value)
-        except RedisError as exc:
-            self._log_redis_error("set", exc)
+        compressed = self._compress(key, value)
+        client = self._client_for(key)
+        if self.redis_expiration_time:
+            self._call(
+                client, "set", [key], None, client.set, key, compressed, self.redis_expiration_time
+            )
+        else:
+            self._call(client, "set", [key], None, client.set, key, compressed)
 
     def set_serialized_multi(self, mapping: Mapping[str, bytes]) -> None:
         """
@@ -221,17 +983,181 @@ class ZstdRedisBackend(_ZstdSerializerMixin, RedisBackend):
         Args:
             mapping: キャッシュキーと値の対応
         """
-        try:
-            if not self.redis_expiration_time:
-                self.writer_client.mset(mapping)
-                return
-
-            pipe = self.writer_client.pipeline()
-            for key, value in mapping.items():
-                pipe.set(key, value, ex=self.redis_expiration_time)
-            pipe.execute()
-        except RedisError as exc:
-            self._log_redis_error("set_multi", exc)
+        key_list = list(mapping)
+        for client, indexes in self._groups(key_list):
+            compressed = {
+                key_list[index]: self._compress(key_list[index], mapping[key_list[index]])
+                for index in indexes
+            }
+            store = self._set_pipeline if self.redis_expiration_time else self._mset
+            self._call(client, "set_multi", list(compressed), None, store, client, compressed)
+
+    def _set_pipeline(self, client: RedisClient, mapping: Mapping[str, bytes]) -> None:
+        """
+        1 回の pipeline で、有効期限付きで複数の値を保存する。
+
+        Args:
+            client: 送り先の Redis クライアント
+            mapping: キャッシュキーと圧縮済みの値の対応
+        """
+        pipe = client.pipeline()
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=self.redis_expiration_time)
+        pipe.execute()
+
+    def invalidate_multi(
+        self,
+        keys: Sequence[str],
+        mapping: Mapping[str, bytes],
+        message: tuple[str, str] | None = None,
+    ) -> None:
+        """
+        キャッシュ値の削除・保存と無効化通知を、送り先ごとに 1 回の pipeline で Redis に送る。
+
+        回路が開いている送り先の分は保持しておき、回路が閉じた後に送り直す。
+
+        Args:
+            keys: 削除するキャッシュキー一覧
+            mapping: 保存するキャッシュキーと値の対応
+            message: 通知用クライアントへの pipeline で PUBLISH する通知チャネル名と本文
+        """
+        key_list = [*keys, *mapping]
+        published = message is None
+        for client, indexes in self._groups(key_list):
+            deleted = [key_list[index] for index in indexes if index < len(keys)]
+            stored = {
+                key_list[index]: mapping[key_list[index]] for index in indexes if index >= len(keys)
+            }
+            client_message = message if client is self.writer_client else None
+            published = published or client_message is not None
+            self._call(
+                client,
+                "invalidate_multi",
+                [*deleted, *stored],
+                None,
+                self._invalidate_pipeline,
+                client,
+                deleted,
+                stored,
+                client_message,
+                on_reject=partial(self._defer, client, deleted, stored, message=client_message),
+            )
+        if not published:
+            # 通知用クライアントへ送るキーが無かった場合は、通知だけを送る。
+            sent = cast(tuple[str, str], message)
+            self._call(
+                self.writer_client,
+                "invalidate_multi",
+                key_list,
+                None,
+                self.writer_client.publish,
+                *sent,
+                on_reject=lambda: self._defer(self.writer_client, message=sent),
+            )
+
+    def _invalidate_pipeline(
+        self,
+        client: RedisClient,
+        deleted: Sequence[str],
+        stored: Mapping[str, bytes],
+        message: tuple[str, str] | None,
+    ) -> None:
+        """
+        1 つの送り先へ、キャッシュ値の削除・保存と無効化通知を 1 回の pipeline で送る。
+
+        Args:
+            client: 送り先の Redis クライアント
+            deleted: 削除するキャッシュキー一覧
+            stored: 保存するキャッシュキーと圧縮前の値の対応
+            message: PUBLISH する通知チャネル名と本文
+        """
+        pipe = client.pipeline()
+        if deleted:
+            self._pipeline_delete(pipe, deleted)
+        for key, value in stored.items():
+            compressed = self._compress(key, value)
+            if self.redis_expiration_time:
+                pipe.set(key, compressed, ex=self.redis_expiration_time)
+            else:
+                pipe.set(key, compressed)
+        if message is not None:
+            pipe.publish(*message)
+        pipe.execute()
+
+    def add_to_index(self, index_keys: Iterable[str], member: str) -> None:
+        """
+        逆引きインデックス (Redis の set) へキャッシュキーを登録する。
+
+        Args:
+            index_keys: 登録先のインデックスキー一覧
+            member: 登録するキャッシュキー
+        """
+        key_list = list(index_keys)
+        for client, indexes in self._groups(key_list):
+            shard_keys = [key_list[index] for index in indexes]
+            self._call(
+                client,
+                "add_to_index",
+                shard_keys,
+                None,
+                self._add_members,
+                client,
+                shard_keys,
+                member,
+            )
+
+    def _add_members(self, client: RedisClient, index_keys: Sequence[str], member: str) -> None:
+        """
+        1 つの送り先の逆引きインデックスへ、1 回の pipeline でキャッシュキーを登録する。
+
+        Args:
+            client: 送り先の Redis クライアント
+            index_keys: 登録先のインデックスキー一覧
+            member: 登録するキャッシュキー
+        """
+        pipe = client.pipeline(transaction=False)
+        for index_key in index_keys:
+            pipe.sadd(index_key, member)
+            # 登録のたびに、キャッシュ値と同じ長さだけ保持期間を延ばす。
+            if self.redis_expiration_time:
+                pipe.expire(index_key, self.redis_expiration_time)
+        pipe.execute()
+
+    def pop_index_members(self, index_keys: Iterable[str]) -> set[str]:
+        """
+        逆引きインデックスに登録されたキャッシュキーを取り出し、インデックスを削除する。
+
+        回路が開いている送り先のインデックスは保持しておき、回路が閉じた後に登録された
+        キャッシュキーごと削除する。
+
+        Args:
+            index_keys: 対象のインデックスキー一覧
+
+        Returns:
+            登録されていたキャッシュキー一覧。取得に失敗した送り先の分は含まない
+        """
+        key_list = list(index_keys)
+        members: set[str] = set()
+        for client, indexes in self._groups(key_list):
+            shard_keys = [key_list[index] for index in indexes]
+            results = self._call(
+                client,
+                "pop_index_members",
+                shard_keys,
+                [],
+                self._pop_sets,
+                client,
+                shard_keys,
+                on_reject=lambda client=client, shard_keys=shard_keys: self._defer(
+                    client, index_keys=shard_keys
+                ),
+            )
+            members.update(
+                member.decode() if isinstance(member, bytes) else member
+                for shard_members in results
+                for member in shard_members or ()
+            )
+        return members
 
     def delete(self, key: str) -> None:
         """
@@ -240,10 +1166,16 @@ class ZstdRedisBackend(_ZstdSerializerMixin, RedisBackend):
         Args:
             key: 削除対象のキャッシュキー
         """
-        try:
-            super().delete(key)
-        except RedisError as exc:
-            self._log_redis_error("delete", exc)
+        client = self._client_for(key)
+        self._call(
+            client,
+            "delete",
+            [key],
+            None,
+            client.delete,
+            key,
+            on_reject=lambda: self._defer(client, [key]),
+        )
 
     def delete_multi(self, keys: Any) -> None:
         """
@@ -252,17 +1184,364 @@ class ZstdRedisBackend(_ZstdSerializerMixin, RedisBackend):
         Args:
             keys: 削除対象のキャッシュキー一覧
         """
-        try:
-            super().delete_multi(keys)
-        except RedisError as exc:
-            self._log_redis_error("delete_multi", exc)
+        key_list = list(keys)
+        for client, indexes in self._groups(key_list):
+            shard_keys = [key_list[index] for index in indexes]
+            self._call(
+                client,
+                "delete_multi",
+                shard_keys,
+                None,
+                client.delete,
+                *shard_keys,
+                on_reject=lambda client=client, shard_keys=shard_keys: self._defer(
+                    client, shard_keys
+                ),
+            )
 
-    def _log_redis_error(self, operation: str, exc: RedisError) -> None:
+    def _log_redis_error(self, operation: str, exc: RedisError, keys: Sequence[str]) -> None:
         """
-        Redis 操作失敗を警告ログに記録する。
+        Redis 操作失敗を警告ログに記録し、対象キーの namespace ごとに数える。
 
         Args:
             operation: 失敗した操作名
             exc: 発生した例外
+            keys: 操作対象のキャッシュキー一覧
         """
         _logger.warning("Redis error during query cache %s: %s", operation, exc)
+        for namespace in metrics.keys_namespaces(keys):
+            metrics.increment("redis_errors", namespace)
+
+
+class ZstdShardedRedisBackend(ZstdRedisBackend):
+    """
+    コンシステントハッシュで複数の standalone Redis へキーを振り分けるキャッシュバックエンド。
+
+    複数キーの操作は担当ノードごとにまとめて送り、1 ノードの障害はそのノードが担当するキーだけを
+    キャッシュミスとして扱う。辞書・無効化通知など全プロセスで共有する操作は先頭ノードで行う。
+    """
+
+    def __init__(self, arguments: Mapping[str, Any]) -> None:
+        """
+        ノードごとの Redis クライアントを生成する。
+
+        Args:
+            arguments: dogpile.cache から渡される設定値。`shard_urls` にノードの接続 URL 一覧を含む
+        """
+        backend_arguments = dict(arguments)
+        self._shard_urls = list(backend_arguments.pop("shard_urls", ()))
+        self._ring = ConsistentHashRing(self._shard_urls)
+        self.shard_clients: list[RedisClient] = []
+        "ノードごとの Redis クライアント。並びは `shard_urls` と同じ"
+        self._tracking_clients: list[RedisClient] = []
+        super().__init__(backend_arguments)
+
+    def _create_client(self) -> None:
+        """
+        ノードごとの Redis クライアントを生成し、先頭ノードを辞書・無効化通知の送り先にする。
+        """
+        arguments = self._client_arguments()
+        shard_clients = [Redis.from_url(url, **arguments) for url in self._shard_urls]
+        self.shard_clients = [*shard_clients]
+        self.writer_client = shard_clients[0]
+        self.reader_client = self.writer_client
+
+    def _create_tracking_client(self, max_entries: int) -> RedisClient:
+        """
+        ノードごとに、client-side caching を有効にした Redis クライアントを生成する。
+
+        Args:
+            max_entries: ノードごとにプロセス内へ保持する最大件数
+
+        Returns:
+            先頭ノードの追跡用クライアント
+        """
+        arguments = self._client_arguments()
+        arguments["protocol"] = 3
+        self._tracking_clients = [
+            Redis.from_url(url, cache_config=CacheConfig(max_size=max_entries), **arguments)
+            for url in self._shard_urls
+        ]
+        return self._tracking_clients[0]
+
+    def _tracking_client_for(self, key: str) -> RedisClient:
+        """
+        キャッシュキーを担当するノードの追跡用クライアントを返す。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            追跡用クライアント
+        """
+        return self._tracking_clients[self._ring.node_index(key)]
+
+    def _named_clients(self) -> list[tuple[str, RedisClient]]:
+        """
+        ノードごとの Redis クライアントと、計測値に使う名前の一覧を返す。
+
+        Returns:
+            名前と Redis クライアントの組の一覧
+        """
+        return [(f"redis:shard{index}", client) for index, client in enumerate(self.shard_clients)]
+
+    def _client_for(self, key: str) -> RedisClient:
+        """
+        キャッシュキーを担当するノードの Redis クライアントを返す。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            Redis クライアント
+        """
+        return self.shard_clients[self._ring.node_index(key)]
+
+    def _groups(self, keys: Sequence[str]) -> list[tuple[RedisClient, list[int]]]:
+        """
+        複数キーの操作を、担当ノードの Redis クライアントごとにまとめる。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            Redis クライアントと、そのクライアントへ送るキーの位置一覧の組
+        """
+        return [
+            (self.shard_clients[node], indexes) for node, indexes in self._ring.group(keys).items()
+        ]
+
+    def _mget(self, client: RedisClient, keys: Sequence[str]) -> list[Any]:
+        """
+        1 つの送り先から複数の値を取得する。
+
+        Args:
+            client: 送り先の Redis クライアント
+            keys: キャッシュキー一覧
+
+        Returns:
+            取得した値一覧。未登録のキーは None
+        """
+        return client.mget(keys)
+
+    def get_serialized(self, key: str) -> bytes | Any:
+        """
+        キャッシュキーを担当するノードから、シリアライズ済みキャッシュ値を取得する。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            展開済みのキャッシュ値。未登録、または担当ノードの障害中なら NO_VALUE
+        """
+        tracked = self._get_tracked([key])
+        if tracked:
+            return self._decompress(key, tracked[0])
+        client = self._client_for(key)
+        value = self._call(client, "get", [key], None, client.get, key)
+        return self._decompress(key, NO_VALUE if value is None else value)
+
+    def get_serialized_multi(self, keys: Any) -> list[Any]:
+        """
+        担当ノードごとに 1 回の MGET で、複数のシリアライズ済みキャッシュ値を取得する。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            キーと同じ順の展開済みキャッシュ値一覧。未登録、または担当ノードの障害中なら NO_VALUE
+        """
+        key_list = list(keys)
+        tracked = self._get_tracked(key_list)
+        values: list[Any] = [tracked.get(index, NO_VALUE) for index in range(len(key_list))]
+        untracked = [index for index in range(len(key_list)) if index not in tracked]
+        untracked_keys = [key_list[index] for index in untracked]
+        for client, indexes in self._groups(untracked_keys):
+            shard_keys = [untracked_keys[index] for index in indexes]
+            # 障害中や回路が開いているノードが担当するキーだけをキャッシュミスにする。
+            fetched = self._call(
+                client, "get_multi", shard_keys, [], self._mget, client, shard_keys
+            )
+            for index, value in zip(indexes, fetched):
+                if value is not None:
+                    values[untracked[index]] = value
+        return [self._decompress(key, value) for key, value in zip(key_list, values)]
+
+
+class ZstdRedisClusterBackend(ZstdShardedRedisBackend):
+    """
+    Redis Cluster を使うキャッシュバックエンド。
+
+    キーの割り当てと MOVED / ASK の追従は redis-py の `RedisCluster` に任せる。
+    Redis Cluster はスロットをまたぐ複数キーのコマンドや MULTI を受け付けないため、
+    複数キーの操作はノードごとの pipeline やスロットごとのコマンドに分けて送る。
+    """
+
+    def __init__(self, arguments: Mapping[str, Any]) -> None:
+        """
+        Redis Cluster のクライアントを生成する。
+
+        Args:
+            arguments: dogpile.cache から渡される設定値。`url` にいずれかのノードの接続 URL を含む
+        """
+        backend_arguments = dict(arguments)
+        if backend_arguments.get("url") is None:
+            raise ValueError("url is required for the Redis Cluster backend")
+        # クラスタ内の割り当ては RedisCluster が行うため、リングは接続 URL 1 件で作る。
+        backend_arguments["shard_urls"] = [backend_arguments["url"]]
+        self.cluster_client: RedisCluster
+        "Redis Cluster のクライアント"
+        super().__init__(backend_arguments)
+
+    def _create_client(self) -> None:
+        """
+        Redis Cluster のクライアントを生成し、すべての操作の送り先にする。
+        """
+        self.cluster_client = RedisCluster.from_url(self.url, **self._client_arguments())
+        self.writer_client = self.cluster_client
+        self.reader_client = self.writer_client
+        self.shard_clients = [self.cluster_client]
+
+    def _create_tracking_client(self, max_entries: int) -> RedisClient:
+        """
+        client-side caching を有効にした Redis Cluster のクライアントを生成する。
+
+        Args:
+            max_entries: プロセス内に保持する最大件数
+
+        Returns:
+            追跡用クライアント
+        """
+        arguments = self._client_arguments()
+        arguments["protocol"] = 3
+        client = RedisCluster.from_url(
+            self.url, cache_config=CacheConfig(max_size=max_entries), **arguments
+        )
+        self._tracking_clients = [client]
+        return client
+
+    def _tracking_client_for(self, key: str) -> RedisClient:
+        """
+        追跡用クライアントを返す。キーの割り当ては RedisCluster が行う。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            追跡用クライアント
+        """
+        del key
+        return self._tracking_clients[0]
+
+    def _named_clients(self) -> list[tuple[str, RedisClient]]:
+        """
+        Redis Cluster のクライアントと、計測値に使う名前を返す。
+
+        ノードの増減やフェイルオーバーは RedisCluster が追従するため、クラスタ全体で 1 つとする。
+
+        Returns:
+            名前と Redis クライアントの組の一覧
+        """
+        return [("redis:cluster", self.cluster_client)]
+
+    def _client_for(self, key: str) -> RedisClient:
+        """
+        Redis Cluster のクライアントを返す。キーの割り当ては RedisCluster が行う。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            Redis クライアント
+        """
+        del key
+        return self.cluster_client
+
+    def _groups(self, keys: Sequence[str]) -> list[tuple[RedisClient, list[int]]]:
+        """
+        複数キーの操作を 1 つにまとめる。pipeline は RedisCluster がノードごとに分けて送る。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            Redis クライアントと、そのクライアントへ送るキーの位置一覧の組
+        """
+        if not keys:
+            return []
+        return [(self.cluster_client, list(range(len(keys))))]
+
+    def _mget(self, client: RedisClient, keys: Sequence[str]) -> list[Any]:
+        """
+        スロットごとの MGET に分けて、複数の値を取得する。
+
+        Args:
+            client: 送り先の Redis クライアント
+            keys: キャッシュキー一覧
+
+        Returns:
+            取得した値一覧。未登録のキーは None
+        """
+        return cast(RedisCluster, client).mget_nonatomic(keys)
+
+    def _mset(self, client: RedisClient, mapping: Mapping[str, bytes]) -> None:
+        """
+        スロットごとの MSET に分けて、有効期限なしで複数の値を保存する。
+
+        Args:
+            client: 送り先の Redis クライアント
+            mapping: キャッシュキーと圧縮済みの値の対応
+        """
+        cast(RedisCluster, client).mset_nonatomic(mapping)
+
+    def _pipeline_delete(self, pipe: Any, keys: Sequence[str]) -> None:
+        """
+        pipeline へ、キーごとの削除を積む。
+
+        Args:
+            pipe: Redis Cluster の pipeline
+            keys: 削除するキャッシュキー一覧
+        """
+        for key in keys:
+            pipe.delete(key)
+
+    def _pop_sets(self, client: RedisClient, keys: Sequence[str]) -> list[Any]:
+        """
+        Redis の set をキーごとに取り出して削除する。
+
+        スロットをまたぐ MULTI は使えないため、取り出しと削除はキーごとに 1 コマンドで行う。
+
+        Args:
+            client: 送り先の Redis クライアント
+            keys: set のキー一覧
+
+        Returns:
+            キーごとのメンバー一覧
+        """
+        pipe = client.pipeline()
+        for key in keys:
+            pipe.spop(key, _SPOP_ALL_COUNT)
+        return pipe.execute()
+
+    def _invalidate_pipeline(
+        self,
+        client: RedisClient,
+        deleted: Sequence[str],
+        stored: Mapping[str, bytes],
+        message: tuple[str, str] | None,
+    ) -> None:
+        """
+        キャッシュ値の削除・保存を pipeline で送った後、無効化通知を PUBLISH する。
+
+        Redis Cluster の pipeline はキーを持たない PUBLISH を送れないため、
+        通知は pipeline の外で送る。
+
+        Args:
+            client: 送り先の Redis クライアント
+            deleted: 削除するキャッシュキー一覧
+            stored: 保存するキャッシュキーと圧縮前の値の対応
+            message: PUBLISH する通知チャネル名と本文
+        """
+        super()._invalidate_pipeline(client, deleted, stored, None)
+        if message is not None:
+            client.publish(*message)
@@ -0,0 +1,213 @@
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from enum import IntEnum
+from threading import Lock
+from time import monotonic
+
+from ..log import get_logger
+from . import metrics
+
+_logger = get_logger()
+
+
+class CircuitState(IntEnum):
+    """
+    サーキットブレーカーの状態。値は計測値 `circuit_state` として出力する。
+    """
+
+    CLOSED = 0
+    "通常どおり Redis を使う"
+    HALF_OPEN = 1
+    "一部の呼び出しだけを試しに Redis へ送り、回復したか確かめる"
+    OPEN = 2
+    "Redis を使わずに即座にキャッシュミス扱いにする"
+
+
+@dataclass(frozen=True)
+class CircuitBreakerPolicy:
+    """
+    サーキットブレーカーの判定条件。
+    """
+
+    window_size: int = 50
+    "失敗率・遅延率を求める直近の呼び出し件数"
+    min_calls: int = 20
+    "判定を始めるのに必要な呼び出し件数"
+    failure_rate_threshold: float = 0.5
+    "回路を開く失敗 (RedisError) の割合"
+    slow_call_seconds: float = 0.05
+    "遅い呼び出しとみなす秒数"
+    slow_call_rate_threshold: float = 0.8
+    "回路を開く遅い呼び出しの割合"
+    open_seconds: float = 10.0
+    "回路を開いてから試しの呼び出しを始めるまでの秒数"
+    half_open_probes: int = 3
+    "試しの呼び出し数。すべて成功すれば回路を閉じる"
+
+
+class CircuitBreaker:
+    """
+    Redis 1 ノード分の呼び出し結果から、Redis を使うかどうかを決めるサーキットブレーカー。
+
+    直近の呼び出しの失敗率または遅延率がしきい値を超えると回路を開き、一定時間は呼び出しを拒否する。
+    その後は試しの呼び出しだけを通し、すべて成功すれば閉じ、1 件でも失敗・遅延すれば開き直す。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        policy: CircuitBreakerPolicy,
+        on_close: Callable[[], None] | None = None,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        """
+        回路を閉じた状態で初期化する。
+
+        Args:
+            name: 計測値・ログに使うノード名
+            policy: 判定条件
+            on_close: 開いていた回路を閉じた後に呼ぶ関数
+            clock: 現在時刻 (秒) を返す関数
+        """
+        self.name = name
+        "計測値・ログに使うノード名"
+        self._policy = policy
+        self._on_close = on_close
+        self._clock = clock
+        self._state = CircuitState.CLOSED
+        self._calls: deque[tuple[bool, bool]] = deque(maxlen=policy.window_size)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = Lock()
+        metrics.set_gauge("circuit_state", name, CircuitState.CLOSED)
+
+    @property
+    def state(self) -> CircuitState:
+        """
+        現在の状態を返す。開いてから `open_seconds` 経過していれば半開状態に移す。
+
+        Returns:
+            現在の状態
+        """
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """
+        Redis を呼び出してよいか判定する。
+
+        許可した呼び出しの結果は、必ず `record_success` か `record_failure` で記録する。
+
+        Returns:
+            呼び出してよければ True
+        """
+        with self._lock:
+            state = self._current_state()
+            if state is CircuitState.CLOSED:
+                return True
+            if state is CircuitState.HALF_OPEN and self._probes < self._policy.half_open_probes:
+                self._probes += 1
+                return True
+        metrics.increment("circuit_rejections", self.name)
+        return False
+
+    def record_success(self, seconds: float) -> None:
+        """
+        例外にならなかった呼び出しを記録する。
+
+        Args:
+            seconds: 呼び出しにかかった秒数
+        """
+        self._record(failed=False, slow=seconds >= self._policy.slow_call_seconds)
+
+    def record_failure(self) -> None:
+        """
+        RedisError になった呼び出しを記録する。
+        """
+        self._record(failed=True, slow=False)
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        """
+        呼び出し結果を記録し、状態を更新する。
+
+        Args:
+            failed: 失敗したか
+            slow: 遅い呼び出しだったか
+        """
+        closed = False
+        with self._lock:
+            state = self._current_state()
+            if state is CircuitState.HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self._policy.half_open_probes:
+                        self._close()
+                        closed = True
+            elif state is CircuitState.CLOSED:
+                self._calls.append((failed, slow))
+                if self._should_open():
+                    self._open()
+        # 閉じた後の処理は Redis を呼び出すため、ロックの外で行う。
+        if closed and self._on_close is not None:
+            self._on_close()
+
+    def _should_open(self) -> bool:
+        """
+        直近の呼び出しの失敗率・遅延率がしきい値を超えたか判定する。
+
+        Returns:
+            回路を開くなら True
+        """
+        total = len(self._calls)
+        if total < self._policy.min_calls:
+            return False
+        failures = sum(1 for failed, _ in self._calls if failed)
+        slow_calls = sum(1 for _, slow in self._calls if slow)
+        return (
+            failures / total >= self._policy.failure_rate_threshold
+            or slow_calls / total >= self._policy.slow_call_rate_threshold
+        )
+
+    def _current_state(self) -> CircuitState:
+        """
+        時間経過を反映した状態を返す。ロックを取得した状態で呼ぶ。
+
+        Returns:
+            現在の状態
+        """
+        if (
+            self._state is CircuitState.OPEN
+            and self._clock() - self._opened_at >= self._policy.open_seconds
+        ):
+            self._transition(CircuitState.HALF_OPEN)
+            self._probes = 0
+            self._probe_successes = 0
+        return self._state
+
+    def _open(self) -> None:
+        self._opened_at = self._clock()
+        self._calls.clear()
+        if self._state is not CircuitState.OPEN:
+            metrics.increment("circuit_opened", self.name)
+        self._transition(CircuitState.OPEN)
+
+    def _close(self) -> None:
+        self._calls.clear()
+        self._transition(CircuitState.CLOSED)
+
+    def _transition(self, state: CircuitState) -> None:
+        """
+        状態を変え、計測値とログに残す。
+
+        Args:
+            state: 新しい状態
+        """
+        if state is self._state:
+            return
+        _logger.warning("Query cache circuit %s: %s -> %s", self.name, self._state.name, state.name)
+        self._state = state
+        metrics.set_gauge("circuit_state", self.name, state)
@@ -1,19 +1,41 @@
-from collections.abc import Callable
+from collections.abc import Callable, Hashable, Iterable, Mapping
 from functools import wraps
+from time import perf_counter
 from typing import Any, ParamSpec, Protocol, TypeVar, cast
 
-from dogpile.cache.api import NO_VALUE
+from dogpile.cache.api import NO_VALUE, CachedValue
 from dogpile.cache.region import CacheRegion
+from sqlalchemy.orm import Session
 
 from ..log import get_logger
-from .invalidation import has_pending_cache_invalidation
+from . import metrics
+from .degraded import (
+    DATABASE_UNAVAILABLE_ERRORS,
+    get_last_known_value,
+    get_or_create_degradable,
+    get_stale_if_error_time,
+    mark_degraded_session,
+    record_stale_read,
+)
+from .identity_map import is_identity_map_enabled, record_avoided_lookups
+from .invalidation import (
+    get_transaction_cached_value,
+    has_committed_version_bump,
+    has_pending_cache_invalidation,
+    set_transaction_cached_value,
+)
 from .key_generator import KeyFunc, KeyGenerator
+from .negative import AbsentResult
 from .region import NullCacheRegion
 from .session_resolver import SessionResolver
+from .stale import background_refresher, get_stale_grace_time, get_stale_value
+from .versioned import VersionedCacheKey, get_or_create_versioned
 
 P = ParamSpec("P")
 T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
 _logger = get_logger()
+_STATUS_METRICS = {"HIT": "hits", "MISS": "misses", "STALE": "stale", "DEGRADED": "degraded"}
 
 
 class _CacheRegionLike(Protocol):
@@ -21,6 +43,8 @@ class _CacheRegionLike(Protocol):
     query_cache が依存する最小限のキャッシュリージョン操作を表す Protocol。
     """
 
+    expiration_time: float | None
+
     def get(
         self,
         key: str,
@@ -28,6 +52,10 @@ class _CacheRegionLike(Protocol):
         ignore_expiration: bool = False,
     ) -> Any: ...
 
+    def get_multi(self, keys: Any, expiration_time: float | None = None) -> list[Any]: ...
+
+    def set_multi(self, mapping: Mapping[str, Any]) -> None: ...
+
     def get_or_create(
         self,
         key: str,
@@ -35,6 +63,21 @@ class _CacheRegionLike(Protocol):
         expiration_time: float | None = None,
     ) -> Any: ...
 
+    def get_value_metadata(
+        self,
+        key: str,
+        expiration_time: float | None = None,
+        ignore_expiration: bool = False,
+    ) -> CachedValue | None: ...
+
+
+class _SessionRebindable(Protocol):
+    """
+    別の Session で同じ処理を行うインスタンスを作れるオブジェクトを表す Protocol。
+    """
+
+    def with_session(self, session: Session) -> Any: ...
+
 
 def query_cache(
     region: CacheRegion | NullCacheRegion | None = None,
@@ -43,6 +86,11 @@ def query_cache(
     session_attr: str = "session",
     region_attr: str = "region",
     unless: Callable[P, bool] | None = None,
+    stale_while_revalidate: bool = False,
+    negative_cache: type[Exception] | None = None,
+    negative_expiration_time: float = 30,
+    reverse_index: Callable[[T], Iterable[str]] | None = None,
+    stale_if_error: bool = False,
 ) -> Callable[[Callable[P, T]], Callable[P, T]]:
     """
     SQLAlchemy クエリ結果をキャッシュするデコレータを返す。
@@ -54,6 +102,16 @@ def query_cache(
         session_attr: Session を保持する属性名
         region_attr: Region を保持する属性名
         unless: True の場合にキャッシュをスキップする条件関数
+        stale_while_revalidate: 有効期限切れや version 更新の後、リージョンの猶予秒数以内なら
+            古い値をすぐに返し、バックグラウンドで再生成する
+        negative_cache: 対象データが無いことを表す例外クラス。指定時は送出された事実を
+            キャッシュし、有効期限内は関数を実行せずに同じ例外を送出する
+        negative_expiration_time: 対象データが無いことをキャッシュする秒数
+        reverse_index: 戻り値から逆引きインデックスキーを返す関数。指定時は値を作るたびに
+            キャッシュキーを各インデックスへ登録し、`schedule_cache_index_deletes` で
+            インデックス単位に削除できるようにする
+        stale_if_error: DB に接続できない場合、有効期限切れからリージョンの
+            `stale_if_error_time` 秒以内の値 (以前の version の値を含む) を代わりに返す
 
     Returns:
         キャッシュ機能付きデコレータ
@@ -61,6 +119,13 @@ def query_cache(
     session_resolver = SessionResolver(session_attr=session_attr)
 
     def decorator(func: Callable[P, T]) -> Callable[P, T]:
+        # シグネチャの解析はデコレート時に済ませ、呼び出しごとには行わない。
+        generate_key = KeyGenerator.compile(key_func, func, session_attr=session_attr)
+        resolve_session = session_resolver.compile(func)
+        fixed_namespace = (
+            metrics.template_namespace(key_func) if isinstance(key_func, str) else None
+        )
+
         @wraps(func)
         def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
             cache_region = _resolve_region(region, args=args, region_attr=region_attr)
@@ -68,41 +133,279 @@ def query_cache(
                 return func(*args, **kwargs)
 
             # 戻り値の detach 判定に使う Session を先に解決しておく。
-            session = session_resolver.resolve(args, dict(kwargs))
+            session = resolve_session(args, kwargs)
+            namespace = ""
 
             def execute_and_prepare_result() -> T:
+                started = perf_counter()
                 result = func(*args, **kwargs)
                 if session is not None:
                     # Session に紐づいた ORM オブジェクトのままキャッシュしない。
                     session_resolver.expunge(session, result)
+                if namespace:
+                    metrics.observe("generate_seconds", namespace, perf_counter() - started)
                 return result
 
-            if has_pending_cache_invalidation(session, cache_region):
-                # 同一 transaction 内で無効化待ちがある間は、stale cache の再利用/再生成を避ける。
-                return execute_and_prepare_result()
+            # 呼び出しごとに Union を組み立てないよう、注釈は文字列にする。
+            def create_cached_result() -> "T | AbsentResult":
+                if negative_cache is None:
+                    return execute_and_prepare_result()
+                try:
+                    return execute_and_prepare_result()
+                except negative_cache as exc:
+                    return AbsentResult.from_error(exc)
+
+            def unwrap(key: str, value: Any, recreate: bool = True) -> T:
+                if negative_cache is None or not isinstance(value, AbsentResult):
+                    return cast(T, value)
+                if recreate and value.is_expired(negative_expiration_time):
+                    # 不在の記録は本体と別の短い有効期限で作り直す。
+                    value = cache_region.get_or_create(
+                        key, create_cached_result, expiration_time=negative_expiration_time
+                    )
+                if isinstance(value, AbsentResult):
+                    _logger.debug("Query cache ABSENT: %s", key)
+                    metrics.increment("absent", namespace)
+                    raise negative_cache(value.message)
+                return cast(T, value)
+
+            cache_key = generate_key(args, kwargs)
+            transaction_key = _transaction_cache_key(cache_key)
+
+            def remember(value: Any) -> Any:
+                # 同一 transaction 内の同じ参照では、共有キャッシュも DB も見ずにこの値を返す。
+                if session is not None and is_identity_map_enabled(session):
+                    set_transaction_cached_value(session, cache_region, transaction_key, value)
+                return value
+
+            if session is not None:
+                value = get_transaction_cached_value(session, cache_region, transaction_key)
+                if value is not NO_VALUE:
+                    _logger.debug("Query cache TRANSACTION HIT: %s", transaction_key)
+                    metrics.increment(
+                        "transaction_hits",
+                        fixed_namespace or metrics.key_namespace(transaction_key),
+                    )
+                    record_avoided_lookups(session)
+                    return unwrap(transaction_key, value, recreate=False)
+                if has_pending_cache_invalidation(session, cache_region):
+                    # 無効化待ちがある間は共有キャッシュを読み書きせず、作った値は
+                    # transaction 内だけで再利用する。
+                    value = create_cached_result()
+                    set_transaction_cached_value(session, cache_region, transaction_key, value)
+                    return unwrap(transaction_key, value, recreate=False)
+
+            namespace = fixed_namespace or metrics.key_namespace(cache_key)
+            refresh = None
+            grace_time = get_stale_grace_time(cache_region)
+            if stale_while_revalidate and grace_time > 0:
+                refresh = _build_refresh(
+                    cache_region,
+                    func,
+                    args,
+                    kwargs,
+                    session,
+                    session_resolver,
+                    session_attr,
+                    expiration_time,
+                    reverse_index,
+                    namespace,
+                )
+
+            if isinstance(cache_key, VersionedCacheKey):
+                if has_committed_version_bump(session, cache_region, cache_key.version_keys):
+                    # 自分の書き込みで進めた version では、古い version の値を返さない。
+                    refresh = None
+                # version 値とキャッシュ値を 1 回の multi-get でまとめて解決する。
+                status, resolved_key, value = get_or_create_versioned(
+                    cache_region,
+                    cache_key,
+                    create_cached_result,
+                    expiration_time=expiration_time,
+                    stale_grace_time=grace_time,
+                    refresh=refresh,
+                    stale_if_error=stale_if_error,
+                )
+                _logger.debug("Query cache %s: %s", status, resolved_key)
+                metrics.increment(_STATUS_METRICS[status], namespace)
+                if status == "DEGRADED":
+                    # 通常の参照と同じく、古い値で代替した分もキャッシュミスに数える。
+                    metrics.increment("misses", namespace)
+                    _mark_degraded(session)
+                    return unwrap(resolved_key, value, recreate=False)
+                if status == "MISS":
+                    _record_reverse_index(cache_region, reverse_index, resolved_key, value)
+                return unwrap(resolved_key, remember(value))
 
-            cache_key = KeyGenerator.generate(
-                key_func,
-                func,
-                args,
-                dict(kwargs),
-                session_attr=session_attr,
-            )
             cached = cache_region.get(cache_key, expiration_time=expiration_time)
             if cached is not NO_VALUE:
                 _logger.debug("Query cache HIT: %s", cache_key)
-                return cast(T, cached)
+                metrics.increment("hits", namespace)
+                return unwrap(cache_key, remember(cached))
+
+            if refresh is not None:
+                stale = get_stale_value(cache_region, cache_key, expiration_time, grace_time)
+                if stale is not NO_VALUE:
+                    refresh(cache_key)
+                    _logger.debug("Query cache STALE: %s", cache_key)
+                    metrics.increment("stale", namespace)
+                    return unwrap(cache_key, remember(stale))
 
             _logger.debug("Query cache MISS: %s", cache_key)
+            metrics.increment("misses", namespace)
 
-            return cast(
-                T,
-                cache_region.get_or_create(
+            if stale_if_error:
+                status, _, created = get_or_create_degradable(
+                    cache_region, cache_key, create_cached_result, expiration_time=expiration_time
+                )
+                if status == "DEGRADED":
+                    metrics.increment("degraded", namespace)
+                    _mark_degraded(session)
+                    return unwrap(cache_key, created, recreate=False)
+            else:
+                created = cache_region.get_or_create(
                     cache_key,
-                    execute_and_prepare_result,
+                    create_cached_result,
                     expiration_time=expiration_time,
-                ),
+                )
+            _record_reverse_index(cache_region, reverse_index, cache_key, created)
+            return unwrap(cache_key, remember(created))
+
+        return wrapper
+
+    return decorator
+
+
+def query_cache_multi(
+    region: CacheRegion | NullCacheRegion | None = None,
+    key_func: KeyFunc | str | None = None,
+    expiration_time: int | None = None,
+    session_attr: str = "session",
+    region_attr: str = "region",
+    stale_if_error: bool = False,
+) -> Callable[[Callable[..., Mapping[K, T]]], Callable[..., dict[K, T]]]:
+    """
+    複数の引数に対するクエリ結果をまとめてキャッシュするデコレータを返す。
+
+    ラップ対象関数は最後の位置引数に引数のリストを受け取り、見つかったものだけを
+    `{引数: 結果}` で返すこと。キャッシュは 1 回の multi-get で参照し、無かった引数だけで
+    ラップ対象関数を 1 回呼び出して結果を `set_multi` で書き戻す。
+
+    Args:
+        region: 使用するキャッシュリージョン
+        key_func: 引数 1 件分のキャッシュキー生成関数またはテンプレート。最後の位置引数には
+            リストではなく 1 件分の引数が渡される
+        expiration_time: キャッシュ有効期限
+        session_attr: Session を保持する属性名
+        region_attr: Region を保持する属性名
+        stale_if_error: DB に接続できない場合、キャッシュに無かった引数の分を有効期限切れから
+            リージョンの `stale_if_error_time` 秒以内の値で代替する。1 件でも代替できなければ
+            例外をそのまま送出する
+
+    Returns:
+        キャッシュ機能付きデコレータ
+    """
+    session_resolver = SessionResolver(session_attr=session_attr)
+
+    def decorator(func: Callable[..., Mapping[K, T]]) -> Callable[..., dict[K, T]]:
+        generate_key = KeyGenerator.compile(key_func, func, session_attr=session_attr)
+        resolve_session = session_resolver.compile(func)
+
+        @wraps(func)
+        def wrapper(*args: Any) -> dict[K, T]:
+            cache_region = _resolve_region(region, args=args, region_attr=region_attr)
+            *leading_args, items = args
+            # 重複を除き、最初に現れた順で扱う。
+            unique_items: list[K] = list(dict.fromkeys(items))
+            if not unique_items:
+                return {}
+
+            session = resolve_session(args, {})
+            namespace = ""
+
+            def load(missing_items: list[K]) -> dict[K, T]:
+                started = perf_counter()
+                result = dict(func(*leading_args, missing_items))
+                if session is not None:
+                    # Session に紐づいた ORM オブジェクトのままキャッシュしない。
+                    session_resolver.expunge(session, list(result.values()))
+                if namespace:
+                    metrics.observe("generate_seconds", namespace, perf_counter() - started)
+                return result
+
+            cache_keys: dict[K, str] = {}
+            for item in unique_items:
+                cache_key = generate_key((*leading_args, item), {})
+                if isinstance(cache_key, VersionedCacheKey):
+                    raise TypeError("query_cache_multi does not support VersionedCacheKey")
+                cache_keys[item] = cache_key
+
+            found: dict[K, T] = {}
+            lookup_items = unique_items
+            if session is not None:
+                found, lookup_items = _get_transaction_values(
+                    session, cache_region, cache_keys, unique_items
+                )
+                if not lookup_items:
+                    return {item: found[item] for item in unique_items if item in found}
+                if has_pending_cache_invalidation(session, cache_region):
+                    # 無効化待ちがある間は共有キャッシュを読み書きせず、読み込んだ値は
+                    # transaction 内だけで再利用する。
+                    loaded = load(lookup_items)
+                    _set_transaction_values(session, cache_region, cache_keys, lookup_items, loaded)
+                    found.update(loaded)
+                    return {item: found[item] for item in unique_items if item in found}
+
+            cached: dict[K, T] = {}
+            cached_values = cache_region.get_multi(
+                [cache_keys[item] for item in lookup_items], expiration_time=expiration_time
             )
+            for item, value in zip(lookup_items, cached_values):
+                # 未存在の記録 (AbsentResult) は対象外とし、改めて問い合わせる。
+                if value is not NO_VALUE and not isinstance(value, AbsentResult):
+                    cached[item] = value
+            found.update(cached)
+
+            missing_items = [item for item in lookup_items if item not in cached]
+            namespace = metrics.key_namespace(cache_keys[unique_items[0]])
+            metrics.increment("hits", namespace, len(cached))
+            metrics.increment("misses", namespace, len(missing_items))
+            _logger.debug(
+                "Query cache multi HIT %d / MISS %d: %s",
+                len(cached),
+                len(missing_items),
+                func.__qualname__,
+            )
+            if missing_items:
+                try:
+                    loaded = load(missing_items)
+                except DATABASE_UNAVAILABLE_ERRORS:
+                    if not stale_if_error:
+                        raise
+                    stale = _get_last_known_values(
+                        cache_region, cache_keys, missing_items, expiration_time
+                    )
+                    if stale is None:
+                        raise
+                    _logger.warning(
+                        "Serving %d stale query cache values: %s", len(stale), func.__qualname__
+                    )
+                    metrics.increment("degraded", namespace, len(stale))
+                    _mark_degraded(session)
+                    found.update(stale)
+                    return {item: found[item] for item in unique_items if item in found}
+                cache_region.set_multi(
+                    {
+                        cache_keys[item]: value
+                        for item, value in loaded.items()
+                        if item in cache_keys
+                    }
+                )
+                cached.update(loaded)
+                found.update(loaded)
+            if session is not None and is_identity_map_enabled(session):
+                _set_transaction_values(session, cache_region, cache_keys, lookup_items, cached)
+            return {item: found[item] for item in unique_items if item in found}
 
         return wrapper
 
@@ -141,3 +444,217 @@ def _resolve_region(
         )
 
     return cast(_CacheRegionLike, resolved_region)
+
+
+def _transaction_cache_key(cache_key: str | VersionedCacheKey) -> str:
+    """
+    トランザクション内で値を保持するときのキーを返す。
+
+    version キーはトランザクション内では解決せず、version キー名そのものからキーを作る。
+    無効化予約のたびに保持した値を捨てるため、version を区別しなくても古い値は残らない。
+
+    Args:
+        cache_key: キャッシュキー
+
+    Returns:
+        トランザクション内で値を保持するキー
+    """
+    if isinstance(cache_key, VersionedCacheKey):
+        return cache_key.build(cache_key.version_keys)
+    return cache_key
+
+
+def _get_transaction_values(
+    session: Session,
+    region: _CacheRegionLike,
+    cache_keys: Mapping[K, str],
+    items: list[K],
+) -> tuple[dict[K, Any], list[K]]:
+    """
+    トランザクション内で保持した値を引数ごとに探す。
+
+    Args:
+        session: 対象セッション
+        region: 対象キャッシュリージョン
+        cache_keys: 引数とキャッシュキーの対応
+        items: 値を探す引数一覧
+
+    Returns:
+        見つかった引数と値の対応 (見つからなかった記録は含まない) と、保持していなかった引数一覧
+    """
+    found: dict[K, Any] = {}
+    missing_items: list[K] = []
+    for item in items:
+        value = get_transaction_cached_value(session, region, cache_keys[item])
+        if value is NO_VALUE:
+            missing_items.append(item)
+        elif not isinstance(value, AbsentResult):
+            found[item] = value
+    remembered = len(items) - len(missing_items)
+    if remembered:
+        metrics.increment(
+            "transaction_hits", metrics.key_namespace(cache_keys[items[0]]), remembered
+        )
+        record_avoided_lookups(session, remembered)
+    return found, missing_items
+
+
+def _set_transaction_values(
+    session: Session,
+    region: _CacheRegionLike,
+    cache_keys: Mapping[K, str],
+    items: list[K],
+    values: Mapping[K, Any],
+) -> None:
+    """
+    引数ごとの値を、現在のトランザクションが終わるまで保持する。
+
+    Args:
+        session: 対象セッション
+        region: 対象キャッシュリージョン
+        cache_keys: 引数とキャッシュキーの対応
+        items: 保持する引数一覧
+        values: 引数と値の対応。含まれない引数は見つからなかったものとして記録する
+    """
+    for item in items:
+        # 見つからなかった引数も記録し、同じトランザクション内で問い合わせ直さない。
+        value = values[item] if item in values else AbsentResult.from_error(LookupError())
+        set_transaction_cached_value(session, region, cache_keys[item], value)
+
+
+def _mark_degraded(session: Session | None) -> None:
+    """
+    古い値で代替したことをセッションへ記録し、リクエスト終了時に commit させない。
+
+    Args:
+        session: ラップ対象関数が使った Session
+    """
+    if session is not None:
+        mark_degraded_session(session)
+
+
+def _get_last_known_values(
+    region: _CacheRegionLike,
+    cache_keys: Mapping[K, str],
+    items: list[K],
+    expiration_time: float | None,
+) -> dict[K, Any] | None:
+    """
+    DB の代わりに返す、最後に保存された値を引数ごとに探す。
+
+    Args:
+        region: 対象キャッシュリージョン
+        cache_keys: 引数とキャッシュキーの対応
+        items: 値を探す引数一覧
+        expiration_time: キャッシュ有効期限
+
+    Returns:
+        引数と値の対応。未存在の記録だったものは含まない。1 件でも見つからなければ None
+    """
+    window = get_stale_if_error_time(region)
+    if window <= 0:
+        return None
+    values: dict[K, Any] = {}
+    ages: list[float] = []
+    for item in items:
+        last_known = get_last_known_value(region, [cache_keys[item]], expiration_time, window)
+        if last_known is None:
+            return None
+        _, value, age = last_known
+        ages.append(age)
+        if not isinstance(value, AbsentResult):
+            values[item] = value
+    record_stale_read(max(ages))
+    return values
+
+
+def _record_reverse_index(
+    region: _CacheRegionLike,
+    reverse_index: Callable[[Any], Iterable[str]] | None,
+    key: str,
+    value: Any,
+) -> None:
+    """
+    キャッシュキーを値に対応する逆引きインデックスへ登録する。
+
+    登録は冪等なため、他プロセスが作成済みの値を受け取った場合も登録してよい。
+
+    Args:
+        region: 対象キャッシュリージョン
+        reverse_index: 値から逆引きインデックスキーを返す関数
+        key: 登録するキャッシュキー
+        value: キャッシュ値
+    """
+    add_to_reverse_index = getattr(region, "add_to_reverse_index", None)
+    if reverse_index is None or add_to_reverse_index is None or isinstance(value, AbsentResult):
+        return
+    index_keys = list(reverse_index(value))
+    if index_keys:
+        add_to_reverse_index(index_keys, key)
+
+
+def _build_refresh(
+    region: _CacheRegionLike,
+    func: Callable[..., Any],
+    args: tuple[object, ...],
+    kwargs: dict[str, object],
+    session: Session | None,
+    session_resolver: SessionResolver,
+    session_attr: str,
+    expiration_time: float | None,
+    reverse_index: Callable[[Any], Iterable[str]] | None = None,
+    namespace: str = "",
+) -> Callable[[str], bool] | None:
+    """
+    キャッシュ値をバックグラウンドで再生成する関数を組み立てる。
+
+    リクエストの Session は別スレッドで使えないため、Session を使う処理は
+    `with_session` で新しい Session に載せ替えたインスタンスで実行する。
+
+    Args:
+        region: 対象キャッシュリージョン
+        func: ラップ対象関数
+        args: ラップ対象関数の位置引数
+        kwargs: ラップ対象関数のキーワード引数
+        session: ラップ対象関数が使う Session
+        session_resolver: Session 解決用ヘルパー
+        session_attr: Session を保持する属性名
+        expiration_time: キャッシュ有効期限
+        reverse_index: 値から逆引きインデックスキーを返す関数
+        namespace: 計測値を集計するキャッシュキーの namespace
+
+    Returns:
+        キャッシュキーを受け取り再生成を予約する関数。載せ替えできない場合は None
+    """
+    if session is None:
+
+        def create() -> Any:
+            return func(*args, **kwargs)
+
+    else:
+        owner = args[0] if args else None
+        if getattr(owner, session_attr, None) is not session or not hasattr(owner, "with_session"):
+            return None
+        rebindable = cast(_SessionRebindable, owner)
+        bind = session.get_bind()
+
+        def create() -> Any:
+            with Session(bind=bind) as refresh_session:
+                result = func(rebindable.with_session(refresh_session), *args[1:], **kwargs)
+                session_resolver.expunge(refresh_session, result)
+                return result
+
+    def refresh(key: str) -> bool:
+        def create_and_index() -> Any:
+            started = perf_counter()
+            value = create()
+            if namespace:
+                metrics.observe("generate_seconds", namespace, perf_counter() - started)
+            _record_reverse_index(region, reverse_index, key, value)
+            return value
+
+        return background_refresher.submit(
+            region, key, create_and_index, expiration_time=expiration_time
+        )
+
+    return refresh
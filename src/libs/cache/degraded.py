@@ -0,0 +1,207 @@
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Literal, Protocol
+
+from dogpile.cache.api import CachedValue
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+from ..log import get_logger
+
+_DEGRADED_SESSION_KEY = "bookmark.degraded_reads"
+_logger = get_logger()
+
+DATABASE_UNAVAILABLE_ERRORS: tuple[type[Exception], ...] = (OperationalError, PoolTimeoutError)
+"DB に接続できない (接続失敗・コネクションプール枯渇など) ことを表す例外"
+STALE_RESPONSE_HEADER = "X-Cache-Stale-Age"
+"DB の代わりに古いキャッシュ値で応答したとき、その値の経過秒数を載せるレスポンスヘッダ"
+
+
+class _DegradedRegionLike(Protocol):
+    """
+    縮退参照で必要な最小限のキャッシュリージョン操作を表す Protocol。
+    """
+
+    expiration_time: float | None
+
+    def get_value_metadata(
+        self,
+        key: str,
+        expiration_time: float | None = None,
+        ignore_expiration: bool = False,
+    ) -> CachedValue | None: ...
+
+    def get_or_create(
+        self,
+        key: str,
+        creator: Callable[[], Any],
+        expiration_time: float | None = None,
+    ) -> Any: ...
+
+
+class StaleReads:
+    """
+    1 リクエストの中で、DB の代わりに返した古いキャッシュ値を記録する。
+    """
+
+    def __init__(self) -> None:
+        self.max_age: float | None = None
+        "返した古い値のうち、最も古いものの経過秒数。返していなければ None"
+        self._lock = Lock()
+
+    def record(self, age: float) -> None:
+        """
+        古いキャッシュ値を返したことを記録する。
+
+        Args:
+            age: 返した値の保存からの経過秒数
+        """
+        with self._lock:
+            if self.max_age is None or age > self.max_age:
+                self.max_age = age
+
+
+_stale_reads: ContextVar[StaleReads | None] = ContextVar("query_cache_stale_reads", default=None)
+
+
+@contextmanager
+def collect_stale_reads() -> Iterator[StaleReads]:
+    """
+    ブロック内で DB の代わりに返した古いキャッシュ値を記録する。
+
+    記録先はコンテキスト変数で共有するため、ブロック内で起動したタスクやスレッドプールでの
+    処理 (同期エンドポイントなど) の分も記録される。
+
+    Yields:
+        記録先
+    """
+    reads = StaleReads()
+    token = _stale_reads.set(reads)
+    try:
+        yield reads
+    finally:
+        _stale_reads.reset(token)
+
+
+def mark_degraded_session(session: Session) -> None:
+    """
+    DB の代わりに古いキャッシュ値を返したセッションとして記録する。
+
+    transaction はその場では巻き戻さず、同じ transaction 内の以降の参照もそのまま続けられる。
+    記録したセッションは、リクエスト終了時に commit せず巻き戻す (`get_session`)。
+
+    Args:
+        session: 古い値を返した参照に使ったセッション
+    """
+    session.info[_DEGRADED_SESSION_KEY] = True
+
+
+def is_degraded_session(session: Session) -> bool:
+    """
+    セッションで DB の代わりに古いキャッシュ値を返したか判定する。
+
+    Args:
+        session: 対象セッション
+
+    Returns:
+        返していれば True
+    """
+    return bool(session.info.get(_DEGRADED_SESSION_KEY))
+
+
+def get_stale_if_error_time(region: object) -> float:
+    """
+    リージョンで DB 障害時に古い値を返してよい秒数を返す。
+
+    Args:
+        region: 対象キャッシュリージョン
+
+    Returns:
+        有効期限切れから古い値を返してよい秒数。縮退参照に対応しないリージョンでは 0
+    """
+    return float(getattr(region, "stale_if_error_time", 0) or 0)
+
+
+def record_stale_read(age: float) -> None:
+    """
+    DB の代わりに古いキャッシュ値を返したことを、`collect_stale_reads` の記録先へ残す。
+
+    Args:
+        age: 返した値の保存からの経過秒数
+    """
+    reads = _stale_reads.get()
+    if reads is not None:
+        reads.record(age)
+
+
+def get_last_known_value(
+    region: _DegradedRegionLike,
+    keys: Sequence[str],
+    expiration_time: float | None,
+    window: float,
+) -> tuple[str, Any, float] | None:
+    """
+    DB の代わりに返す、最後に保存された値を探す。
+
+    Args:
+        region: 対象キャッシュリージョン
+        keys: 候補のキャッシュキー一覧。先頭から順に探す
+        expiration_time: キャッシュ有効期限。None ならリージョンの既定値
+        window: 有効期限切れから古い値を返してよい秒数
+
+    Returns:
+        見つかったキャッシュキー、値、保存からの経過秒数の組。どれも無いか古すぎれば None
+    """
+    if expiration_time is None:
+        expiration_time = region.expiration_time
+    for key in keys:
+        metadata = region.get_value_metadata(key, ignore_expiration=True)
+        if metadata is None:
+            continue
+        if expiration_time is not None and metadata.age > expiration_time + window:
+            continue
+        return key, metadata.payload, metadata.age
+    return None
+
+
+def get_or_create_degradable(
+    region: _DegradedRegionLike,
+    key: str,
+    creator: Callable[[], Any],
+    expiration_time: float | None = None,
+    fallback_keys: Sequence[str] = (),
+) -> tuple[Literal["MISS", "DEGRADED"], str, Any]:
+    """
+    キャッシュ値を取得・生成し、DB に接続できなければ最後に保存された値を返す。
+
+    Args:
+        region: 対象キャッシュリージョン
+        key: キャッシュキー
+        creator: キャッシュミス時に値を生成する関数
+        expiration_time: キャッシュ有効期限
+        fallback_keys: `key` に値が無い場合に探す、以前の version のキャッシュキー一覧
+
+    Returns:
+        参照結果 (MISS / DEGRADED)、値を取得したキャッシュキー、値の組
+
+    Raises:
+        OperationalError, TimeoutError: DB に接続できず、返せる古い値も無い
+    """
+    try:
+        return "MISS", key, region.get_or_create(key, creator, expiration_time=expiration_time)
+    except DATABASE_UNAVAILABLE_ERRORS as exc:
+        window = get_stale_if_error_time(region)
+        last_known = (
+            get_last_known_value(region, [key, *fallback_keys], expiration_time, window)
+            if window > 0
+            else None
+        )
+        if last_known is None:
+            raise
+        stale_key, value, age = last_known
+        record_stale_read(age)
+        _logger.warning("Serving stale query cache %s: %s", stale_key, exc)
+        return "DEGRADED", stale_key, value
@@ -0,0 +1,356 @@
+from collections.abc import Iterable, Mapping
+from threading import Lock
+from time import monotonic
+from typing import Protocol
+
+import zstandard as zstd
+from redis import Redis, RedisCluster
+from redis.exceptions import RedisError
+
+from ..log import get_logger
+
+_logger = get_logger()
+_DEFAULT_KEY_PREFIX = "bookmark:query-cache:zstd-dict"
+# zstd の仕様で 0〜32767 は登録済み辞書用に予約されているため、それ以降の ID を採番する。
+_MIN_USER_DICT_ID = 32768
+_DEFAULT_DICTIONARY_HISTORY = 3
+
+DEFAULT_DICTIONARY_NAMESPACES: Mapping[str, str] = {
+    "bookmark:detail:": "bookmark-detail",
+    "bookmark:list:": "bookmark-list",
+    "user:": "user",
+}
+"キャッシュキーの prefix と辞書 namespace の対応"
+
+
+class ZstdDictionarySource(Protocol):
+    """
+    学習済み辞書の取得元を表す Protocol。
+    """
+
+    def load_current(self) -> dict[str, int]: ...
+
+    def load(self, dict_id: int) -> bytes | None: ...
+
+
+class ZstdDictionaryStore:
+    """
+    学習済み zstd 辞書を Redis 上でバージョン管理する。
+
+    辞書本体は辞書 ID ごとに保持し、namespace ごとの現行 ID と履歴を別キーで管理する。
+    旧 ID で圧縮されたエントリを読めるよう、直近の履歴分の辞書は残しておく。
+    """
+
+    def __init__(self, client: Redis | RedisCluster, key_prefix: str = _DEFAULT_KEY_PREFIX) -> None:
+        """
+        辞書ストアを初期化する。
+
+        Args:
+            client: 辞書の保存先 Redis クライアント
+            key_prefix: 辞書管理用キーの prefix
+        """
+        self._client = client
+        self._dictionaries_key = f"{key_prefix}:dicts"
+        self._current_key = f"{key_prefix}:current"
+        self._sequence_key = f"{key_prefix}:seq"
+        self._history_key_prefix = f"{key_prefix}:history"
+
+    def load_current(self) -> dict[str, int]:
+        """
+        namespace ごとの現行辞書 ID を取得する。
+
+        Returns:
+            namespace と辞書 ID の対応
+        """
+        current = self._client.hgetall(self._current_key)
+        return {_decode(namespace): int(dict_id) for namespace, dict_id in current.items()}
+
+    def load(self, dict_id: int) -> bytes | None:
+        """
+        辞書本体を取得する。
+
+        Args:
+            dict_id: 辞書 ID
+
+        Returns:
+            辞書のバイト列。未登録なら None
+        """
+        dictionary = self._client.hget(self._dictionaries_key, str(dict_id))
+        return None if dictionary is None else _encode(dictionary)
+
+    def next_dict_id(self) -> int:
+        """
+        新しい辞書 ID を採番する。
+
+        Returns:
+            全 namespace で一意な辞書 ID
+        """
+        return _MIN_USER_DICT_ID + int(self._client.incr(self._sequence_key))
+
+    def save(
+        self,
+        namespace: str,
+        dictionary: zstd.ZstdCompressionDict,
+        keep: int = _DEFAULT_DICTIONARY_HISTORY,
+    ) -> list[int]:
+        """
+        辞書を保存して namespace の現行辞書に切り替え、古い履歴を削除する。
+
+        Args:
+            namespace: 辞書 namespace
+            dictionary: 保存する辞書
+            keep: 保持する辞書の世代数 (現行辞書を含む)
+
+        Returns:
+            削除した辞書 ID 一覧
+        """
+        dict_id = dictionary.dict_id()
+        history_key = f"{self._history_key_prefix}:{namespace}"
+        pipe = self._client.pipeline()
+        pipe.hset(self._dictionaries_key, str(dict_id), dictionary.as_bytes())
+        pipe.hset(self._current_key, namespace, str(dict_id))
+        pipe.lpush(history_key, str(dict_id))
+        pipe.lrange(history_key, max(1, keep), -1)
+        pipe.ltrim(history_key, 0, max(1, keep) - 1)
+        expired = [int(value) for value in pipe.execute()[3]]
+        if expired:
+            self._client.hdel(self._dictionaries_key, *(str(value) for value in expired))
+        return expired
+
+
+class ZstdDictionaryCodec:
+    """
+    キャッシュキーの namespace に応じた辞書で zstd 圧縮・展開を行う。
+
+    展開時は zstd フレームに記録された辞書 ID から辞書を選ぶため、
+    辞書の切り替え前に書き込まれたエントリも TTL 切れまで読み出せる。
+    """
+
+    def __init__(
+        self,
+        level: int,
+        namespaces: Mapping[str, str] | None = None,
+        source: ZstdDictionarySource | None = None,
+        refresh_interval: float = 0,
+    ) -> None:
+        """
+        コーデックを初期化する。
+
+        Args:
+            level: zstd 圧縮レベル
+            namespaces: キャッシュキーの prefix と辞書 namespace の対応
+            source: 学習済み辞書の取得元。None なら `install` した辞書だけを使う
+            refresh_interval: 取得元から現行辞書を再読み込みする間隔秒数
+        """
+        self._level = level
+        # 長い prefix を優先して照合する。
+        self._namespaces = sorted(
+            (namespaces or {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
+        self._source = source
+        self._refresh_interval = refresh_interval
+        self._next_refresh_at = 0.0
+        self._default_compressor = zstd.ZstdCompressor(level=level)
+        self._default_decompressor = zstd.ZstdDecompressor()
+        self._compressors: dict[str, zstd.ZstdCompressor] = {}
+        self._current_dict_ids: dict[str, int] = {}
+        self._decompressors: dict[int, zstd.ZstdDecompressor] = {}
+        self._unknown_dict_ids: set[int] = set()
+        self._lock = Lock()
+
+    def install(self, namespace: str, dictionary: bytes) -> int:
+        """
+        namespace の現行辞書を登録する。
+
+        Args:
+            namespace: 辞書 namespace
+            dictionary: 辞書のバイト列
+
+        Returns:
+            登録した辞書 ID
+        """
+        compression_dict = self._register(dictionary)
+        compression_dict.precompute_compress(level=self._level)
+        compressor = zstd.ZstdCompressor(level=self._level, dict_data=compression_dict)
+        dict_id = compression_dict.dict_id()
+        with self._lock:
+            self._compressors[namespace] = compressor
+            self._current_dict_ids[namespace] = dict_id
+        return dict_id
+
+    def compress(self, key: str, data: bytes) -> bytes:
+        """
+        キーの namespace に対応する辞書でデータを圧縮する。
+
+        Args:
+            key: キャッシュキー
+            data: 圧縮対象のバイト列
+
+        Returns:
+            圧縮済みバイト列
+        """
+        self._refresh_if_due()
+        namespace = self.namespace_of(key)
+        compressor = self._compressors.get(namespace) if namespace else None
+        return (compressor or self._default_compressor).compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        フレームの辞書 ID に対応する辞書でデータを展開する。
+
+        Args:
+            data: 圧縮済みバイト列
+
+        Returns:
+            展開したバイト列
+
+        Raises:
+            zstd.ZstdError: zstd フレームとして不正、または辞書が見つからない
+        """
+        dict_id = zstd.get_frame_parameters(data).dict_id
+        if dict_id == 0:
+            return self._default_decompressor.decompress(data)
+
+        decompressor = self._decompressors.get(dict_id) or self._load_decompressor(dict_id)
+        if decompressor is None:
+            raise zstd.ZstdError(f"unknown zstd dictionary id: {dict_id}")
+        return decompressor.decompress(data)
+
+    def namespace_of(self, key: str) -> str | None:
+        """
+        キャッシュキーが属する辞書 namespace を返す。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            辞書 namespace。どの prefix にも一致しなければ None
+        """
+        for prefix, namespace in self._namespaces:
+            if key.startswith(prefix):
+                return namespace
+        return None
+
+    def refresh(self) -> None:
+        """
+        取得元から namespace ごとの現行辞書を読み込み直す。
+        """
+        if self._source is None:
+            return
+        try:
+            current = self._source.load_current()
+            for namespace, dict_id in current.items():
+                if self._current_dict_ids.get(namespace) == dict_id:
+                    continue
+                dictionary = self._source.load(dict_id)
+                if dictionary is not None:
+                    self.install(namespace, dictionary)
+        except RedisError as exc:
+            # 辞書を読めない間も辞書なし圧縮で動作を継続する。
+            _logger.warning("Failed to load query cache zstd dictionaries: %s", exc)
+        with self._lock:
+            self._unknown_dict_ids.clear()
+
+    def _refresh_if_due(self) -> None:
+        """
+        再読み込み間隔を過ぎていれば現行辞書を読み込み直す。
+        """
+        if self._source is None or self._refresh_interval <= 0:
+            return
+        now = monotonic()
+        with self._lock:
+            if now < self._next_refresh_at:
+                return
+            self._next_refresh_at = now + self._refresh_interval
+        self.refresh()
+
+    def _load_decompressor(self, dict_id: int) -> zstd.ZstdDecompressor | None:
+        """
+        未読み込みの辞書 ID を取得元から読み込む。
+
+        Args:
+            dict_id: 辞書 ID
+
+        Returns:
+            展開器。取得できなければ None
+        """
+        if self._source is None or dict_id in self._unknown_dict_ids:
+            return None
+        try:
+            dictionary = self._source.load(dict_id)
+        except RedisError as exc:
+            _logger.warning("Failed to load query cache zstd dictionary %s: %s", dict_id, exc)
+            return None
+        if dictionary is None:
+            # 削除済みの辞書は次回の再読み込みまで問い合わせない。
+            with self._lock:
+                self._unknown_dict_ids.add(dict_id)
+            return None
+        self._register(dictionary)
+        return self._decompressors.get(dict_id)
+
+    def _register(self, dictionary: bytes) -> zstd.ZstdCompressionDict:
+        """
+        辞書を展開用に登録する。
+
+        Args:
+            dictionary: 辞書のバイト列
+
+        Returns:
+            読み込んだ辞書
+        """
+        compression_dict = zstd.ZstdCompressionDict(dictionary)
+        decompressor = zstd.ZstdDecompressor(dict_data=compression_dict)
+        with self._lock:
+            self._decompressors[compression_dict.dict_id()] = decompressor
+        return compression_dict
+
+
+def train_dictionary(
+    samples: Iterable[bytes],
+    dict_id: int,
+    dict_size: int,
+    level: int,
+) -> zstd.ZstdCompressionDict:
+    """
+    サンプルから zstd 辞書を学習する。
+
+    Args:
+        samples: 学習に使う非圧縮データ一覧
+        dict_id: 付与する辞書 ID
+        dict_size: 辞書の最大バイト数
+        level: 学習時に想定する圧縮レベル
+
+    Returns:
+        学習した辞書
+
+    Raises:
+        zstd.ZstdError: サンプル不足などで学習できない
+    """
+    return zstd.train_dictionary(dict_size, list(samples), dict_id=dict_id, level=level)
+
+
+def _decode(value: bytes | str) -> str:
+    """
+    Redis の応答を文字列に変換する。
+
+    Args:
+        value: Redis から取得した値
+
+    Returns:
+        文字列
+    """
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _encode(value: bytes | str) -> bytes:
+    """
+    Redis の応答をバイト列に変換する。
+
+    Args:
+        value: Redis から取得した値
+
+    Returns:
+        バイト列
+    """
+    return value.encode() if isinstance(value, str) else value
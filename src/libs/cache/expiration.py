@@ -0,0 +1,91 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
+from math import log
+from random import random
+
+
+@dataclass(frozen=True)
+class ExpirationPolicy:
+    """
+    キャッシュ値の有効期限の扱いを表す設定。
+    """
+
+    jitter: float = 0.0
+    "保存ごとに有効期限を短くする割合の上限 (0〜1)。0 なら全エントリ同じ有効期限"
+    early_refresh_beta: float = 0.0
+    "有効期限前に確率的に作り直す度合い (XFetch の β)。0 なら期限前に作り直さない"
+
+    def jitter_seconds(self, expiration_time: float | None) -> float:
+        """
+        保存する値の有効期限を短くする秒数を乱数で決める。
+
+        Args:
+            expiration_time: 保存時の有効期限秒数。None または負なら無期限
+
+        Returns:
+            0 以上 `expiration_time * jitter` 未満の秒数
+        """
+        if self.jitter <= 0 or expiration_time is None or expiration_time <= 0:
+            return 0.0
+        # 有効期限を分散させるための乱数で、推測されても問題ないため暗号用の乱数は使わない。
+        return expiration_time * min(self.jitter, 1.0) * random()  # nosec B311
+
+    def early_expiration_seconds(self, recompute_seconds: float) -> float:
+        """
+        参照ごとに、有効期限をどれだけ前倒しで切れたものとみなすかを乱数で決める。
+
+        XFetch と同じく `再生成にかかった秒数 × β × -ln(U)` とし、U は (0, 1] の一様乱数とする。
+        期限が近いほど、また再生成が重いほど、期限前に作り直す確率が上がる。
+
+        Args:
+            recompute_seconds: 値の生成にかかった秒数
+
+        Returns:
+            前倒しする秒数
+        """
+        if self.early_refresh_beta <= 0 or recompute_seconds <= 0:
+            return 0.0
+        # 再生成の時期を分散させるための乱数で、推測されても問題ないため暗号用の乱数は使わない。
+        return recompute_seconds * self.early_refresh_beta * -log(1.0 - random())  # nosec B311
+
+
+class ExpirationPolicies:
+    """
+    キャッシュキーの prefix ごとの有効期限設定。
+    """
+
+    def __init__(self, policies: Mapping[str, ExpirationPolicy] | None = None) -> None:
+        """
+        prefix と設定の対応を保持する。
+
+        Args:
+            policies: キャッシュキーの prefix と設定の対応。prefix `""` はすべてのキーに一致する
+        """
+        # 長い prefix を優先して一致させる。
+        self._policies = sorted(
+            (policies or {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
+        self._enabled = any(
+            policy.jitter > 0 or policy.early_refresh_beta > 0 for _, policy in self._policies
+        )
+
+    def __bool__(self) -> bool:
+        return self._enabled
+
+    def of(self, key: str) -> ExpirationPolicy:
+        """
+        キャッシュキーに適用する設定を返す。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            最も長く一致した prefix の設定。どれにも一致しなければ何もしない設定
+        """
+        for prefix, policy in self._policies:
+            if key.startswith(prefix):
+                return policy
+        return _NO_POLICY
+
+
+_NO_POLICY = ExpirationPolicy()
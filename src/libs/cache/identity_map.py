@@ -0,0 +1,119 @@
+from collections.abc import Callable, Hashable
+from typing import Any, TypeVar
+
+from sqlalchemy.orm import Session
+
+from ..log import get_logger
+from . import metrics
+
+_ENABLED_SESSION_KEY = "bookmark.request_identity_map"
+_LOOKUPS_SESSION_KEY = "bookmark.request_lookups"
+_AVOIDED_LOOKUPS_SESSION_KEY = "bookmark.avoided_lookups"
+_logger = get_logger()
+
+T = TypeVar("T")
+
+
+def enable_identity_map(session: Session) -> None:
+    """
+    セッション内で同じリポジトリ・DAO の参照を 1 回にまとめる。
+
+    リクエストごとに作るセッションで有効にする。有効にしたセッションでは、`query_cache` の
+    参照結果と `memoize_lookup` の取得結果を、commit・rollback または書き込みまで再利用する。
+
+    Args:
+        session: 対象セッション
+    """
+    session.info[_ENABLED_SESSION_KEY] = True
+
+
+def is_identity_map_enabled(session: Session) -> bool:
+    """
+    セッションで参照の再利用が有効か判定する。
+
+    Args:
+        session: 対象セッション
+
+    Returns:
+        有効なら True
+    """
+    return bool(session.info.get(_ENABLED_SESSION_KEY))
+
+
+def memoize_lookup(session: Session, key: Hashable, loader: Callable[[], T | None]) -> T | None:
+    """
+    セッション内で同じ条件の 1 件取得を 1 回の問い合わせにまとめる。
+
+    `enable_identity_map` で有効にしたセッションだけが対象で、それ以外では毎回問い合わせる。
+    見つからなかった結果は記録しない (保存せずに追加された行を取りこぼさないため)。
+    記録は `clear_lookups` のほか、commit と rollback でも捨てる。
+
+    Args:
+        session: 対象セッション
+        key: 取得条件を表すキー
+        loader: 記録が無い場合に問い合わせる関数
+
+    Returns:
+        取得結果
+    """
+    if not is_identity_map_enabled(session):
+        return loader()
+    lookups: dict[Hashable, Any] = session.info.setdefault(_LOOKUPS_SESSION_KEY, {})
+    if key in lookups:
+        record_avoided_lookups(session)
+        return lookups[key]
+    value = loader()
+    if value is not None:
+        lookups[key] = value
+    return value
+
+
+def clear_lookups(session: Session) -> None:
+    """
+    `memoize_lookup` で記録した取得結果をすべて捨てる。
+
+    Args:
+        session: 対象セッション
+    """
+    session.info.pop(_LOOKUPS_SESSION_KEY, None)
+
+
+def record_avoided_lookups(session: Session, count: int = 1) -> None:
+    """
+    セッション内の記録を使って省いた問い合わせ (DB・キャッシュ) の件数を加算する。
+
+    Args:
+        session: 対象セッション
+        count: 省いた件数
+    """
+    session.info[_AVOIDED_LOOKUPS_SESSION_KEY] = get_avoided_lookups(session) + count
+
+
+def get_avoided_lookups(session: Session) -> int:
+    """
+    セッション内の記録を使って省いた問い合わせの件数を返す。
+
+    Args:
+        session: 対象セッション
+
+    Returns:
+        省いた件数
+    """
+    return int(session.info.get(_AVOIDED_LOOKUPS_SESSION_KEY, 0))
+
+
+def report_avoided_lookups(session: Session) -> int:
+    """
+    リクエスト終了時に、省いた問い合わせの件数を計測値 `avoided_lookups` として出力する。
+
+    Args:
+        session: リクエストで使ったセッション
+
+    Returns:
+        省いた件数
+    """
+    avoided = get_avoided_lookups(session)
+    metrics.observe("avoided_lookups", "request", avoided)
+    if avoided:
+        _logger.debug("Request avoided %d repeated lookups", avoided)
+    return avoided
@@ -1,14 +1,24 @@
+from collections.abc import Callable, Iterable
 from dataclasses import dataclass, field
 from threading import Lock
+from time import monotonic, time, time_ns
 from typing import Any, Protocol
 from uuid import uuid4
 
+from dogpile.cache.api import NO_VALUE
 from sqlalchemy import event
 from sqlalchemy.orm import Session
 
+from ..log import get_logger
+from .identity_map import clear_lookups
+
 _PENDING_INVALIDATIONS_SESSION_KEY = "bookmark.pending_cache_invalidations"
+_PENDING_REGIONS_SESSION_KEY = "bookmark.pending_cache_invalidation_regions"
+_TRANSACTION_CACHE_SESSION_KEY = "bookmark.transaction_query_cache"
+_COMMITTED_VERSION_BUMPS_SESSION_KEY = "bookmark.committed_cache_version_bumps"
 _LISTENERS_INSTALLED = False
 _LISTENERS_LOCK = Lock()
+_logger = get_logger()
 
 
 class _CacheRegionLike(Protocol):
@@ -21,6 +31,31 @@ class _CacheRegionLike(Protocol):
     def delete(self, key: str) -> None: ...
 
 
+@dataclass
+class InvalidationStats:
+    """
+    commit 後のキャッシュ無効化の実行状況を表すカウンタ。
+    """
+
+    commits: int = 0
+    "無効化を実行した commit 数"
+    deleted_keys: int = 0
+    "削除したキャッシュキー数"
+    bumped_versions: int = 0
+    "更新した version 管理キー数"
+    total_seconds: float = 0.0
+    "無効化にかかった合計秒数"
+    max_seconds: float = 0.0
+    "1 commit あたりの最長秒数"
+
+
+_stats = InvalidationStats()
+_stats_lock = Lock()
+_version_bump_listeners: list[Callable[[], object]] = []
+"commit 後の無効化で version を更新したときに呼ぶ関数の一覧"
+_version_bump_listeners_lock = Lock()
+
+
 @dataclass
 class _PendingInvalidation:
     """
@@ -30,6 +65,10 @@ class _PendingInvalidation:
     region: _CacheRegionLike
     keys: set[str] = field(default_factory=set)
     version_keys: set[str] = field(default_factory=set)
+    index_keys: set[str] = field(default_factory=set)
+
+    def __bool__(self) -> bool:
+        return bool(self.keys or self.version_keys or self.index_keys)
 
 
 @dataclass
@@ -42,14 +81,45 @@ class _PendingTransactionInvalidation:
     pending_by_region: dict[int, _PendingInvalidation] = field(default_factory=dict)
 
 
+@dataclass
+class _TransactionCache:
+    """
+    1 つのトランザクション内で参照したキャッシュ値を保持するデータ。
+    """
+
+    parent_key: int | None
+    values: dict[tuple[int, str], Any] = field(default_factory=dict)
+
+
 def new_cache_version() -> str:
     """
     キャッシュバージョン用の一意なトークンを生成する。
 
+    先頭に発行時刻 (ミリ秒の 16 進数) を含める。
+
     Returns:
         新しいバージョン文字列
     """
-    return uuid4().hex
+    return f"{time_ns() // 1_000_000:x}-{uuid4().hex}"
+
+
+def cache_version_age(version: str) -> float | None:
+    """
+    キャッシュバージョンが発行されてからの経過秒数を返す。
+
+    Args:
+        version: `new_cache_version` で生成したバージョン文字列
+
+    Returns:
+        経過秒数。発行時刻を含まない形式なら None
+    """
+    issued_at, separator, _ = version.partition("-")
+    if not separator:
+        return None
+    try:
+        return time() - int(issued_at, 16) / 1000
+    except ValueError:
+        return None
 
 
 def schedule_cache_key_deletes(
@@ -67,6 +137,8 @@ def schedule_cache_key_deletes(
     """
     pending = _get_pending_invalidation(session, region)
     pending.keys.update(keys)
+    _mark_pending_region(session, region, pending)
+    _clear_transaction_cache(session, region)
 
 
 def schedule_cache_version_bumps(
@@ -84,6 +156,27 @@ def schedule_cache_version_bumps(
     """
     pending = _get_pending_invalidation(session, region)
     pending.version_keys.update(version_keys)
+    _mark_pending_region(session, region, pending)
+    _clear_transaction_cache(session, region)
+
+
+def schedule_cache_index_deletes(
+    session: Session,
+    region: _CacheRegionLike,
+    *index_keys: str,
+) -> None:
+    """
+    commit 完了後に実行する、逆引きインデックスに登録されたキャッシュキーの削除を予約する。
+
+    Args:
+        session: 対象セッション
+        region: 削除対象のキャッシュリージョン
+        index_keys: 対象の逆引きインデックスキー一覧
+    """
+    pending = _get_pending_invalidation(session, region)
+    pending.index_keys.update(index_keys)
+    _mark_pending_region(session, region, pending)
+    _clear_transaction_cache(session, region)
 
 
 def has_pending_cache_invalidation(
@@ -103,23 +196,83 @@ def has_pending_cache_invalidation(
     if session is None:
         return False
 
-    pending_by_transaction = _get_pending_invalidations(session)
-    if region is None:
-        return any(
-            pending.keys or pending.version_keys
-            for transaction_pending in pending_by_transaction.values()
-            for pending in transaction_pending.pending_by_region.values()
-        )
+    # 予約時に記録したリージョンの集合だけを見て、トランザクションを走査しない。
+    pending_regions = session.info.get(_PENDING_REGIONS_SESSION_KEY)
+    if not pending_regions:
+        return False
+    return region is None or id(region) in pending_regions
 
-    region_key = id(region)
-    return any(
-        region_key in transaction_pending.pending_by_region
-        and bool(
-            transaction_pending.pending_by_region[region_key].keys
-            or transaction_pending.pending_by_region[region_key].version_keys
-        )
-        for transaction_pending in pending_by_transaction.values()
+
+def has_committed_version_bump(
+    session: Session | None,
+    region: object,
+    version_keys: Iterable[str],
+) -> bool:
+    """
+    セッションの commit で更新した version 管理キーを含むか判定する。
+
+    自分の書き込みで進めた version では、古い version の値を返さずに作り直させるために使う。
+
+    Args:
+        session: 判定対象のセッション
+        region: 対象キャッシュリージョン
+        version_keys: version 管理キー一覧
+
+    Returns:
+        1 つでも更新済みなら True
+    """
+    if session is None:
+        return False
+    bumped = session.info.get(_COMMITTED_VERSION_BUMPS_SESSION_KEY)
+    if not bumped:
+        return False
+    return any((id(region), version_key) in bumped for version_key in version_keys)
+
+
+def get_transaction_cached_value(session: Session, region: object, key: str) -> Any:
+    """
+    現在のトランザクション (nested transaction なら外側を含む) で保持した値を返す。
+
+    Args:
+        session: 対象セッション
+        region: 対象キャッシュリージョン
+        key: キャッシュキー
+
+    Returns:
+        保持した値。無ければ `NO_VALUE`
+    """
+    caches: dict[int, _TransactionCache] = session.info.get(_TRANSACTION_CACHE_SESSION_KEY, {})
+    transaction = _get_current_transaction(session)
+    while transaction is not None:
+        cache = caches.get(id(transaction))
+        if cache is not None and (id(region), key) in cache.values:
+            return cache.values[(id(region), key)]
+        transaction = getattr(transaction, "parent", None)
+    return NO_VALUE
+
+
+def set_transaction_cached_value(session: Session, region: object, key: str, value: Any) -> None:
+    """
+    参照した値を、現在のトランザクションが終わるまで保持する。
+
+    値は commit で捨て、rollback では rollback したトランザクション配下の分だけを捨てる。
+    同じリージョンへ新たに無効化を予約した場合も、そのリージョンの値をすべて捨てる。
+
+    Args:
+        session: 対象セッション
+        region: 対象キャッシュリージョン
+        key: キャッシュキー
+        value: 保持する値
+    """
+    transaction = _get_current_transaction(session)
+    if transaction is None:
+        return
+    parent = getattr(transaction, "parent", None)
+    caches = session.info.setdefault(_TRANSACTION_CACHE_SESSION_KEY, {})
+    cache = caches.setdefault(
+        id(transaction), _TransactionCache(parent_key=id(parent) if parent is not None else None)
     )
+    cache.values[(id(region), key)] = value
 
 
 def install_session_cache_invalidation_listeners() -> None:
@@ -136,32 +289,154 @@ def install_session_cache_invalidation_listeners() -> None:
         _LISTENERS_INSTALLED = True
 
 
+def add_version_bump_listener(listener: Callable[[], object]) -> None:
+    """
+    commit 後の無効化で version を更新したときに呼ぶ関数を登録する。
+
+    関数は commit したスレッドで呼ぶため、時間のかかる処理は関数の中で別スレッドへ渡す。
+    登録済みの関数は重ねて登録しない。
+
+    Args:
+        listener: 引数なしで呼ぶ関数
+    """
+    with _version_bump_listeners_lock:
+        if listener not in _version_bump_listeners:
+            _version_bump_listeners.append(listener)
+
+
+def remove_version_bump_listener(listener: Callable[[], object]) -> None:
+    """
+    `add_version_bump_listener` で登録した関数を外す。未登録なら何もしない。
+
+    Args:
+        listener: 登録した関数
+    """
+    with _version_bump_listeners_lock:
+        if listener in _version_bump_listeners:
+            _version_bump_listeners.remove(listener)
+
+
+def get_invalidation_stats() -> InvalidationStats:
+    """
+    commit 後のキャッシュ無効化の実行状況を返す。
+
+    Returns:
+        無効化の実行状況のカウンタ
+    """
+    return _stats
+
+
 def _after_commit(session: Session) -> None:
     """
     commit 完了後に予約済みのキャッシュ無効化を実行する。
 
+    リージョンごとに削除と version 更新を 1 回の操作にまとめ、かかった時間を記録する。
+
     Args:
         session: commit 済みセッション
     """
+    session.info.pop(_TRANSACTION_CACHE_SESSION_KEY, None)
+    clear_lookups(session)
     pending_by_transaction = _pop_pending_invalidations(session)
     pending_by_region = _merge_pending_invalidations(pending_by_transaction)
+    if not pending_by_region:
+        return
+
+    started = monotonic()
+    deleted_keys = 0
+    bumped_versions = 0
     for pending in pending_by_region.values():
-        region = pending.region
-        for key in pending.keys:
-            region.delete(key)
-        for version_key in pending.version_keys:
-            region.set(version_key, new_cache_version())
+        versions = {version_key: new_cache_version() for version_key in pending.version_keys}
+        _apply_invalidation(pending.region, pending.keys, versions, pending.index_keys)
+        if versions:
+            bumped = session.info.setdefault(_COMMITTED_VERSION_BUMPS_SESSION_KEY, set())
+            bumped.update((id(pending.region), version_key) for version_key in versions)
+        deleted_keys += len(pending.keys)
+        bumped_versions += len(versions)
+
+    elapsed = monotonic() - started
+    with _stats_lock:
+        _stats.commits += 1
+        _stats.deleted_keys += deleted_keys
+        _stats.bumped_versions += bumped_versions
+        _stats.total_seconds += elapsed
+        _stats.max_seconds = max(_stats.max_seconds, elapsed)
+    _logger.debug(
+        "Query cache invalidation took %.3fms: %d keys, %d versions",
+        elapsed * 1000,
+        deleted_keys,
+        bumped_versions,
+    )
+    if bumped_versions:
+        _notify_version_bump_listeners()
+
+
+def _notify_version_bump_listeners() -> None:
+    """
+    version 更新を登録済みの関数へ知らせる。関数の失敗は警告ログに記録して続ける。
+    """
+    with _version_bump_listeners_lock:
+        listeners = list(_version_bump_listeners)
+    for listener in listeners:
+        try:
+            listener()
+        except Exception as exc:
+            _logger.warning("Query cache version bump listener failed: %s", exc)
+
+
+def _apply_invalidation(
+    region: _CacheRegionLike, keys: set[str], versions: dict[str, str], index_keys: set[str]
+) -> None:
+    """
+    1 つのリージョンへ削除と version 更新を反映する。
+
+    Args:
+        region: 対象キャッシュリージョン
+        keys: 削除するキャッシュキー一覧
+        versions: version 管理キーと新しい version 値の対応
+        index_keys: 登録されたキャッシュキーも削除する逆引きインデックスキー一覧
+    """
+    apply = getattr(region, "apply_invalidation", None)
+    if apply is not None:
+        # 削除・version 更新・他プロセスへの通知をリージョン側でまとめて送る。
+        apply(keys, versions, index_keys)
+        return
+
+    # apply_invalidation を持たないリージョンは逆引きインデックスへの登録も行わない。
+
+    for key in keys:
+        region.delete(key)
+    for version_key, version in versions.items():
+        region.set(version_key, version)
+    _publish_invalidation(region, keys | set(versions))
+
+
+def _publish_invalidation(region: _CacheRegionLike, keys: set[str]) -> None:
+    """
+    リージョンがプロセス内キャッシュを持つ場合、他プロセスへ無効化を通知する。
+
+    Args:
+        region: 無効化したキャッシュリージョン
+        keys: 削除または version 更新したキャッシュキー一覧
+    """
+    publish = getattr(region, "publish_invalidation", None)
+    if publish is not None and keys:
+        publish(keys)
 
 
 def _after_soft_rollback(session: Session, previous_transaction: object) -> None:
     """
-    rollback 後に予約済みのキャッシュ無効化を破棄する。
+    rollback 後に予約済みのキャッシュ無効化と、トランザクション内で保持した値を破棄する。
+
+    `memoize_lookup` の記録は、どのトランザクションで取得したか区別しないためすべて捨てる。
 
     Args:
         session: rollback 済みセッション
         previous_transaction: rollback 対象のトランザクション
     """
     _discard_pending_invalidations(session, previous_transaction)
+    _discard_transaction_caches(session, previous_transaction)
+    clear_lookups(session)
 
 
 def _get_pending_invalidations(session: Session) -> dict[int, _PendingTransactionInvalidation]:
@@ -212,6 +487,21 @@ def _get_pending_invalidation(
     return pending_by_region[region_key]
 
 
+def _mark_pending_region(
+    session: Session, region: _CacheRegionLike, pending: _PendingInvalidation
+) -> None:
+    """
+    無効化を予約したリージョンを記録する。
+
+    Args:
+        session: 対象セッション
+        region: 対象キャッシュリージョン
+        pending: 対象リージョン向けの保留中無効化情報
+    """
+    if pending:
+        session.info.setdefault(_PENDING_REGIONS_SESSION_KEY, set()).add(id(region))
+
+
 def _pop_pending_invalidations(session: Session) -> dict[int, _PendingTransactionInvalidation]:
     """
     セッションに紐づく保留中キャッシュ無効化一覧を取り出して削除する。
@@ -223,6 +513,7 @@ def _pop_pending_invalidations(session: Session) -> dict[int, _PendingTransactio
         取り出した保留中無効化情報
     """
     pending = session.info.pop(_PENDING_INVALIDATIONS_SESSION_KEY, {})
+    session.info.pop(_PENDING_REGIONS_SESSION_KEY, None)
     return pending
 
 
@@ -245,8 +536,53 @@ def _discard_pending_invalidations(session: Session, transaction: object) -> Non
             if pending.parent_key == target_key
         )
 
+    # 残ったトランザクションの予約からリージョンの集合を作り直す。
+    session.info[_PENDING_REGIONS_SESSION_KEY] = {
+        region_key
+        for transaction_pending in pending_by_transaction.values()
+        for region_key, pending in transaction_pending.pending_by_region.items()
+        if pending
+    }
     if not pending_by_transaction:
         session.info.pop(_PENDING_INVALIDATIONS_SESSION_KEY, None)
+        session.info.pop(_PENDING_REGIONS_SESSION_KEY, None)
+
+
+def _clear_transaction_cache(session: Session, region: _CacheRegionLike) -> None:
+    """
+    トランザクション内で保持した、指定リージョンの値をすべて捨てる。
+
+    Args:
+        session: 対象セッション
+        region: 対象キャッシュリージョン
+    """
+    caches: dict[int, _TransactionCache] = session.info.get(_TRANSACTION_CACHE_SESSION_KEY, {})
+    region_key = id(region)
+    for cache in caches.values():
+        for cache_key in [cache_key for cache_key in cache.values if cache_key[0] == region_key]:
+            del cache.values[cache_key]
+
+
+def _discard_transaction_caches(session: Session, transaction: object) -> None:
+    """
+    指定トランザクション配下で保持した値だけを捨てる。
+
+    Args:
+        session: 対象セッション
+        transaction: 破棄対象のトランザクション
+    """
+    caches: dict[int, _TransactionCache] = session.info.get(_TRANSACTION_CACHE_SESSION_KEY, {})
+    target_keys = [id(transaction)]
+    while target_keys:
+        target_key = target_keys.pop()
+        caches.pop(target_key, None)
+        target_keys.extend(
+            transaction_key
+            for transaction_key, cache in tuple(caches.items())
+            if cache.parent_key == target_key
+        )
+    if not caches:
+        session.info.pop(_TRANSACTION_CACHE_SESSION_KEY, None)
 
 
 def _merge_pending_invalidations(
@@ -268,6 +604,7 @@ def _merge_pending_invalidations(
                 pending_by_region[region_key] = _PendingInvalidation(region=pending.region)
             pending_by_region[region_key].keys.update(pending.keys)
             pending_by_region[region_key].version_keys.update(pending.version_keys)
+            pending_by_region[region_key].index_keys.update(pending.index_keys)
     return pending_by_region
 
 
@@ -0,0 +1,83 @@
+from hashlib import blake2b
+
+from dogpile.cache.api import NO_VALUE
+
+from .local import LocalCache
+
+_DEFAULT_DIGEST_SIZE = 16
+_DEBUG_MAPPING_PREFIX = "bookmark:query-cache:key-map:"
+# 同じキーの対応を毎回書き込まないよう、書き込み済みのキーをしばらく覚えておく。
+_RECORDED_KEYS_MAX_ENTRIES = 10_000
+_RECORDED_KEYS_EXPIRATION_TIME = 60
+
+
+class KeyCompactor:
+    """
+    キャッシュキーの可変部分を固定長の keyed digest に置き換える。
+
+    digest は秘密鍵付きの BLAKE2b で求め、利用者が入力を選んで衝突させることを防ぐ。
+    """
+
+    def __init__(
+        self,
+        secret: str | bytes,
+        digest_size: int = _DEFAULT_DIGEST_SIZE,
+        debug_mapping: bool = False,
+    ) -> None:
+        """
+        digest の鍵と、元のキーとの対応を記録するかを保持する。
+
+        Args:
+            secret: digest の秘密鍵
+            digest_size: digest のバイト数。キー上では 2 倍の長さの 16 進数になる
+            debug_mapping: 短縮後のキーから元のキーを引けるよう、対応をキャッシュへ保存するか
+        """
+        secret_bytes = secret.encode() if isinstance(secret, str) else secret
+        # BLAKE2b の鍵長上限 (64 バイト) に収まるよう、任意長の秘密鍵から鍵を導出する。
+        self._key = blake2b(secret_bytes, digest_size=32).digest()
+        self._digest_size = digest_size
+        self.debug_mapping = debug_mapping
+        "短縮後のキーと元のキーの対応をキャッシュへ保存するか"
+        self._recorded = LocalCache(_RECORDED_KEYS_MAX_ENTRIES, _RECORDED_KEYS_EXPIRATION_TIME)
+
+    def compact(self, prefix: str, variable: str) -> str:
+        """
+        可変部分を digest に置き換えたキャッシュキーを返す。
+
+        Args:
+            prefix: そのまま残す namespace 部分
+            variable: digest に置き換える可変部分
+
+        Returns:
+            `{prefix}:h:{digest}` 形式のキャッシュキー
+        """
+        digest = blake2b(variable.encode(), key=self._key, digest_size=self._digest_size)
+        return f"{prefix}:h:{digest.hexdigest()}"
+
+    def needs_recording(self, key: str) -> bool:
+        """
+        短縮後のキーの対応を、このプロセスから最近保存していないか判定する。
+
+        Args:
+            key: 短縮後のキャッシュキー
+
+        Returns:
+            保存が必要なら True
+        """
+        if not self.debug_mapping or self._recorded.get(key) is not NO_VALUE:
+            return False
+        self._recorded.set(key, True)
+        return True
+
+
+def debug_mapping_key(key: str) -> str:
+    """
+    短縮後のキーに対応する元のキーを保存するキャッシュキーを返す。
+
+    Args:
+        key: 短縮後のキャッシュキー
+
+    Returns:
+        対応を保存するキャッシュキー
+    """
+    return f"{_DEBUG_MAPPING_PREFIX}{key}"
@@ -3,7 +3,10 @@ from collections.abc import Callable
 
 from sqlalchemy.orm import Session
 
-type KeyFunc = Callable[..., str]
+from .versioned import VersionedCacheKey
+
+type KeyFunc = Callable[..., str | VersionedCacheKey]
+type CompiledKeyFunc = Callable[[tuple[object, ...], dict[str, object]], str | VersionedCacheKey]
 
 
 class KeyGenerator:
@@ -43,11 +46,40 @@ class KeyGenerator:
             テンプレートベースのキー生成関数
         """
 
+        render = _TemplateRenderer(template, func)
+
         def key_func(*args: object, **kwargs: object) -> str:
-            return KeyGenerator._render_template(template, func, args, kwargs)
+            return render(args, kwargs)
 
         return key_func
 
+    @staticmethod
+    def compile(
+        key_func: KeyFunc | str | None,
+        func: Callable[..., object],
+        session_attr: str = "session",
+    ) -> CompiledKeyFunc:
+        """
+        デコレート時にキー生成方法を確定し、位置引数とキーワード引数からキーを作る関数を返す。
+
+        テンプレートはシグネチャの解析をここで済ませ、呼び出しごとには行わない。
+
+        Args:
+            key_func: キー生成関数またはテンプレート
+            func: 対象関数
+            session_attr: Session を保持する属性名
+
+        Returns:
+            `(args, kwargs)` からキャッシュキーを生成する関数
+        """
+        if key_func is None:
+            return lambda args, kwargs: KeyGenerator.default(
+                func, args, kwargs, session_attr=session_attr
+            )
+        if isinstance(key_func, str):
+            return _TemplateRenderer(key_func, func)
+        return lambda args, kwargs: key_func(*args, **kwargs)
+
     @staticmethod
     def generate(
         key_func: KeyFunc | str | None,
@@ -55,7 +87,7 @@ class KeyGenerator:
         args: tuple[object, ...],
         kwargs: dict[str, object],
         session_attr: str = "session",
-    ) -> str:
+    ) -> str | VersionedCacheKey:
         """
         指定ルールに従ってキャッシュキーを生成する。
 
@@ -67,13 +99,9 @@ class KeyGenerator:
             session_attr: Session を保持する属性名
 
         Returns:
-            生成したキャッシュキー
+            生成したキャッシュキー。version 管理キーに依存する場合は `VersionedCacheKey`
         """
-        if key_func is None:
-            return KeyGenerator.default(func, args, kwargs, session_attr=session_attr)
-        if isinstance(key_func, str):
-            return KeyGenerator.from_template(key_func, func)(*args, **kwargs)
-        return key_func(*args, **kwargs)
+        return KeyGenerator.compile(key_func, func, session_attr=session_attr)(args, kwargs)
 
     @staticmethod
     def _filter_args(args: tuple[object, ...], session_attr: str) -> tuple[object, ...]:
@@ -105,25 +133,57 @@ class KeyGenerator:
         """
         return isinstance(value, Session) or hasattr(value, session_attr)
 
-    @staticmethod
-    def _render_template(
-        template: str,
-        func: Callable[..., object],
-        args: tuple[object, ...],
-        kwargs: dict[str, object],
-    ) -> str:
+
+class _TemplateRenderer:
+    """
+    キーテンプレートを対象関数の引数で展開する。
+    """
+
+    def __init__(self, template: str, func: Callable[..., object]) -> None:
         """
-        関数シグネチャに引数を束縛してテンプレートを展開する。
+        対象関数のシグネチャを解析しておく。
 
         Args:
             template: キーテンプレート
-            func: 対象関数
+            func: 引数名解決に使う対象関数
+        """
+        self._template = template
+        self._signature = inspect.signature(func)
+        parameters = list(self._signature.parameters.values())
+        # 位置・キーワード兼用の引数だけなら、束縛は引数名との対応付けだけで済む。
+        self._simple = all(
+            parameter.kind is inspect.Parameter.POSITIONAL_OR_KEYWORD for parameter in parameters
+        )
+        self._names = tuple(parameter.name for parameter in parameters)
+        self._keyword_names = tuple(
+            frozenset(self._names[index:]) for index in range(len(self._names) + 1)
+        )
+        self._defaults = {
+            parameter.name: parameter.default
+            for parameter in parameters
+            if parameter.default is not inspect.Parameter.empty
+        }
+
+    def __call__(self, args: tuple[object, ...], kwargs: dict[str, object]) -> str:
+        """
+        引数を束縛してテンプレートを展開する。
+
+        Args:
             args: 位置引数
             kwargs: キーワード引数
 
         Returns:
             展開済みキャッシュキー
         """
-        bound_arguments = inspect.signature(func).bind_partial(*args, **kwargs)
+        if (
+            self._simple
+            and len(args) <= len(self._names)
+            and self._keyword_names[len(args)].issuperset(kwargs)
+        ):
+            arguments = {**self._defaults, **dict(zip(self._names, args)), **kwargs}
+            return self._template.format_map(arguments)
+
+        # 可変長引数などを含む場合や、不正な引数はシグネチャに任せて束縛する。
+        bound_arguments = self._signature.bind_partial(*args, **kwargs)
         bound_arguments.apply_defaults()
-        return template.format_map(bound_arguments.arguments)
+        return self._template.format_map(bound_arguments.arguments)
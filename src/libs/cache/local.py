@@ -0,0 +1,291 @@
+import json
+from collections import OrderedDict
+from collections.abc import Iterable
+from copy import copy, deepcopy
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any
+from uuid import UUID, uuid4
+
+from dogpile.cache.api import NO_VALUE
+from pydantic import AnyUrl, BaseModel
+from pydantic_core import Url
+from redis import Redis, RedisCluster
+from redis.client import PubSub, PubSubWorkerThread
+from redis.exceptions import RedisError
+
+from ..log import get_logger
+
+_logger = get_logger()
+_PUBSUB_POLL_INTERVAL = 1.0
+_PUBSUB_ERROR_BACKOFF = 1.0
+# 書き換えられないため、複製せずに共有してよい型。
+_IMMUTABLE_TYPES = frozenset(
+    {str, int, float, bool, bytes, type(None), datetime, date, Decimal, UUID}
+)
+_IMMUTABLE_BASES = (Enum, AnyUrl, Url)
+
+
+class LocalCache:
+    """
+    プロセス内で復元済みの値を保持する、件数上限付き LRU キャッシュ。
+
+    保存時と取得時に値を複製し、呼び出し元が書き換えても保持している値に影響しないようにする。
+    複製は書き換えられる部分 (リスト・辞書・モデル) だけに留め、文字列や日時などは共有する。
+    """
+
+    def __init__(self, max_entries: int, expiration_time: float) -> None:
+        """
+        ローカルキャッシュを初期化する。
+
+        Args:
+            max_entries: 保持する最大件数
+            expiration_time: 各エントリを保持する最大秒数
+
+        Raises:
+            ValueError: 最大件数または保持秒数が不正
+        """
+        if max_entries <= 0:
+            raise ValueError(f"max_entries must be positive: {max_entries}")
+        if expiration_time <= 0:
+            raise ValueError(f"expiration_time must be positive: {expiration_time}")
+        self._max_entries = max_entries
+        self._expiration_time = expiration_time
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Any:
+        """
+        ローカルキャッシュから値を取得する。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            保持している値の複製。未登録または期限切れの場合は `NO_VALUE`
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return NO_VALUE
+            expires_at, value = entry
+            if expires_at <= monotonic():
+                del self._entries[key]
+                return NO_VALUE
+            self._entries.move_to_end(key)
+        return _copy_value(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        ローカルキャッシュに値を保存し、上限超過分を LRU 順に追い出す。
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+        """
+        # 保存後に呼び出し元が値を書き換えても、保持している値に影響しないよう複製しておく。
+        value = _copy_value(value)
+        expires_at = monotonic() + self._expiration_time
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_multi(self, keys: Iterable[str]) -> None:
+        """
+        複数のキーをローカルキャッシュから削除する。
+
+        Args:
+            keys: 削除対象のキャッシュキー一覧
+        """
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        ローカルキャッシュを全件破棄する。
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        """
+        保持しているキャッシュ値の件数を返す。
+
+        Returns:
+            件数
+        """
+        with self._lock:
+            return len(self._entries)
+
+
+def _copy_value(value: Any) -> Any:
+    """
+    書き換えられる部分だけを複製した値を返す。
+
+    `deepcopy` はモデルの全フィールドを複製するため、復元し直すより遅くなる。
+    リスト・辞書・タプル・pydantic モデルはたどって複製し、不変な値はそのまま共有する。
+
+    Args:
+        value: 複製対象の値
+
+    Returns:
+        複製した値
+    """
+    value_type = type(value)
+    if value_type in _IMMUTABLE_TYPES or isinstance(value, _IMMUTABLE_BASES):
+        return value
+    if value_type is list:
+        return [_copy_value(item) for item in value]
+    if value_type is dict:
+        return {key: _copy_value(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        items = [_copy_value(item) for item in value]
+        # CachedValue などの NamedTuple は位置引数で組み立て直す。
+        return value_type(*items) if hasattr(value, "_fields") else value_type(items)
+    if isinstance(value, BaseModel):
+        # copy はフィールドの辞書を新しく作るため、書き換えられる値だけ差し替える。
+        copied = copy(value)
+        fields = copied.__dict__
+        for name, item in fields.items():
+            if type(item) not in _IMMUTABLE_TYPES:
+                fields[name] = _copy_value(item)
+        return copied
+    return deepcopy(value)
+
+
+class LocalCacheInvalidator:
+    """
+    Redis pub/sub で全プロセスのローカルキャッシュ無効化を中継する。
+
+    購読が途切れた間の通知は失われるため、エラー検知時はローカルキャッシュを全件破棄する。
+    取りこぼしの最終的な上限は `LocalCache` の保持秒数で担保する。
+    """
+
+    def __init__(self, client: Redis | RedisCluster, channel: str, local_cache: LocalCache) -> None:
+        """
+        無効化通知の送受信ヘルパーを初期化する。
+
+        Args:
+            client: 通知に使う Redis クライアント
+            channel: 通知チャネル名
+            local_cache: 無効化対象のローカルキャッシュ
+        """
+        self._client = client
+        self._channel = channel
+        self._local_cache = local_cache
+        self._origin = uuid4().hex
+        self._pubsub: PubSub | None = None
+        self._thread: PubSubWorkerThread | None = None
+        self._lock = Lock()
+
+    def start(self) -> None:
+        """
+        通知の購読スレッドを開始する。多重に呼ばれても 1 スレッドだけ起動する。
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self._channel: self._handle_message})
+                self._thread = pubsub.run_in_thread(
+                    sleep_time=_PUBSUB_POLL_INTERVAL,
+                    daemon=True,
+                    exception_handler=self._handle_error,
+                )
+                self._pubsub = pubsub
+            except RedisError as exc:
+                # 購読できない間はローカルキャッシュ側の TTL だけで鮮度を保つ。
+                _logger.warning("Failed to subscribe query cache invalidation: %s", exc)
+
+    def stop(self) -> None:
+        """
+        通知の購読スレッドを停止する。
+        """
+        with self._lock:
+            if self._thread is not None:
+                self._thread.stop()
+                self._thread = None
+            if self._pubsub is not None:
+                self._pubsub.close()
+                self._pubsub = None
+
+    def publish(self, keys: Iterable[str]) -> None:
+        """
+        他プロセスへキャッシュキーの無効化を通知する。
+
+        Args:
+            keys: 無効化対象のキャッシュキー一覧
+        """
+        message = self.message(keys)
+        if message is None:
+            return
+        try:
+            self._client.publish(*message)
+        except RedisError as exc:
+            _logger.warning("Failed to publish query cache invalidation: %s", exc)
+
+    def message(self, keys: Iterable[str]) -> tuple[str, str] | None:
+        """
+        キャッシュキーの無効化通知を他の Redis 操作と同じ pipeline で送るためのメッセージを返す。
+
+        Args:
+            keys: 無効化対象のキャッシュキー一覧
+
+        Returns:
+            通知チャネル名と本文の組。対象キーが無ければ None
+        """
+        key_list = sorted(set(keys))
+        if not key_list:
+            return None
+        return self._channel, self._encode(key_list)
+
+    def _encode(self, keys: list[str]) -> str:
+        """
+        無効化通知のメッセージ本文を生成する。
+
+        Args:
+            keys: 無効化対象のキャッシュキー一覧
+
+        Returns:
+            JSON 文字列
+        """
+        return json.dumps({"origin": self._origin, "keys": keys})
+
+    def _handle_message(self, message: dict[str, Any]) -> None:
+        """
+        受信した無効化通知をローカルキャッシュへ反映する。
+
+        Args:
+            message: redis-py から渡される pub/sub メッセージ
+        """
+        try:
+            payload = json.loads(message["data"])
+        except (KeyError, TypeError, ValueError) as exc:
+            _logger.warning("Invalid query cache invalidation message: %s", exc)
+            return
+
+        # 自プロセスの通知は commit 時に反映済みなので、直後の再取得を避けるため読み捨てる。
+        if payload.get("origin") == self._origin:
+            return
+        self._local_cache.delete_multi(payload.get("keys", ()))
+
+    def _handle_error(self, exc: BaseException, pubsub: PubSub, thread: PubSubWorkerThread) -> None:
+        """
+        購読中のエラー時にローカルキャッシュを破棄して購読を継続する。
+
+        Args:
+            exc: 発生した例外
+            pubsub: 購読中の PubSub
+            thread: 購読スレッド
+        """
+        del pubsub, thread
+        _logger.warning("Query cache invalidation subscription error: %s", exc)
+        self._local_cache.clear()
+        sleep(_PUBSUB_ERROR_BACKOFF)
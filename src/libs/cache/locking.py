@@ -0,0 +1,195 @@
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+from redis.exceptions import RedisError
+
+from ..log import get_logger
+
+_logger = get_logger()
+
+
+class QueryCacheLockTimeoutError(Exception):
+    """
+    キャッシュ再生成ロックの待機時間上限を超えた。
+    """
+
+    pass
+
+
+@dataclass
+class LockWaitStats:
+    """
+    キャッシュ再生成ロックの待機状況を表すカウンタ。
+    """
+
+    acquisitions: int = 0
+    "待機ありで取得したロック数"
+    contended: int = 0
+    "他プロセスが保持中で待たされた回数"
+    wait_seconds: float = 0.0
+    "待機した合計秒数"
+    max_wait_seconds: float = 0.0
+    "最長の待機秒数"
+    timeouts: int = 0
+    "待機時間上限を超えた回数"
+    fallbacks: int = 0
+    "ロックを取れずに DB を直接参照した回数"
+    errors: int = 0
+    "Redis 障害でロックを使えなかった回数"
+
+
+class LockWaitRecorder:
+    """
+    複数スレッドから `LockWaitStats` を更新する。
+    """
+
+    def __init__(self) -> None:
+        self.stats = LockWaitStats()
+        "ロック待機状況"
+        self._lock = Lock()
+
+    def record_wait(self, waited: float, acquired: bool, contended: bool) -> None:
+        """
+        ロック取得の待機結果を記録する。
+
+        Args:
+            waited: 待機した秒数
+            acquired: ロックを取得できたか
+            contended: 他プロセスが保持していたか
+        """
+        with self._lock:
+            if acquired:
+                self.stats.acquisitions += 1
+            else:
+                self.stats.timeouts += 1
+            if contended:
+                self.stats.contended += 1
+                self.stats.wait_seconds += waited
+                self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+
+    def record_fallback(self) -> None:
+        """
+        ロックを取れずに DB を直接参照したことを記録する。
+        """
+        with self._lock:
+            self.stats.fallbacks += 1
+
+    def record_error(self) -> None:
+        """
+        Redis 障害でロックを使えなかったことを記録する。
+        """
+        with self._lock:
+            self.stats.errors += 1
+
+
+class BudgetedRedisLock:
+    """
+    待機時間の上限付きで Redis ロックを取得する、redis-py の `Lock` と同じ形のロック。
+
+    dogpile.cache の Redis backend と同じく `_RedisLockWrapper` で包んで mutex として渡す。
+    dogpile.cache は待機ありの `acquire` の戻り値を見ないため、上限超過は例外か
+    「ロックなしで生成する」のどちらかで扱う。
+    """
+
+    def __init__(
+        self,
+        lock: Any,
+        key: str,
+        wait_timeout: float,
+        fallback_to_db: bool,
+        recorder: LockWaitRecorder,
+    ) -> None:
+        """
+        ロックと待機方針を保持する。
+
+        Args:
+            lock: redis-py の `Lock`
+            key: 対象キャッシュキー
+            wait_timeout: ロック取得を待つ最大秒数
+            fallback_to_db: 上限超過時にロックなしで生成するか
+            recorder: 待機状況の記録先
+        """
+        self._lock = lock
+        self._key = key
+        self._wait_timeout = wait_timeout
+        self._fallback_to_db = fallback_to_db
+        self._recorder = recorder
+        self._owned = False
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        ロックを取得する。
+
+        Args:
+            blocking: 保持中の場合に待つか
+
+        Returns:
+            ロックを取得したか。待機ありの場合、上限超過でも生成を進めるなら True
+
+        Raises:
+            QueryCacheLockTimeoutError: 上限超過し、DB 参照へのフォールバックが無効な場合
+        """
+        try:
+            if not blocking:
+                self._owned = bool(self._lock.acquire(blocking=False))
+                return self._owned
+
+            # まず待たずに試し、取れなかったときだけ待機として計測する。
+            self._owned = bool(self._lock.acquire(blocking=False))
+            if self._owned:
+                self._recorder.record_wait(0.0, acquired=True, contended=False)
+                return True
+
+            started = monotonic()
+            self._owned = bool(
+                self._lock.acquire(blocking=True, blocking_timeout=self._wait_timeout)
+            )
+        except RedisError as exc:
+            # Redis 障害時はキャッシュ同様にロックもフェイルオープンにする。
+            self._recorder.record_error()
+            _logger.warning("Redis error during query cache lock %s: %s", self._key, exc)
+            self._owned = False
+            return True
+
+        waited = monotonic() - started
+        self._recorder.record_wait(waited, acquired=self._owned, contended=True)
+        if self._owned:
+            _logger.debug("Query cache lock acquired after %.3fs: %s", waited, self._key)
+            return True
+
+        if not self._fallback_to_db:
+            raise QueryCacheLockTimeoutError(
+                f"Timed out waiting {self._wait_timeout}s for query cache lock: {self._key}"
+            )
+        self._recorder.record_fallback()
+        _logger.warning(
+            "Query cache lock wait exceeded %.3fs, querying DB directly: %s", waited, self._key
+        )
+        return True
+
+    def release(self) -> None:
+        """
+        取得済みのロックを解放する。
+        """
+        if not self._owned:
+            return
+        self._owned = False
+        try:
+            self._lock.release()
+        except RedisError as exc:
+            # 生成が lock_timeout を超えてロックが失効した場合など。
+            _logger.warning("Failed to release query cache lock %s: %s", self._key, exc)
+
+    def locked(self) -> bool:
+        """
+        ロックが保持中か返す。
+
+        Returns:
+            保持中なら True
+        """
+        try:
+            return bool(self._lock.locked())
+        except RedisError:
+            return False
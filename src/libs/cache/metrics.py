@@ -0,0 +1,292 @@
+from bisect import bisect_left
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Protocol
+
+from .versioned import VersionedCacheKey
+
+_SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+_BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+_NAMESPACES = (
+    "bookmark:list:all",
+    "bookmark:list:tags",
+    "bookmark:list-ids:all",
+    "bookmark:list-ids:tags",
+)
+"先頭 2 要素より細かく分けて集計するキーの namespace"
+
+
+class MetricsSink(Protocol):
+    """
+    クエリキャッシュの計測値を受け取る出力先を表す Protocol。
+    """
+
+    def increment(self, name: str, namespace: str, value: float = 1) -> None: ...
+
+    def observe(self, name: str, namespace: str, value: float) -> None: ...
+
+    def set_gauge(self, name: str, namespace: str, value: float) -> None: ...
+
+
+@dataclass
+class Histogram:
+    """
+    計測値の分布を表すヒストグラム。
+    """
+
+    bounds: tuple[float, ...]
+    "各バケットの上限値"
+    buckets: list[int] = field(default_factory=list)
+    "各バケットの件数。末尾は上限値を超えた件数"
+    count: int = 0
+    "計測件数"
+    total: float = 0.0
+    "計測値の合計"
+    max: float = 0.0
+    "計測値の最大"
+
+    def __post_init__(self) -> None:
+        if not self.buckets:
+            self.buckets = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        """
+        計測値を 1 件追加する。
+
+        Args:
+            value: 計測値
+        """
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+
+class InMemoryMetricsSink:
+    """
+    計測値をプロセス内のカウンタとヒストグラムに集計する出力先。
+
+    ヒストグラムのバケットは、名前が `_bytes` で終わればバイト数向け、それ以外は秒数向けにする。
+    """
+
+    def __init__(self) -> None:
+        self._counters: dict[tuple[str, str], float] = {}
+        self._histograms: dict[tuple[str, str], Histogram] = {}
+        self._gauges: dict[tuple[str, str], float] = {}
+        self._lock = Lock()
+
+    def increment(self, name: str, namespace: str, value: float = 1) -> None:
+        """
+        カウンタを加算する。
+
+        Args:
+            name: 計測項目名
+            namespace: キャッシュキーの namespace
+            value: 加算する値
+        """
+        with self._lock:
+            self._counters[(name, namespace)] = self._counters.get((name, namespace), 0) + value
+
+    def observe(self, name: str, namespace: str, value: float) -> None:
+        """
+        ヒストグラムへ計測値を追加する。
+
+        Args:
+            name: 計測項目名
+            namespace: キャッシュキーの namespace
+            value: 計測値
+        """
+        with self._lock:
+            histogram = self._histograms.get((name, namespace))
+            if histogram is None:
+                bounds = _BYTES_BUCKETS if name.endswith("_bytes") else _SECONDS_BUCKETS
+                histogram = self._histograms[(name, namespace)] = Histogram(bounds=bounds)
+            histogram.observe(value)
+
+    def set_gauge(self, name: str, namespace: str, value: float) -> None:
+        """
+        ゲージを現在値で上書きする。
+
+        Args:
+            name: 計測項目名
+            namespace: キャッシュキーの namespace またはノード名
+            value: 現在値
+        """
+        with self._lock:
+            self._gauges[(name, namespace)] = value
+
+    def counter(self, name: str, namespace: str) -> float:
+        """
+        カウンタの現在値を返す。
+
+        Args:
+            name: 計測項目名
+            namespace: キャッシュキーの namespace
+
+        Returns:
+            現在値。未計測なら 0
+        """
+        with self._lock:
+            return self._counters.get((name, namespace), 0)
+
+    def gauge(self, name: str, namespace: str) -> float | None:
+        """
+        ゲージの現在値を返す。
+
+        Args:
+            name: 計測項目名
+            namespace: キャッシュキーの namespace またはノード名
+
+        Returns:
+            現在値。未計測なら None
+        """
+        with self._lock:
+            return self._gauges.get((name, namespace))
+
+    def histogram(self, name: str, namespace: str) -> Histogram | None:
+        """
+        ヒストグラムの複製を返す。
+
+        Args:
+            name: 計測項目名
+            namespace: キャッシュキーの namespace
+
+        Returns:
+            ヒストグラム。未計測なら None
+        """
+        with self._lock:
+            histogram = self._histograms.get((name, namespace))
+            if histogram is None:
+                return None
+            return Histogram(
+                bounds=histogram.bounds,
+                buckets=list(histogram.buckets),
+                count=histogram.count,
+                total=histogram.total,
+                max=histogram.max,
+            )
+
+    def clear(self) -> None:
+        """
+        集計済みの値をすべて破棄する。
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+
+_sink: MetricsSink = InMemoryMetricsSink()
+
+
+def get_metrics_sink() -> MetricsSink:
+    """
+    現在の計測値の出力先を返す。
+
+    Returns:
+        計測値の出力先
+    """
+    return _sink
+
+
+def set_metrics_sink(sink: MetricsSink) -> None:
+    """
+    計測値の出力先を差し替える。
+
+    Args:
+        sink: 新しい出力先
+    """
+    global _sink
+    _sink = sink
+
+
+def increment(name: str, namespace: str, value: float = 1) -> None:
+    """
+    現在の出力先のカウンタを加算する。
+
+    Args:
+        name: 計測項目名
+        namespace: キャッシュキーの namespace
+        value: 加算する値
+    """
+    _sink.increment(name, namespace, value)
+
+
+def observe(name: str, namespace: str, value: float) -> None:
+    """
+    現在の出力先のヒストグラムへ計測値を追加する。
+
+    Args:
+        name: 計測項目名
+        namespace: キャッシュキーの namespace
+        value: 計測値
+    """
+    _sink.observe(name, namespace, value)
+
+
+def set_gauge(name: str, namespace: str, value: float) -> None:
+    """
+    現在の出力先のゲージを上書きする。
+
+    Args:
+        name: 計測項目名
+        namespace: キャッシュキーの namespace またはノード名
+        value: 現在値
+    """
+    _sink.set_gauge(name, namespace, value)
+
+
+def key_namespace(key: str | VersionedCacheKey) -> str:
+    """
+    キャッシュキーから集計用の namespace を求める。
+
+    Args:
+        key: キャッシュキー
+
+    Returns:
+        `bookmark:list:all` のような登録済み namespace。該当しなければ `:` 区切りの先頭 2 要素
+    """
+    if isinstance(key, VersionedCacheKey):
+        # namespace は version 値より前にあるため、仮の version 値で組み立てて判定する。
+        key = key.build(tuple("" for _ in key.version_keys))
+    for namespace in _NAMESPACES:
+        if key == namespace or key.startswith(f"{namespace}:"):
+            return namespace
+    return ":".join(key.split(":", 2)[:2])
+
+
+def template_namespace(template: str) -> str | None:
+    """
+    キーテンプレートの固定部分だけで namespace が決まる場合、その namespace を返す。
+
+    Args:
+        template: キーテンプレート
+
+    Returns:
+        namespace。置換フィールドの値によって変わりうる場合は None
+    """
+    prefix = template.split("{", 1)[0]
+    namespace = key_namespace(prefix)
+    if namespace in _NAMESPACES:
+        return namespace if prefix.startswith(f"{namespace}:") or prefix == template else None
+    if prefix != template and prefix.count(":") < 2:
+        # 先頭 2 要素に置換フィールドが含まれる。
+        return None
+    if any(registered.startswith(f"{namespace}:") for registered in _NAMESPACES):
+        # 置換フィールドの値によって、より細かい登録済み namespace に一致しうる。
+        return None
+    return namespace
+
+
+def keys_namespaces(keys: Sequence[str]) -> set[str]:
+    """
+    複数のキャッシュキーの namespace を重複なく求める。
+
+    Args:
+        keys: キャッシュキー一覧
+
+    Returns:
+        namespace の集合
+    """
+    return {key_namespace(key) for key in keys}
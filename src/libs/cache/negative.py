@@ -0,0 +1,45 @@
+from time import time
+
+from pydantic import BaseModel
+
+from .serializers import register_cache_model
+
+
+class AbsentResult(BaseModel):
+    """
+    対象データが存在しなかったことを表すキャッシュ値。
+    """
+
+    message: str
+    "対象データが無かったときの例外メッセージ"
+    cached_at: float
+    "保存した時刻 (UNIX 時間)"
+
+    @classmethod
+    def from_error(cls, error: Exception) -> "AbsentResult":
+        """
+        対象データが無かったときの例外から生成する。
+
+        Args:
+            error: 送出された例外
+
+        Returns:
+            生成したキャッシュ値
+        """
+        return cls(message=str(error), cached_at=time())
+
+    def is_expired(self, expiration_time: float) -> bool:
+        """
+        保存から有効期限を過ぎたか判定する。
+
+        Args:
+            expiration_time: 有効期限秒数
+
+        Returns:
+            過ぎていれば True
+        """
+        return time() - self.cached_at >= expiration_time
+
+
+# 値が小さいので、キャッシュにはコンパクト形式で保存する。
+register_cache_model(AbsentResult)
@@ -1,19 +1,38 @@
+from collections.abc import Mapping
+from dataclasses import fields, replace
 from functools import lru_cache
-from typing import Any
+from typing import Any, TypeVar
 from urllib.parse import urlsplit
 
 from dogpile.cache.region import CacheRegion
 
 from ..config import Config, get_config
 from ..log import get_logger
+from .circuit import CircuitBreakerPolicy
+from .dictionaries import DEFAULT_DICTIONARY_NAMESPACES
+from .expiration import ExpirationPolicy
+from .key_compaction import KeyCompactor
 from .region import NullCacheRegion, create_redis_region
+from .warmup import WarmupPolicy
 
 _logger = get_logger()
 
+PolicyT = TypeVar("PolicyT", CircuitBreakerPolicy, ExpirationPolicy, WarmupPolicy)
 
-def _build_connection_kwargs(config: Config) -> dict[str, Any]:
+
+def build_connection_kwargs(config: Config) -> dict[str, Any]:
+    """
+    クエリキャッシュ用 Redis クライアントの追加接続引数を組み立てる。
+
+    Args:
+        config: アプリケーション設定
+
+    Returns:
+        Redis クライアントへ渡す追加引数
+    """
     connection_kwargs: dict[str, Any] = {}
-    if urlsplit(config.cache_redis_url).scheme != "rediss":
+    urls = [config.cache_redis_url, *config.cache_redis_shard_urls]
+    if all(urlsplit(url).scheme != "rediss" for url in urls):
         return connection_kwargs
 
     # blacklist 用 Redis 設定と分離した cache 用 SSL 設定だけをここで組み立てる。
@@ -29,21 +48,176 @@ def _build_connection_kwargs(config: Config) -> dict[str, Any]:
     return connection_kwargs
 
 
+def build_expiration_policies(config: Config) -> dict[str, ExpirationPolicy]:
+    """
+    キャッシュキーの prefix ごとの有効期限設定を組み立てる。
+
+    Args:
+        config: アプリケーション設定
+
+    Returns:
+        prefix と有効期限設定の対応。prefix `""` は全体の既定値
+
+    Raises:
+        ValueError: 負の値、存在しない項目名、または数値でない値を指定した
+    """
+    default = ExpirationPolicy(
+        jitter=_non_negative(config.cache_ttl_jitter, "CACHE_TTL_JITTER"),
+        early_refresh_beta=_non_negative(
+            config.cache_early_refresh_beta, "CACHE_EARLY_REFRESH_BETA"
+        ),
+    )
+    policies = {"": default}
+    for prefix, overrides in config.cache_expiration_policies.items():
+        setting = f"CACHE_EXPIRATION_POLICIES[{prefix!r}]"
+        if not isinstance(overrides, Mapping):
+            raise ValueError(f"{setting} must be an object: {overrides!r}")
+        # 指定の無い項目は全体の既定値を引き継ぐ。
+        policies[prefix] = _override_policy(default, overrides, setting)
+    return policies
+
+
+def build_key_compactor(config: Config) -> KeyCompactor | None:
+    """
+    キャッシュキー短縮の設定を組み立てる。
+
+    Args:
+        config: アプリケーション設定
+
+    Returns:
+        キー短縮の設定。無効なら None
+    """
+    if not config.cache_key_compaction:
+        return None
+    return KeyCompactor(
+        config.cache_key_digest_secret or config.hash_salt,
+        debug_mapping=config.cache_key_debug_mapping,
+    )
+
+
+def build_circuit_breaker_policy(config: Config) -> CircuitBreakerPolicy | None:
+    """
+    クエリキャッシュ用 Redis のサーキットブレーカーの判定条件を組み立てる。
+
+    Args:
+        config: アプリケーション設定
+
+    Returns:
+        判定条件。無効なら None
+    """
+    if not config.cache_circuit_breaker_enabled:
+        return None
+    # 指定の無い項目は既定値を使う。
+    return _override_policy(
+        CircuitBreakerPolicy(), config.cache_circuit_breaker, "CACHE_CIRCUIT_BREAKER"
+    )
+
+
+def build_warmup_policy(config: Config) -> WarmupPolicy | None:
+    """
+    キャッシュの事前読み込みの設定を組み立てる。
+
+    Args:
+        config: アプリケーション設定
+
+    Returns:
+        事前読み込みの設定。無効なら None
+    """
+    if not config.cache_enabled or not config.cache_warmup_enabled:
+        return None
+    # 指定の無い項目は既定値を使う。
+    return _override_policy(WarmupPolicy(), config.cache_warmup, "CACHE_WARMUP")
+
+
+def _override_policy(policy: PolicyT, overrides: Mapping[str, Any], setting: str) -> PolicyT:
+    """
+    JSON で指定された設定値で、設定の項目を置き換える。値は項目の既定値と同じ型に変換する。
+
+    Args:
+        policy: 既定値の設定
+        overrides: 項目名と値の対応
+        setting: エラーメッセージに使う環境変数名
+
+    Returns:
+        置き換えた設定
+
+    Raises:
+        ValueError: 存在しない項目名、数値でない値、負の値、または整数の項目に小数を指定した
+    """
+    unknown = set(overrides) - {field.name for field in fields(policy)}
+    if unknown:
+        raise ValueError(f"{setting} has unknown fields: {', '.join(sorted(unknown))}")
+    values: dict[str, Any] = {}
+    for name, value in overrides.items():
+        if isinstance(value, bool) or not isinstance(value, int | float):
+            raise ValueError(f"{setting}.{name} must be a number: {value!r}")
+        # どの設定も件数・秒数・割合のため、負の値は受け付けない。
+        _non_negative(value, f"{setting}.{name}")
+        if not isinstance(getattr(policy, name), int):
+            values[name] = float(value)
+        elif float(value).is_integer():
+            values[name] = int(value)
+        else:
+            raise ValueError(f"{setting}.{name} must be an integer: {value!r}")
+    return replace(policy, **values)
+
+
+def _non_negative(value: float, setting: str) -> float:
+    """
+    設定値が 0 以上か検証する。
+
+    Args:
+        value: 検証対象の値
+        setting: エラーメッセージに使う設定名
+
+    Returns:
+        検証済みの値
+
+    Raises:
+        ValueError: 負の値を指定した
+    """
+    if value < 0:
+        raise ValueError(f"{setting} must not be negative: {value!r}")
+    return value
+
+
 @lru_cache
 def get_query_cache_region() -> CacheRegion | NullCacheRegion:
     config = get_config()
     if not config.cache_enabled:
         return NullCacheRegion()
 
-    if not config.cache_redis_url:
+    if not config.cache_redis_url and not config.cache_redis_shard_urls:
         _logger.warning("Query cache is enabled but CACHE_REDIS_URL is not configured")
         return NullCacheRegion()
 
     # Region はプロセス内で共有し、repository ごとに同じ backend を使い回す。
-    connection_kwargs = _build_connection_kwargs(config)
+    connection_kwargs = build_connection_kwargs(config)
     return create_redis_region(
-        url=config.cache_redis_url,
+        url=config.cache_redis_url or None,
         expiration_time=config.cache_redis_expiration_time,
         zstd_level=config.cache_zstd_level,
         connection_kwargs=connection_kwargs or None,
+        local_max_entries=config.cache_local_max_entries,
+        local_expiration_time=config.cache_local_expiration_time,
+        invalidation_channel=config.cache_invalidation_channel,
+        zstd_dictionary_namespaces=(
+            DEFAULT_DICTIONARY_NAMESPACES
+            if config.cache_zstd_dictionary_refresh_interval > 0
+            else None
+        ),
+        zstd_dictionary_refresh_interval=config.cache_zstd_dictionary_refresh_interval,
+        stale_grace_time=config.cache_stale_grace_time,
+        distributed_lock=config.cache_lock_enabled,
+        lock_timeout=config.cache_lock_timeout,
+        lock_wait_timeout=config.cache_lock_wait_timeout,
+        lock_fallback_to_db=config.cache_lock_fallback_to_db,
+        expiration_policies=build_expiration_policies(config),
+        key_compactor=build_key_compactor(config),
+        client_side_cache_max_entries=config.cache_client_side_cache_max_entries,
+        client_side_cache_retry_interval=config.cache_client_side_cache_retry_interval,
+        shard_urls=config.cache_redis_shard_urls or None,
+        cluster=config.cache_redis_cluster,
+        circuit_breaker=build_circuit_breaker_policy(config),
+        stale_if_error_time=config.cache_stale_if_error_time,
     )
@@ -1,13 +1,27 @@
-from collections.abc import Callable, Mapping
-from typing import Any, TypeVar
+from collections.abc import Callable, Collection, Iterable, Mapping, Sequence
+from threading import local
+from time import perf_counter
+from typing import Any, TypeVar, cast
 
-from dogpile.cache import make_region
-from dogpile.cache.api import NO_VALUE
+from dogpile.cache.api import NO_VALUE, CacheBackend, CachedValue, CacheReturnType
 from dogpile.cache.region import CacheRegion, register_backend
 
+from . import metrics
+from .backends import ZstdRedisBackend
+from .circuit import CircuitBreakerPolicy
+from .expiration import ExpirationPolicies, ExpirationPolicy
+from .key_compaction import KeyCompactor, debug_mapping_key
+from .local import LocalCache, LocalCacheInvalidator
+from .serializers import CacheSerializer
+
 _MEMORY_BACKEND_NAME = "bookmark.zstd_memory"
 _REDIS_BACKEND_NAME = "bookmark.zstd_redis"
+_SHARDED_REDIS_BACKEND_NAME = "bookmark.zstd_sharded_redis"
+_REDIS_CLUSTER_BACKEND_NAME = "bookmark.zstd_redis_cluster"
 _BACKENDS_REGISTERED = False
+_DEFAULT_INVALIDATION_CHANNEL = "bookmark:query-cache:invalidate"
+# 期限前再生成に使う生成秒数を保存する metadata の項目名。
+_RECOMPUTE_SECONDS_FIELD = "d"
 T = TypeVar("T")
 
 
@@ -21,26 +35,669 @@ def _register_backends() -> None:
 
     register_backend(_MEMORY_BACKEND_NAME, "src.libs.cache.backends", "ZstdMemoryBackend")
     register_backend(_REDIS_BACKEND_NAME, "src.libs.cache.backends", "ZstdRedisBackend")
+    register_backend(
+        _SHARDED_REDIS_BACKEND_NAME, "src.libs.cache.backends", "ZstdShardedRedisBackend"
+    )
+    register_backend(
+        _REDIS_CLUSTER_BACKEND_NAME, "src.libs.cache.backends", "ZstdRedisClusterBackend"
+    )
     _BACKENDS_REGISTERED = True
 
 
-def create_memory_region(expiration_time: int = 300, zstd_level: int = 3) -> CacheRegion:
+class _PendingGeneration(local):
+    """
+    スレッドごとに、get_or_create で生成中の値の情報を保持する。
+    """
+
+    expiration_time: float | None = None
+    "生成中の値に適用する有効期限"
+    seconds: float = 0.0
+    "値の生成にかかった秒数"
+
+
+class QueryCacheRegion(CacheRegion):
+    """
+    クエリキャッシュ用のキャッシュリージョン。
+
+    commit 後の無効化をまとめて backend へ反映する操作と、stale-while-revalidate の猶予秒数を持つ。
+    保存時は有効期限を乱数で短くずらし、参照時は生成コストに応じて確率的に期限切れとみなす。
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """
+        クエリキャッシュ用リージョンを初期化する。
+
+        Args:
+            args: `CacheRegion` へ渡す位置引数
+            kwargs: `CacheRegion` へ渡すキーワード引数
+        """
+        super().__init__(*args, **kwargs)
+        self.stale_grace_time: float = 0
+        "有効期限切れ・version 更新後に古い値を返してよい秒数"
+        self.stale_if_error_time: float = 0
+        "DB に接続できない場合に、有効期限切れ・version 更新後の古い値を返してよい秒数"
+        self.expiration_policies = ExpirationPolicies()
+        "キャッシュキーの prefix ごとの有効期限設定"
+        self.key_compactor: KeyCompactor | None = None
+        "長いキャッシュキーの可変部分を digest に置き換える設定。None なら置き換えない"
+        self._pending_generation = _PendingGeneration()
+
+    @property
+    def cache_backend(self) -> CacheBackend:
+        """
+        設定済みの backend。
+
+        dogpile.cache の `backend` は未設定時に例外を送出する memoized_property のため、
+        backend の操作はこの型付きの参照を通して呼ぶ。
+        """
+        return cast(CacheBackend, self.backend)
+
+    def compact_key(self, prefix: str, variable: str) -> str:
+        """
+        可変部分を含むキャッシュキーを組み立てる。`key_compactor` があれば可変部分を digest にする。
+
+        Args:
+            prefix: そのまま残す namespace 部分
+            variable: 可変部分
+
+        Returns:
+            キャッシュキー
+        """
+        key = f"{prefix}:{variable}"
+        if self.key_compactor is None:
+            return key
+        compacted = self.key_compactor.compact(prefix, variable)
+        if self.key_compactor.needs_recording(compacted):
+            # 運用時に digest から元のキーを追えるよう、対応を同じ有効期限で保存する。
+            self.set(debug_mapping_key(compacted), key)
+        return compacted
+
+    def describe_key(self, key: str) -> str | None:
+        """
+        短縮後のキャッシュキーから元のキーを返す。
+
+        Args:
+            key: 短縮後のキャッシュキー
+
+        Returns:
+            元のキー。対応を保存していないか期限切れなら None
+        """
+        original = self.get(debug_mapping_key(key), ignore_expiration=True)
+        return None if original is NO_VALUE else str(original)
+
+    def add_to_reverse_index(self, index_keys: Iterable[str], key: str) -> None:
+        """
+        キャッシュキーを逆引きインデックスへ登録する。backend が対応しない場合は何もしない。
+
+        Args:
+            index_keys: 登録先のインデックスキー一覧
+            key: 登録するキャッシュキー
+        """
+        add_to_index = getattr(self.backend, "add_to_index", None)
+        if add_to_index is not None:
+            add_to_index([self._mangle(index_key) for index_key in index_keys], key)
+
+    def apply_invalidation(
+        self,
+        keys: Collection[str],
+        versions: Mapping[str, Any],
+        index_keys: Collection[str] = (),
+    ) -> None:
+        """
+        キャッシュキーの削除と version 値の更新をまとめて反映する。
+
+        backend が `invalidate_multi` を持つ場合は 1 回の pipeline で送る。
+
+        Args:
+            keys: 削除するキャッシュキー一覧
+            versions: version 管理キーと新しい version 値の対応
+            index_keys: 登録されたキャッシュキーも削除する逆引きインデックスキー一覧
+        """
+        pop_index_members = getattr(self.backend, "pop_index_members", None)
+        if index_keys and pop_index_members is not None:
+            members = pop_index_members([self._mangle(index_key) for index_key in index_keys])
+            keys = {*keys, *members}
+        if not keys and not versions:
+            return
+        self._apply_invalidation(keys, versions)
+
+    def _apply_invalidation(self, keys: Collection[str], versions: Mapping[str, Any]) -> None:
+        """
+        キャッシュキーの削除と version 値の更新を backend へ送る。
+
+        Args:
+            keys: 削除するキャッシュキー一覧
+            versions: version 管理キーと新しい version 値の対応
+        """
+        metadata = self._gen_metadata()
+        delete_keys = [self._mangle(key) for key in keys]
+        values = {
+            self._mangle(key): self._value(value, metadata) for key, value in versions.items()
+        }
+        # 他プロセスの L1 は backend と同じ変換後のキーで値を持つため、変換後のキーで通知する。
+        invalidated = [*delete_keys, *values]
+        invalidate_multi = getattr(self.backend, "invalidate_multi", None)
+        if invalidate_multi is not None and self.serializer:
+            message = self._invalidation_message(invalidated)
+            invalidate_multi(
+                delete_keys,
+                {key: self._serialized_cached_value(value) for key, value in values.items()},
+                message,
+            )
+            if message is not None:
+                return
+        else:
+            if delete_keys:
+                self.cache_backend.delete_multi(delete_keys)
+            self._set_multi_cached_value_to_backend(values)
+        self.publish_invalidation(invalidated)
+
+    def publish_invalidation(self, keys: Iterable[str]) -> None:
+        """
+        無効化したキーを他プロセスへ通知する。プロセス内キャッシュを持たないため何もしない。
+
+        Args:
+            keys: 削除または version 更新した backend 上のキャッシュキー一覧
+        """
+        del keys
+
+    def _invalidation_message(self, keys: Sequence[str]) -> tuple[str, str] | None:
+        """
+        無効化の pipeline に含める通知メッセージを返す。
+
+        Args:
+            keys: 削除または version 更新した backend 上のキャッシュキー一覧
+
+        Returns:
+            通知チャネル名と本文の組。通知しない場合は None
+        """
+        del keys
+        return None
+
+    def get_or_create(
+        self,
+        key: str,
+        creator: Callable[..., Any],
+        expiration_time: float | None = None,
+        should_cache_fn: Callable[[Any], bool] | None = None,
+        creator_args: tuple[Any, Mapping[str, Any]] | None = None,
+    ) -> Any:
+        """
+        キャッシュ値を取得し、無ければ生成して保存する。
+
+        保存時に有効期限設定を適用できるよう、生成にかかった秒数と有効期限を記録しておく。
+
+        Args:
+            key: キャッシュキー
+            creator: 値を生成する関数
+            expiration_time: キャッシュ有効期限
+            should_cache_fn: 生成した値を保存するか判定する関数
+            creator_args: `creator` へ渡す位置引数とキーワード引数の組
+
+        Returns:
+            キャッシュ値または生成した値
+        """
+        pending = self._pending_generation
+        saved = (pending.expiration_time, pending.seconds)
+
+        def timed_creator(*args: Any, **kwargs: Any) -> Any:
+            started = perf_counter()
+            try:
+                return creator(*args, **kwargs)
+            finally:
+                # 生成中に入れ子で呼ばれた get_or_create の記録を上書きする。
+                pending.expiration_time = expiration_time
+                pending.seconds = perf_counter() - started
+
+        try:
+            return super().get_or_create(
+                key, timed_creator, expiration_time, should_cache_fn, creator_args
+            )
+        finally:
+            pending.expiration_time, pending.seconds = saved
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        値を保存する。有効期限設定を適用するため、metadata は値ごとに作る。
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+        """
+        self._set_cached_value_to_backend(self._mangle(key), self._value(value))
+
+    def set_multi(self, mapping: Mapping[str, Any]) -> None:
+        """
+        複数の値を保存する。
+
+        Args:
+            mapping: キャッシュキーと保存する値の対応
+        """
+        if not mapping:
+            return
+        # 有効期限をキーごとにずらすため、metadata はキーごとに作る。
+        self._set_multi_cached_value_to_backend(
+            {self._mangle(key): self._value(value) for key, value in mapping.items()}
+        )
+
+    def _get_from_backend(self, key: str) -> CacheReturnType:
+        """
+        backend からキャッシュ値を取得し、期限前再生成の対象を期限切れとして扱わせる。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            キャッシュ値。未登録なら `NO_VALUE`
+        """
+        return self._expire_early(key, self._load_cached_value(key))
+
+    def _get_multi_from_backend(self, keys: Iterable[str]) -> Sequence[CacheReturnType]:
+        """
+        backend から複数のキャッシュ値を取得し、期限前再生成の対象を期限切れとして扱わせる。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            キーと同じ順のキャッシュ値一覧。未登録のものは `NO_VALUE`
+        """
+        key_list = list(keys)
+        return [
+            self._expire_early(key, value)
+            for key, value in zip(key_list, self._load_cached_values(key_list))
+        ]
+
+    def _set_cached_value_to_backend(self, key: str, value: CachedValue) -> None:
+        """
+        有効期限設定を適用して backend へ保存する。
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+        """
+        self._store_cached_value(key, self._apply_expiration_policy(key, value))
+
+    def _set_multi_cached_value_to_backend(self, mapping: Mapping[str, CachedValue]) -> None:
+        """
+        有効期限設定を適用して backend へ複数の値を保存する。
+
+        Args:
+            mapping: キャッシュキーと保存する値の対応
+        """
+        self._store_cached_values(
+            {key: self._apply_expiration_policy(key, value) for key, value in mapping.items()}
+        )
+
+    def _load_cached_value(self, key: str) -> CacheReturnType:
+        """
+        backend からキャッシュ値を取得する。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            キャッシュ値。未登録なら `NO_VALUE`
+        """
+        if not self.deserializer:
+            return super()._get_from_backend(key)
+        return self._parse_from_backend(key, self.cache_backend.get_serialized(key))
+
+    def _load_cached_values(self, keys: Sequence[str]) -> Sequence[CacheReturnType]:
+        """
+        backend から複数のキャッシュ値を取得する。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            キーと同じ順のキャッシュ値一覧。未登録のものは `NO_VALUE`
+        """
+        if not self.deserializer:
+            return super()._get_multi_from_backend(keys)
+        return [
+            self._parse_from_backend(key, value)
+            for key, value in zip(keys, self.cache_backend.get_serialized_multi(keys))
+        ]
+
+    def _store_cached_value(self, key: str, value: CachedValue) -> None:
+        """
+        backend へキャッシュ値を保存する。
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+        """
+        if not self.serializer:
+            super()._set_cached_value_to_backend(key, value)
+            return
+        self.cache_backend.set_serialized(key, self._serialize_to_backend(key, value))
+
+    def _store_cached_values(self, mapping: Mapping[str, CachedValue]) -> None:
+        """
+        backend へ複数のキャッシュ値を保存する。
+
+        Args:
+            mapping: キャッシュキーと保存する値の対応
+        """
+        if not mapping or not self.serializer:
+            super()._set_multi_cached_value_to_backend(mapping)
+            return
+        self.cache_backend.set_serialized_multi(
+            {key: self._serialize_to_backend(key, value) for key, value in mapping.items()}
+        )
+
+    def _apply_expiration_policy(self, key: str, value: CachedValue) -> CachedValue:
+        """
+        保存する値の作成時刻を乱数でずらし、期限前再生成に使う生成秒数を記録する。
+
+        作成時刻を過去へずらすと、dogpile.cache の有効期限判定ではその分だけ早く期限切れになる。
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+
+        Returns:
+            設定を適用した値
+        """
+        if not self.expiration_policies:
+            return value
+        policy = self.expiration_policies.of(key)
+        pending = self._pending_generation
+        expiration_time = pending.expiration_time
+        if expiration_time is None:
+            expiration_time = self.expiration_time
+        metadata = dict(value.metadata)
+        metadata["ct"] -= policy.jitter_seconds(expiration_time)
+        if policy.early_refresh_beta > 0 and pending.seconds > 0:
+            metadata[_RECOMPUTE_SECONDS_FIELD] = round(pending.seconds, 6)
+        return CachedValue(value.payload, metadata)
+
+    def _expire_early(self, key: str, value: CacheReturnType) -> CacheReturnType:
+        """
+        期限前再生成の対象になった値を、作成時刻を前倒しして期限切れとして扱わせる。
+
+        Args:
+            key: キャッシュキー
+            value: backend から取得した値
+
+        Returns:
+            作成時刻を前倒しした値。対象外ならそのままの値
+        """
+        if value is NO_VALUE or not self.expiration_policies:
+            return value
+        cached = cast(CachedValue, value)
+        recompute_seconds = cached.metadata.get(_RECOMPUTE_SECONDS_FIELD)
+        if not recompute_seconds:
+            return value
+        early = self.expiration_policies.of(key).early_expiration_seconds(recompute_seconds)
+        if early <= 0:
+            return value
+        return CachedValue(cached.payload, {**cached.metadata, "ct": cached.metadata["ct"] - early})
+
+    def _parse_from_backend(self, key: str, value: Any) -> CacheReturnType:
+        """
+        backend から取得した値を復元し、かかった時間を記録する。
+
+        Args:
+            key: キャッシュキー
+            value: backend から取得した値
+
+        Returns:
+            復元した値。未登録なら `NO_VALUE`
+        """
+        if value is None or value is NO_VALUE:
+            return NO_VALUE
+        started = perf_counter()
+        parsed = self._parse_serialized_from_backend(value)
+        metrics.observe("deserialize_seconds", metrics.key_namespace(key), perf_counter() - started)
+        return parsed
+
+    def _serialize_to_backend(self, key: str, value: CachedValue) -> bytes:
+        """
+        backend へ保存する形式に直列化し、かかった時間を記録する。
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+
+        Returns:
+            直列化したバイト列
+        """
+        started = perf_counter()
+        # serializer 設定時だけ呼ばれるため、戻り値は常にバイト列になる。
+        serialized = cast(bytes, self._serialized_cached_value(value))
+        metrics.observe("serialize_seconds", metrics.key_namespace(key), perf_counter() - started)
+        return serialized
+
+    def _mangle(self, key: str) -> str:
+        """
+        key_mangler 設定時は backend と同じキーに変換する。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            backend 上のキャッシュキー
+        """
+        return self.key_mangler(key) if self.key_mangler else key
+
+
+class TwoTierCacheRegion(QueryCacheRegion):
+    """
+    プロセス内の L1 キャッシュを backend (L2) の手前に置くキャッシュリージョン。
+
+    L1 には復元済みの `CachedValue` をそのまま保持し、HIT 時は通信・展開・復元を省く。
+    """
+
+    def __init__(self, local_cache: LocalCache, *args: Any, **kwargs: Any) -> None:
+        """
+        二層キャッシュリージョンを初期化する。
+
+        Args:
+            local_cache: L1 として使うローカルキャッシュ
+            args: `CacheRegion` へ渡す位置引数
+            kwargs: `CacheRegion` へ渡すキーワード引数
+        """
+        super().__init__(*args, **kwargs)
+        self.local_cache = local_cache
+        "L1 キャッシュ"
+        self.invalidator: LocalCacheInvalidator | None = None
+        "他プロセスへの L1 無効化通知"
+
+    def publish_invalidation(self, keys: Iterable[str]) -> None:
+        """
+        commit 後に無効化したキーを他プロセスの L1 へ通知する。
+
+        Args:
+            keys: 削除または version 更新した backend 上のキャッシュキー一覧
+        """
+        if self.invalidator is not None:
+            self.invalidator.publish(keys)
+
+    def _apply_invalidation(self, keys: Collection[str], versions: Mapping[str, Any]) -> None:
+        """
+        キャッシュキーの削除と version 値の更新を backend へ送り、L1 からも削除する。
+
+        Args:
+            keys: 削除するキャッシュキー一覧
+            versions: version 管理キーと新しい version 値の対応
+        """
+        super()._apply_invalidation(keys, versions)
+        self.local_cache.delete_multi(self._mangle(key) for key in [*keys, *versions])
+
+    def _invalidation_message(self, keys: Sequence[str]) -> tuple[str, str] | None:
+        """
+        無効化の pipeline に含める、他プロセスの L1 への通知メッセージを返す。
+
+        Args:
+            keys: 削除または version 更新した backend 上のキャッシュキー一覧
+
+        Returns:
+            通知チャネル名と本文の組。通知しない場合は None
+        """
+        if self.invalidator is None:
+            return None
+        return self.invalidator.message(keys)
+
+    def delete(self, key: str) -> None:
+        """
+        backend と L1 からキャッシュ値を削除する。
+
+        Args:
+            key: キャッシュキー
+        """
+        super().delete(key)
+        self.local_cache.delete_multi([self._mangle(key)])
+
+    def delete_multi(self, keys: Iterable[str]) -> None:
+        """
+        backend と L1 から複数のキャッシュ値を削除する。
+
+        Args:
+            keys: キャッシュキー一覧
+        """
+        key_list = list(keys)
+        super().delete_multi(key_list)
+        self.local_cache.delete_multi(self._mangle(key) for key in key_list)
+
+    def _load_cached_value(self, key: str) -> CacheReturnType:
+        """
+        L1 からキャッシュ値を取得し、無ければ backend から取得して L1 へ保存する。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            キャッシュ値。未登録なら `NO_VALUE`
+        """
+        value = self.local_cache.get(key)
+        if value is not NO_VALUE:
+            return value
+
+        value = super()._load_cached_value(key)
+        if value is not NO_VALUE:
+            self.local_cache.set(key, value)
+        return value
+
+    def _load_cached_values(self, keys: Sequence[str]) -> Sequence[CacheReturnType]:
+        """
+        L1 から複数のキャッシュ値を取得し、無いものだけを backend から取得して L1 へ保存する。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            キーと同じ順のキャッシュ値一覧。未登録のものは `NO_VALUE`
+        """
+        key_list = list(keys)
+        values = [self.local_cache.get(key) for key in key_list]
+        missing_indexes = [index for index, value in enumerate(values) if value is NO_VALUE]
+        if not missing_indexes:
+            return values
+
+        # L1 に無いキーだけを 1 回の multi-get で L2 から取得する。
+        fetched = super()._load_cached_values([key_list[index] for index in missing_indexes])
+        for index, value in zip(missing_indexes, fetched):
+            values[index] = value
+            if value is not NO_VALUE:
+                self.local_cache.set(key_list[index], value)
+        return values
+
+    def _store_cached_value(self, key: str, value: CachedValue) -> None:
+        """
+        backend と L1 へキャッシュ値を保存する。
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+        """
+        super()._store_cached_value(key, value)
+        self.local_cache.set(key, value)
+
+    def _store_cached_values(self, mapping: Mapping[str, CachedValue]) -> None:
+        """
+        backend と L1 へ複数のキャッシュ値を保存する。
+
+        Args:
+            mapping: キャッシュキーと保存する値の対応
+        """
+        super()._store_cached_values(mapping)
+        for key, value in mapping.items():
+            self.local_cache.set(key, value)
+
+
+def _make_region(local_max_entries: int, local_expiration_time: float) -> QueryCacheRegion:
+    """
+    L1 設定に応じて未設定のキャッシュリージョンを生成する。
+
+    Args:
+        local_max_entries: L1 の最大件数。0 以下なら L1 を使わない
+        local_expiration_time: L1 の保持秒数
+
+    Returns:
+        未設定のキャッシュリージョン
+    """
+    if local_max_entries <= 0:
+        return QueryCacheRegion()
+    return TwoTierCacheRegion(LocalCache(local_max_entries, local_expiration_time))
+
+
+def create_memory_region(
+    expiration_time: int = 300,
+    zstd_level: int = 3,
+    max_bytes: int = 64 * 1024 * 1024,
+    local_max_entries: int = 0,
+    local_expiration_time: float = 30,
+    zstd_dictionary_namespaces: Mapping[str, str] | None = None,
+    zstd_dictionaries: Mapping[str, bytes] | None = None,
+    serializer: CacheSerializer | None = None,
+    stale_grace_time: float = 0,
+    expiration_policies: Mapping[str, ExpirationPolicy] | None = None,
+    key_compactor: KeyCompactor | None = None,
+    stale_if_error_time: float = 0,
+) -> CacheRegion:
     """
     zstd 圧縮対応のインメモリキャッシュリージョンを生成する。
 
     Args:
-        expiration_time: キャッシュ有効期限
+        expiration_time: キャッシュ有効期限。各エントリの保持期限にも使う
         zstd_level: zstd 圧縮レベル
+        max_bytes: 保持する圧縮済みデータの合計バイト数上限
+        local_max_entries: L1 キャッシュの最大件数。0 なら L1 を使わない
+        local_expiration_time: L1 キャッシュの保持秒数
+        zstd_dictionary_namespaces: キャッシュキーの prefix と辞書 namespace の対応
+        zstd_dictionaries: namespace ごとの学習済み zstd 辞書
+        serializer: 値の直列化に使うシリアライザ。省略時はコンパクト形式
+        stale_grace_time: 有効期限切れ後も再生成中に古い値を返してよい秒数。
+            backend はこの秒数だけ長く値を保持する
+        expiration_policies: キャッシュキーの prefix と有効期限設定の対応。
+            prefix `""` はすべてのキーに一致する
+        key_compactor: `compact_key` で組み立てるキーの可変部分を digest にする設定
+        stale_if_error_time: DB に接続できない場合に、有効期限切れ後も古い値を返してよい秒数。
+            `stale_grace_time` より長ければ、backend はこの秒数だけ長く値を保持する
 
     Returns:
         生成したキャッシュリージョン
     """
     _register_backends()
-    return make_region().configure(
+    region = _make_region(local_max_entries, local_expiration_time).configure(
         _MEMORY_BACKEND_NAME,
         expiration_time=expiration_time,
-        arguments={"zstd_level": zstd_level},
+        arguments={
+            "expiration_time": expiration_time + max(stale_grace_time, stale_if_error_time),
+            "zstd_level": zstd_level,
+            "max_bytes": max_bytes,
+            "zstd_dictionary_namespaces": zstd_dictionary_namespaces,
+            "zstd_dictionaries": dict(zstd_dictionaries or {}),
+            "serializer": serializer,
+        },
     )
+    region.stale_grace_time = stale_grace_time
+    region.stale_if_error_time = stale_if_error_time
+    region.expiration_policies = ExpirationPolicies(expiration_policies)
+    region.key_compactor = key_compactor
+    return region
 
 
 def create_redis_region(
@@ -51,6 +708,25 @@ def create_redis_region(
     expiration_time: int = 3600,
     zstd_level: int = 3,
     connection_kwargs: Mapping[str, Any] | None = None,
+    local_max_entries: int = 0,
+    local_expiration_time: float = 30,
+    invalidation_channel: str = _DEFAULT_INVALIDATION_CHANNEL,
+    zstd_dictionary_namespaces: Mapping[str, str] | None = None,
+    zstd_dictionary_refresh_interval: float = 300,
+    serializer: CacheSerializer | None = None,
+    stale_grace_time: float = 0,
+    distributed_lock: bool = False,
+    lock_timeout: int = 30,
+    lock_wait_timeout: float = 5,
+    lock_fallback_to_db: bool = True,
+    expiration_policies: Mapping[str, ExpirationPolicy] | None = None,
+    key_compactor: KeyCompactor | None = None,
+    client_side_cache_max_entries: int = 0,
+    client_side_cache_retry_interval: float = 60,
+    shard_urls: Sequence[str] | None = None,
+    cluster: bool = False,
+    circuit_breaker: CircuitBreakerPolicy | None = None,
+    stale_if_error_time: float = 0,
 ) -> CacheRegion:
     """
     zstd 圧縮対応の Redis キャッシュリージョンを生成する。
@@ -63,15 +739,68 @@ def create_redis_region(
         expiration_time: キャッシュ有効期限
         zstd_level: zstd 圧縮レベル
         connection_kwargs: Redis クライアント生成時の追加引数
+        local_max_entries: L1 キャッシュの最大件数。0 なら L1 を使わない
+        local_expiration_time: L1 キャッシュの保持秒数
+        invalidation_channel: L1 無効化を通知する pub/sub チャネル名
+        zstd_dictionary_namespaces: キャッシュキーの prefix と辞書 namespace の対応。
+            指定時は Redis に保存された学習済み辞書で圧縮する
+        zstd_dictionary_refresh_interval: 学習済み辞書を Redis から再読み込みする間隔秒数
+        serializer: 値の直列化に使うシリアライザ。省略時はコンパクト形式
+        stale_grace_time: 有効期限切れ後も再生成中に古い値を返してよい秒数。
+            Redis 上の TTL はこの秒数だけ長くする
+        distributed_lock: キャッシュ再生成を Redis ロックでプロセス間 1 本に絞るか
+        lock_timeout: 再生成ロックの保持上限秒数。保持プロセスが落ちてもこの秒数で解放される
+        lock_wait_timeout: 他プロセスの再生成を待つ最大秒数
+        lock_fallback_to_db: 待機上限を超えたらロックなしで DB を参照するか。
+            False なら `QueryCacheLockTimeoutError` を送出する
+        expiration_policies: キャッシュキーの prefix と有効期限設定の対応。
+            prefix `""` はすべてのキーに一致する
+        key_compactor: `compact_key` で組み立てるキーの可変部分を digest にする設定
+        client_side_cache_max_entries: RESP3 の client-side caching でプロセス内に保持する
+            version 管理キーの最大件数。0 なら使わない
+        client_side_cache_retry_interval: client-side caching が使えなかった後、
+            通常の取得を続けてから再び試すまでの秒数
+        shard_urls: 指定時は、これらの standalone Redis へコンシステントハッシュでキーを振り分ける。
+            辞書・無効化通知は先頭の Redis を使う
+        cluster: `url` を Redis Cluster のノードとして扱うか
+        circuit_breaker: 指定時は Redis ノードごとにサーキットブレーカーを付け、
+            失敗・遅延が続いたノードをしばらく使わずにキャッシュミスとして扱う
+        stale_if_error_time: DB に接続できない場合に、有効期限切れ後も古い値を返してよい秒数。
+            `stale_grace_time` より長ければ、Redis 上の TTL はこの秒数だけ長くする
 
     Returns:
         生成したキャッシュリージョン
+
+    Raises:
+        ValueError: `shard_urls` と `cluster` を同時に指定した、または `cluster` で `url` が無い
     """
+    if shard_urls and cluster:
+        raise ValueError("shard_urls and cluster cannot be used together")
+    if cluster and url is None:
+        raise ValueError("url is required when cluster is enabled")
     _register_backends()
     arguments: dict[str, Any] = {
-        "expiration_time": expiration_time,
+        "expiration_time": int(expiration_time + max(stale_grace_time, stale_if_error_time)),
         "zstd_level": zstd_level,
+        "zstd_dictionary_namespaces": zstd_dictionary_namespaces,
+        "zstd_dictionary_refresh_interval": zstd_dictionary_refresh_interval,
+        "serializer": serializer,
+        "distributed_lock": distributed_lock,
+        "lock_timeout": lock_timeout,
+        "lock_wait_timeout": lock_wait_timeout,
+        "lock_fallback_to_db": lock_fallback_to_db,
+        "client_side_cache_max_entries": client_side_cache_max_entries,
+        "client_side_cache_retry_interval": client_side_cache_retry_interval,
+        "circuit_breaker_policy": circuit_breaker,
+        # ロックは get_or_create を呼んだスレッド内で取得・解放する。
+        "thread_local_lock": False,
     }
+    backend_name = _REDIS_BACKEND_NAME
+    if shard_urls:
+        backend_name = _SHARDED_REDIS_BACKEND_NAME
+        arguments["shard_urls"] = list(shard_urls)
+    elif cluster:
+        backend_name = _REDIS_CLUSTER_BACKEND_NAME
     if url is not None:
         arguments["url"] = url
     else:
@@ -81,11 +810,22 @@ def create_redis_region(
     if connection_kwargs is not None:
         arguments["connection_kwargs"] = dict(connection_kwargs)
 
-    return make_region().configure(
-        _REDIS_BACKEND_NAME,
+    region = _make_region(local_max_entries, local_expiration_time).configure(
+        backend_name,
         expiration_time=expiration_time,
         arguments=arguments,
     )
+    backend = region.actual_backend
+    if isinstance(region, TwoTierCacheRegion) and isinstance(backend, ZstdRedisBackend):
+        region.invalidator = LocalCacheInvalidator(
+            backend.writer_client, invalidation_channel, region.local_cache
+        )
+        region.invalidator.start()
+    region.stale_grace_time = stale_grace_time
+    region.stale_if_error_time = stale_if_error_time
+    region.expiration_policies = ExpirationPolicies(expiration_policies)
+    region.key_compactor = key_compactor
+    return region
 
 
 class NullCacheRegion:
@@ -93,6 +833,9 @@ class NullCacheRegion:
     常にキャッシュミスとして振る舞うダミーリージョン。
     """
 
+    expiration_time: float | None = None
+    "キャッシュ有効期限。保存しないため常に None"
+
     def get(
         self,
         key: str,
@@ -113,6 +856,46 @@ class NullCacheRegion:
         del key, expiration_time, ignore_expiration
         return NO_VALUE
 
+    def get_multi(
+        self,
+        keys: Sequence[str],
+        expiration_time: float | None = None,
+        ignore_expiration: bool = False,
+    ) -> list[Any]:
+        """
+        常にすべて `NO_VALUE` を返す。
+
+        Args:
+            keys: キャッシュキー一覧
+            expiration_time: 参照時の有効期限
+            ignore_expiration: 有効期限を無視するか
+
+        Returns:
+            キー数分の `NO_VALUE`
+        """
+        del expiration_time, ignore_expiration
+        return [NO_VALUE for _ in keys]
+
+    def get_value_metadata(
+        self,
+        key: str,
+        expiration_time: float | None = None,
+        ignore_expiration: bool = False,
+    ) -> CachedValue | None:
+        """
+        常に None を返す。
+
+        Args:
+            key: キャッシュキー
+            expiration_time: 参照時の有効期限
+            ignore_expiration: 有効期限を無視するか
+
+        Returns:
+            常に None
+        """
+        del key, expiration_time, ignore_expiration
+        return None
+
     def get_or_create(
         self,
         key: str,
@@ -144,6 +927,15 @@ class NullCacheRegion:
         """
         del key, value, expiration_time
 
+    def set_multi(self, mapping: Mapping[str, Any]) -> None:
+        """
+        何も保存しない。
+
+        Args:
+            mapping: キャッシュキーと保存対象の値の対応
+        """
+        del mapping
+
     def delete(self, key: str) -> None:
         """
         何も削除しない。
@@ -1,3 +1,5 @@
+import inspect
+from collections.abc import Callable
 from typing import Any
 
 from sqlalchemy.exc import InvalidRequestError
@@ -7,6 +9,8 @@ from ..log import get_logger
 
 _logger = get_logger()
 
+type CompiledSessionResolver = Callable[[tuple[object, ...], dict[str, object]], Session | None]
+
 
 class SessionResolver:
     def __init__(self, session_attr: str = "session") -> None:
@@ -44,6 +48,50 @@ class SessionResolver:
 
         return None
 
+    def compile(self, func: Callable[..., object]) -> CompiledSessionResolver:
+        """
+        対象関数のシグネチャから Session を持つ引数を求め、その引数を先に見る解決関数を返す。
+
+        `Session` 型注釈の引数があればその引数を、先頭引数が `self` ならその属性を見る。
+        見た場所に Session が無ければ `resolve` で全引数から探す。
+
+        Args:
+            func: 対象関数
+
+        Returns:
+            `(args, kwargs)` から Session を解決する関数
+        """
+        parameters = list(inspect.signature(func).parameters.values())
+        for index, parameter in enumerate(parameters):
+            if parameter.annotation not in (Session, "Session"):
+                continue
+            name = parameter.name
+
+            def resolve_argument(
+                args: tuple[object, ...], kwargs: dict[str, object]
+            ) -> Session | None:
+                value = args[index] if index < len(args) else kwargs.get(name)
+                if isinstance(value, Session):
+                    return value
+                return self.resolve(args, kwargs)
+
+            return resolve_argument
+
+        if parameters and parameters[0].name == "self":
+            session_attr = self._session_attr
+
+            def resolve_attribute(
+                args: tuple[object, ...], kwargs: dict[str, object]
+            ) -> Session | None:
+                candidate = getattr(args[0], session_attr, None) if args else None
+                if isinstance(candidate, Session):
+                    return candidate
+                return self.resolve(args, kwargs)
+
+            return resolve_attribute
+
+        return self.resolve
+
     def expunge(self, session: Session, result: Any) -> None:
         """
         キャッシュ対象の ORM オブジェクトを Session から切り離す。
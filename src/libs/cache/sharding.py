@@ -0,0 +1,99 @@
+from bisect import bisect
+from collections.abc import Sequence
+from hashlib import blake2b
+
+_DEFAULT_REPLICAS = 160
+
+
+class ConsistentHashRing:
+    """
+    キャッシュキーを複数の Redis ノードへ割り当てるコンシステントハッシュ。
+
+    ノードごとに仮想ノードを配置し、ノードの増減で移動するキーを全体の一部に抑える。
+    Redis Cluster と同じく、キーに `{...}` のハッシュタグがあればその部分だけで割り当てる。
+    """
+
+    def __init__(self, nodes: Sequence[str], replicas: int = _DEFAULT_REPLICAS) -> None:
+        """
+        ノード一覧から仮想ノードを配置する。
+
+        Args:
+            nodes: ノード名 (接続 URL など) の一覧。並び順は割り当てに影響しない
+            replicas: ノードあたりの仮想ノード数
+
+        Raises:
+            ValueError: ノードが空、重複している、または仮想ノード数が不正
+        """
+        if not nodes:
+            raise ValueError("nodes must not be empty")
+        if len(set(nodes)) != len(nodes):
+            raise ValueError(f"nodes must be unique: {list(nodes)}")
+        if replicas <= 0:
+            raise ValueError(f"replicas must be positive: {replicas}")
+        points = sorted(
+            (_hash(f"{node}#{replica}"), index)
+            for index, node in enumerate(nodes)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._indexes = [index for _, index in points]
+
+    def node_index(self, key: str) -> int:
+        """
+        キャッシュキーを担当するノードの位置を返す。
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            コンストラクタに渡したノード一覧上の位置
+        """
+        position = bisect(self._hashes, _hash(_hash_tag(key)))
+        return self._indexes[position % len(self._indexes)]
+
+    def group(self, keys: Sequence[str]) -> dict[int, list[int]]:
+        """
+        キャッシュキーを担当ノードごとにまとめる。
+
+        Args:
+            keys: キャッシュキー一覧
+
+        Returns:
+            ノードの位置と、そのノードが担当するキーの位置一覧の対応
+        """
+        groups: dict[int, list[int]] = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(self.node_index(key), []).append(position)
+        return groups
+
+
+def _hash(value: str) -> int:
+    """
+    リング上の位置を求める。
+
+    Args:
+        value: ノード名またはキー
+
+    Returns:
+        64 bit のハッシュ値
+    """
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def _hash_tag(key: str) -> str:
+    """
+    割り当てに使うキーの部分を返す。
+
+    Args:
+        key: キャッシュキー
+
+    Returns:
+        空でない `{...}` があればその内側、無ければキー全体
+    """
+    start = key.find("{")
+    if start < 0:
+        return key
+    end = key.find("}", start + 1)
+    if end <= start + 1:
+        return key
+    return key[start + 1 : end]
@@ -0,0 +1,171 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition
+from typing import Any, Protocol
+
+from dogpile.cache.api import NO_VALUE, CachedValue
+
+from ..log import get_logger
+
+_MAX_REFRESH_WORKERS = 4
+_logger = get_logger()
+
+
+class _StaleRegionLike(Protocol):
+    """
+    stale-while-revalidate で必要な最小限のキャッシュリージョン操作を表す Protocol。
+    """
+
+    expiration_time: float | None
+
+    def get_value_metadata(
+        self,
+        key: str,
+        expiration_time: float | None = None,
+        ignore_expiration: bool = False,
+    ) -> CachedValue | None: ...
+
+    def get_or_create(
+        self,
+        key: str,
+        creator: Callable[[], Any],
+        expiration_time: float | None = None,
+    ) -> Any: ...
+
+
+def get_stale_grace_time(region: object) -> float:
+    """
+    リージョンで期限切れの値を返してよい猶予秒数を返す。
+
+    Args:
+        region: 対象キャッシュリージョン
+
+    Returns:
+        猶予秒数。stale-while-revalidate に対応しないリージョンでは 0
+    """
+    return float(getattr(region, "stale_grace_time", 0) or 0)
+
+
+def get_stale_value(
+    region: _StaleRegionLike, key: str, expiration_time: float | None, grace_time: float
+) -> Any:
+    """
+    有効期限切れから猶予秒数以内の値を返す。
+
+    Args:
+        region: 対象キャッシュリージョン
+        key: キャッシュキー
+        expiration_time: キャッシュ有効期限。None ならリージョンの既定値
+        grace_time: 有効期限切れ後に値を返してよい秒数
+
+    Returns:
+        猶予内の値。値が無いか猶予を過ぎていれば `NO_VALUE`
+    """
+    metadata = region.get_value_metadata(key, ignore_expiration=True)
+    if metadata is None:
+        return NO_VALUE
+
+    if expiration_time is None:
+        expiration_time = region.expiration_time
+    if expiration_time is not None and metadata.age > expiration_time + grace_time:
+        return NO_VALUE
+    return metadata.payload
+
+
+class BackgroundRefresher:
+    """
+    キャッシュ値をバックグラウンドスレッドで作り直す。
+
+    同じキーの再生成はプロセス内で 1 本に絞り、プロセス間は region の dogpile lock で絞る。
+    """
+
+    def __init__(self, max_workers: int = _MAX_REFRESH_WORKERS) -> None:
+        """
+        再生成用スレッドプールの設定を保持する。スレッドは初回投入時に起動する。
+
+        Args:
+            max_workers: 同時に再生成する最大数
+        """
+        self._max_workers = max_workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._in_flight: set[tuple[int, str]] = set()
+        self._condition = Condition()
+
+    def submit(
+        self,
+        region: _StaleRegionLike,
+        key: str,
+        creator: Callable[[], Any],
+        expiration_time: float | None = None,
+    ) -> bool:
+        """
+        キャッシュ値の再生成を予約する。
+
+        Args:
+            region: 対象キャッシュリージョン
+            key: 再生成するキャッシュキー
+            creator: 値を生成する関数
+            expiration_time: キャッシュ有効期限
+
+        Returns:
+            予約したか。同じキーを再生成中なら False
+        """
+        flight = (id(region), key)
+        with self._condition:
+            if flight in self._in_flight:
+                return False
+            self._in_flight.add(flight)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="query-cache-refresh"
+                )
+            executor = self._executor
+
+        executor.submit(self._refresh, flight, region, key, creator, expiration_time)
+        return True
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        予約済みの再生成がすべて終わるまで待つ。
+
+        Args:
+            timeout: 最大待機秒数
+
+        Returns:
+            時間内に終わったか
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._in_flight, timeout=timeout)
+
+    def _refresh(
+        self,
+        flight: tuple[int, str],
+        region: _StaleRegionLike,
+        key: str,
+        creator: Callable[[], Any],
+        expiration_time: float | None,
+    ) -> None:
+        """
+        キャッシュ値を再生成して保存する。
+
+        Args:
+            flight: 再生成中の識別子
+            region: 対象キャッシュリージョン
+            key: 再生成するキャッシュキー
+            creator: 値を生成する関数
+            expiration_time: キャッシュ有効期限
+        """
+        try:
+            # 期限切れの値は get_or_create が作り直し、他プロセスが作成中なら lock で待たずに戻る。
+            region.get_or_create(key, creator, expiration_time=expiration_time)
+            _logger.debug("Query cache REFRESHED: %s", key)
+        except Exception as exc:
+            # 失敗しても猶予内は古い値を返し続け、猶予を過ぎれば通常のキャッシュミスになる。
+            _logger.warning("Failed to refresh query cache %s: %s", key, exc)
+        finally:
+            with self._condition:
+                self._in_flight.discard(flight)
+                self._condition.notify_all()
+
+
+background_refresher = BackgroundRefresher()
@@ -0,0 +1,273 @@
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import chain
+
+_SKETCH_DEPTH = 4
+_SKETCH_MAX_COUNT = 15
+_SKETCH_SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+_SKETCH_MIN_WIDTH = 1024
+_SKETCH_SAMPLE_FACTOR = 10
+_PROTECTED_RATIO = 0.8
+# 各カウンタを半減する変換表。bytes.translate で全カウンタを 1 回の C 呼び出しで半減する。
+_HALVE_TABLE = bytes(count >> 1 for count in range(256))
+
+
+@dataclass
+class EvictionStats:
+    """
+    サイズ上限付きキャッシュの追い出し状況を表すカウンタ。
+    """
+
+    evictions: int = 0
+    "容量超過で追い出したエントリ数"
+    rejections: int = 0
+    "頻度が低く main 領域への昇格を拒否したエントリ数"
+    expirations: int = 0
+    "TTL 切れで破棄したエントリ数"
+
+
+class FrequencySketch:
+    """
+    キーの参照頻度を近似的に数える Count-Min Sketch。
+
+    各カウンタは 4bit 相当 (最大 15) に飽和させ、一定回数の記録ごとに全カウンタを半減して
+    古い人気度を忘れる。
+    """
+
+    def __init__(self, expected_entries: int) -> None:
+        """
+        Sketch を初期化する。
+
+        Args:
+            expected_entries: 想定する最大エントリ数
+        """
+        width = _SKETCH_MIN_WIDTH
+        while width < expected_entries:
+            width <<= 1
+        self._mask = width - 1
+        self._table = array("B", bytes(width * _SKETCH_DEPTH))
+        self._width = width
+        self._sample_size = width * _SKETCH_SAMPLE_FACTOR
+        self._additions = 0
+
+    def frequency(self, key: str) -> int:
+        """
+        キーの推定参照回数を返す。
+
+        Args:
+            key: 対象キー
+
+        Returns:
+            推定参照回数
+        """
+        return min(self._table[index] for index in self._indexes(key))
+
+    def increment(self, key: str) -> None:
+        """
+        キーの参照を 1 回記録する。
+
+        Args:
+            key: 対象キー
+        """
+        incremented = False
+        for index in self._indexes(key):
+            if self._table[index] < _SKETCH_MAX_COUNT:
+                self._table[index] += 1
+                incremented = True
+        if not incremented:
+            return
+
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._reset()
+
+    def _indexes(self, key: str) -> list[int]:
+        """
+        各行のカウンタ位置を計算する。
+
+        Args:
+            key: 対象キー
+
+        Returns:
+            行ごとのカウンタ位置
+        """
+        key_hash = hash(key)
+        return [
+            row * self._width + (((key_hash ^ seed) * seed) >> 16 & self._mask)
+            for row, seed in enumerate(_SKETCH_SEEDS)
+        ]
+
+    def _reset(self) -> None:
+        """
+        全カウンタを半減して古い参照履歴を減衰させる。
+        """
+        self._table = array("B", self._table.tobytes().translate(_HALVE_TABLE))
+        self._additions //= 2
+
+
+class WTinyLfuPolicy:
+    """
+    バイト数上限付きの W-TinyLFU 追い出しポリシー。
+
+    新規エントリはまず小さな window (LRU) に入り、window から溢れた候補は
+    main 領域 (probation / protected の SLRU) の追い出し候補と参照頻度を比べて
+    頻度が高い場合だけ main へ昇格する。
+    """
+
+    def __init__(self, max_bytes: int, window_ratio: float, expected_entries: int) -> None:
+        """
+        ポリシーを初期化する。
+
+        Args:
+            max_bytes: 保持するバイト数の上限
+            window_ratio: 上限のうち window に割り当てる比率
+            expected_entries: 頻度 Sketch のサイズ決定に使う想定エントリ数
+
+        Raises:
+            ValueError: 上限バイト数または window 比率が不正
+        """
+        if max_bytes <= 0:
+            raise ValueError(f"max_bytes must be positive: {max_bytes}")
+        if not 0 < window_ratio < 1:
+            raise ValueError(f"window_ratio must be between 0 and 1: {window_ratio}")
+        self.max_bytes = max_bytes
+        self._window_max = max(1, int(max_bytes * window_ratio))
+        self._main_max = max_bytes - self._window_max
+        self._protected_max = int(self._main_max * _PROTECTED_RATIO)
+        self._window: OrderedDict[str, int] = OrderedDict()
+        self._probation: OrderedDict[str, int] = OrderedDict()
+        self._protected: OrderedDict[str, int] = OrderedDict()
+        self._window_bytes = 0
+        self._probation_bytes = 0
+        self._protected_bytes = 0
+        self._sketch = FrequencySketch(expected_entries)
+        self.stats = EvictionStats()
+
+    @property
+    def total_bytes(self) -> int:
+        """
+        現在保持しているエントリの合計バイト数。
+        """
+        return self._window_bytes + self._probation_bytes + self._protected_bytes
+
+    def record_access(self, key: str) -> None:
+        """
+        既存エントリへの参照を記録し、LRU 順と SLRU の段を更新する。
+
+        Args:
+            key: 参照したキー
+        """
+        self._sketch.increment(key)
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+        elif key in self._probation:
+            # probation で再参照されたエントリは protected へ昇格させる。
+            size = self._probation.pop(key)
+            self._probation_bytes -= size
+            self._protected[key] = size
+            self._protected_bytes += size
+            self._demote_protected_overflow()
+
+    def add(self, key: str, size: int) -> list[str]:
+        """
+        エントリを追加し、上限を超えた分の追い出し対象キーを返す。
+
+        Args:
+            key: 追加するキー
+            size: エントリのバイト数
+
+        Returns:
+            追い出したキー一覧 (追加したキー自身が含まれる場合もある)
+        """
+        self._sketch.increment(key)
+        self.remove(key)
+        if size > self._window_max and size > self._main_max:
+            # どの領域にも収まらないエントリは頻度に関係なく保持しない。
+            self.stats.rejections += 1
+            return [key]
+
+        self._window[key] = size
+        self._window_bytes += size
+        evicted: list[str] = []
+        while self._window_bytes > self._window_max and self._window:
+            candidate, candidate_size = self._window.popitem(last=False)
+            self._window_bytes -= candidate_size
+            evicted.extend(self._admit_to_main(candidate, candidate_size))
+        return evicted
+
+    def remove(self, key: str) -> None:
+        """
+        エントリをポリシーの管理対象から外す。
+
+        Args:
+            key: 対象キー
+        """
+        for segment, attr in (
+            (self._window, "_window_bytes"),
+            (self._probation, "_probation_bytes"),
+            (self._protected, "_protected_bytes"),
+        ):
+            size = segment.pop(key, None)
+            if size is not None:
+                setattr(self, attr, getattr(self, attr) - size)
+                return
+
+    def _admit_to_main(self, candidate: str, size: int) -> list[str]:
+        """
+        window から溢れた候補を main 領域へ入れるか判定する。
+
+        Args:
+            candidate: window から溢れたキー
+            size: 候補のバイト数
+
+        Returns:
+            追い出したキー一覧
+        """
+        if size > self._main_max:
+            self.stats.rejections += 1
+            return [candidate]
+
+        candidate_frequency = self._sketch.frequency(candidate)
+        victims = self._main_victims(self._probation_bytes + self._protected_bytes + size)
+        # 追い出す前に全候補と比べ、1 件でも候補より人気があれば main を変えずに候補側を捨てる。
+        if any(self._sketch.frequency(victim) >= candidate_frequency for victim in victims):
+            self.stats.rejections += 1
+            return [candidate]
+
+        for victim in victims:
+            self.remove(victim)
+        self.stats.evictions += len(victims)
+        self._probation[candidate] = size
+        self._probation_bytes += size
+        return victims
+
+    def _main_victims(self, required_bytes: int) -> list[str]:
+        """
+        main 領域を上限内に収めるために追い出す候補を、追い出す順に返す。
+
+        Args:
+            required_bytes: 候補を加えた後の main 領域のバイト数
+
+        Returns:
+            probation の古い順、続けて protected の古い順に並べた追い出し候補
+        """
+        victims: list[str] = []
+        for victim, victim_size in chain(self._probation.items(), self._protected.items()):
+            if required_bytes <= self._main_max:
+                break
+            victims.append(victim)
+            required_bytes -= victim_size
+        return victims
+
+    def _demote_protected_overflow(self) -> None:
+        """
+        protected の上限を超えた分を probation へ戻す。
+        """
+        while self._protected_bytes > self._protected_max and self._protected:
+            key, size = self._protected.popitem(last=False)
+            self._protected_bytes -= size
+            self._probation[key] = size
+            self._probation_bytes += size
@@ -0,0 +1,252 @@
+from collections.abc import Callable, Sequence
+from threading import Lock
+from typing import Any, Literal, NamedTuple, Protocol
+from weakref import WeakKeyDictionary
+
+from dogpile.cache.api import NO_VALUE, CachedValue
+
+from .degraded import get_or_create_degradable
+from .invalidation import cache_version_age, new_cache_version
+from .stale import get_stale_value
+
+_MAX_KNOWN_VERSIONS = 10_000
+type LookupStatus = Literal["HIT", "MISS", "STALE", "DEGRADED"]
+
+
+class VersionedCacheKey(NamedTuple):
+    """
+    version 管理キーの現在値から組み立てるキャッシュキー。
+    """
+
+    version_keys: tuple[str, ...]
+    "キーに埋め込む version 管理キー一覧"
+    build: Callable[[tuple[str, ...]], str]
+    "version 値の並びからキャッシュキーを組み立てる関数"
+
+
+class _VersionedRegionLike(Protocol):
+    """
+    versioned lookup で必要な最小限のキャッシュリージョン操作を表す Protocol。
+    """
+
+    expiration_time: float | None
+
+    def get(self, key: str, expiration_time: float | None = None) -> Any: ...
+
+    def get_multi(self, keys: Sequence[str], expiration_time: float | None = None) -> list[Any]: ...
+
+    def get_or_create(
+        self,
+        key: str,
+        creator: Callable[[], Any],
+        expiration_time: float | None = None,
+    ) -> Any: ...
+
+    def get_value_metadata(
+        self,
+        key: str,
+        expiration_time: float | None = None,
+        ignore_expiration: bool = False,
+    ) -> CachedValue | None: ...
+
+
+class _KnownVersions:
+    """
+    リージョンごとに直近で観測した version 値を保持する。
+
+    値は次回 lookup のキー推測にだけ使い、正しさは常に backend 上の version 値で確認する。
+    """
+
+    def __init__(self) -> None:
+        self._by_region: WeakKeyDictionary[object, dict[str, str]] = WeakKeyDictionary()
+        self._lock = Lock()
+
+    def get(self, region: object, version_keys: tuple[str, ...]) -> tuple[str, ...] | None:
+        """
+        version 管理キー群の既知の値を返す。
+
+        Args:
+            region: 対象キャッシュリージョン
+            version_keys: version 管理キー一覧
+
+        Returns:
+            既知の version 値の並び。1 つでも未観測なら None
+        """
+        with self._lock:
+            known = self._by_region.get(region)
+            if known is None:
+                return None
+            versions = tuple(known.get(version_key) for version_key in version_keys)
+        if None in versions:
+            return None
+        return versions  # type: ignore[return-value]
+
+    def update(
+        self, region: object, version_keys: tuple[str, ...], versions: tuple[str, ...]
+    ) -> None:
+        """
+        観測した version 値を記録する。
+
+        Args:
+            region: 対象キャッシュリージョン
+            version_keys: version 管理キー一覧
+            versions: 観測した version 値の並び
+        """
+        with self._lock:
+            known = self._by_region.setdefault(region, {})
+            if len(known) >= _MAX_KNOWN_VERSIONS:
+                # 推測用の値なので、上限に達したら単純に捨てて観測し直す。
+                known.clear()
+            known.update(zip(version_keys, versions))
+
+
+_known_versions = _KnownVersions()
+
+
+def get_or_create_versioned(
+    region: _VersionedRegionLike,
+    key: VersionedCacheKey,
+    creator: Callable[[], Any],
+    expiration_time: float | None = None,
+    stale_grace_time: float = 0,
+    refresh: Callable[[str], Any] | None = None,
+    stale_if_error: bool = False,
+) -> tuple[LookupStatus, str, Any]:
+    """
+    version 値の解決とキャッシュ値の取得を 1 回の multi-get で行う。
+
+    前回観測した version 値でキーを推測し、version 管理キーと一緒に取得する。
+    取得した version 値が推測と一致すれば、そのキャッシュ値は現在の version に対応する。
+    version が進んでいた場合だけ、正しいキーで取り直す。
+
+    `refresh` を指定した場合、有効期限切れまたは version 更新から `stale_grace_time` 秒以内で
+    新しい値が未生成なら、古い値を返して `refresh` にキャッシュ値の再生成を任せる。
+
+    `stale_if_error` を指定した場合、値の生成中に DB へ接続できなければ、現在または以前に
+    観測した version のキーに残っている値を返す。
+
+    Args:
+        region: 対象キャッシュリージョン
+        key: version 付きキャッシュキー
+        creator: キャッシュミス時に値を生成する関数
+        expiration_time: キャッシュ有効期限
+        stale_grace_time: 有効期限切れ・version 更新後に古い値を返してよい秒数
+        refresh: 新しいキーの値をバックグラウンドで再生成する関数
+        stale_if_error: DB に接続できない場合に、リージョンの猶予秒数以内の古い値を返すか
+
+    Returns:
+        参照結果 (HIT / MISS / STALE / DEGRADED)、解決したキャッシュキー、値の組
+    """
+    version_keys = key.version_keys
+    guessed = _known_versions.get(region, version_keys)
+    if guessed is not None:
+        guessed_key = key.build(guessed)
+        *versions, cached = region.get_multi(
+            [*version_keys, guessed_key], expiration_time=expiration_time
+        )
+        current = _normalize_versions(versions)
+        if current == guessed:
+            if cached is not NO_VALUE:
+                return "HIT", guessed_key, cached
+            if refresh is not None:
+                # 有効期限切れから猶予内の値があれば、それを返して再生成を任せる。
+                stale = get_stale_value(region, guessed_key, expiration_time, stale_grace_time)
+                if stale is not NO_VALUE:
+                    refresh(guessed_key)
+                    return "STALE", guessed_key, stale
+            return _get_or_create(region, guessed_key, creator, expiration_time, stale_if_error)
+        if (
+            refresh is not None
+            and current is not None
+            and cached is not NO_VALUE
+            and _bumped_within(guessed, current, stale_grace_time)
+        ):
+            resolved_key = key.build(current)
+            value = region.get(resolved_key, expiration_time=expiration_time)
+            if value is not NO_VALUE:
+                _known_versions.update(region, version_keys, current)
+                return "HIT", resolved_key, value
+            # 既知 version を据え置き、再生成が終わるまで後続の参照にも旧 version の値を返す。
+            refresh(resolved_key)
+            return "STALE", guessed_key, cached
+    else:
+        current = _normalize_versions(
+            region.get_multi(list(version_keys), expiration_time=expiration_time)
+        )
+
+    if current is None:
+        # 未生成の version は並行リクエスト間で 1 値に収束させるため region 側の排他で作る。
+        current = tuple(
+            str(region.get_or_create(version_key, new_cache_version))
+            for version_key in version_keys
+        )
+    _known_versions.update(region, version_keys, current)
+    resolved_key = key.build(current)
+    # version が進む前の値は、DB に接続できない場合の候補にする。
+    fallback_keys = [key.build(guessed)] if guessed is not None and guessed != current else []
+    return _get_or_create(
+        region, resolved_key, creator, expiration_time, stale_if_error, fallback_keys
+    )
+
+
+def _get_or_create(
+    region: _VersionedRegionLike,
+    key: str,
+    creator: Callable[[], Any],
+    expiration_time: float | None,
+    stale_if_error: bool,
+    fallback_keys: Sequence[str] = (),
+) -> tuple[LookupStatus, str, Any]:
+    """
+    キャッシュミスしたキーの値を取得・生成する。
+
+    Args:
+        region: 対象キャッシュリージョン
+        key: キャッシュキー
+        creator: 値を生成する関数
+        expiration_time: キャッシュ有効期限
+        stale_if_error: DB に接続できない場合に古い値を返すか
+        fallback_keys: DB に接続できない場合に探す、以前の version のキャッシュキー一覧
+
+    Returns:
+        参照結果 (MISS / DEGRADED)、値を取得したキャッシュキー、値の組
+    """
+    if stale_if_error:
+        return get_or_create_degradable(region, key, creator, expiration_time, fallback_keys)
+    return "MISS", key, region.get_or_create(key, creator, expiration_time=expiration_time)
+
+
+def _bumped_within(previous: tuple[str, ...], current: tuple[str, ...], grace_time: float) -> bool:
+    """
+    変化した version がすべて猶予秒数以内に発行されたものか判定する。
+
+    Args:
+        previous: 以前の version 値の並び
+        current: 現在の version 値の並び
+        grace_time: 猶予秒数
+
+    Returns:
+        猶予以内なら True。発行時刻が分からない version を含む場合は False
+    """
+    for before, after in zip(previous, current):
+        if before == after:
+            continue
+        age = cache_version_age(after)
+        if age is None or age > grace_time:
+            return False
+    return True
+
+
+def _normalize_versions(values: Sequence[Any]) -> tuple[str, ...] | None:
+    """
+    取得した version 値を文字列の並びにする。
+
+    Args:
+        values: backend から取得した version 値一覧
+
+    Returns:
+        version 値の並び。未生成のものがあれば None
+    """
+    if any(value is NO_VALUE for value in values):
+        return None
+    return tuple(str(value) for value in values)
@@ -0,0 +1,381 @@
+from collections.abc import Callable, Hashable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Condition, Lock, Timer, local
+from time import monotonic
+from typing import Any
+
+from dogpile.cache.api import NO_VALUE
+
+from ..log import get_logger
+from . import metrics
+
+_TARGETS_CACHE_KEY = "cache:warmup:targets"
+"プロセス間で共有する、参照回数上位の事前読み込み対象を保存するキー"
+_PERSISTED_TARGETS = 100
+"プロセス間で共有する事前読み込み対象の最大数"
+_logger = get_logger()
+
+WarmupTarget = tuple[str, tuple[Hashable, ...]]
+"事前読み込みの対象。読み込み関数の登録名と、読み込み関数へ渡す引数の組"
+
+
+@dataclass(frozen=True)
+class WarmupPolicy:
+    """
+    キャッシュの事前読み込みの設定。
+    """
+
+    top_n: int = 20
+    "起動時・version 更新後に事前読み込みする、参照回数上位の対象数"
+    delay_seconds: float = 2.0
+    "version 更新後、事前読み込みを始めるまでの秒数。この間の更新は 1 回の読み込みにまとめる"
+    max_workers: int = 2
+    "同時に事前読み込みする最大数"
+    half_life_seconds: float = 600.0
+    "参照回数を半分に減衰させる秒数。古い参照ほど順位への影響を小さくする"
+    max_entries: int = 1000
+    "参照回数を数える対象の最大数。超えたら回数の少ない対象から捨てる"
+
+
+class AccessTracker:
+    """
+    事前読み込みの対象ごとの参照回数を、時間とともに減衰させながら数える。
+    """
+
+    def __init__(
+        self,
+        half_life_seconds: float,
+        max_entries: int,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        """
+        空の状態で初期化する。
+
+        Args:
+            half_life_seconds: 参照回数を半分に減衰させる秒数
+            max_entries: 数える対象の最大数
+            clock: 現在時刻 (秒) を返す関数
+        """
+        self._half_life_seconds = half_life_seconds
+        self._max_entries = max_entries
+        self._clock = clock
+        # 全対象を毎回減衰させる代わりに、新しい参照ほど大きな重みで加算する。
+        # 重みの基準時刻からの経過で重みが大きくなりすぎたら、全体を縮めて基準時刻を進める。
+        self._origin = clock()
+        self._scores: dict[WarmupTarget, float] = {}
+        self._lock = Lock()
+
+    def record(self, target: WarmupTarget, count: float = 1) -> None:
+        """
+        対象の参照を記録する。
+
+        Args:
+            target: 参照された対象
+            count: 現在時刻に換算した参照回数
+        """
+        with self._lock:
+            weight = self._weight()
+            self._scores[target] = self._scores.get(target, 0.0) + count * weight
+            if len(self._scores) > self._max_entries:
+                self._evict()
+
+    def top(self, n: int) -> list[tuple[WarmupTarget, float]]:
+        """
+        参照回数の多い順に対象を返す。
+
+        Args:
+            n: 返す最大件数
+
+        Returns:
+            対象と、現在時刻に換算した参照回数の組の一覧
+        """
+        with self._lock:
+            weight = self._weight()
+            ranked = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(target, score / weight) for target, score in ranked]
+
+    def _weight(self) -> float:
+        """
+        現在時刻の参照 1 回分の重みを返す。ロックを取得した状態で呼ぶ。
+
+        Returns:
+            重み
+        """
+        elapsed = self._clock() - self._origin
+        if elapsed > self._half_life_seconds * 32:
+            scale = 2 ** (-elapsed / self._half_life_seconds)
+            self._scores = {
+                target: score * scale
+                for target, score in self._scores.items()
+                # 1 回分の参照の 1/1000 未満まで減衰した対象は数えるのをやめる。
+                if score * scale >= 0.001
+            }
+            self._origin += elapsed
+            elapsed = 0.0
+        return 2 ** (elapsed / self._half_life_seconds)
+
+    def _evict(self) -> None:
+        """
+        参照回数の少ない対象を捨て、最大数の半分まで減らす。ロックを取得した状態で呼ぶ。
+        """
+        ranked = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)
+        self._scores = dict(ranked[: max(self._max_entries // 2, 1)])
+
+
+class CacheWarmer:
+    """
+    参照回数の多いキャッシュを、起動時と version 更新の後にバックグラウンドで事前に読み込む。
+
+    読み込み関数は名前で登録し、参照は登録名と引数の組で記録する。参照回数上位の対象は
+    キャッシュリージョンへ保存し、新しく起動したプロセスも他のプロセスの記録から読み込む。
+    """
+
+    def __init__(self, clock: Callable[[], float] = monotonic) -> None:
+        """
+        無効な状態で初期化する。`start` するまで参照の記録も読み込みも行わない。
+
+        Args:
+            clock: 現在時刻 (秒) を返す関数
+        """
+        self._clock = clock
+        self._loaders: dict[str, Callable[..., Any]] = {}
+        self._policy: WarmupPolicy | None = None
+        self._tracker: AccessTracker | None = None
+        self._region: Any = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._in_flight: set[WarmupTarget] = set()
+        self._timer: Timer | None = None
+        self._condition = Condition()
+        self._warming = local()
+
+    def register(self, name: str, loader: Callable[..., Any]) -> None:
+        """
+        読み込み関数を登録する。
+
+        Args:
+            name: 登録名
+            loader: 記録した引数を受け取り、キャッシュを読み込む関数
+        """
+        self._loaders[name] = loader
+
+    def start(self, region: Any, policy: WarmupPolicy) -> int:
+        """
+        参照の記録を始め、他のプロセスの記録から参照回数上位の対象を読み込む。
+
+        Args:
+            region: 記録の共有に使うキャッシュリージョン
+            policy: 事前読み込みの設定
+
+        Returns:
+            読み込みを予約した対象数
+        """
+        with self._condition:
+            self._policy = policy
+            self._tracker = AccessTracker(
+                policy.half_life_seconds, policy.max_entries, clock=self._clock
+            )
+            self._region = region
+        self._restore()
+        return self.warm_up()
+
+    def stop(self) -> None:
+        """
+        参照回数上位の対象を保存し、予約済みの読み込みを取り消して無効な状態に戻す。
+        """
+        self._save()
+        with self._condition:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            executor = self._executor
+            self._executor = None
+            self._policy = None
+            self._tracker = None
+            # 取り消した読み込みは終わりを通知しないため、ここで読み込み中の記録を消す。
+            self._in_flight.clear()
+            self._condition.notify_all()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def record(self, name: str, *args: Hashable) -> None:
+        """
+        キャッシュを使う参照を記録する。
+
+        事前読み込み中の参照や、登録されていない名前の参照は記録しない。
+
+        Args:
+            name: 読み込み関数の登録名
+            args: 読み込み関数へ渡す引数
+        """
+        tracker = self._tracker
+        if tracker is None or name not in self._loaders or getattr(self._warming, "active", False):
+            return
+        tracker.record((name, args))
+
+    def schedule(self) -> bool:
+        """
+        `delay_seconds` 秒後の事前読み込みを予約する。version 更新の後に呼ぶ。
+
+        Returns:
+            予約したか。無効な状態か、既に予約済みなら False
+        """
+        with self._condition:
+            if self._policy is None or self._timer is not None:
+                return False
+            self._timer = Timer(self._policy.delay_seconds, self._run_scheduled)
+            self._timer.daemon = True
+            self._timer.start()
+        return True
+
+    def warm_up(self) -> int:
+        """
+        参照回数上位の対象の読み込みを予約する。
+
+        Returns:
+            予約した対象数。読み込み中の対象は数えない
+        """
+        with self._condition:
+            policy = self._policy
+            tracker = self._tracker
+        if policy is None or tracker is None:
+            return 0
+
+        self._save()
+        submitted = 0
+        for target, _ in tracker.top(policy.top_n):
+            if target[0] in self._loaders and self._submit(target, policy):
+                submitted += 1
+        if submitted:
+            _logger.info("Warming up %d query cache targets", submitted)
+        return submitted
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        予約済みの読み込みがすべて終わるまで待つ。
+
+        Args:
+            timeout: 最大待機秒数
+
+        Returns:
+            時間内に終わったか
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._in_flight and self._timer is None, timeout=timeout
+            )
+
+    def _run_scheduled(self) -> None:
+        """
+        予約した時刻になったら読み込みを始める。
+        """
+        with self._condition:
+            self._timer = None
+        self.warm_up()
+        with self._condition:
+            self._condition.notify_all()
+
+    def _submit(self, target: WarmupTarget, policy: WarmupPolicy) -> bool:
+        """
+        対象 1 件の読み込みをスレッドプールへ投入する。
+
+        Args:
+            target: 読み込む対象
+            policy: 事前読み込みの設定
+
+        Returns:
+            投入したか。同じ対象を読み込み中なら False
+        """
+        with self._condition:
+            if target in self._in_flight:
+                return False
+            self._in_flight.add(target)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=policy.max_workers, thread_name_prefix="query-cache-warmup"
+                )
+            executor = self._executor
+        executor.submit(self._warm, target)
+        return True
+
+    def _warm(self, target: WarmupTarget) -> None:
+        """
+        対象 1 件を読み込む。
+
+        Args:
+            target: 読み込む対象
+        """
+        name, args = target
+        self._warming.active = True
+        try:
+            self._loaders[name](*args)
+            metrics.increment("warmups", name)
+            _logger.debug("Query cache WARMED: %s%r", name, args)
+        except Exception as exc:
+            # 読み込めなくても、通常の参照時にキャッシュミスとして作り直される。
+            metrics.increment("warmup_errors", name)
+            _logger.warning("Failed to warm up query cache %s%r: %s", name, args, exc)
+        finally:
+            self._warming.active = False
+            with self._condition:
+                self._in_flight.discard(target)
+                self._condition.notify_all()
+
+    def _save(self) -> None:
+        """
+        参照回数上位の対象をキャッシュリージョンへ保存し、他のプロセスと共有する。
+        """
+        tracker = self._tracker
+        if tracker is None or self._region is None:
+            return
+        try:
+            self._region.set(
+                _TARGETS_CACHE_KEY,
+                [(name, args, score) for (name, args), score in tracker.top(_PERSISTED_TARGETS)],
+            )
+        except Exception as exc:
+            _logger.warning("Failed to save query cache warmup targets: %s", exc)
+
+    def _restore(self) -> None:
+        """
+        他のプロセスが保存した参照回数上位の対象を、自プロセスの記録へ加える。
+        """
+        tracker = self._tracker
+        if tracker is None or self._region is None:
+            return
+        try:
+            saved = self._region.get(_TARGETS_CACHE_KEY)
+        except Exception as exc:
+            _logger.warning("Failed to load query cache warmup targets: %s", exc)
+            return
+        if saved is NO_VALUE:
+            return
+        for name, args, score in _valid_entries(saved):
+            tracker.record((name, args), score)
+
+
+def _valid_entries(saved: Any) -> Iterable[tuple[str, tuple[Hashable, ...], float]]:
+    """
+    保存された事前読み込み対象のうち、読み込める形式のものだけを返す。
+
+    Args:
+        saved: キャッシュリージョンから取得した値
+
+    Returns:
+        登録名、引数、参照回数の組の一覧
+    """
+    if not isinstance(saved, list):
+        return []
+    entries = []
+    for entry in saved:
+        try:
+            name, args, score = entry
+            hash(args)
+        except (TypeError, ValueError):
+            continue
+        if isinstance(name, str) and isinstance(args, tuple) and isinstance(score, (int, float)):
+            entries.append((name, args, float(score)))
+    return entries
+
+
+cache_warmer = CacheWarmer()
@@ -1,3 +1,4 @@
+import json
 import os
 from typing import Final
 
@@ -48,6 +49,10 @@ class Config(BaseModel):
     "クエリキャッシュ全体の有効/無効"
     cache_redis_url: str
     "クエリキャッシュ用 Redis 接続URL"
+    cache_redis_shard_urls: list[str]
+    "キーを振り分けるクエリキャッシュ用 standalone Redis の接続URL一覧 (カンマ区切り)"
+    cache_redis_cluster: bool
+    "クエリキャッシュ用 Redis 接続URLを Redis Cluster のノードとして扱うか"
     cache_redis_expiration_time: int
     "クエリキャッシュのデフォルトTTL(秒)"
     cache_zstd_level: int
@@ -60,6 +65,54 @@ class Config(BaseModel):
     "クエリキャッシュ用クライアント証明書ファイルパス (mTLS用)"
     cache_redis_ssl_keyfile: str
     "クエリキャッシュ用クライアント秘密鍵ファイルパス (mTLS用)"
+    cache_local_max_entries: int
+    "プロセス内 L1 クエリキャッシュの最大件数 (0で無効)"
+    cache_local_expiration_time: int
+    "プロセス内 L1 クエリキャッシュの保持秒数"
+    cache_invalidation_channel: str
+    "L1 クエリキャッシュ無効化を通知する Redis pub/sub チャネル名"
+    cache_zstd_dictionary_refresh_interval: int
+    "クエリキャッシュの学習済み zstd 辞書を Redis から再読み込みする間隔(秒) (0で辞書を使わない)"
+    cache_stale_grace_time: int
+    "期限切れ・無効化後のクエリキャッシュを再生成中に返してよい秒数 (0で無効)"
+    cache_lock_enabled: bool
+    "クエリキャッシュの再生成を Redis ロックでプロセス間 1 本に絞るか"
+    cache_lock_timeout: int
+    "クエリキャッシュ再生成ロックの保持上限(秒)"
+    cache_lock_wait_timeout: float
+    "クエリキャッシュ再生成ロックを待つ最大秒数"
+    cache_lock_fallback_to_db: bool
+    "ロック待機上限を超えたら DB を直接参照するか (0なら503エラー)"
+    cache_list_compose_from_detail: bool
+    "一覧キャッシュにはハッシュIDの並びだけを保存し、要素は詳細キャッシュから組み立てるか"
+    cache_ttl_jitter: float
+    "クエリキャッシュの有効期限を保存ごとに最大何割短くするか (0で無効)"
+    cache_early_refresh_beta: float
+    "生成コストに応じて有効期限前に確率的に再生成する度合い (XFetch の β, 0で無効)"
+    cache_expiration_policies: dict[str, dict[str, float]]
+    "キャッシュキーの prefix ごとに jitter / early_refresh_beta を上書きする設定"
+    cache_key_compaction: bool
+    "長くなるクエリキャッシュキーの可変部分を keyed digest に置き換えるか"
+    cache_key_digest_secret: str
+    "キャッシュキー短縮の digest に使う秘密鍵 (未設定なら SALT を使う)"
+    cache_key_debug_mapping: bool
+    "短縮したキャッシュキーと元のキーの対応をキャッシュへ保存するか"
+    cache_client_side_cache_max_entries: int
+    "RESP3 client-side caching でプロセス内に保持する version 管理キーの最大件数 (0 で無効)"
+    cache_client_side_cache_retry_interval: float
+    "client-side caching が使えなかった後、再び試すまでの秒数"
+    cache_circuit_breaker_enabled: bool
+    "クエリキャッシュ用 Redis の失敗・遅延が続いたら、しばらく Redis を使わずに DB を参照するか"
+    cache_circuit_breaker: dict[str, float]
+    "サーキットブレーカーの判定条件 (CircuitBreakerPolicy の項目名と値) を上書きする設定"
+    cache_stale_if_error_time: int
+    "DB に接続できない場合に、期限切れ・無効化後のクエリキャッシュを返してよい秒数 (0で無効)"
+    cache_request_identity_map_enabled: bool
+    "1 リクエスト内で同じリポジトリ・DAO の参照を 1 回にまとめるか"
+    cache_warmup_enabled: bool
+    "起動時と一覧キャッシュの version 更新後に、よく参照されるキャッシュを事前に読み込むか"
+    cache_warmup: dict[str, float]
+    "キャッシュの事前読み込みの設定 (WarmupPolicy の項目名と値) を上書きする設定"
     blacklist_redis_url: str
     "ブラックリスト用 Redis 接続URL"
     blacklist_redis_ssl_verify_cert: bool
@@ -104,12 +157,46 @@ _config = Config(
     access_token_expire_minutes=int(env.get("ACCESS_TOKEN_EXPIRE_MINUTES", 20)),
     cache_enabled=bool(int(env.get("CACHE_ENABLED", 0))),
     cache_redis_url=env.get("CACHE_REDIS_URL", ""),
+    cache_redis_shard_urls=[
+        url.strip() for url in env.get("CACHE_REDIS_SHARD_URLS", "").split(",") if url.strip()
+    ],
+    cache_redis_cluster=bool(int(env.get("CACHE_REDIS_CLUSTER", 0))),
     cache_redis_expiration_time=int(env.get("CACHE_REDIS_EXPIRATION_TIME", 300)),
     cache_zstd_level=int(env.get("CACHE_ZSTD_LEVEL", 3)),
     cache_redis_ssl_verify_cert=bool(int(env.get("CACHE_REDIS_SSL_VERIFY_CERT", 0))),
     cache_redis_ssl_ca_certs=env.get("CACHE_REDIS_SSL_CA_CERTS", ""),
     cache_redis_ssl_certfile=env.get("CACHE_REDIS_SSL_CERTFILE", ""),
     cache_redis_ssl_keyfile=env.get("CACHE_REDIS_SSL_KEYFILE", ""),
+    cache_local_max_entries=int(env.get("CACHE_LOCAL_MAX_ENTRIES", 0)),
+    cache_local_expiration_time=int(env.get("CACHE_LOCAL_EXPIRATION_TIME", 30)),
+    cache_invalidation_channel=env.get(
+        "CACHE_INVALIDATION_CHANNEL", "bookmark:query-cache:invalidate"
+    ),
+    cache_zstd_dictionary_refresh_interval=int(
+        env.get("CACHE_ZSTD_DICTIONARY_REFRESH_INTERVAL", 300)
+    ),
+    cache_stale_grace_time=int(env.get("CACHE_STALE_GRACE_TIME", 0)),
+    cache_lock_enabled=bool(int(env.get("CACHE_LOCK_ENABLED", 0))),
+    cache_lock_timeout=int(env.get("CACHE_LOCK_TIMEOUT", 30)),
+    cache_lock_wait_timeout=float(env.get("CACHE_LOCK_WAIT_TIMEOUT", 5)),
+    cache_lock_fallback_to_db=bool(int(env.get("CACHE_LOCK_FALLBACK_TO_DB", 1))),
+    cache_list_compose_from_detail=bool(int(env.get("CACHE_LIST_COMPOSE_FROM_DETAIL", 0))),
+    cache_ttl_jitter=float(env.get("CACHE_TTL_JITTER", 0)),
+    cache_early_refresh_beta=float(env.get("CACHE_EARLY_REFRESH_BETA", 0)),
+    cache_expiration_policies=json.loads(env.get("CACHE_EXPIRATION_POLICIES", "{}")),
+    cache_key_compaction=bool(int(env.get("CACHE_KEY_COMPACTION", 0))),
+    cache_key_digest_secret=env.get("CACHE_KEY_DIGEST_SECRET", ""),
+    cache_key_debug_mapping=bool(int(env.get("CACHE_KEY_DEBUG_MAPPING", 0))),
+    cache_client_side_cache_max_entries=int(env.get("CACHE_CLIENT_SIDE_CACHE_MAX_ENTRIES", 0)),
+    cache_client_side_cache_retry_interval=float(
+        env.get("CACHE_CLIENT_SIDE_CACHE_RETRY_INTERVAL", 60)
+    ),
+    cache_circuit_breaker_enabled=bool(int(env.get("CACHE_CIRCUIT_BREAKER_ENABLED", 1))),
+    cache_circuit_breaker=json.loads(env.get("CACHE_CIRCUIT_BREAKER", "{}")),
+    cache_stale_if_error_time=int(env.get("CACHE_STALE_IF_ERROR_TIME", 0)),
+    cache_request_identity_map_enabled=bool(int(env.get("CACHE_REQUEST_IDENTITY_MAP_ENABLED", 0))),
+    cache_warmup_enabled=bool(int(env.get("CACHE_WARMUP_ENABLED", 0))),
+    cache_warmup=json.loads(env.get("CACHE_WARMUP", "{}")),
     blacklist_redis_url=env.get("BLACKLIST_REDIS_URL", ""),
     blacklist_redis_ssl_verify_cert=bool(int(env.get("BLACKLIST_REDIS_SSL_VERIFY_CERT", 0))),
     blacklist_redis_ssl_ca_certs=env.get("BLACKLIST_REDIS_SSL_CA_CERTS", ""),
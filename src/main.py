@@ -1,9 +1,28 @@
-from fastapi import FastAPI
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.gzip import GZipMiddleware
 from .controllers import auth, bookmark, user, version
 from .error_handler import add_error_handlers
+from .libs.cache import STALE_RESPONSE_HEADER, collect_stale_reads
 from .libs.openapi_tags import OPENAPI_TAGS
 from .libs.version import APP_VERSION
+from .repositories.warmup import start_cache_warmup, stop_cache_warmup
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    アプリケーションの起動・終了時の処理
+
+    Args:
+        app: WebAPP インスタンス
+    """
+    # よく参照されるキャッシュを、最初のリクエストより前にバックグラウンドで読み込む
+    start_cache_warmup()
+    yield
+    stop_cache_warmup()
 
 
 def create_app() -> FastAPI:
@@ -15,11 +34,23 @@ def create_app() -> FastAPI:
         description="API for bookmarking web page URL",
         openapi_tags=OPENAPI_TAGS,
         version=APP_VERSION,
+        lifespan=lifespan,
     )
 
     # gzip圧縮
     app.add_middleware(GZipMiddleware, minimum_size=1000)
 
+    # DB 障害時に古いクエリキャッシュで応答した場合は、その経過秒数をヘッダで知らせる
+    @app.middleware("http")
+    async def add_stale_response_header(
+        request: Request, call_next: Callable[[Request], Awaitable[Response]]
+    ) -> Response:
+        with collect_stale_reads() as stale_reads:
+            response = await call_next(request)
+        if stale_reads.max_age is not None:
+            response.headers[STALE_RESPONSE_HEADER] = str(int(stale_reads.max_age))
+        return response
+
     # ルーティング設定
     for controller in (auth, bookmark, user, version):
         app.include_router(controller.router, tags=[controller.tagname])
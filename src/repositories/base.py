@@ -1,10 +1,14 @@
+from collections.abc import Callable
+from typing import Self
+
 from dogpile.cache.region import CacheRegion
 from sqlalchemy.orm.session import Session
 
-from ..libs.cache import NullCacheRegion, get_query_cache_region
+from ..libs.cache import NullCacheRegion, VersionedCacheKey, get_query_cache_region
 from ..libs.cache.invalidation import (
     install_session_cache_invalidation_listeners,
     new_cache_version,
+    schedule_cache_index_deletes,
     schedule_cache_key_deletes,
     schedule_cache_version_bumps,
 )
@@ -12,6 +16,11 @@ from ..libs.page import Page
 
 install_session_cache_invalidation_listeners()
 
+NOT_FOUND_CACHE_EXPIRATION_TIME = 30
+"未存在データの問い合わせ結果をキャッシュする秒数"
+LIST_CACHE_WINDOW_SIZE = 100
+"ページサイズによらず一覧キャッシュを共有するための、固定長の窓の件数"
+
 
 class RepositoryError(Exception):
     pass
@@ -57,16 +66,78 @@ class BaseRepository:
         self.region = region if region is not None else get_query_cache_region()
         "クエリキャッシュリージョン"
 
-    def _page_cache_fragment(self) -> str:
+    def with_session(self, session: Session) -> Self:
         """
-        現在のページ条件をキャッシュキー向けの文字列に変換する。
+        同じ条件で別の Session を使うレポジトリを生成する。
+
+        キャッシュ値のバックグラウンド再生成など、リクエストの Session を使えない処理で使う。
+
+        Args:
+            session: データベースセッション
+
+        Returns:
+            生成したレポジトリ
+        """
+        return type(self)(session, page=self.page, region=self.region)
+
+    def _page_cache_fragment(self, page: Page | None = None) -> str:
+        """
+        ページ条件をキャッシュキー向けの文字列に変換する。
+
+        Args:
+            page: 対象のページ情報。省略時は現在のページ情報
 
         Returns:
             ページ条件を表す文字列
         """
-        if self.page is None:
+        page = page or self.page
+        if page is None:
             return "page:none:size:none"
-        return f"page:{self.page.number}:size:{self.page.size}"
+        return f"page:{page.number}:size:{page.size}"
+
+    def _list_cache_windows(self) -> tuple[list[Page], int]:
+        """
+        現在のページ条件を覆う、`LIST_CACHE_WINDOW_SIZE` 件単位に揃えた窓を返す。
+
+        Returns:
+            先頭から順に並べた窓のページ情報と、先頭の窓の中での開始位置の組
+
+        Raises:
+            ValueError: ページ情報が指定されていない
+        """
+        if self.page is None:
+            raise ValueError("list cache windows require page")
+        first = self.page.offset // LIST_CACHE_WINDOW_SIZE
+        last = (self.page.offset + self.page.size - 1) // LIST_CACHE_WINDOW_SIZE
+        windows = [
+            Page(number=number + 1, size=LIST_CACHE_WINDOW_SIZE)
+            for number in range(first, last + 1)
+        ]
+        return windows, self.page.offset - first * LIST_CACHE_WINDOW_SIZE
+
+    def _read_list_windows[T](self, load: Callable[[Page | None], list[T]]) -> list[T]:
+        """
+        窓ごとに取得した一覧をつなげ、現在のページ条件の範囲を切り出す。
+
+        Args:
+            load: 窓のページ情報を受け取り、その範囲の一覧を返す関数。ページ情報が
+                指定されていない場合は None を渡して全件を取得させる
+
+        Returns:
+            現在のページ条件の一覧
+        """
+        if self.page is None:
+            return load(None)
+
+        windows, start = self._list_cache_windows()
+        items: list[T] = []
+        for window in windows:
+            window_items = load(window)
+            items.extend(window_items)
+            if len(window_items) < window.size:
+                # 末尾に達したので、後続の窓は空になる。
+                break
+        return items[start : start + self.page.size]
 
     def _cache_version_key(self, namespace: str) -> str:
         """
@@ -78,7 +149,46 @@ class BaseRepository:
         Returns:
             バージョン管理キー
         """
-        return f"{self.__class__.__module__}.{self.__class__.__qualname__}:version:{namespace}"
+        return self._compact_cache_key(
+            f"{self.__class__.__module__}.{self.__class__.__qualname__}:version", namespace
+        )
+
+    def _compact_cache_key(self, prefix: str, variable: str) -> str:
+        """
+        可変部分を含むキャッシュキーを組み立てる。
+
+        リージョンにキー短縮が設定されていれば、可変部分を固定長の digest に置き換える。
+
+        Args:
+            prefix: そのまま残す namespace 部分
+            variable: 可変部分
+
+        Returns:
+            キャッシュキー
+        """
+        compact_key = getattr(self.region, "compact_key", None)
+        if compact_key is None:
+            return f"{prefix}:{variable}"
+        return compact_key(prefix, variable)
+
+    def _versioned_cache_key(
+        self, namespaces: tuple[str, ...], build: Callable[[tuple[str, ...]], str]
+    ) -> VersionedCacheKey:
+        """
+        指定 namespace 群の version を埋め込むキャッシュキーを返す。
+
+        version 値はキャッシュ参照時に本体の値とまとめて解決される。
+
+        Args:
+            namespaces: キーに埋め込む version の namespace 一覧
+            build: version 値の並びからキャッシュキーを組み立てる関数
+
+        Returns:
+            version 付きキャッシュキー
+        """
+        return VersionedCacheKey(
+            tuple(self._cache_version_key(namespace) for namespace in namespaces), build
+        )
 
     def _get_cache_version(self, namespace: str) -> str:
         """
@@ -117,6 +227,15 @@ class BaseRepository:
         """
         schedule_cache_key_deletes(self.session, self.region, *keys)
 
+    def _delete_indexed_cache_keys(self, *index_keys: str) -> None:
+        """
+        指定された逆引きインデックスに登録されたキャッシュキー群を削除する。
+
+        Args:
+            index_keys: 対象の逆引きインデックスキー一覧
+        """
+        schedule_cache_index_deletes(self.session, self.region, *index_keys)
+
     @staticmethod
     def _new_cache_version() -> str:
         """
@@ -1,12 +1,30 @@
+from typing import Self
 from urllib.parse import quote
 
+from sqlalchemy.orm.session import Session
+
 from ..dao.models.bookmark import BookmarkDao
 from ..dao.operators.bookmark import BookmarkDaoOperator
 from ..dao.operators.bookmark_tag import BookmarkTagDaoOperator
 from ..dao.operators.tag import TagDaoOperator
 from ..entities.bookmark import BookmarkEntity
-from ..libs.cache import query_cache
-from .base import BaseRepository
+from ..libs.page import Page
+from ..libs.cache import (
+    VersionedCacheKey,
+    cache_warmer,
+    query_cache,
+    query_cache_multi,
+    register_cache_model,
+)
+from ..libs.config import get_config
+from .base import NOT_FOUND_CACHE_EXPIRATION_TIME, BaseRepository
+
+
+# キャッシュにはフィールド順のコンパクト形式で保存する。
+register_cache_model(BookmarkEntity)
+
+LIST_WARMUP_NAME = "bookmark.list"
+"一覧の事前読み込みの登録名。引数はページ番号、ページサイズ、タグ名の組"
 
 
 class BookmarkRepository(BaseRepository):
@@ -14,13 +32,34 @@ class BookmarkRepository(BaseRepository):
     ブックマークリポジトリクラス
     """
 
-    def __init__(self, *args, **kwargs) -> None:
+    def __init__(self, *args, compose_lists: bool | None = None, **kwargs) -> None:
+        """
+        初期化処理
+
+        Args:
+            compose_lists: 一覧キャッシュにはハッシュIDの並びだけを保存し、要素を詳細キャッシュから
+                組み立てるか。None なら設定値に従う
+        """
         super().__init__(*args, **kwargs)
+        self.compose_lists = (
+            get_config().cache_list_compose_from_detail if compose_lists is None else compose_lists
+        )
+        "一覧を詳細キャッシュから組み立てるか"
         self.bookmark_operator = BookmarkDaoOperator(self.session, page=self.page)
         self.tag_operator = TagDaoOperator(self.session)
         self.bookmark_tag_operator = BookmarkTagDaoOperator(self.session)
 
-    @query_cache(key_func=lambda self, hashed_id: type(self)._find_one_cache_key(hashed_id))
+    def with_session(self, session: Session) -> Self:
+        return type(self)(
+            session, page=self.page, region=self.region, compose_lists=self.compose_lists
+        )
+
+    @query_cache(
+        key_func=lambda self, hashed_id: type(self)._find_one_cache_key(hashed_id),
+        negative_cache=BaseRepository.NotFoundError,
+        negative_expiration_time=NOT_FOUND_CACHE_EXPIRATION_TIME,
+        stale_if_error=True,
+    )
     def find_one(self, /, hashed_id: str) -> BookmarkEntity:
         """
         指定されたハッシュIDに対応するブックマークを1件取得する。
@@ -46,7 +85,30 @@ class BookmarkRepository(BaseRepository):
 
         return BookmarkEntity(**params)
 
-    @query_cache(key_func=lambda self: self._find_all_cache_key())
+    @query_cache_multi(
+        key_func=lambda self, hashed_id: type(self)._find_one_cache_key(hashed_id),
+        stale_if_error=True,
+    )
+    def find_many(self, /, hashed_ids: list[str]) -> dict[str, BookmarkEntity]:
+        """
+        指定されたハッシュIDに対応するブックマークをまとめて取得する。
+
+        詳細キャッシュ (`find_one` と同じキー) を 1 回の multi-get で参照し、無かったものだけを
+        1 回の IN 句で DB から取得する。
+
+        Args:
+            hashed_ids: ブックマークのハッシュIDのリスト
+
+        Returns:
+            ハッシュIDとブックマークエンティティの対応。見つからなかったものは含まない
+        """
+        bookmark_daos = self.bookmark_operator.find_by_hashed_ids(hashed_ids)
+        return {
+            entity.hashed_id: entity
+            for entity in self._create_entities_with_tags(bookmark_daos)
+            if entity.hashed_id is not None
+        }
+
     def find_all(self) -> list[BookmarkEntity]:
         """
         全てのブックマークを取得する。
@@ -54,10 +116,11 @@ class BookmarkRepository(BaseRepository):
         Returns:
             ブックマークエンティティのリスト
         """
-        bookmark_daos = self.bookmark_operator.find_all()
-        return self._create_entities_with_tags(bookmark_daos)
+        self._record_list_access([])
+        if self.compose_lists:
+            return self._find_by_hashed_ids(self._find_all_hashed_ids())
+        return self._find_all()
 
-    @query_cache(key_func=lambda self, tag_names: self._find_by_tags_cache_key(tag_names))
     def find_by_tags(self, tag_names: list[str]) -> list[BookmarkEntity]:
         """
         指定されたタグ名に関連付けられたブックマークを取得する。
@@ -68,9 +131,101 @@ class BookmarkRepository(BaseRepository):
         Returns:
             list[BookmarkEntity]: 指定されたタグに関連付けられたブックマークエンティティのリスト
         """
-        bookmark_daos = self.bookmark_operator.find_by_tags(tag_names)
+        self._record_list_access(tag_names)
+        if self.compose_lists:
+            return self._find_by_hashed_ids(self._find_hashed_ids_by_tags(tag_names))
+        return self._find_by_tags(tag_names)
+
+    def _find_all(self) -> list[BookmarkEntity]:
+        return self._read_list_windows(self._find_all_in_window)
+
+    @query_cache(
+        key_func=lambda self, window: self._find_all_cache_key(window=window),
+        stale_while_revalidate=True,
+        reverse_index=lambda bookmarks: BookmarkRepository._list_index_keys(bookmarks),
+        stale_if_error=True,
+    )
+    def _find_all_in_window(self, window: Page | None) -> list[BookmarkEntity]:
+        bookmark_daos = self.bookmark_operator.find_all(window)
         return self._create_entities_with_tags(bookmark_daos)
 
+    def _find_all_hashed_ids(self) -> list[str]:
+        return self._read_list_windows(self._find_all_hashed_ids_in_window)
+
+    @query_cache(
+        key_func=lambda self, window: self._find_all_cache_key(ids_only=True, window=window),
+        stale_while_revalidate=True,
+        reverse_index=lambda hashed_ids: BookmarkRepository._list_index_keys(hashed_ids),
+        stale_if_error=True,
+    )
+    def _find_all_hashed_ids_in_window(self, window: Page | None) -> list[str]:
+        return [dao.hashed_id for dao in self.bookmark_operator.find_all(window)]
+
+    def _find_by_tags(self, tag_names: list[str]) -> list[BookmarkEntity]:
+        return self._read_list_windows(
+            lambda window: self._find_by_tags_in_window(tag_names, window)
+        )
+
+    @query_cache(
+        key_func=lambda self, tag_names, window: self._find_by_tags_cache_key(
+            tag_names, window=window
+        ),
+        stale_while_revalidate=True,
+        reverse_index=lambda bookmarks: BookmarkRepository._list_index_keys(bookmarks),
+        stale_if_error=True,
+    )
+    def _find_by_tags_in_window(
+        self, tag_names: list[str], window: Page | None
+    ) -> list[BookmarkEntity]:
+        bookmark_daos = self.bookmark_operator.find_by_tags(tag_names, window)
+        return self._create_entities_with_tags(bookmark_daos)
+
+    def _find_hashed_ids_by_tags(self, tag_names: list[str]) -> list[str]:
+        return self._read_list_windows(
+            lambda window: self._find_hashed_ids_by_tags_in_window(tag_names, window)
+        )
+
+    @query_cache(
+        key_func=lambda self, tag_names, window: self._find_by_tags_cache_key(
+            tag_names, ids_only=True, window=window
+        ),
+        stale_while_revalidate=True,
+        reverse_index=lambda hashed_ids: BookmarkRepository._list_index_keys(hashed_ids),
+        stale_if_error=True,
+    )
+    def _find_hashed_ids_by_tags_in_window(
+        self, tag_names: list[str], window: Page | None
+    ) -> list[str]:
+        return [dao.hashed_id for dao in self.bookmark_operator.find_by_tags(tag_names, window)]
+
+    def _record_list_access(self, tag_names: list[str]) -> None:
+        """
+        一覧の参照を、事前読み込みの対象として記録する。
+
+        Args:
+            tag_names: 検索条件のタグ名のリスト。全件なら空
+        """
+        # タグ順や重複の違いは同じ条件として数える。
+        cache_warmer.record(
+            LIST_WARMUP_NAME,
+            self.page.number if self.page else None,
+            self.page.size if self.page else None,
+            tuple(sorted(set(tag_names))),
+        )
+
+    def _find_by_hashed_ids(self, hashed_ids: list[str]) -> list[BookmarkEntity]:
+        """
+        ハッシュIDの並びに対応するブックマークを、詳細キャッシュから組み立てる。
+
+        Args:
+            hashed_ids: 一覧の並び順どおりのハッシュIDのリスト
+
+        Returns:
+            ブックマークエンティティのリスト。既に削除されたものは含まない
+        """
+        found = self.find_many(hashed_ids)
+        return [found[hashed_id] for hashed_id in hashed_ids if hashed_id in found]
+
     def _create_entities_with_tags(self, bookmark_daos: list[BookmarkDao]) -> list[BookmarkEntity]:
         """
         ブックマークDAOリストからタグ付きのエンティティを作成する。
@@ -112,7 +267,7 @@ class BookmarkRepository(BaseRepository):
         self._save_tags(bookmark.tags, bookmark_dao.id)
         # 詳細キーは直接削除し、一覧系は version を進めてまとめて無効化する。
         self._delete_cache_keys(type(self)._find_one_cache_key(bookmark_dao.hashed_id))
-        self._bump_cache_versions("list", "tag-list")
+        self._bump_cache_versions("list", *self._tag_cache_namespaces(bookmark.tags or []))
 
     def update_one(self, bookmark: BookmarkEntity, /, current_hashed_id: str) -> None:
         """
@@ -130,6 +285,8 @@ class BookmarkRepository(BaseRepository):
             raise self.NotFoundError("Not found specified data.")
         for k, v in bookmark.model_dump(exclude_none=True, exclude={"tags"}).items():
             setattr(bookmark_dao, k, v)
+        # 付け替え前のタグの一覧からも外れるため、保存前のタグを控えておく。
+        old_tags = [tag.name for tag in self.tag_operator.find_by_bookmark_id(bookmark_dao.id)]
 
         self.bookmark_operator.save(bookmark_dao)
         self.session.refresh(bookmark_dao)
@@ -141,7 +298,11 @@ class BookmarkRepository(BaseRepository):
             type(self)._find_one_cache_key(current_hashed_id),
             type(self)._find_one_cache_key(bookmark_dao.hashed_id),
         )
-        self._bump_cache_versions("list", "tag-list")
+        # 更新ではページ境界がずれないため、一覧は対象を含むキーだけを削除する。
+        self._delete_indexed_cache_keys(type(self)._list_index_key(current_hashed_id))
+        if bookmark.tags is not None and set(bookmark.tags) != set(old_tags):
+            # タグの付け替えは検索結果の顔ぶれが変わるため、変更前後のタグの条件を無効化する。
+            self._bump_cache_versions(*self._tag_cache_namespaces([*old_tags, *bookmark.tags]))
 
     def _save_tags(self, tags: list[str] | None, bookmark_dao_id: int) -> None:
         """
@@ -172,21 +333,65 @@ class BookmarkRepository(BaseRepository):
         bookmark_dao = self.bookmark_operator.find_one_by_hashed_id(hashed_id)
         if bookmark_dao is None:
             raise self.NotFoundError("Not found specified data.")
+        tags = [tag.name for tag in self.tag_operator.find_by_bookmark_id(bookmark_dao.id)]
 
         self.bookmark_operator.delete(bookmark_dao)
         self._delete_cache_keys(type(self)._find_one_cache_key(hashed_id))
-        self._bump_cache_versions("list", "tag-list")
+        self._bump_cache_versions("list", *self._tag_cache_namespaces(tags))
 
     @staticmethod
     def _find_one_cache_key(hashed_id: str | None) -> str:
         return f"bookmark:detail:{hashed_id}"
 
-    def _find_all_cache_key(self) -> str:
-        version = self._get_cache_version("list")
-        return f"bookmark:list:all:v:{version}:{self._page_cache_fragment()}"
+    @staticmethod
+    def _list_index_key(hashed_id: str | None) -> str:
+        return f"bookmark:list-index:{hashed_id}"
+
+    @staticmethod
+    def _list_index_keys(bookmarks: list[BookmarkEntity] | list[str]) -> list[str]:
+        # 一覧キャッシュを、含まれるブックマークごとの逆引きインデックスへ登録する。
+        return [
+            BookmarkRepository._list_index_key(
+                bookmark if isinstance(bookmark, str) else bookmark.hashed_id
+            )
+            for bookmark in bookmarks
+        ]
+
+    def _find_all_cache_key(
+        self, ids_only: bool = False, window: Page | None = None
+    ) -> VersionedCacheKey:
+        prefix = "bookmark:list-ids" if ids_only else "bookmark:list"
+        page = self._page_cache_fragment(window)
+        return self._versioned_cache_key(
+            ("list",), lambda versions: f"{prefix}:all:v:{versions[0]}:{page}"
+        )
 
-    def _find_by_tags_cache_key(self, tag_names: list[str]) -> str:
-        version = self._get_cache_version("tag-list")
+    def _find_by_tags_cache_key(
+        self, tag_names: list[str], ids_only: bool = False, window: Page | None = None
+    ) -> VersionedCacheKey:
         # タグ順や重複に依存しないように正規化し、区切り文字を含むタグでもキー衝突しないようにする。
+        namespaces = self._tag_cache_namespaces(tag_names)
         normalized_tags = ",".join(quote(tag_name, safe="") for tag_name in sorted(set(tag_names)))
-        return f"bookmark:list:tags:{normalized_tags}:v:{version}:{self._page_cache_fragment()}"
+        prefix = "bookmark:list-ids" if ids_only else "bookmark:list"
+        page = self._page_cache_fragment(window)
+        # 複数タグの条件は、構成する全タグの version を組み合わせてキーにする。
+        # タグ数・タグ長に比例して長くなるため、キー短縮の対象にする。
+        return self._versioned_cache_key(
+            namespaces,
+            lambda versions: self._compact_cache_key(
+                f"{prefix}:tags", f"{normalized_tags}:v:{'.'.join(versions)}:{page}"
+            ),
+        )
+
+    @staticmethod
+    def _tag_cache_namespaces(tag_names: list[str]) -> tuple[str, ...]:
+        """
+        タグごとの一覧キャッシュ version の namespace を返す。
+
+        Args:
+            tag_names: タグ名のリスト
+
+        Returns:
+            重複を除いてタグ名順に並べた namespace 一覧
+        """
+        return tuple(f"tag:{quote(tag_name, safe='')}" for tag_name in sorted(set(tag_names)))
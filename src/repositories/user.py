@@ -1,8 +1,15 @@
 from ..dao.models.user import UserDao
 from ..dao.operators.user import UserDaoOperator
 from ..entities.user import UserEntity
-from ..libs.cache import query_cache
-from .base import BaseRepository
+from ..libs.cache import VersionedCacheKey, query_cache, register_cache_model
+from .base import NOT_FOUND_CACHE_EXPIRATION_TIME, BaseRepository
+
+
+# キャッシュにはフィールド順のコンパクト形式で保存する。
+register_cache_model(UserEntity)
+
+DETAIL_WARMUP_NAME = "user.detail"
+"ユーザー詳細の事前読み込みの登録名。引数はユーザー名"
 
 
 class UserRepository(BaseRepository):
@@ -14,7 +21,11 @@ class UserRepository(BaseRepository):
         super().__init__(*args, **kwargs)
         self.user_operator = UserDaoOperator(self.session, page=self.page)
 
-    @query_cache(key_func=lambda self, name: type(self)._find_one_cache_key(name))
+    @query_cache(
+        key_func=lambda self, name: type(self)._find_one_cache_key(name),
+        negative_cache=BaseRepository.NotFoundError,
+        negative_expiration_time=NOT_FOUND_CACHE_EXPIRATION_TIME,
+    )
     def find_one(self, /, name: str) -> UserEntity:
         """
         指定されたユーザー名に対応するユーザーを1件取得する。
@@ -87,6 +98,8 @@ class UserRepository(BaseRepository):
     def _find_one_cache_key(name: str) -> str:
         return f"user:detail:{name}"
 
-    def _find_all_cache_key(self) -> str:
-        version = self._get_cache_version("list")
-        return f"user:list:v:{version}:{self._page_cache_fragment()}"
+    def _find_all_cache_key(self) -> VersionedCacheKey:
+        page = self._page_cache_fragment()
+        return self._versioned_cache_key(
+            ("list",), lambda versions: f"user:list:v:{versions[0]}:{page}"
+        )
@@ -0,0 +1,95 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from sqlalchemy.orm import Session
+
+from ..dao.session import ScopedSession
+from ..libs.cache import cache_warmer, get_query_cache_region
+from ..libs.cache.invalidation import add_version_bump_listener, remove_version_bump_listener
+from ..libs.cache.provider import build_warmup_policy
+from ..libs.config import get_config
+from ..libs.page import Page
+from .bookmark import LIST_WARMUP_NAME as BOOKMARK_LIST_WARMUP_NAME
+from .bookmark import BookmarkRepository
+from .user import DETAIL_WARMUP_NAME as USER_DETAIL_WARMUP_NAME
+from .user import UserRepository
+
+
+@contextmanager
+def _warmup_session() -> Iterator[Session]:
+    """
+    事前読み込み用のセッションを、読み込みを行うスレッドで生成する。
+
+    Yields:
+        データベースセッション
+    """
+    session = ScopedSession()
+    try:
+        with session.begin():
+            yield session
+    finally:
+        ScopedSession.remove()
+
+
+def warm_bookmark_list(
+    page_number: int | None, page_size: int | None, tag_names: tuple[str, ...]
+) -> None:
+    """
+    ブックマーク一覧のキャッシュを読み込む。
+
+    Args:
+        page_number: ページ番号。ページ指定なしなら None
+        page_size: ページサイズ。ページ指定なしなら None
+        tag_names: 検索条件のタグ名。全件なら空
+    """
+    page = (
+        Page(number=page_number, size=page_size)
+        if page_number is not None and page_size is not None
+        else None
+    )
+    with _warmup_session() as session:
+        repository = BookmarkRepository(session, page=page)
+        if tag_names:
+            repository.find_by_tags(list(tag_names))
+        else:
+            repository.find_all()
+
+
+def warm_user_detail(name: str) -> None:
+    """
+    ユーザー詳細のキャッシュを読み込む。
+
+    Args:
+        name: ユーザー名
+    """
+    with _warmup_session() as session:
+        try:
+            UserRepository(session).find_one(name)
+        except UserRepository.NotFoundError:
+            # 削除済みのユーザーは、未存在の記録が残るだけなので何もしない。
+            pass
+
+
+def start_cache_warmup() -> int:
+    """
+    キャッシュの事前読み込みを始める。アプリケーションの起動時に呼ぶ。
+
+    Returns:
+        起動時に読み込みを予約した対象数。無効なら 0
+    """
+    policy = build_warmup_policy(get_config())
+    if policy is None:
+        return 0
+    cache_warmer.register(BOOKMARK_LIST_WARMUP_NAME, warm_bookmark_list)
+    cache_warmer.register(USER_DETAIL_WARMUP_NAME, warm_user_detail)
+    # version 更新で一覧キャッシュが空になるため、よく参照される一覧を少し後に読み込み直す。
+    add_version_bump_listener(cache_warmer.schedule)
+    return cache_warmer.start(get_query_cache_region(), policy)
+
+
+def stop_cache_warmup() -> None:
+    """
+    キャッシュの事前読み込みを止める。アプリケーションの終了時に呼ぶ。
+    """
+    remove_version_bump_listener(cache_warmer.schedule)
+    cache_warmer.stop()
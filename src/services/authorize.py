@@ -15,6 +15,8 @@ from sqlalchemy.orm.session import Session
 from ..dao.session import SessionDepend
 from ..dto.auth import RequestForLogin, Token
 from ..entities.user import UserEntity
+from ..libs.cache import cache_warmer
+from ..repositories.user import DETAIL_WARMUP_NAME as USER_DETAIL_WARMUP_NAME
 from ..repositories.user import UserRepository
 from .base import ServiceBase, ServiceError
 from .token_blacklist import TokenBlacklistService
@@ -324,6 +326,8 @@ class AuthorizeService(ServiceBase):
             user = self.get_user(name=token_data.username)
         except (ValidationError, UserRepository.NotFoundError, self.Error):
             raise self.Error("Could not validate credentials")
+        # 認証済みのユーザーは、次のリクエストでも参照されるため事前読み込みの対象にする。
+        cache_warmer.record(USER_DETAIL_WARMUP_NAME, user.name)
         return user
 
 
@@ -0,0 +1,135 @@
+import argparse
+from collections.abc import Iterator
+
+import zstandard as zstd
+from redis import Redis, RedisCluster
+
+from .libs.cache.dictionaries import (
+    DEFAULT_DICTIONARY_NAMESPACES,
+    ZstdDictionaryCodec,
+    ZstdDictionaryStore,
+    train_dictionary,
+)
+from .libs.cache.provider import build_connection_kwargs
+from .libs.config import Config, get_config
+
+_SCAN_COUNT = 1000
+_MGET_BATCH_SIZE = 100
+
+
+def _sample_values(
+    client: Redis | RedisCluster, codec: ZstdDictionaryCodec, prefix: str, limit: int
+) -> Iterator[bytes]:
+    """
+    prefix に一致するキャッシュエントリを展開した状態で取り出す。
+
+    Args:
+        client: クエリキャッシュ用 Redis クライアント
+        codec: 既存エントリの展開に使うコーデック
+        prefix: 対象キャッシュキーの prefix
+        limit: 取り出す最大件数
+
+    Yields:
+        展開済みのキャッシュ値
+    """
+    keys: list[bytes] = []
+    for key in client.scan_iter(match=f"{prefix}*", count=_SCAN_COUNT):
+        keys.append(key)
+        if len(keys) >= limit:
+            break
+
+    # Redis Cluster ではスロットをまたぐ MGET を送れないため、スロットごとに分けて取得する。
+    mget = client.mget_nonatomic if isinstance(client, RedisCluster) else client.mget
+    for start in range(0, len(keys), _MGET_BATCH_SIZE):
+        for value in mget(keys[start : start + _MGET_BATCH_SIZE]):
+            # キャッシュ値は bytes で保存するため、それ以外の応答は学習対象から外す。
+            if not isinstance(value, bytes):
+                continue
+            try:
+                yield codec.decompress(value)
+            except zstd.ZstdError:
+                # 辞書が削除済みの古いエントリなどは学習対象から外す。
+                continue
+
+
+def _connect(config: Config) -> Redis | RedisCluster:
+    """
+    辞書の保存先と同じ Redis へ接続する。
+
+    複数ノードへ振り分ける構成では、キャッシュ backend と同じく先頭ノードに辞書を置き、
+    そのノードが担当するエントリを標本にする。
+
+    Args:
+        config: アプリケーション設定
+
+    Returns:
+        Redis クライアント。Redis Cluster 構成では RedisCluster
+    """
+    connection_kwargs = build_connection_kwargs(config)
+    if config.cache_redis_cluster:
+        return RedisCluster.from_url(config.cache_redis_url, **connection_kwargs)
+    url = config.cache_redis_shard_urls[0] if config.cache_redis_shard_urls else None
+    return Redis.from_url(url or config.cache_redis_url, **connection_kwargs)
+
+
+def train_cache_dictionaries(sample_size: int, dict_size: int, keep: int) -> None:
+    """
+    稼働中のクエリキャッシュからサンプルを取り、namespace ごとの zstd 辞書を学習して登録する。
+
+    Args:
+        sample_size: namespace ごとに使う最大サンプル数
+        dict_size: 辞書の最大バイト数
+        keep: 保持する辞書の世代数
+    """
+    config = get_config()
+    client = _connect(config)
+    store = ZstdDictionaryStore(client)
+    codec = ZstdDictionaryCodec(level=config.cache_zstd_level, source=store)
+    namespaces: dict[str, list[str]] = {}
+    for prefix, namespace in DEFAULT_DICTIONARY_NAMESPACES.items():
+        namespaces.setdefault(namespace, []).append(prefix)
+
+    for namespace, prefixes in namespaces.items():
+        samples = [
+            value
+            for prefix in prefixes
+            for value in _sample_values(client, codec, prefix, sample_size)
+        ]
+        if not samples:
+            print(f"{namespace}: no samples, skipped")
+            continue
+
+        try:
+            dictionary = train_dictionary(
+                samples,
+                dict_id=store.next_dict_id(),
+                dict_size=dict_size,
+                level=config.cache_zstd_level,
+            )
+        except zstd.ZstdError as exc:
+            print(f"{namespace}: failed to train with {len(samples)} samples ({exc})")
+            continue
+
+        # 学習前後の圧縮後サイズを比べて効果を出力する。
+        plain = zstd.ZstdCompressor(level=config.cache_zstd_level)
+        trained = zstd.ZstdCompressor(level=config.cache_zstd_level, dict_data=dictionary)
+        before = sum(len(plain.compress(sample)) for sample in samples)
+        after = sum(len(trained.compress(sample)) for sample in samples)
+        expired = store.save(namespace, dictionary, keep=keep)
+        print(
+            f"{namespace}: dict_id={dictionary.dict_id()} samples={len(samples)} "
+            f"bytes {before} -> {after} removed={expired}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train zstd dictionaries for the query cache")
+    parser.add_argument("--sample-size", type=int, default=2000)
+    parser.add_argument("--dict-size", type=int, default=16 * 1024)
+    parser.add_argument("--keep", type=int, default=3)
+    args = parser.parse_args()
+    train_cache_dictionaries(args.sample_size, args.dict_size, args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,13 @@
+from typing import Any
+
+import pytest
+from dogpile.cache.api import CachedValue
 from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
 
+import src.repositories.base as repository_base
+from src.dao.operators.bookmark import BookmarkDaoOperator
+from src.libs.cache import STALE_RESPONSE_HEADER, create_memory_region
 from src.libs.util import datetime_to_str
 from src.main import app
 
@@ -85,3 +93,40 @@ class TestGetBookmark(BaseTest):
         hashed_id = "x" * 64
         response = client.get(self.api_path(hashed_id))
         assert response.status_code == 422
+
+    def test_get_one_stale_when_database_unavailable(
+        self,
+        client: TestClient,
+        db_session: SessionForTest,
+        mock_get_current_active_user: None,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        """
+        正常系:
+        DB に接続できない場合は有効期限切れのキャッシュで応答し、経過秒数をヘッダで知らせる
+        """
+        # テストデータ作成
+        region = create_memory_region(expiration_time=60, stale_if_error_time=600)
+        monkeypatch.setattr(repository_base, "get_query_cache_region", lambda: region)
+        db_bookmark = self.create_bookmarks(db_session, num=1)[0]
+        assert client.get(self.api_path(db_bookmark.hashed_id)).status_code == 200
+        # 保存時刻を過去へずらし、有効期限切れの値にする。
+        key = f"bookmark:detail:{db_bookmark.hashed_id}"
+        cached = region.get_value_metadata(key, ignore_expiration=True)
+        assert cached is not None
+        region._set_cached_value_to_backend(
+            key, CachedValue(cached.payload, {**cached.metadata, "ct": cached.metadata["ct"] - 120})
+        )
+
+        def database_down(*args: Any, **kwargs: Any) -> None:
+            raise OperationalError("SELECT 1", {}, Exception("Can't connect to MySQL server"))
+
+        monkeypatch.setattr(BookmarkDaoOperator, "find_one_by_hashed_id", database_down)
+
+        # リクエストの送信
+        response = client.get(self.api_path(db_bookmark.hashed_id))
+
+        # レスポンスの検証
+        assert response.status_code == 200
+        assert response.json()["bookmark"]["hashed_id"] == db_bookmark.hashed_id
+        assert int(response.headers[STALE_RESPONSE_HEADER]) >= 120
@@ -0,0 +1,295 @@
+from collections.abc import Iterator
+from dataclasses import replace
+from typing import Any
+
+import pytest
+from dogpile.cache.api import NO_VALUE
+from redis.backoff import NoBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.retry import Retry
+
+from src.libs.cache import (
+    CircuitBreaker,
+    CircuitBreakerPolicy,
+    CircuitState,
+    InMemoryMetricsSink,
+    ZstdRedisBackend,
+    create_redis_region,
+    get_metrics_sink,
+    set_metrics_sink,
+)
+from src.libs.cache.provider import build_circuit_breaker_policy
+from src.libs.config import get_config
+
+_UNREACHABLE_URL = "redis://127.0.0.1:1/0"
+_CONNECTION_KWARGS = {
+    "retry": Retry(NoBackoff(), 0),
+    "socket_connect_timeout": 0.01,
+    "socket_timeout": 0.01,
+}
+
+
+class FakeClock:
+    """
+    テストから進められる時計。
+    """
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RecordingPipeline:
+    """
+    送信されたコマンドを記録するテスト用 Redis pipeline。
+    """
+
+    def __init__(self, executed: list[list[tuple[str, tuple]]]) -> None:
+        self.commands: list[tuple[str, tuple]] = []
+        self._executed = executed
+
+    def delete(self, *keys: str) -> None:
+        self.commands.append(("delete", keys))
+
+    def set(self, key: str, value: bytes, ex: int | None = None) -> None:
+        self.commands.append(("set", (key,)))
+
+    def execute(self) -> list[object]:
+        self._executed.append(self.commands)
+        return []
+
+
+@pytest.fixture
+def metrics_sink() -> Iterator[InMemoryMetricsSink]:
+    # 他のテストの計測値が混ざらないよう、専用の出力先に差し替える。
+    previous = get_metrics_sink()
+    sink = InMemoryMetricsSink()
+    set_metrics_sink(sink)
+    yield sink
+    set_metrics_sink(previous)
+
+
+def test_circuit_breaker_opens_on_failures_and_closes_after_probes(
+    metrics_sink: InMemoryMetricsSink,
+) -> None:
+    """
+    正常系:
+    失敗率がしきい値を超えると開き、一定時間後の試しの呼び出しがすべて成功すると閉じる
+    """
+    clock = FakeClock()
+    closed: list[bool] = []
+    policy = CircuitBreakerPolicy(
+        window_size=4, min_calls=4, failure_rate_threshold=0.5, open_seconds=10, half_open_probes=2
+    )
+    breaker = CircuitBreaker("redis", policy, on_close=lambda: closed.append(True), clock=clock)
+
+    # 関数の実行
+    for failed in [False, True, False, True]:
+        assert breaker.allow()
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success(0.001)
+
+    # 開いている間は呼び出しを拒否し、状態を計測値へ出力することを検証
+    assert breaker.state is CircuitState.OPEN
+    assert not breaker.allow()
+    assert metrics_sink.gauge("circuit_state", "redis") == CircuitState.OPEN
+    assert metrics_sink.counter("circuit_rejections", "redis") == 1
+
+    # 一定時間後は試しの呼び出し数だけを通すことを検証
+    clock.now = 10
+    assert breaker.state is CircuitState.HALF_OPEN
+    assert [breaker.allow() for _ in range(3)] == [True, True, False]
+
+    # 試しの呼び出しがすべて成功すると閉じることを検証
+    breaker.record_success(0.001)
+    assert breaker.state is CircuitState.HALF_OPEN
+    breaker.record_success(0.001)
+    assert breaker.state is CircuitState.CLOSED
+    assert closed == [True]
+    assert metrics_sink.gauge("circuit_state", "redis") == CircuitState.CLOSED
+    assert metrics_sink.counter("circuit_opened", "redis") == 1
+
+
+def test_circuit_breaker_opens_on_slow_calls_and_reopens_on_slow_probe() -> None:
+    """
+    正常系:
+    遅い呼び出しの割合がしきい値を超えると開き、試しの呼び出しが遅ければ開き直す
+    """
+    clock = FakeClock()
+    policy = CircuitBreakerPolicy(
+        window_size=4,
+        min_calls=4,
+        slow_call_seconds=0.05,
+        slow_call_rate_threshold=0.75,
+        open_seconds=10,
+    )
+    breaker = CircuitBreaker("redis", policy, clock=clock)
+
+    # 関数の実行
+    for seconds in [0.1, 0.01, 0.1, 0.1]:
+        assert breaker.allow()
+        breaker.record_success(seconds)
+    assert breaker.state is CircuitState.OPEN
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_success(0.1)
+
+    # 遅い試しの呼び出しで開き直し、そこから再び待つことを検証
+    assert breaker.state is CircuitState.OPEN
+    clock.now = 19
+    assert breaker.state is CircuitState.OPEN
+    clock.now = 20
+    assert breaker.state is CircuitState.HALF_OPEN
+
+
+def _open_circuit_region(
+    monkeypatch: pytest.MonkeyPatch, **kwargs: Any
+) -> tuple[Any, ZstdRedisBackend, FakeClock]:
+    clock = FakeClock()
+    region = create_redis_region(
+        url=_UNREACHABLE_URL,
+        connection_kwargs=_CONNECTION_KWARGS,
+        distributed_lock=True,
+        circuit_breaker=CircuitBreakerPolicy(
+            window_size=2, min_calls=2, open_seconds=10, half_open_probes=1
+        ),
+        **kwargs,
+    )
+    backend = region.backend
+    assert isinstance(backend, ZstdRedisBackend)
+    for breaker in backend._breakers.values():
+        monkeypatch.setattr(breaker, "_clock", clock)
+    # 接続できない Redis への呼び出しが続き、回路が開く。
+    assert region.get("bookmark:detail:1") is NO_VALUE
+    assert region.get("bookmark:detail:2") is NO_VALUE
+    assert backend.circuit_states == {"redis": CircuitState.OPEN}
+    return region, backend, clock
+
+
+def test_redis_region_skips_redis_while_circuit_is_open(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    正常系:
+    回路が開いている間は Redis を呼び出さずにキャッシュミスとして扱い、分散ロックも使わない
+    """
+    region, backend, _ = _open_circuit_region(monkeypatch)
+    calls: list[str] = []
+
+    def record(name: str):
+        def call(*args: Any, **kwargs: Any) -> Any:
+            calls.append(name)
+            raise RedisConnectionError("must not be called")
+
+        return call
+
+    for name in ["get", "mget", "set", "mset", "pipeline", "delete", "lock", "publish"]:
+        monkeypatch.setattr(backend.writer_client, name, record(name))
+
+    # 関数の実行
+    assert region.get("bookmark:detail:1") is NO_VALUE
+    assert region.get_multi(["bookmark:detail:1", "bookmark:detail:2"]) == [NO_VALUE, NO_VALUE]
+    assert region.get_or_create("bookmark:detail:3", lambda: "db") == "db"
+    region.set_multi({"bookmark:detail:4": "value"})
+
+    # Redis へ 1 回も送らないことを検証
+    assert calls == []
+    assert backend.get_mutex("bookmark:detail:3") is None
+
+
+def test_dictionary_refresh_skips_redis_while_circuit_is_open(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    回路が開いている間は、圧縮時の学習済み辞書の再読み込みで Redis を呼び出さない
+    """
+    region, backend, _ = _open_circuit_region(
+        monkeypatch,
+        zstd_dictionary_namespaces={"bookmark:detail:": "bookmark-detail"},
+        zstd_dictionary_refresh_interval=1,
+    )
+    calls: list[str] = []
+
+    def record(name: str):
+        def call(*args: Any, **kwargs: Any) -> Any:
+            calls.append(name)
+            raise RedisConnectionError("must not be called")
+
+        return call
+
+    for name in ["hgetall", "hget"]:
+        monkeypatch.setattr(backend.writer_client, name, record(name))
+
+    # 関数の実行
+    compressed = backend.codec.compress("bookmark:detail:1", b"value")
+
+    # Redis を呼び出さずに辞書なしで圧縮することを検証
+    assert calls == []
+    assert backend.codec.decompress(compressed) == b"value"
+
+
+def test_redis_region_replays_invalidation_after_circuit_closes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    回路が開いている間に送れなかった削除と version 更新を、回路が閉じた後に送り直す
+    """
+    region, backend, clock = _open_circuit_region(monkeypatch)
+    executed: list[list[tuple[str, tuple]]] = []
+    monkeypatch.setattr(
+        backend.writer_client, "pipeline", lambda *args, **kwargs: RecordingPipeline(executed)
+    )
+    monkeypatch.setattr(backend.writer_client, "get", lambda key: None)
+
+    # 関数の実行
+    region.apply_invalidation({"bookmark:detail:1"}, {"bookmark:version:list": "v2"})
+    assert executed == []
+    clock.now = 10
+    assert region.get("bookmark:detail:2") is NO_VALUE
+
+    # 試しの呼び出しが成功して回路が閉じ、保持していた無効化を送ることを検証
+    assert backend.circuit_states == {"redis": CircuitState.CLOSED}
+    assert executed == [[("delete", ("bookmark:detail:1",)), ("set", ("bookmark:version:list",))]]
+
+
+def test_build_circuit_breaker_policy_converts_values_to_field_types() -> None:
+    """
+    正常系:
+    JSON の設定値は項目の型に変換し、指定の無い項目は既定値を使う
+    """
+    config = get_config().model_copy(
+        update={
+            "cache_circuit_breaker_enabled": True,
+            "cache_circuit_breaker": {"window_size": 10.0, "open_seconds": 3},
+        }
+    )
+
+    # 関数の実行
+    policy = build_circuit_breaker_policy(config)
+
+    # 整数の項目は int、小数の項目は float に変換することを検証
+    assert policy == replace(CircuitBreakerPolicy(), window_size=10, open_seconds=3.0)
+    assert policy is not None
+    assert type(policy.window_size) is int
+    assert type(policy.open_seconds) is float
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [{"window": 10}, {"window_size": 2.5}, {"min_calls": "20"}, {"half_open_probes": True}],
+)
+def test_build_circuit_breaker_policy_rejects_invalid_values(overrides: dict[str, Any]) -> None:
+    """
+    異常系:
+    存在しない項目名、整数の項目への小数、数値でない値は ValueError
+    """
+    config = get_config().model_copy(
+        update={"cache_circuit_breaker_enabled": True, "cache_circuit_breaker": overrides}
+    )
+
+    with pytest.raises(ValueError):
+        build_circuit_breaker_policy(config)
@@ -0,0 +1,142 @@
+from time import sleep
+from typing import Any
+
+import pytest
+
+from src.libs.cache import ExpirationPolicy, create_memory_region, query_cache
+from src.libs.cache.expiration import ExpirationPolicies
+from src.libs.cache.provider import build_expiration_policies
+from src.libs.config import get_config
+
+
+def test_expiration_policies_match_longest_prefix() -> None:
+    """
+    正常系:
+    キャッシュキーには最も長く一致した prefix の設定を適用する
+    """
+    default = ExpirationPolicy(jitter=0.1)
+    lists = ExpirationPolicy(jitter=0.3, early_refresh_beta=2.0)
+    policies = ExpirationPolicies({"": default, "bookmark:list:": lists})
+
+    assert policies.of("bookmark:list:all:v:1") == lists
+    assert policies.of("bookmark:detail:abc") == default
+    assert not ExpirationPolicies({"": ExpirationPolicy()})
+
+
+def test_jitter_spreads_expiration_of_keys_written_together() -> None:
+    """
+    正常系:
+    同時に保存したキーでも有効期限は設定した割合の範囲でばらける
+    """
+    region = create_memory_region(
+        expiration_time=100, expiration_policies={"": ExpirationPolicy(jitter=0.5)}
+    )
+
+    # 関数の実行
+    region.set_multi({f"bookmark:detail:{index}": index for index in range(50)})
+
+    # 作成時刻が 0〜50 秒の範囲で過去へずれていることを検証
+    ages = [region.get_value_metadata(f"bookmark:detail:{index}").age for index in range(50)]
+    assert all(0 <= age < 51 for age in ages)
+    assert max(ages) - min(ages) > 1
+
+
+def test_jitter_is_scaled_to_expiration_time_of_call() -> None:
+    """
+    正常系:
+    呼び出しごとに指定した有効期限に対する割合で有効期限を短くする
+    """
+    region = create_memory_region(
+        expiration_time=1000, expiration_policies={"": ExpirationPolicy(jitter=0.5)}
+    )
+
+    # 関数の実行
+    for index in range(20):
+        region.get_or_create(f"user:detail:{index}", lambda: "value", expiration_time=2)
+
+    # 短い有効期限の値が保存直後に期限切れ扱いにならないことを検証
+    ages = [region.get_value_metadata(f"user:detail:{index}").age for index in range(20)]
+    assert all(age < 1.1 for age in ages)
+
+
+def test_costly_value_is_recomputed_before_expiration() -> None:
+    """
+    正常系:
+    生成コストに比べて β が大きいと、有効期限前でも作り直す
+    """
+    region = create_memory_region(
+        expiration_time=300,
+        expiration_policies={
+            "": ExpirationPolicy(),
+            "bookmark:list:": ExpirationPolicy(early_refresh_beta=1e12),
+        },
+    )
+    calls = {"list": 0, "detail": 0}
+
+    # テスト対象関数の定義
+    @query_cache(region=region, key_func="bookmark:list:all")
+    def load_list() -> int:
+        calls["list"] += 1
+        sleep(0.001)
+        return calls["list"]
+
+    @query_cache(region=region, key_func="bookmark:detail:1")
+    def load_detail() -> int:
+        calls["detail"] += 1
+        sleep(0.001)
+        return calls["detail"]
+
+    # 関数の実行
+    assert [load_list() for _ in range(3)] == [1, 2, 3]
+    assert [load_detail() for _ in range(3)] == [1, 1, 1]
+
+    # 期限前再生成の対象 namespace だけ生成秒数を記録することを検証
+    assert region.get_value_metadata("bookmark:list:all", ignore_expiration=True).metadata["d"] > 0
+    assert "d" not in region.get_value_metadata("bookmark:detail:1").metadata
+
+
+def test_build_expiration_policies_applies_prefix_overrides() -> None:
+    """
+    正常系:
+    prefix ごとの上書きは指定の無い項目を全体の既定値から引き継ぐ
+    """
+    config = get_config().model_copy(
+        update={
+            "cache_ttl_jitter": 0.1,
+            "cache_early_refresh_beta": 1.0,
+            "cache_expiration_policies": {"bookmark:list:": {"jitter": 1}},
+        }
+    )
+
+    # 関数の実行
+    policies = build_expiration_policies(config)
+
+    # 既定値の引き継ぎと型の変換を検証
+    assert policies == {
+        "": ExpirationPolicy(jitter=0.1, early_refresh_beta=1.0),
+        "bookmark:list:": ExpirationPolicy(jitter=1.0, early_refresh_beta=1.0),
+    }
+    assert type(policies["bookmark:list:"].jitter) is float
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        {"cache_ttl_jitter": -0.1},
+        {"cache_early_refresh_beta": -1.0},
+        {"cache_expiration_policies": {"bookmark:list:": {"jitter": -0.2}}},
+        {"cache_expiration_policies": {"bookmark:list:": {"early_refresh_beta": -1}}},
+        {"cache_expiration_policies": {"bookmark:list:": {"ttl": 10}}},
+        {"cache_expiration_policies": {"bookmark:list:": {"jitter": "0.2"}}},
+        {"cache_expiration_policies": {"bookmark:list:": 0.2}},
+    ],
+)
+def test_build_expiration_policies_rejects_invalid_values(update: dict[str, Any]) -> None:
+    """
+    異常系:
+    負の値、存在しない項目名、数値でない値は ValueError
+    """
+    config = get_config().model_copy(update=update)
+
+    with pytest.raises(ValueError):
+        build_expiration_policies(config)
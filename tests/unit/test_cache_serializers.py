@@ -0,0 +1,165 @@
+import pickle  # nosec B403
+from datetime import UTC, datetime, timedelta, timezone
+
+import pytest
+from dogpile.cache.api import NO_VALUE
+from pydantic import BaseModel, HttpUrl, create_model
+
+from src.entities.bookmark import BookmarkEntity
+from src.entities.user import UserEntity
+from src.libs.cache import CompactSerializer, PickleSerializer, create_memory_region
+from src.libs.cache.serializers import CacheDeserializationError
+from src.libs.enum import AuthorityEnum
+
+
+class Unregistered(BaseModel):
+    value: int
+
+
+@pytest.fixture
+def serializer() -> CompactSerializer:
+    compact = CompactSerializer()
+    compact.register(BookmarkEntity)
+    compact.register(UserEntity)
+    return compact
+
+
+def _bookmark(index: int) -> BookmarkEntity:
+    return BookmarkEntity(
+        hashed_id=f"{index:064x}",
+        url=f"https://example.com/articles/{index}",
+        memo=f"memo {index}",
+        created_at=datetime(2024, 1, 1, tzinfo=UTC),
+        updated_at=datetime(2024, 1, 2, tzinfo=UTC),
+        tags=["python", "cache"],
+    )
+
+
+def test_compact_serializer_round_trips_entity_page(serializer: CompactSerializer) -> None:
+    """
+    正常系:
+    エンティティのリストを型を保ったまま復元し、pickle より小さく書き出す
+    """
+    page = [_bookmark(index) for index in range(10)]
+
+    data = serializer.dumps(page)
+    restored = serializer.loads(data)
+
+    assert restored == page
+    assert isinstance(restored[0].url, HttpUrl)
+    assert restored[0].created_at.tzinfo is UTC
+    assert len(data) < len(pickle.dumps(page))
+
+
+def test_compact_serializer_restores_enum_and_fields_set(serializer: CompactSerializer) -> None:
+    """
+    正常系:
+    Enum フィールドと未設定フィールドの情報を復元する
+    """
+    user = UserEntity(
+        name="alice", hashed_password="x", disabled=False, authority=AuthorityEnum.ADMIN
+    )
+    bookmark = BookmarkEntity(url="https://example.com", memo="")
+
+    restored_user = serializer.loads(serializer.dumps(user))
+    restored_bookmark = serializer.loads(serializer.dumps(bookmark))
+
+    assert restored_user.authority is AuthorityEnum.ADMIN
+    assert restored_bookmark.model_fields_set == {"url", "memo"}
+    assert restored_bookmark.model_dump(exclude_unset=True) == bookmark.model_dump(
+        exclude_unset=True
+    )
+
+
+def test_compact_serializer_falls_back_to_pickle(serializer: CompactSerializer) -> None:
+    """
+    正常系:
+    コンパクト形式で表現できない値や既存の pickle 形式の値も扱える
+    """
+    # 検証を経ずに組み立てられ、フィールドの型が注釈と異なるモデルも含める。
+    unvalidated = BookmarkEntity.model_construct(url="https://example.com", memo="")
+    values = [{"a", "b"}, Unregistered(value=1), (1, "x"), {"key": [None, 1.5]}, unvalidated]
+
+    for value in values:
+        assert serializer.loads(serializer.dumps(value)) == value
+    assert serializer.loads(PickleSerializer().dumps(_bookmark(1))) == _bookmark(1)
+
+
+def test_compact_serializer_rejects_changed_schema() -> None:
+    """
+    異常系:
+    フィールド構成が変わったモデルの旧データは復元しない
+    """
+    old_model = create_model("Item", __module__=__name__, a=(int, ...), b=(str, ...))
+    new_model = create_model("Item", __module__=__name__, b=(str, ...), a=(int, ...))
+    writer = CompactSerializer()
+    writer.register(old_model)
+    reader = CompactSerializer()
+    reader.register(new_model)
+
+    with pytest.raises(CacheDeserializationError):
+        reader.loads(writer.dumps(old_model(a=1, b="x")))
+
+
+def test_compact_serializer_round_trips_datetime_time_zones(
+    serializer: CompactSerializer,
+) -> None:
+    """
+    正常系:
+    タイムゾーンなし・UTC・その他のタイムゾーン付きの日時を復元する
+    """
+    created_at = datetime(2024, 1, 1, 9, 30, 15, 123456)
+    page = [
+        _bookmark(1).model_copy(update={"created_at": created_at}),
+        _bookmark(2).model_copy(update={"created_at": created_at.replace(tzinfo=UTC)}),
+        _bookmark(3).model_copy(
+            update={"created_at": created_at.replace(tzinfo=timezone(timedelta(hours=9)))}
+        ),
+    ]
+
+    # 関数の実行
+    restored = serializer.loads(serializer.dumps(page))
+
+    # 日時とタイムゾーンを保ったまま復元することを検証
+    assert restored == page
+    assert [bookmark.created_at.utcoffset() for bookmark in restored] == [
+        None,
+        timedelta(0),
+        timedelta(hours=9),
+    ]
+
+
+def test_compact_serializer_rejects_changed_field_type() -> None:
+    """
+    異常系:
+    フィールド名が同じでも型注釈が変わったモデルの旧データは、一覧でも復元しない
+    """
+    old_model = create_model("Typed", __module__=__name__, value=(str, ...))
+    new_model = create_model("Typed", __module__=__name__, value=(int, ...))
+    writer = CompactSerializer()
+    writer.register(old_model)
+    reader = CompactSerializer()
+    reader.register(new_model)
+
+    # 検証を経ずに旧データを読まないことを検証
+    with pytest.raises(CacheDeserializationError):
+        reader.loads(writer.dumps(old_model(value="x")))
+    with pytest.raises(CacheDeserializationError):
+        reader.loads(writer.dumps([old_model(value="x"), old_model(value="y")]))
+
+
+def test_region_treats_undecodable_value_as_miss() -> None:
+    """
+    異常系:
+    復元できない値はキャッシュミスとして扱う
+    """
+    model = create_model("Entry", __module__=__name__, value=(int, ...))
+    writer_serializer = CompactSerializer()
+    writer_serializer.register(model)
+    writer = create_memory_region(serializer=writer_serializer)
+    reader = create_memory_region(serializer=CompactSerializer())
+    writer.set("entry", model(value=1))
+    reader.backend._cache["entry"] = writer.backend._cache["entry"]
+
+    assert reader.get("entry") is NO_VALUE
+    assert reader.get_or_create("entry", lambda: "recreated") == "recreated"
@@ -0,0 +1,166 @@
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy.orm import Session
+
+from src.dao.models.base import BaseDao
+from src.libs.cache import AccessTracker, CacheWarmer, WarmupPolicy, create_memory_region
+from src.libs.cache import invalidation as cache_invalidation
+from src.libs.cache.provider import build_warmup_policy
+from src.libs.config import get_config
+
+
+class FakeClock:
+    """
+    テストから進められる時計。
+    """
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def session(sqlite_session_factory) -> Iterator[Session]:
+    with sqlite_session_factory(BaseDao.metadata) as db_session:
+        yield db_session
+
+
+def test_access_tracker_ranks_recent_accesses_higher_and_is_bounded() -> None:
+    """
+    正常系:
+    参照回数は時間とともに減衰し、数える対象は最大数を超えない
+    """
+    clock = FakeClock()
+    tracker = AccessTracker(half_life_seconds=60, max_entries=4, clock=clock)
+
+    # 関数の実行
+    for _ in range(3):
+        tracker.record(("list", (1,)))
+    clock.now = 60
+    tracker.record(("list", (2,)))
+    tracker.record(("list", (2,)))
+
+    # 半減期を経た 3 回より、直近の 2 回を上位にすることを検証
+    assert tracker.top(2) == [(("list", (2,)), 2.0), (("list", (1,)), 1.5)]
+
+    # 最大数を超えたら、回数の少ない対象から捨てることを検証
+    for number in range(3, 6):
+        tracker.record(("list", (number,)))
+    assert [target for target, _ in tracker.top(10)] == [("list", (2,)), ("list", (1,))]
+
+    # 長時間経過しても順位と換算後の回数が保たれることを検証
+    clock.now = 60 + 60 * 40
+    tracker.record(("list", (6,)))
+    assert tracker.top(1) == [(("list", (6,)), 1.0)]
+
+
+def test_cache_warmer_loads_top_targets_and_shares_them_with_new_process() -> None:
+    """
+    正常系:
+    参照回数上位の対象だけを読み込み、新しく起動したプロセスも共有された記録から読み込む
+    """
+    region = create_memory_region()
+    policy = WarmupPolicy(top_n=2, delay_seconds=0, max_workers=1)
+    loaded: list[tuple[int, int]] = []
+    warmer = CacheWarmer()
+
+    def load(page_number: int, page_size: int) -> None:
+        loaded.append((page_number, page_size))
+        # 読み込み中の参照は記録しない。
+        warmer.record("bookmark.list", 99, page_size)
+
+    warmer.register("bookmark.list", load)
+    assert warmer.start(region, policy) == 0
+    for page_number in [1, 1, 1, 2, 2, 3]:
+        warmer.record("bookmark.list", page_number, 10)
+    warmer.record("unknown", 1)
+
+    # 関数の実行
+    assert warmer.schedule()
+    assert warmer.wait(timeout=5)
+
+    # 上位 2 件だけを読み込むことを検証
+    assert sorted(loaded) == [(1, 10), (2, 10)]
+    warmer.stop()
+
+    # 新しいプロセスは保存された記録から起動時に読み込むことを検証
+    loaded.clear()
+    new_warmer = CacheWarmer()
+    new_warmer.register("bookmark.list", load)
+    assert new_warmer.start(region, policy) == 2
+    assert new_warmer.wait(timeout=5)
+    assert sorted(loaded) == [(1, 10), (2, 10)]
+    new_warmer.stop()
+
+
+def test_version_bump_commit_schedules_warmup(session: Session) -> None:
+    """
+    正常系:
+    version 更新を含む commit の後だけ、登録した関数から事前読み込みを予約する。
+    無効な状態や登録を外した後は予約しない
+    """
+    region = create_memory_region()
+    warmer = CacheWarmer()
+    loaded: list[str] = []
+    warmer.register("user.detail", loaded.append)
+    cache_invalidation.add_version_bump_listener(warmer.schedule)
+    cache_invalidation.install_session_cache_invalidation_listeners()
+
+    # 開始前は version 更新の後でも予約しないことを検証
+    with session.begin():
+        cache_invalidation.schedule_cache_version_bumps(session, region, "user:version:list")
+    assert not warmer.schedule()
+
+    warmer.start(region, WarmupPolicy(delay_seconds=0))
+    warmer.record("user.detail", "alice")
+
+    # 関数の実行
+    with session.begin():
+        cache_invalidation.schedule_cache_key_deletes(session, region, "user:detail:bob")
+    assert warmer.wait(timeout=5)
+    assert loaded == []
+    with session.begin():
+        cache_invalidation.schedule_cache_version_bumps(session, region, "user:version:list")
+    assert warmer.wait(timeout=5)
+
+    # version 更新の後に読み込むことを検証
+    assert loaded == ["alice"]
+    warmer.stop()
+
+    # 登録を外した後は version 更新の後でも予約しないことを検証
+    cache_invalidation.remove_version_bump_listener(warmer.schedule)
+    warmer.start(region, WarmupPolicy(delay_seconds=60))
+    with session.begin():
+        cache_invalidation.schedule_cache_version_bumps(session, region, "user:version:list")
+    assert warmer.wait(timeout=0)
+    warmer.stop()
+
+
+def test_build_warmup_policy_converts_values_to_field_types() -> None:
+    """
+    正常系:
+    JSON の設定値は項目の型に変換する。整数の項目に小数を指定した場合は ValueError
+    """
+    config = get_config().model_copy(
+        update={
+            "cache_enabled": True,
+            "cache_warmup_enabled": True,
+            "cache_warmup": {"top_n": 5.0, "delay_seconds": 1},
+        }
+    )
+
+    # 関数の実行
+    policy = build_warmup_policy(config)
+
+    # 整数の項目は int、小数の項目は float に変換することを検証
+    assert policy is not None
+    assert (policy.top_n, policy.delay_seconds) == (5, 1.0)
+    assert type(policy.top_n) is int
+    assert type(policy.delay_seconds) is float
+
+    # 整数の項目への小数は ValueError になることを検証
+    with pytest.raises(ValueError):
+        build_warmup_policy(config.model_copy(update={"cache_warmup": {"max_workers": 1.5}}))
@@ -0,0 +1,247 @@
+from time import sleep
+
+import pytest
+from dogpile.cache.api import CachedValue
+from dogpile.cache.region import CacheRegion
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+from src.dao import session as dao_session
+from src.dao.models.base import BaseDao
+from src.libs.cache import (
+    VersionedCacheKey,
+    collect_stale_reads,
+    create_memory_region,
+    query_cache,
+    query_cache_multi,
+)
+from src.libs.cache.degraded import is_degraded_session
+from src.libs.cache.invalidation import new_cache_version
+
+
+def _database_down() -> OperationalError:
+    return OperationalError("SELECT 1", {}, Exception("Can't connect to MySQL server"))
+
+
+def test_expired_value_is_served_when_database_is_unavailable() -> None:
+    """
+    正常系:
+    DB に接続できない場合は有効期限切れの値を返し、その経過秒数を記録する
+    """
+    region = create_memory_region(stale_if_error_time=60)
+    database_up = True
+
+    @query_cache(region=region, key_func="counter", expiration_time=0.05, stale_if_error=True)
+    def load_counter() -> int:
+        if not database_up:
+            raise _database_down()
+        return 1
+
+    assert load_counter() == 1
+    sleep(0.1)
+    database_up = False
+
+    # 関数の実行
+    with collect_stale_reads() as stale_reads:
+        value = load_counter()
+
+    # 期限切れの値を返し、経過秒数が記録されることを検証
+    assert value == 1
+    assert stale_reads.max_age is not None and stale_reads.max_age >= 0.1
+
+
+def test_previous_version_is_served_when_database_is_unavailable() -> None:
+    """
+    正常系:
+    version 更新後に DB へ接続できない場合は、以前の version の値を返す
+    """
+    region = create_memory_region(stale_if_error_time=60)
+    version_key = "widgets:version:list"
+    region.set(version_key, new_cache_version())
+    database_up = True
+
+    @query_cache(
+        region=region,
+        key_func=lambda: VersionedCacheKey(
+            (version_key,), lambda versions: f"widgets:list:v:{versions[0]}"
+        ),
+        stale_if_error=True,
+    )
+    def load_widgets() -> list[str]:
+        if not database_up:
+            raise PoolTimeoutError("QueuePool limit reached")
+        return ["a", "b"]
+
+    assert load_widgets() == ["a", "b"]
+    region.set(version_key, new_cache_version())
+    database_up = False
+
+    # 関数の実行
+    with collect_stale_reads() as stale_reads:
+        value = load_widgets()
+
+    # 以前の version の値を返すことを検証
+    assert value == ["a", "b"]
+    assert stale_reads.max_age is not None
+
+
+def test_database_error_is_raised_without_usable_value() -> None:
+    """
+    異常系:
+    縮退参照を指定していない、または猶予を過ぎた値しか無い場合は DB のエラーをそのまま送出する
+    """
+    region = create_memory_region(stale_if_error_time=0.05)
+    database_up = True
+
+    @query_cache(region=region, key_func="degradable", expiration_time=0.05, stale_if_error=True)
+    def load_degradable() -> int:
+        if not database_up:
+            raise _database_down()
+        return 1
+
+    @query_cache(region=region, key_func="strict", expiration_time=0.05)
+    def load_strict() -> int:
+        if not database_up:
+            raise _database_down()
+        return 1
+
+    assert load_degradable() == 1
+    assert load_strict() == 1
+    sleep(0.06)
+    database_up = False
+
+    # 縮退参照を指定していなければ猶予内でも送出することを検証
+    with pytest.raises(OperationalError):
+        load_strict()
+    # 猶予を過ぎた値は返さないことを検証
+    sleep(0.06)
+    with pytest.raises(OperationalError):
+        load_degradable()
+
+
+def test_query_cache_multi_serves_expired_values_when_database_is_unavailable() -> None:
+    """
+    正常系:
+    複数件の取得でも、キャッシュに無かった分を有効期限切れの値で代替する。
+    1 件でも代替できなければ DB のエラーを送出する
+    """
+    region = create_memory_region(stale_if_error_time=60)
+    database_up = True
+
+    @query_cache_multi(
+        region=region,
+        key_func=lambda widget_id: f"widget:{widget_id}",
+        expiration_time=0.05,
+        stale_if_error=True,
+    )
+    def load_widgets(widget_ids: list[int]) -> dict[int, str]:
+        if not database_up:
+            raise _database_down()
+        return {widget_id: f"widget-{widget_id}" for widget_id in widget_ids}
+
+    assert load_widgets([1, 2]) == {1: "widget-1", 2: "widget-2"}
+    sleep(0.1)
+    database_up = False
+
+    # 関数の実行
+    with collect_stale_reads() as stale_reads:
+        values = load_widgets([1, 2])
+
+    # 期限切れの値で代替し、保存していない引数を含む場合は送出することを検証
+    assert values == {1: "widget-1", 2: "widget-2"}
+    assert stale_reads.max_age is not None
+    with pytest.raises(OperationalError):
+        load_widgets([1, 3])
+
+
+class WidgetReader:
+    """
+    セッションを使って値を読むテスト用リポジトリ。
+    """
+
+    def __init__(self, session: Session, region: CacheRegion) -> None:
+        self.session = session
+        self.region = region
+        self.unavailable: set[int] = set()
+
+    @query_cache(key_func=lambda self, widget_id: f"widget:{widget_id}", stale_if_error=True)
+    def find(self, widget_id: int) -> int:
+        if widget_id in self.unavailable:
+            raise _database_down()
+        return self.session.execute(text("SELECT :value"), {"value": widget_id}).scalar_one()
+
+
+def _store_expired(region: CacheRegion, key: str, value: object, age: float) -> None:
+    # 保存時刻を過去へずらし、有効期限切れの値として保存する。
+    cached = region._value(value)
+    region._set_cached_value_to_backend(
+        key, CachedValue(cached.payload, {**cached.metadata, "ct": cached.metadata["ct"] - age})
+    )
+
+
+def test_degraded_read_keeps_transaction_usable(sqlite_session_factory) -> None:
+    """
+    正常系:
+    古い値で代替した後も同じ transaction で参照を続けられ、セッションは縮退として記録される
+    """
+    region = create_memory_region(expiration_time=60, stale_if_error_time=600)
+    _store_expired(region, "widget:1", 1, age=120)
+
+    with sqlite_session_factory(BaseDao.metadata) as session:
+        reader = WidgetReader(session, region)
+        reader.unavailable.add(1)
+
+        # 関数の実行
+        with session.begin():
+            stale = reader.find(1)
+            fresh = reader.find(2)
+
+            # 古い値で代替した後も、同じ transaction で DB を参照できることを検証
+            assert (stale, fresh) == (1, 2)
+            assert is_degraded_session(session)
+
+
+def test_get_session_rolls_back_degraded_request(
+    sqlite_session_factory, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    正常系:
+    古い値で代替したリクエストのセッションは、終了時に commit せず巻き戻す
+    """
+    region = create_memory_region(expiration_time=60, stale_if_error_time=600)
+    _store_expired(region, "widget:1", 1, age=120)
+
+    with sqlite_session_factory(BaseDao.metadata) as session:
+        session.execute(text("CREATE TABLE widget_log (id INTEGER)"))
+        session.commit()
+        monkeypatch.setattr(dao_session, "ScopedSession", _FixedScopedSession(session))
+
+        # 関数の実行
+        requests = dao_session.get_session()
+        request_session = next(requests)
+        request_session.execute(text("INSERT INTO widget_log VALUES (1)"))
+        reader = WidgetReader(request_session, region)
+        reader.unavailable.add(1)
+        assert reader.find(1) == 1
+        with pytest.raises(StopIteration):
+            next(requests)
+
+        # リクエスト中の書き込みが commit されていないことを検証
+        assert session.execute(text("SELECT COUNT(*) FROM widget_log")).scalar_one() == 0
+
+
+class _FixedScopedSession:
+    """
+    既存のセッションを返すテスト用 scoped_session。
+    """
+
+    def __init__(self, session: Session) -> None:
+        self._session = session
+
+    def __call__(self) -> Session:
+        return self._session
+
+    def remove(self) -> None:
+        pass
@@ -1,16 +1,31 @@
+import inspect
 from collections.abc import Iterator
+from random import Random
 
 import pytest
 from dogpile.cache.api import NO_VALUE
 from dogpile.cache.region import CacheRegion
 from redis.backoff import NoBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError
 from redis.retry import Retry
 from sqlalchemy import Integer, String, inspect as sa_inspect
 from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
 
-from src.libs.cache import NullCacheRegion, create_memory_region, create_redis_region, query_cache
+from src.libs.cache import (
+    InMemoryMetricsSink,
+    NullCacheRegion,
+    QueryCacheLockTimeoutError,
+    ZstdMemoryBackend,
+    create_memory_region,
+    create_redis_region,
+    get_metrics_sink,
+    query_cache,
+    query_cache_multi,
+    set_metrics_sink,
+)
 from src.libs.cache.key_generator import KeyGenerator
 from src.libs.cache.session_resolver import SessionResolver
+from src.libs.cache.tinylfu import WTinyLfuPolicy
 
 
 class Base(DeclarativeBase):
@@ -30,6 +45,16 @@ def session(sqlite_session_factory) -> Iterator[Session]:
         yield db_session
 
 
+@pytest.fixture
+def metrics_sink() -> Iterator[InMemoryMetricsSink]:
+    # 他のテストの計測値が混ざらないよう、専用の出力先に差し替える。
+    previous = get_metrics_sink()
+    sink = InMemoryMetricsSink()
+    set_metrics_sink(sink)
+    yield sink
+    set_metrics_sink(previous)
+
+
 def _create_widget(session: Session, name: str = "cached") -> int:
     # テスト用の Widget を 1 件作成する
     widget = Widget(name=name)
@@ -104,6 +129,38 @@ def test_template_key_generator_binds_argument_names(session: Session) -> None:
     assert key_func(session, 7) == "widget:7:False"
 
 
+def test_template_key_is_compiled_at_decoration_time(
+    memory_region: CacheRegion, session: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    正常系:
+    テンプレートのシグネチャ解析はデコレート時だけ行い、呼び出し方によらず同じキーになる
+    """
+    calls = 0
+
+    # テスト対象関数の定義
+    @query_cache(region=memory_region, key_func="widget:{widget_id}:{include_deleted}")
+    def load_widget(db: Session, widget_id: int, include_deleted: bool = False) -> int:
+        nonlocal calls
+        calls += 1
+        return widget_id
+
+    # 呼び出し時にシグネチャを解析すると失敗するようにする
+    def fail_signature(*args: object, **kwargs: object) -> None:
+        raise AssertionError("signature must not be inspected per call")
+
+    monkeypatch.setattr(inspect, "signature", fail_signature)
+
+    # 関数の実行
+    load_widget(session, 1)
+    load_widget(session, widget_id=1)
+    load_widget(db=session, widget_id=1, include_deleted=False)
+    load_widget(session, 1, include_deleted=True)
+
+    # 位置引数・キーワード引数・デフォルト値の違いを同じキーに揃えることを検証
+    assert calls == 2
+
+
 def test_default_key_sorts_keyword_arguments(session: Session) -> None:
     """
     正常系:
@@ -314,6 +371,50 @@ def test_unless_skips_cache(memory_region: CacheRegion) -> None:
     assert calls == 2
 
 
+def test_query_cache_multi_loads_only_missing_items_at_once(
+    session: Session, memory_region: CacheRegion
+) -> None:
+    """
+    正常系:
+    query_cache_multi は 1 回の multi-get で参照し、キャッシュに無い引数だけでまとめて問い合わせる
+    """
+
+    # キャッシュリージョンとテストデータの準備
+    region = memory_region
+    widget_ids = [_create_widget(session, name=f"widget{number}") for number in range(3)]
+
+    class Repository:
+        def __init__(self, db: Session) -> None:
+            self.session: Session = db
+            self.region = region
+            self.requested: list[list[int]] = []
+
+        @query_cache(key_func="widget:{widget_id}")
+        def get_by_id(self, widget_id: int) -> Widget | None:
+            return self.session.get(Widget, widget_id)
+
+        # 1 件分のキーは単体取得と同じ形式にする
+        @query_cache_multi(key_func=lambda self, widget_id: f"widget:{widget_id}")
+        def get_by_ids(self, widget_ids: list[int]) -> dict[int, Widget]:
+            self.requested.append(widget_ids)
+            widgets = self.session.query(Widget).filter(Widget.id.in_(widget_ids)).all()
+            return {widget.id: widget for widget in widgets}
+
+    # テスト対象の準備 (1 件だけ単体取得でキャッシュしておく)
+    repository = Repository(session)
+    repository.get_by_id(widget_id=widget_ids[1])
+
+    # 存在しない ID と重複を含めてまとめて取得する
+    first = repository.get_by_ids([widget_ids[2], 999, widget_ids[0], widget_ids[1], widget_ids[2]])
+    second = repository.get_by_ids(widget_ids)
+
+    # キャッシュに無かったものだけを 1 回で問い合わせ、結果は引数の順に返ることを検証
+    assert repository.requested == [[widget_ids[2], 999, widget_ids[0]]]
+    assert list(first) == [widget_ids[2], widget_ids[0], widget_ids[1]]
+    assert [widget.name for widget in second.values()] == ["widget0", "widget1", "widget2"]
+    assert all(sa_inspect(widget).detached for widget in first.values())
+
+
 def test_null_cache_region_never_caches() -> None:
     """
     正常系:
@@ -398,6 +499,104 @@ def test_memory_backend_stores_compressed_bytes() -> None:
     assert isinstance(region.backend._cache["payload"], bytes)
 
 
+def _incompressible(size: int, seed: int) -> bytes:
+    # backend 側で zstd 圧縮されるため、容量管理の検証には圧縮の効かないデータを使う。
+    return Random(seed).randbytes(size)
+
+
+def test_memory_backend_keeps_total_bytes_within_budget() -> None:
+    """
+    正常系:
+    メモリバックエンドは圧縮済みバイト数の上限を超えないよう追い出す
+    """
+    backend = ZstdMemoryBackend({"max_bytes": 4096})
+
+    backend.set_serialized_multi(
+        {f"key:{index}": _incompressible(100, index) for index in range(100)}
+    )
+
+    # 上限内に収まり、溢れた分は追い出しか拒否として数えられる。
+    assert backend.total_bytes <= 4096
+    assert backend.stats.evictions + backend.stats.rejections > 0
+    stored = [value for value in backend.get_serialized_multi(["key:99", "missing"])]
+    assert stored[1] is NO_VALUE
+
+
+def test_memory_backend_keeps_frequent_keys_against_scan() -> None:
+    """
+    正常系:
+    一度しか参照されないキーの大量投入でも、頻繁に参照されるキーは残る
+    """
+    backend = ZstdMemoryBackend({"max_bytes": 10_000})
+    hot_keys = [f"hot:{index}" for index in range(10)]
+    for index, key in enumerate(hot_keys):
+        backend.set_serialized(key, _incompressible(100, -index - 1))
+    for _ in range(5):
+        backend.get_serialized_multi(hot_keys)
+
+    # 1 回きりのキーを容量の数倍流し込む。
+    for index in range(500):
+        backend.set_serialized(f"scan:{index}", _incompressible(100, index))
+
+    assert all(value is not NO_VALUE for value in backend.get_serialized_multi(hot_keys))
+    assert backend.stats.rejections > 0
+
+
+def test_tinylfu_rejection_keeps_less_frequent_victims() -> None:
+    """
+    正常系:
+    追い出し候補に候補より人気のあるエントリが含まれる場合、main 領域から何も追い出さない
+    """
+    policy = WTinyLfuPolicy(max_bytes=400, window_ratio=0.25, expected_entries=16)
+    policy.add("cold", 150)
+    policy.add("hot", 150)
+    for _ in range(5):
+        policy.record_access("hot")
+    for _ in range(2):
+        policy.record_access("candidate")
+
+    # 関数の実行
+    evicted = policy.add("candidate", 300)
+
+    # 候補だけを捨て、候補より参照の少ないエントリも残すことを検証
+    assert evicted == ["candidate"]
+    assert policy.total_bytes == 300
+    assert policy.stats.evictions == 0
+    assert policy.stats.rejections == 1
+
+
+def test_memory_backend_rejects_entry_larger_than_budget() -> None:
+    """
+    正常系:
+    上限より大きいエントリは保持しない
+    """
+    backend = ZstdMemoryBackend({"max_bytes": 1024})
+
+    backend.set_serialized("huge", _incompressible(2048, 0))
+
+    assert backend.get_serialized("huge") is NO_VALUE
+    assert backend.stats.rejections == 1
+    assert backend.total_bytes == 0
+
+
+def test_memory_backend_expires_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    正常系:
+    メモリバックエンドはエントリごとの TTL を過ぎた値を返さない
+    """
+    now = 1000.0
+    monkeypatch.setattr("src.libs.cache.backends.monotonic", lambda: now)
+    backend = ZstdMemoryBackend({"expiration_time": 10})
+    backend.set_serialized("key", b"value")
+    assert backend.get_serialized("key") == b"value"
+
+    now = 1011.0
+
+    assert backend.get_serialized("key") is NO_VALUE
+    assert backend.stats.expirations == 1
+    assert backend.total_bytes == 0
+
+
 def test_redis_backend_fails_open_when_redis_is_unavailable() -> None:
     """
     正常系:
@@ -431,3 +630,290 @@ def test_redis_backend_fails_open_when_redis_is_unavailable() -> None:
 
     # 例外にせず毎回本体が実行されることを検証
     assert calls == 2
+
+
+class HeldLock:
+    """
+    他プロセスが保持中の Redis ロックを再現するテスト用ロック。
+    """
+
+    def __init__(self, released_after_wait: bool) -> None:
+        self.released_after_wait = released_after_wait
+        self.blocking_timeouts: list[float | None] = []
+        self.releases = 0
+
+    def acquire(self, blocking: bool = True, blocking_timeout: float | None = None) -> bool:
+        if not blocking:
+            return False
+        self.blocking_timeouts.append(blocking_timeout)
+        return self.released_after_wait
+
+    def release(self) -> None:
+        self.releases += 1
+
+    def locked(self) -> bool:
+        return True
+
+
+def _unreachable_locking_region(lock_fallback_to_db: bool = True) -> CacheRegion:
+    # 値の読み書きは失敗させ、ロックだけをテスト用に差し替える Region を作る。
+    return create_redis_region(
+        host="127.0.0.1",
+        port=1,
+        expiration_time=1,
+        connection_kwargs={
+            "retry": Retry(NoBackoff(), 0),
+            "socket_connect_timeout": 0.01,
+            "socket_timeout": 0.01,
+        },
+        distributed_lock=True,
+        lock_wait_timeout=0.5,
+        lock_fallback_to_db=lock_fallback_to_db,
+    )
+
+
+def test_redis_lock_waits_for_other_process_and_records_stats(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    他プロセスが再生成中なら待機上限までロックを待ち、待機状況を記録する
+    """
+    region = _unreachable_locking_region()
+    lock = HeldLock(released_after_wait=True)
+    monkeypatch.setattr(region.backend.writer_client, "lock", lambda *args, **kwargs: lock)
+
+    assert region.get_or_create("value", lambda: "created") == "created"
+
+    stats = region.backend.lock_stats
+    assert lock.blocking_timeouts == [0.5]
+    assert lock.releases == 1
+    assert (stats.acquisitions, stats.contended, stats.timeouts) == (1, 1, 0)
+
+
+def test_redis_lock_wait_timeout_falls_back_to_db(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    正常系:
+    待機上限を超えたらロックなしで生成し、保持していないロックは解放しない
+    """
+    region = _unreachable_locking_region()
+    lock = HeldLock(released_after_wait=False)
+    monkeypatch.setattr(region.backend.writer_client, "lock", lambda *args, **kwargs: lock)
+
+    assert region.get_or_create("value", lambda: "created") == "created"
+
+    stats = region.backend.lock_stats
+    assert lock.releases == 0
+    assert (stats.timeouts, stats.fallbacks) == (1, 1)
+
+
+def test_redis_lock_wait_timeout_raises_without_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    異常系:
+    DB 参照へのフォールバックが無効なら待機上限超過を例外にする
+    """
+    region = _unreachable_locking_region(lock_fallback_to_db=False)
+    lock = HeldLock(released_after_wait=False)
+    monkeypatch.setattr(region.backend.writer_client, "lock", lambda *args, **kwargs: lock)
+    calls = 0
+
+    def create() -> str:
+        nonlocal calls
+        calls += 1
+        return "created"
+
+    with pytest.raises(QueryCacheLockTimeoutError):
+        region.get_or_create("value", create)
+    assert calls == 0
+
+
+def test_redis_lock_fails_open_when_redis_is_unavailable() -> None:
+    """
+    正常系:
+    Redis 障害でロックを取れない場合も関数本体を実行する
+    """
+    region = _unreachable_locking_region(lock_fallback_to_db=False)
+
+    assert region.get_or_create("value", lambda: "created") == "created"
+    assert region.backend.lock_stats.errors == 1
+
+
+def test_query_cache_records_metrics_per_namespace(
+    memory_region: CacheRegion, metrics_sink: InMemoryMetricsSink
+) -> None:
+    """
+    正常系:
+    ヒット/ミス・生成時間・直列化時間・圧縮後サイズをキーの namespace ごとに記録する
+    """
+
+    # テスト対象関数の定義
+    @query_cache(region=memory_region, key_func="bookmark:detail:{value}")
+    def load_detail(value: int) -> dict[str, int]:
+        return {"value": value}
+
+    @query_cache(region=memory_region, key_func="bookmark:list:tags:{value}:v:1:page")
+    def load_tags(value: int) -> list[int]:
+        return [value]
+
+    # 関数の実行
+    load_detail(1)
+    load_detail(1)
+    load_detail(2)
+    load_tags(1)
+
+    # namespace ごとに集計されることを検証
+    assert metrics_sink.counter("misses", "bookmark:detail") == 2
+    assert metrics_sink.counter("hits", "bookmark:detail") == 1
+    assert metrics_sink.counter("misses", "bookmark:list:tags") == 1
+    for name in ("generate_seconds", "serialize_seconds", "compressed_bytes"):
+        histogram = metrics_sink.histogram(name, "bookmark:detail")
+        assert histogram is not None and histogram.count == 2
+    deserialized = metrics_sink.histogram("deserialize_seconds", "bookmark:detail")
+    assert deserialized is not None and deserialized.count >= 1
+
+
+def test_redis_errors_are_counted_per_namespace(metrics_sink: InMemoryMetricsSink) -> None:
+    """
+    異常系:
+    Redis 障害はキーの namespace ごとに数える
+    """
+
+    # 到達不能な Redis を指定した Region の準備
+    region = create_redis_region(
+        host="127.0.0.1",
+        port=1,
+        connection_kwargs={
+            "retry": Retry(NoBackoff(), 0),
+            "socket_connect_timeout": 0.01,
+            "socket_timeout": 0.01,
+        },
+    )
+
+    # テスト対象関数の定義
+    @query_cache(region=region, key_func="user:detail:{name}")
+    def load_user(name: str) -> str:
+        return name
+
+    # 関数の実行
+    assert load_user("alice") == "alice"
+
+    # 取得と保存の失敗が user:detail として記録されることを検証
+    assert metrics_sink.counter("redis_errors", "user:detail") >= 2
+
+
+class TrackingClient:
+    """
+    client-side caching 有効の Redis クライアントを再現するテスト用クライアント。
+    """
+
+    def __init__(self, values: dict[str, bytes], error: Exception | None = None) -> None:
+        self.keys: list[str] = []
+        self._values = values
+        self._error = error
+
+    def get(self, key: str) -> bytes | None:
+        self.keys.append(key)
+        if self._error is not None:
+            raise self._error
+        return self._values.get(key)
+
+
+def _unreachable_region_with_client_side_cache(retry_interval: float = 60) -> CacheRegion:
+    return create_redis_region(
+        host="127.0.0.1",
+        port=1,
+        connection_kwargs={
+            "retry": Retry(NoBackoff(), 0),
+            "socket_connect_timeout": 0.01,
+            "socket_timeout": 0.01,
+        },
+        client_side_cache_max_entries=16,
+        client_side_cache_retry_interval=retry_interval,
+    )
+
+
+def test_redis_version_keys_are_read_through_client_side_cache(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    version 管理キーだけを client-side caching 有効のクライアントから取得する
+    """
+    region = _unreachable_region_with_client_side_cache()
+    backend = region.backend
+    version_key = "src.repositories.user.UserRepository:version:list"
+    serialized = region._serialize_to_backend(version_key, region._value("v1"))
+    stored = backend._compress(version_key, serialized)
+    tracking = TrackingClient({version_key: stored})
+    monkeypatch.setattr(backend, "tracking_client", tracking)
+    fetched: list[list[str]] = []
+
+    def mget(keys: list[str]) -> list[bytes | None]:
+        fetched.append(list(keys))
+        return [None for _ in keys]
+
+    monkeypatch.setattr(backend.reader_client, "mget", mget)
+
+    # 関数の実行
+    values = region.get_multi([version_key, "user:list:v:v1:1"])
+
+    # version 管理キーはプロセス内のキャッシュ経由、一覧は MGET で取得することを検証
+    assert values == ["v1", NO_VALUE]
+    assert tracking.keys == [version_key]
+    assert fetched == [["user:list:v:v1:1"]]
+
+
+def test_redis_client_side_cache_falls_back_when_tracking_is_unavailable(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    異常系:
+    client-side caching が使えない場合は通常の取得に切り替え、しばらく再試行しない
+    """
+    region = _unreachable_region_with_client_side_cache()
+    backend = region.backend
+    tracking = TrackingClient({}, error=RedisConnectionError("HELLO is not supported"))
+    monkeypatch.setattr(backend, "tracking_client", tracking)
+    fetched: list[list[str]] = []
+
+    def mget(keys: list[str]) -> list[bytes | None]:
+        fetched.append(list(keys))
+        return [None for _ in keys]
+
+    monkeypatch.setattr(backend.reader_client, "mget", mget)
+    keys = ["src.repositories.user.UserRepository:version:list", "user:list:v:v1:1"]
+
+    # 関数の実行
+    assert region.get_multi(keys) == [NO_VALUE, NO_VALUE]
+    assert region.get_multi(keys) == [NO_VALUE, NO_VALUE]
+
+    # 失敗後は追跡用クライアントを使わず、全キーを MGET で取得することを検証
+    assert len(tracking.keys) == 1
+    assert fetched == [keys, keys]
+
+
+def test_redis_client_side_cache_retries_after_configured_interval(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    client-side caching が使えなかった後、設定した秒数が経てば追跡用クライアントを再び試す
+    """
+    now = 1000.0
+    monkeypatch.setattr("src.libs.cache.backends.monotonic", lambda: now)
+    region = _unreachable_region_with_client_side_cache(retry_interval=5)
+    backend = region.backend
+    tracking = TrackingClient({}, error=RedisConnectionError("HELLO is not supported"))
+    monkeypatch.setattr(backend, "tracking_client", tracking)
+    monkeypatch.setattr(backend.reader_client, "mget", lambda keys: [None for _ in keys])
+    keys = ["src.repositories.user.UserRepository:version:list"]
+
+    # 関数の実行
+    region.get_multi(keys)
+    now = 1004.0
+    region.get_multi(keys)
+    now = 1005.0
+    region.get_multi(keys)
+
+    # 設定した秒数の間は再試行せず、経過後に再試行することを検証
+    assert len(tracking.keys) == 2
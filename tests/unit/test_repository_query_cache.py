@@ -1,22 +1,27 @@
 from collections.abc import Iterator
 from threading import Barrier, Lock, Thread
-from time import sleep
+from time import sleep, time
 
 import pytest
 from dogpile.cache.api import NO_VALUE
 from dogpile.cache.region import CacheRegion
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from src.dao.models.base import BaseDao
 from src.dao.models.bookmark import BookmarkDao
 from src.dao.models.tag import TagDao
 from src.dao.models.user import UserDao
+from src.dao.operators.bookmark import BookmarkDaoOperator
 from src.entities.bookmark import BookmarkEntity
 from src.entities.user import UserEntity
+from src.libs.cache import KeyCompactor, create_memory_region
+from src.libs.cache import identity_map as cache_identity_map
 from src.libs.cache import invalidation as cache_invalidation
 from src.libs.enum import AuthorityEnum
 from src.libs.page import Page
 from src.libs.util import get_hashed_id
+from src.repositories.base import NOT_FOUND_CACHE_EXPIRATION_TIME
 from src.repositories.bookmark import BookmarkRepository
 from src.repositories.user import UserRepository
 from tests.unit.factory import UnitDataFactory
@@ -102,14 +107,14 @@ def test_user_repository_find_one_cache_and_invalidation(
     assert calls == 3
 
 
-def test_user_repository_find_one_not_found_is_not_cached(
+def test_user_repository_find_one_not_found_is_cached_until_add(
     session: Session,
     memory_region: CacheRegion,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
     """
     正常系:
-    未存在ユーザーの詳細取得はキャッシュされず毎回再評価される
+    未存在ユーザーの詳細取得は不在としてキャッシュされ、追加後に無効化される
     """
     repository = UserRepository(session, region=memory_region)
 
@@ -117,7 +122,7 @@ def test_user_repository_find_one_not_found_is_not_cached(
     original = repository.user_operator.find_one_by_name
 
     def wrapped(name: str) -> UserDao | None:
-        # NotFoundError で終わるケースでも、都度 DB 参照が走ることを確認する。
+        # NotFoundError で終わるケースの DB 参照回数を数える。
         nonlocal calls
         calls += 1
         return original(name)
@@ -130,7 +135,21 @@ def test_user_repository_find_one_not_found_is_not_cached(
     with pytest.raises(UserRepository.NotFoundError, match="Not found specified data."):
         repository.find_one(name="missing-user")
 
-    # 例外結果はキャッシュされず、毎回 DAO が呼ばれる。
+    # 2 回目は不在の記録から同じ例外を送出し、DAO は呼ばれない。
+    assert calls == 1
+
+    repository.add_one(
+        UserEntity(
+            name="missing-user",
+            hashed_password="hashed-password",
+            disabled=False,
+            authority=AuthorityEnum.READWRITE,
+        )
+    )
+    session.commit()
+
+    # 追加時の詳細キー削除で不在の記録も消え、追加したユーザーが取得できる。
+    assert repository.find_one(name="missing-user").name == "missing-user"
     assert calls == 2
 
 
@@ -363,25 +382,28 @@ def test_bookmark_repository_find_one_cache_and_invalidation(
     assert refreshed.memo == cached.memo == "after"
     assert refreshed.tags == cached.tags == ["tag2"]
     assert bookmark_calls == 3
-    assert tag_calls == 2
+    # update_one でも無効化対象のタグを知るため、変更前のタグを 1 回読む。
+    assert tag_calls == 3
 
 
-def test_bookmark_repository_find_one_not_found_is_not_cached(
+def test_bookmark_repository_find_one_not_found_is_cached_until_add(
     session: Session,
     memory_region: CacheRegion,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
     """
     正常系:
-    未存在ブックマークの詳細取得はキャッシュされず毎回再評価される
+    未存在ブックマークの詳細取得は不在としてキャッシュされ、追加後に無効化される
     """
     repository = BookmarkRepository(session, region=memory_region)
+    url = "https://example.com/missing"
+    hashed_id = get_hashed_id(url)
 
     bookmark_calls = 0
     original = repository.bookmark_operator.find_one_by_hashed_id
 
     def wrapped(hashed_id: str) -> BookmarkDao | None:
-        # 未ヒット時もキャッシュせず、毎回 bookmark 本体を問い合わせることを見る。
+        # 未ヒット時の bookmark 本体の問い合わせ回数を数える。
         nonlocal bookmark_calls
         bookmark_calls += 1
         return original(hashed_id)
@@ -389,15 +411,44 @@ def test_bookmark_repository_find_one_not_found_is_not_cached(
     monkeypatch.setattr(repository.bookmark_operator, "find_one_by_hashed_id", wrapped)
 
     with pytest.raises(BookmarkRepository.NotFoundError, match="Not found specified data."):
-        repository.find_one(hashed_id="missing-bookmark")
+        repository.find_one(hashed_id=hashed_id)
 
     with pytest.raises(BookmarkRepository.NotFoundError, match="Not found specified data."):
-        repository.find_one(hashed_id="missing-bookmark")
+        repository.find_one(hashed_id=hashed_id)
 
-    # 例外結果はキャッシュされず、毎回 DAO が呼ばれる。
+    # 2 回目は不在の記録から同じ例外を送出し、DAO は呼ばれない。
+    assert bookmark_calls == 1
+
+    repository.add_one(BookmarkEntity(url=url, memo="", hashed_id=hashed_id, tags=["tag1"]))
+    session.commit()
+
+    # 追加時の詳細キー削除で不在の記録も消え、追加したブックマークが取得できる。
+    assert repository.find_one(hashed_id=hashed_id).hashed_id == hashed_id
     assert bookmark_calls == 2
 
 
+def test_not_found_cache_expires_with_its_own_ttl(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    不在の記録は通常のキャッシュより短い専用の有効期限で作り直される
+    """
+    repository = UserRepository(session, region=memory_region)
+    with pytest.raises(UserRepository.NotFoundError):
+        repository.find_one(name="missing-user")
+
+    # 不在の記録の有効期限を過ぎた状態を再現する。
+    now = time() + NOT_FOUND_CACHE_EXPIRATION_TIME + 1
+    monkeypatch.setattr("src.libs.cache.negative.time", lambda: now)
+    monkeypatch.setattr("dogpile.cache.api.time.time", lambda: now)
+    UnitDataFactory(session).create_user("missing-user")
+
+    assert repository.find_one(name="missing-user").name == "missing-user"
+
+
 def test_bookmark_repository_delete_one_invalidates_detail_and_lists(
     session: Session,
     memory_region: CacheRegion,
@@ -429,17 +480,17 @@ def test_bookmark_repository_delete_one_invalidates_detail_and_lists(
         detail_calls += 1
         return original_find_one(hashed_id)
 
-    def wrapped_find_all() -> list[BookmarkDao]:
+    def wrapped_find_all(page: Page | None = None) -> list[BookmarkDao]:
         # 全件一覧が delete 後に再評価されるかを確認する。
         nonlocal list_calls
         list_calls += 1
-        return original_find_all()
+        return original_find_all(page)
 
-    def wrapped_find_by_tags(tag_names: list[str]) -> list[BookmarkDao]:
+    def wrapped_find_by_tags(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
         # タグ検索一覧も version bump で巻き込んで無効化されることを見る。
         nonlocal tag_list_calls
         tag_list_calls += 1
-        return original_find_by_tags(tag_names)
+        return original_find_by_tags(tag_names, page)
 
     monkeypatch.setattr(repository.bookmark_operator, "find_one_by_hashed_id", wrapped_find_one)
     monkeypatch.setattr(repository.bookmark_operator, "find_all", wrapped_find_all)
@@ -497,11 +548,11 @@ def test_bookmark_repository_tag_list_cache_normalizes_key_and_invalidates_on_ad
     calls = 0
     original = repository.bookmark_operator.find_by_tags
 
-    def wrapped(tag_names: list[str]) -> list[BookmarkDao]:
+    def wrapped(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
         # タグ一覧クエリの実行回数で、キー正規化と無効化の両方を確認する。
         nonlocal calls
         calls += 1
-        return original(tag_names)
+        return original(tag_names, page)
 
     monkeypatch.setattr(repository.bookmark_operator, "find_by_tags", wrapped)
 
@@ -522,7 +573,7 @@ def test_bookmark_repository_tag_list_cache_normalizes_key_and_invalidates_on_ad
     )
     session.commit()
 
-    # add 後は tag-list version が進み、同じタグ条件でも再検索される。
+    # add 後は追加したタグの version が進み、同じタグ条件でも再検索される。
     refreshed = repository.find_by_tags(["tag1", "tag2"])
     cached = repository.find_by_tags(["tag2", "tag1"])
     assert sorted(bookmark.memo for bookmark in refreshed) == ["first", "second"]
@@ -530,6 +581,301 @@ def test_bookmark_repository_tag_list_cache_normalizes_key_and_invalidates_on_ad
     assert calls == 2
 
 
+def test_bookmark_repository_tag_list_cache_invalidates_only_written_tags(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    ブックマーク更新では変更前後のタグを含む検索条件だけが無効化される
+    """
+    factory = UnitDataFactory(session)
+    factory.create_bookmark("https://example.com/1", "first", ["tag1"])
+    factory.create_bookmark("https://example.com/2", "second", ["tag2"])
+    factory.create_bookmark("https://example.com/3", "third", ["tag3"])
+    repository = BookmarkRepository(
+        session,
+        page=Page(number=1, size=10),
+        region=memory_region,
+    )
+
+    calls: list[tuple[str, ...]] = []
+    original = repository.bookmark_operator.find_by_tags
+
+    def wrapped(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
+        # どのタグ条件が再検索されたかを記録する。
+        calls.append(tuple(sorted(tag_names)))
+        return original(tag_names, page)
+
+    monkeypatch.setattr(repository.bookmark_operator, "find_by_tags", wrapped)
+
+    conditions = [["tag1"], ["tag2"], ["tag3"], ["tag1", "tag3"], ["tag2", "tag3"]]
+    for condition in conditions:
+        repository.find_by_tags(condition)
+    calls.clear()
+
+    # tag1 から tag2 へ付け替える。
+    repository.update_one(
+        BookmarkEntity(url="https://example.com/1", memo="first", tags=["tag2"]),
+        current_hashed_id=get_hashed_id("https://example.com/1"),
+    )
+    session.commit()
+
+    results = {tuple(condition): repository.find_by_tags(condition) for condition in conditions}
+
+    # tag1 と tag2 を含む条件だけ再検索され、tag3 のみの条件はキャッシュを使い続ける。
+    assert sorted(calls) == [("tag1",), ("tag1", "tag3"), ("tag2",), ("tag2", "tag3")]
+    assert results[("tag1",)] == []
+    assert sorted(bookmark.memo for bookmark in results[("tag2",)]) == ["first", "second"]
+    assert sorted(bookmark.memo for bookmark in results[("tag3",)]) == ["third"]
+
+    # 削除では削除前のタグを含む条件が無効化される。
+    calls.clear()
+    repository.delete_one(get_hashed_id("https://example.com/3"))
+    session.commit()
+    for condition in conditions:
+        repository.find_by_tags(condition)
+    assert sorted(calls) == [("tag1", "tag3"), ("tag2", "tag3"), ("tag3",)]
+
+
+def test_bookmark_repository_update_one_drops_only_lists_containing_bookmark(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    ブックマーク更新ではそのブックマークを含む一覧キャッシュだけが削除される
+    """
+    factory = UnitDataFactory(session)
+    factory.create_bookmark("https://example.com/1", "first", ["tag1"])
+    factory.create_bookmark("https://example.com/2", "second", ["tag2"])
+    repository = BookmarkRepository(session, page=Page(number=1, size=10), region=memory_region)
+
+    calls: list[str] = []
+    operator = repository.bookmark_operator
+    original_find_all = operator.find_all
+    original_find_by_tags = operator.find_by_tags
+
+    def wrapped_find_all(page: Page | None = None) -> list[BookmarkDao]:
+        calls.append("all")
+        return original_find_all(page)
+
+    def wrapped_find_by_tags(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
+        # どのタグの一覧が再検索されたかを記録する。
+        calls.append(f"tags:{','.join(tag_names)}")
+        return original_find_by_tags(tag_names, page)
+
+    monkeypatch.setattr(operator, "find_all", wrapped_find_all)
+    monkeypatch.setattr(operator, "find_by_tags", wrapped_find_by_tags)
+
+    def load_lists() -> list[list[str]]:
+        return [
+            [bookmark.memo for bookmark in bookmarks]
+            for bookmarks in (
+                repository.find_all(),
+                repository.find_by_tags(["tag1"]),
+                repository.find_by_tags(["tag2"]),
+            )
+        ]
+
+    assert load_lists() == [["first", "second"], ["first"], ["second"]]
+    calls.clear()
+
+    # タグを変えずに 2 件目のブックマークのメモだけを更新する。
+    repository.update_one(
+        BookmarkEntity(url="https://example.com/2", memo="updated"),
+        current_hashed_id=get_hashed_id("https://example.com/2"),
+    )
+    session.commit()
+
+    # 2 件目を含む一覧だけが再検索され、tag1 の一覧はキャッシュを使い続ける。
+    assert load_lists() == [["first", "updated"], ["first"], ["updated"]]
+    assert calls == ["all", "tags:tag2"]
+
+
+def test_bookmark_repository_find_many_shares_detail_cache(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    find_many は find_one と同じ詳細キャッシュを使い、更新後は対象だけを取得し直す
+    """
+    factory = UnitDataFactory(session)
+    first = factory.create_bookmark("https://example.com/1", "first", ["tag1"])
+    second = factory.create_bookmark("https://example.com/2", "second", ["tag2"])
+    repository = BookmarkRepository(session, region=memory_region)
+
+    requested: list[list[str]] = []
+    original = repository.bookmark_operator.find_by_hashed_ids
+
+    def wrapped(hashed_ids: list[str]) -> list[BookmarkDao]:
+        # まとめて問い合わせたハッシュIDを記録する。
+        requested.append(list(hashed_ids))
+        return original(hashed_ids)
+
+    monkeypatch.setattr(repository.bookmark_operator, "find_by_hashed_ids", wrapped)
+
+    repository.find_one(hashed_id=first.hashed_id)
+    found = repository.find_many([first.hashed_id, second.hashed_id, "missing"])
+    assert {hashed_id: bookmark.memo for hashed_id, bookmark in found.items()} == {
+        first.hashed_id: "first",
+        second.hashed_id: "second",
+    }
+    assert requested == [[second.hashed_id, "missing"]]
+
+    repository.update_one(
+        BookmarkEntity(url="https://example.com/2", memo="updated"),
+        current_hashed_id=second.hashed_id,
+    )
+    session.commit()
+    requested.clear()
+
+    # 更新で詳細キーが削除されたものだけを取得し直す。
+    found = repository.find_many([first.hashed_id, second.hashed_id])
+    assert found[second.hashed_id].memo == "updated"
+    assert requested == [[second.hashed_id]]
+
+
+def test_bookmark_repository_composes_lists_from_detail_cache(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    一覧はハッシュIDの並びだけをキャッシュし、詳細キャッシュに無い要素だけを 1 回で DB から読む
+    """
+    factory = UnitDataFactory(session)
+    for number in (1, 2, 3):
+        factory.create_bookmark(f"https://example.com/{number}", f"memo{number}", ["tag1"])
+    repository = BookmarkRepository(
+        session, page=Page(number=1, size=10), region=memory_region, compose_lists=True
+    )
+
+    list_calls = 0
+    loaded: list[list[str]] = []
+    original_find_all = repository.bookmark_operator.find_all
+    original_find_by_hashed_ids = repository.bookmark_operator.find_by_hashed_ids
+
+    def wrapped_find_all(page: Page | None = None) -> list[BookmarkDao]:
+        nonlocal list_calls
+        list_calls += 1
+        return original_find_all(page)
+
+    def wrapped_find_by_hashed_ids(hashed_ids: list[str]) -> list[BookmarkDao]:
+        # 詳細キャッシュに無かったハッシュIDだけが問い合わされることを見る。
+        loaded.append(sorted(hashed_ids))
+        return original_find_by_hashed_ids(hashed_ids)
+
+    monkeypatch.setattr(repository.bookmark_operator, "find_all", wrapped_find_all)
+    monkeypatch.setattr(
+        repository.bookmark_operator, "find_by_hashed_ids", wrapped_find_by_hashed_ids
+    )
+
+    # 詳細キャッシュに 1 件だけ載せておく。
+    repository.find_one(hashed_id=get_hashed_id("https://example.com/2"))
+
+    first = repository.find_all()
+    second = repository.find_all()
+    assert [bookmark.memo for bookmark in first] == ["memo1", "memo2", "memo3"]
+    assert second == first
+    assert list_calls == 1
+    assert loaded == [
+        sorted([get_hashed_id("https://example.com/1"), get_hashed_id("https://example.com/3")])
+    ]
+
+    # 一覧のキーにはハッシュIDだけが保存される。
+    hashed_ids = repository._find_all_hashed_ids()
+    assert hashed_ids == [bookmark.hashed_id for bookmark in first]
+
+    # メモの更新は詳細キャッシュの削除だけで一覧に反映される。
+    repository.update_one(
+        BookmarkEntity(url="https://example.com/1", memo="updated"),
+        current_hashed_id=get_hashed_id("https://example.com/1"),
+    )
+    session.commit()
+    loaded.clear()
+
+    assert [bookmark.memo for bookmark in repository.find_all()] == ["updated", "memo2", "memo3"]
+    assert loaded == [[get_hashed_id("https://example.com/1")]]
+
+
+def test_bookmark_repository_shares_id_windows_across_page_sizes(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    ハッシュIDの一覧は固定長の窓単位でキャッシュし、ページサイズが違っても共有する
+    """
+    factory = UnitDataFactory(session)
+    bookmarks = [
+        factory.create_bookmark(f"https://example.com/{number}", f"memo{number}", ["tag1"])
+        for number in range(150)
+    ]
+    expected = [bookmark.hashed_id for bookmark in bookmarks]
+
+    windows: list[tuple[int, int]] = []
+
+    def repository_for(number: int, size: int) -> BookmarkRepository:
+        repository = BookmarkRepository(
+            session,
+            page=Page(number=number, size=size),
+            region=memory_region,
+            compose_lists=True,
+        )
+        original = repository.bookmark_operator.find_all
+
+        def wrapped(page: Page | None = None) -> list[BookmarkDao]:
+            # DB へ問い合わせた窓を記録する。
+            assert page is not None
+            windows.append((page.number, page.size))
+            return original(page)
+
+        monkeypatch.setattr(repository.bookmark_operator, "find_all", wrapped)
+        return repository
+
+    # 1 つ目の窓 (先頭 100 件) だけを DB から読み、同じ窓に収まるページはそれを切り出す。
+    assert repository_for(3, 10)._find_all_hashed_ids() == expected[20:30]
+    assert repository_for(1, 30)._find_all_hashed_ids() == expected[:30]
+    assert windows == [(1, 100)]
+
+    # 窓をまたぐページは 2 つの窓をつなげ、まだ無い窓だけを読む。
+    assert repository_for(2, 60)._find_all_hashed_ids() == expected[60:120]
+    assert windows == [(1, 100), (2, 100)]
+
+    # 末尾を超えるページは空になる。
+    assert repository_for(4, 50)._find_all_hashed_ids() == []
+    assert windows == [(1, 100), (2, 100)]
+
+
+def test_bookmark_operator_orders_all_list_queries(session: Session) -> None:
+    """
+    正常系:
+    窓ごとの取得・ページ指定・ページ指定なしのいずれの一覧も主キー順に並べる
+    """
+    statement = select(BookmarkDao)
+
+    # 関数の実行
+    paged = BookmarkDaoOperator(session, page=Page(number=2, size=10)).pagenation(statement)
+    windowed = BookmarkDaoOperator(session, page=Page(number=2, size=10)).pagenation(
+        statement, Page(number=1, size=100)
+    )
+    unpaged = BookmarkDaoOperator(session).pagenation(statement)
+
+    # 並び順とページ指定を検証
+    for query in (paged, windowed, unpaged):
+        assert "ORDER BY bookmark.id" in str(query)
+    assert "LIMIT" in str(paged)
+    assert "LIMIT" in str(windowed)
+    assert "LIMIT" not in str(unpaged)
+
+
 def test_bookmark_repository_tag_list_cache_escapes_delimiters(
     session: Session,
     memory_region: CacheRegion,
@@ -551,11 +897,11 @@ def test_bookmark_repository_tag_list_cache_escapes_delimiters(
     calls = 0
     original = repository.bookmark_operator.find_by_tags
 
-    def wrapped(tag_names: list[str]) -> list[BookmarkDao]:
+    def wrapped(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
         # 条件が異なる 2 回の検索で、それぞれ別キーが使われることを確認する。
         nonlocal calls
         calls += 1
-        return original(tag_names)
+        return original(tag_names, page)
 
     monkeypatch.setattr(repository.bookmark_operator, "find_by_tags", wrapped)
 
@@ -590,11 +936,11 @@ def test_bookmark_repository_tag_list_cache_normalizes_duplicate_tags(
     calls = 0
     original = repository.bookmark_operator.find_by_tags
 
-    def wrapped(tag_names: list[str]) -> list[BookmarkDao]:
+    def wrapped(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
         # SQL 上は同義な ["tag1"] と ["tag1", "tag1"] が同じキーを使うことを見る。
         nonlocal calls
         calls += 1
-        return original(tag_names)
+        return original(tag_names, page)
 
     monkeypatch.setattr(repository.bookmark_operator, "find_by_tags", wrapped)
 
@@ -607,14 +953,14 @@ def test_bookmark_repository_tag_list_cache_normalizes_duplicate_tags(
     assert calls == 1
 
 
-def test_bookmark_repository_tag_list_cache_separates_page_size(
+def test_bookmark_repository_tag_list_cache_shares_window_across_page_sizes(
     session: Session,
     memory_region: CacheRegion,
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
     """
     正常系:
-    タグ検索一覧キャッシュはページサイズごとに別キーになる
+    タグ検索一覧キャッシュはページサイズによらず同じ窓のキーを使う
     """
     factory = UnitDataFactory(session)
     factory.create_bookmark("https://example.com/1", "first", ["tag1"])
@@ -635,17 +981,17 @@ def test_bookmark_repository_tag_list_cache_separates_page_size(
     original_small_page = small_page_repository.bookmark_operator.find_by_tags
     original_large_page = large_page_repository.bookmark_operator.find_by_tags
 
-    def wrapped_small_page(tag_names: list[str]) -> list[BookmarkDao]:
-        # size=1 の取得が size=2 のキャッシュと混ざらないことを確認する。
+    def wrapped_small_page(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
+        # size=1 の取得で窓全体が DB から読まれることを確認する。
         nonlocal small_page_calls
         small_page_calls += 1
-        return original_small_page(tag_names)
+        return original_small_page(tag_names, page)
 
-    def wrapped_large_page(tag_names: list[str]) -> list[BookmarkDao]:
-        # 同じタグ条件でもページサイズが違えば別キーで評価されることを見る。
+    def wrapped_large_page(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
+        # 同じタグ条件ならページサイズが違っても同じ窓のキャッシュを使うことを見る。
         nonlocal large_page_calls
         large_page_calls += 1
-        return original_large_page(tag_names)
+        return original_large_page(tag_names, page)
 
     monkeypatch.setattr(small_page_repository.bookmark_operator, "find_by_tags", wrapped_small_page)
     monkeypatch.setattr(large_page_repository.bookmark_operator, "find_by_tags", wrapped_large_page)
@@ -655,11 +1001,11 @@ def test_bookmark_repository_tag_list_cache_separates_page_size(
     large_page = large_page_repository.find_by_tags(["tag1"])
     cached_large_page = large_page_repository.find_by_tags(["tag1"])
 
-    # ページサイズごとに 1 回ずつ DB を読み、同一条件では cache hit する。
+    # 最初の 1 回だけ DB を読み、以降はページサイズが違っても窓から切り出す。
     assert len(small_page) == len(cached_small_page) == 1
     assert len(large_page) == len(cached_large_page) == 2
     assert small_page_calls == 1
-    assert large_page_calls == 1
+    assert large_page_calls == 0
 
 
 def test_bookmark_repository_tag_list_cache_invalidation_reaches_all_pages(
@@ -681,7 +1027,7 @@ def test_bookmark_repository_tag_list_cache_invalidation_reaches_all_pages(
     )
     large_page_repository = BookmarkRepository(
         session,
-        page=Page(number=1, size=2),
+        page=Page(number=1, size=3),
         region=memory_region,
     )
 
@@ -690,17 +1036,17 @@ def test_bookmark_repository_tag_list_cache_invalidation_reaches_all_pages(
     original_small_page = small_page_repository.bookmark_operator.find_by_tags
     original_large_page = large_page_repository.bookmark_operator.find_by_tags
 
-    def wrapped_small_page(tag_names: list[str]) -> list[BookmarkDao]:
+    def wrapped_small_page(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
         # 追加前後で size=1 のタグ検索一覧が再評価されるかを追跡する。
         nonlocal small_page_calls
         small_page_calls += 1
-        return original_small_page(tag_names)
+        return original_small_page(tag_names, page)
 
-    def wrapped_large_page(tag_names: list[str]) -> list[BookmarkDao]:
-        # tag-list version の更新が size=2 の一覧にも波及することを見る。
+    def wrapped_large_page(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
+        # タグ version の更新後に size=3 の一覧が新しい窓を使うことを見る。
         nonlocal large_page_calls
         large_page_calls += 1
-        return original_large_page(tag_names)
+        return original_large_page(tag_names, page)
 
     monkeypatch.setattr(small_page_repository.bookmark_operator, "find_by_tags", wrapped_small_page)
     monkeypatch.setattr(large_page_repository.bookmark_operator, "find_by_tags", wrapped_large_page)
@@ -710,7 +1056,7 @@ def test_bookmark_repository_tag_list_cache_invalidation_reaches_all_pages(
     large_page_repository.find_by_tags(["tag1"])
     large_page_repository.find_by_tags(["tag1"])
     assert small_page_calls == 1
-    assert large_page_calls == 1
+    assert large_page_calls == 0
 
     small_page_repository.add_one(
         BookmarkEntity(
@@ -727,11 +1073,11 @@ def test_bookmark_repository_tag_list_cache_invalidation_reaches_all_pages(
     refreshed_large_page = large_page_repository.find_by_tags(["tag1"])
     cached_large_page = large_page_repository.find_by_tags(["tag1"])
 
-    # tag-list namespace の version が進むと、全ページ条件で 1 回ずつ再検索される。
+    # タグの version が進むと窓が 1 回だけ再検索され、どのページ条件にも追加分が反映される。
     assert len(refreshed_small_page) == len(cached_small_page) == 1
-    assert len(refreshed_large_page) == len(cached_large_page) == 2
+    assert len(refreshed_large_page) == len(cached_large_page) == 3
     assert small_page_calls == 2
-    assert large_page_calls == 2
+    assert large_page_calls == 0
 
 
 def test_bump_cache_versions_does_not_depend_on_current_version(
@@ -811,6 +1157,149 @@ def test_detail_cache_is_deleted_after_commit_but_same_transaction_reads_bypass_
     )
 
 
+def test_same_transaction_reads_reuse_values_created_after_write(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    無効化待ちの間に作った値は同一トランザクション内で再利用し、次の書き込みや rollback で捨てる
+    """
+    UnitDataFactory(session).create_user("alice")
+    UnitDataFactory(session).create_user("bob")
+    session.commit()
+    repository = UserRepository(session, region=memory_region)
+
+    calls = 0
+    original = repository.user_operator.find_one_by_name
+
+    def wrapped(name: str) -> UserDao | None:
+        # トランザクション内で保持した値を使えたかを DB 呼び出し回数で確認する。
+        nonlocal calls
+        calls += 1
+        return original(name)
+
+    monkeypatch.setattr(repository.user_operator, "find_one_by_name", wrapped)
+
+    repository.update_one(
+        UserEntity(
+            name="alice",
+            hashed_password="changed",
+            disabled=False,
+            authority=AuthorityEnum.READWRITE,
+        ),
+        current_name="alice",
+    )
+    assert calls == 1
+
+    # 関数の実行
+    first = repository.find_one(name="bob")
+    second = repository.find_one(name="bob")
+
+    # 2 回目は DB も共有キャッシュも使わずに返すことを検証
+    assert first.name == second.name == "bob"
+    assert calls == 2
+    assert memory_region.get(repository._find_one_cache_key("bob")) is NO_VALUE
+
+    # 同じリージョンへの次の書き込みで、保持した値を捨てることを検証
+    repository._bump_cache_versions("list")
+    assert repository.find_one(name="bob").name == "bob"
+    assert calls == 3
+
+    # rollback 後は保持した値を使わず、共有キャッシュへ戻ることを検証
+    session.rollback()
+    assert repository.find_one(name="bob").name == "bob"
+    assert calls == 4
+    assert memory_region.get(repository._find_one_cache_key("bob")).name == "bob"
+
+
+def test_nested_rollback_discards_values_created_in_nested_transaction(
+    session: Session,
+    memory_region: CacheRegion,
+) -> None:
+    """
+    正常系:
+    nested transaction の rollback では、その中で保持した値だけを捨てる
+    """
+    with session.begin():
+        cache_invalidation.schedule_cache_key_deletes(session, memory_region, "user:detail:outer")
+        cache_invalidation.set_transaction_cached_value(
+            session, memory_region, "user:detail:outer", "outer"
+        )
+        nested_transaction = session.begin_nested()
+        cache_invalidation.set_transaction_cached_value(
+            session, memory_region, "user:detail:nested", "nested"
+        )
+        # nested transaction からも外側で保持した値を参照できる。
+        assert (
+            cache_invalidation.get_transaction_cached_value(
+                session, memory_region, "user:detail:outer"
+            )
+            == "outer"
+        )
+        nested_transaction.rollback()
+
+        assert (
+            cache_invalidation.get_transaction_cached_value(
+                session, memory_region, "user:detail:outer"
+            )
+            == "outer"
+        )
+        assert (
+            cache_invalidation.get_transaction_cached_value(
+                session, memory_region, "user:detail:nested"
+            )
+            is NO_VALUE
+        )
+
+    # commit 後は保持した値をすべて捨てる。
+    assert (
+        cache_invalidation.get_transaction_cached_value(session, memory_region, "user:detail:outer")
+        is NO_VALUE
+    )
+
+
+def test_identity_map_deduplicates_repository_and_dao_lookups_in_request(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    参照の再利用を有効にしたセッションでは、同じリポジトリ・DAO の参照を 1 回にまとめ、
+    省いた件数を数える
+    """
+    UnitDataFactory(session).create_user("alice")
+    session.commit()
+    cache_identity_map.enable_identity_map(session)
+    repository = UserRepository(session, region=memory_region)
+
+    statements: list[str] = []
+    original = session.execute
+
+    def wrapped(statement, *args, **kwargs):
+        # DB へ送った SELECT を記録する。
+        statements.append(str(statement))
+        return original(statement, *args, **kwargs)
+
+    monkeypatch.setattr(session, "execute", wrapped)
+
+    # 関数の実行
+    first = repository.find_one(name="alice")
+    second = repository.find_one(name="alice")
+    repository.update_one(first.model_copy(update={"disabled": True}), current_name="alice")
+
+    # 2 回目の詳細取得はキャッシュも見ず、更新時の DAO 取得も SELECT しないことを検証
+    assert first.name == second.name == "alice"
+    assert len(statements) == 1
+    assert cache_identity_map.get_avoided_lookups(session) == 2
+
+    # 書き込み後は記録を使わずに読み直すことを検証
+    assert repository.find_one(name="alice").disabled is True
+    assert len(statements) == 2
+
+
 def test_list_cache_invalidation_is_discarded_on_rollback(
     session: Session,
     memory_region: CacheRegion,
@@ -938,3 +1427,99 @@ def test_get_cache_version_initialization_is_atomic(session: Session) -> None:
 
     assert len(versions) == 4
     assert len(set(versions)) == 1
+
+
+def test_list_cache_lookup_resolves_version_and_value_in_one_multi_get(
+    session: Session,
+    memory_region: CacheRegion,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    一覧キャッシュは version と値を 1 回の multi-get で取得し、他プロセスの version 更新も反映する
+    """
+    UnitDataFactory(session).create_user("alice")
+    repository = UserRepository(session, page=Page(number=1, size=10), region=memory_region)
+    repository.find_all()
+
+    backend = memory_region.backend
+    single_gets: list[str] = []
+    multi_gets: list[list[str]] = []
+    original_get = backend.get_serialized
+    original_get_multi = backend.get_serialized_multi
+
+    def wrapped_get(key: str) -> object:
+        single_gets.append(key)
+        return original_get(key)
+
+    def wrapped_get_multi(keys: list[str]) -> object:
+        multi_gets.append(list(keys))
+        return original_get_multi(keys)
+
+    monkeypatch.setattr(backend, "get_serialized", wrapped_get)
+    monkeypatch.setattr(backend, "get_serialized_multi", wrapped_get_multi)
+
+    cached = repository.find_all()
+    assert [user.name for user in cached] == ["alice"]
+    assert single_gets == []
+    assert len(multi_gets) == 1
+    assert multi_gets[0][0] == repository._cache_version_key("list")
+
+    # 別プロセスが version を進めた状態を再現する。ローカルの既知 version は古いままになる。
+    UnitDataFactory(session).create_user("bob")
+    memory_region.set(repository._cache_version_key("list"), "bumped-elsewhere")
+
+    refreshed = repository.find_all()
+    assert sorted(user.name for user in refreshed) == ["alice", "bob"]
+
+
+def test_bookmark_repository_tag_list_cache_compacts_long_keys(
+    session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    キー短縮が有効なら、長いタグ条件でも固定長のキーでキャッシュし、元のキーを引ける
+    """
+    region = create_memory_region(key_compactor=KeyCompactor("secret", debug_mapping=True))
+    tags = [f"{index}" * 100 for index in range(10)]
+    UnitDataFactory(session).create_bookmark("https://example.com/1", "first", tags)
+    repository = BookmarkRepository(session, page=Page(number=1, size=10), region=region)
+
+    calls = 0
+    original = repository.bookmark_operator.find_by_tags
+
+    def wrapped(tag_names: list[str], page: Page | None = None) -> list[BookmarkDao]:
+        # 短縮後のキーでも cache hit と無効化が効くことを確認する。
+        nonlocal calls
+        calls += 1
+        return original(tag_names, page)
+
+    monkeypatch.setattr(repository.bookmark_operator, "find_by_tags", wrapped)
+
+    repository.find_by_tags(tags)
+    repository.find_by_tags(list(reversed(tags)))
+    assert calls == 1
+
+    # タグの長さに関係なく、可変部分は 32 桁の digest になる。
+    list_keys = [key for key in region.backend._cache if key.startswith("bookmark:list:tags:")]
+    assert len(list_keys) == 1
+    assert len(list_keys[0]) == len("bookmark:list:tags:h:") + 32
+    original_key = region.describe_key(list_keys[0])
+    assert original_key is not None
+    assert original_key.startswith("bookmark:list:tags:")
+    assert all(tag in original_key for tag in tags)
+
+    repository.add_one(
+        BookmarkEntity(
+            hashed_id=get_hashed_id("https://example.com/2"),
+            url="https://example.com/2",
+            memo="second",
+            tags=tags,
+        )
+    )
+    session.commit()
+
+    refreshed = repository.find_by_tags(tags)
+    assert sorted(bookmark.memo for bookmark in refreshed) == ["first", "second"]
+    assert calls == 2
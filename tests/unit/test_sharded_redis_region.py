@@ -0,0 +1,361 @@
+import json
+import shutil
+import socket
+import subprocess
+from collections.abc import Iterator
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Any
+
+import pytest
+from dogpile.cache.api import NO_VALUE
+from redis import Redis, RedisCluster
+from redis.backoff import NoBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import RedisError
+from redis.retry import Retry
+
+from src.libs.cache import (
+    ConsistentHashRing,
+    ZstdRedisClusterBackend,
+    ZstdShardedRedisBackend,
+    create_redis_region,
+)
+
+_UNREACHABLE_SHARD_URLS = [
+    "redis://127.0.0.1:1/0",
+    "redis://127.0.0.1:2/0",
+    "redis://127.0.0.1:3/0",
+]
+_CONNECTION_KWARGS = {
+    "retry": Retry(NoBackoff(), 0),
+    "socket_connect_timeout": 0.01,
+    "socket_timeout": 0.01,
+}
+
+
+class RecordingPipeline:
+    """
+    送信されたコマンドを送り先ごとに記録するテスト用 Redis pipeline。
+    """
+
+    def __init__(self, shard: int, executed: list[tuple[int, list[tuple[str, tuple]]]]) -> None:
+        self.commands: list[tuple[str, tuple]] = []
+        self._shard = shard
+        self._executed = executed
+
+    def delete(self, *keys: str) -> None:
+        self.commands.append(("delete", keys))
+
+    def set(self, key: str, value: bytes, ex: int | None = None) -> None:
+        self.commands.append(("set", (key,)))
+
+    def publish(self, channel: str, message: str) -> None:
+        self.commands.append(("publish", (channel, json.loads(message)["keys"])))
+
+    def execute(self) -> list[object]:
+        self._executed.append((self._shard, self.commands))
+        return []
+
+
+def test_consistent_hash_ring_moves_only_keys_of_added_node() -> None:
+    """
+    正常系:
+    キーはノードへ偏りなく割り当てられ、ノード追加時は追加したノードへ移るキーだけが変わる
+    """
+    keys = [f"bookmark:detail:{index}" for index in range(3000)]
+    ring = ConsistentHashRing(["redis://a", "redis://b", "redis://c"])
+    grown = ConsistentHashRing(["redis://a", "redis://b", "redis://c", "redis://d"])
+
+    # 関数の実行
+    before = [ring.node_index(key) for key in keys]
+    after = [grown.node_index(key) for key in keys]
+
+    # 各ノードの担当がおおよそ均等であることを検証
+    assert all(600 < before.count(node) < 1400 for node in range(3))
+    # 移動したキーはすべて追加したノードへ移り、移動量は全体の一部に収まることを検証
+    moved = [node for node_before, node in zip(before, after) if node_before != node]
+    assert set(moved) == {3}
+    assert 300 < len(moved) < 1200
+
+
+def test_consistent_hash_ring_colocates_hash_tags() -> None:
+    """
+    正常系:
+    `{...}` のハッシュタグが同じキーは同じノードへ割り当てる
+    """
+    ring = ConsistentHashRing([f"redis://node-{index}" for index in range(8)])
+
+    nodes = {ring.node_index(f"bookmark:{{user-1}}:list:{page}") for page in range(50)}
+
+    assert len(nodes) == 1
+
+
+def test_consistent_hash_ring_rejects_invalid_nodes() -> None:
+    """
+    異常系:
+    ノードが空または重複している場合は ValueError
+    """
+    with pytest.raises(ValueError):
+        ConsistentHashRing([])
+    with pytest.raises(ValueError):
+        ConsistentHashRing(["redis://a", "redis://a"])
+
+
+def _sharded_region() -> tuple[Any, ZstdShardedRedisBackend]:
+    region = create_redis_region(
+        shard_urls=_UNREACHABLE_SHARD_URLS, connection_kwargs=_CONNECTION_KWARGS
+    )
+    backend = region.backend
+    assert isinstance(backend, ZstdShardedRedisBackend)
+    return region, backend
+
+
+def test_sharded_region_reads_each_shard_with_one_mget(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    正常系:
+    複数キーの取得は担当ノードごとに 1 回の MGET にまとめ、障害中のノードの分だけミスにする
+    """
+    region, backend = _sharded_region()
+    keys = [f"bookmark:detail:{index}" for index in range(30)]
+    ring = ConsistentHashRing(_UNREACHABLE_SHARD_URLS)
+    stored = {
+        key: backend._compress(key, region._serialize_to_backend(key, region._value(key)))
+        for key in keys
+    }
+    fetched: dict[int, list[list[str]]] = {shard: [] for shard in range(3)}
+
+    def make_mget(shard: int):
+        def mget(shard_keys: list[str]) -> list[bytes | None]:
+            fetched[shard].append(list(shard_keys))
+            if shard == 2:
+                raise RedisConnectionError("shard 2 is down")
+            return [stored[key] for key in shard_keys]
+
+        return mget
+
+    for shard, client in enumerate(backend.shard_clients):
+        monkeypatch.setattr(client, "mget", make_mget(shard))
+
+    # 関数の実行
+    values = region.get_multi(keys)
+
+    # 各ノードへ担当キーだけを 1 回で問い合わせることを検証
+    for shard in range(3):
+        assert fetched[shard] == [[key for key in keys if ring.node_index(key) == shard]]
+    # 障害中のノードが担当するキーだけがミスになることを検証
+    assert values == [key if ring.node_index(key) != 2 else NO_VALUE for key in keys]
+
+
+def test_sharded_region_sends_invalidation_per_shard(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    正常系:
+    削除と version 更新は担当ノードごとに 1 回の pipeline で送り、通知は先頭ノードから送る
+    """
+    region, backend = _sharded_region()
+    ring = ConsistentHashRing(_UNREACHABLE_SHARD_URLS)
+    executed: list[tuple[int, list[tuple[str, tuple]]]] = []
+    for shard, client in enumerate(backend.shard_clients):
+        monkeypatch.setattr(
+            client,
+            "pipeline",
+            lambda *args, shard=shard, **kwargs: RecordingPipeline(shard, executed),
+        )
+    deleted = [f"bookmark:detail:{index}" for index in range(10)]
+    versions = {f"bookmark:version:{index}": "v2" for index in range(10)}
+    message = ("test:invalidate", json.dumps({"origin": "test", "keys": deleted}))
+
+    # 関数の実行
+    backend.invalidate_multi(deleted, {key: b"v2" for key in versions}, message)
+
+    # ノードごとに 1 本の pipeline へ削除・保存をまとめることを検証
+    assert sorted(shard for shard, _ in executed) == sorted(
+        {ring.node_index(key) for key in [*deleted, *versions]}
+    )
+    for shard, commands in executed:
+        shard_deleted = tuple(key for key in deleted if ring.node_index(key) == shard)
+        shard_versions = [key for key in versions if ring.node_index(key) == shard]
+        expected = [("delete", shard_deleted)] if shard_deleted else []
+        expected += [("set", (key,)) for key in shard_versions]
+        if shard == 0:
+            expected.append(("publish", ("test:invalidate", deleted)))
+        assert commands == expected
+
+
+class RecordingRedisCluster:
+    """
+    pipeline の実行とスロットごとのコマンドを記録するテスト用 RedisCluster。
+    """
+
+    def __init__(self) -> None:
+        self.executed: list[tuple[int, list[tuple[str, tuple]]]] = []
+        self.commands: list[tuple[str, tuple]] = []
+
+    def pipeline(self, *args: Any, **kwargs: Any) -> RecordingPipeline:
+        return RecordingPipeline(0, self.executed)
+
+    def mget_nonatomic(self, keys: list[str]) -> list[bytes | None]:
+        self.commands.append(("mget_nonatomic", tuple(keys)))
+        return [None for _ in keys]
+
+    def publish(self, channel: str, message: str) -> None:
+        self.commands.append(("publish", (channel, json.loads(message)["keys"])))
+
+
+def test_cluster_region_splits_commands_by_slot(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    正常系:
+    Redis Cluster では複数キーの取得をスロットごとのコマンドで送り、
+    無効化通知は pipeline の実行後に pipeline の外から送る
+    """
+    cluster = RecordingRedisCluster()
+    monkeypatch.setattr(RedisCluster, "from_url", lambda *args, **kwargs: cluster)
+    region = create_redis_region(url="redis://127.0.0.1:1/0", cluster=True)
+    backend = region.backend
+    assert isinstance(backend, ZstdRedisClusterBackend)
+    keys = [f"bookmark:detail:{index}" for index in range(3)]
+    deleted = ["bookmark:detail:0"]
+    message = ("test:invalidate", json.dumps({"origin": "test", "keys": deleted}))
+
+    # 関数の実行
+    values = region.get_multi(keys)
+    backend.invalidate_multi(deleted, {"bookmark:version:0": b"v2"}, message)
+
+    # 取得はスロットごとの MGET に分けて送り、未登録のキーはミスになることを検証
+    assert values == [NO_VALUE] * 3
+    assert cluster.commands[0] == ("mget_nonatomic", tuple(keys))
+    # 無効化の pipeline には PUBLISH を積まず、実行後に送ることを検証
+    assert cluster.executed[-1] == (
+        0,
+        [("delete", ("bookmark:detail:0",)), ("set", ("bookmark:version:0",))],
+    )
+    assert cluster.commands[-1] == ("publish", ("test:invalidate", deleted))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_redis(port: int) -> None:
+    client = Redis(port=port)
+    deadline = monotonic() + 5
+    while True:
+        try:
+            client.ping()
+            return
+        except RedisError:
+            if monotonic() > deadline:
+                raise
+            sleep(0.05)
+
+
+def _start_redis_servers(
+    directory: Path, count: int, *options: str
+) -> tuple[list[int], list[subprocess.Popen[bytes]]]:
+    ports = [_free_port() for _ in range(count)]
+    processes = []
+    for port in ports:
+        workdir = directory / str(port)
+        workdir.mkdir()
+        command = ["redis-server", "--port", str(port), "--save", "", "--dir", str(workdir)]
+        processes.append(subprocess.Popen([*command, *options], stdout=subprocess.DEVNULL))
+    for port in ports:
+        _wait_for_redis(port)
+    return ports, processes
+
+
+@pytest.fixture
+def redis_shard_ports(tmp_path: Path) -> Iterator[list[int]]:
+    """
+    ローカルに起動した 3 つの standalone redis-server のポート
+    """
+    if shutil.which("redis-server") is None:
+        pytest.skip("redis-server is not installed")
+    ports, processes = _start_redis_servers(tmp_path, 3)
+    yield ports
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+@pytest.fixture
+def redis_cluster_port(tmp_path: Path) -> Iterator[int]:
+    """
+    ローカルに起動した 3 ノードの Redis Cluster のいずれかのポート
+    """
+    if shutil.which("redis-server") is None or shutil.which("redis-cli") is None:
+        pytest.skip("redis-server or redis-cli is not installed")
+    ports, processes = _start_redis_servers(tmp_path, 3, "--cluster-enabled", "yes")
+    subprocess.run(
+        [
+            "redis-cli",
+            "--cluster",
+            "create",
+            *(f"127.0.0.1:{port}" for port in ports),
+            "--cluster-replicas",
+            "0",
+            "--cluster-yes",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = monotonic() + 10
+    while Redis(port=ports[0]).cluster("info").get("cluster_state") != "ok":
+        if monotonic() > deadline:
+            raise TimeoutError("Redis Cluster did not become ready")
+        sleep(0.1)
+    yield ports[0]
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+def test_sharded_region_against_local_redis_servers(redis_shard_ports: list[int]) -> None:
+    """
+    正常系:
+    複数の redis-server へキーを振り分けて保存・取得・無効化できる
+    """
+    urls = [f"redis://127.0.0.1:{port}/0" for port in redis_shard_ports]
+    region = create_redis_region(shard_urls=urls, distributed_lock=True)
+    keys = [f"bookmark:detail:{index}" for index in range(100)]
+
+    # 関数の実行
+    region.set_multi({key: key.upper() for key in keys})
+    assert region.get_multi(keys) == [key.upper() for key in keys]
+    assert region.get_or_create("bookmark:list:all", lambda: [1, 2]) == [1, 2]
+    region.apply_invalidation(set(keys[:50]), {"bookmark:version:list": "v2"})
+
+    # すべてのノードにキーが分散し、無効化がノードをまたいで反映されることを検証
+    assert all(Redis(port=port).dbsize() > 0 for port in redis_shard_ports)
+    values = region.get_multi(keys)
+    assert values[:50] == [NO_VALUE] * 50
+    assert values[50:] == [key.upper() for key in keys[50:]]
+    assert region.get("bookmark:version:list") == "v2"
+
+
+def test_cluster_region_against_local_redis_cluster(redis_cluster_port: int) -> None:
+    """
+    正常系:
+    Redis Cluster でもスロットをまたぐキーを保存・取得・無効化できる
+    """
+    region = create_redis_region(
+        url=f"redis://127.0.0.1:{redis_cluster_port}/0", cluster=True, distributed_lock=True
+    )
+    keys = [f"bookmark:detail:{index}" for index in range(100)]
+
+    # 関数の実行
+    region.set_multi({key: key.upper() for key in keys})
+    assert region.get_multi(keys) == [key.upper() for key in keys]
+    assert region.get_or_create("bookmark:list:all", lambda: [1, 2]) == [1, 2]
+    region.add_to_reverse_index(["bookmark:list-index:a", "bookmark:list-index:b"], keys[0])
+    region.apply_invalidation(
+        set(keys[1:50]), {"bookmark:version:list": "v2"}, {"bookmark:list-index:a"}
+    )
+
+    # 逆引きインデックス経由の削除も含め、スロットをまたいで無効化されることを検証
+    values = region.get_multi(keys)
+    assert values[:50] == [NO_VALUE] * 50
+    assert values[50:] == [key.upper() for key in keys[50:]]
+    assert region.get("bookmark:version:list") == "v2"
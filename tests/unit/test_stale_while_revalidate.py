@@ -0,0 +1,218 @@
+from collections.abc import Iterator
+from threading import Event
+from time import sleep
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from src.libs.cache import VersionedCacheKey, create_memory_region, query_cache
+from src.dao.models.base import BaseDao
+from src.libs.cache.invalidation import (
+    install_session_cache_invalidation_listeners,
+    new_cache_version,
+    schedule_cache_version_bumps,
+)
+from src.libs.cache.stale import background_refresher
+
+
+@pytest.fixture(autouse=True)
+def wait_background_refresh() -> Iterator[None]:
+    yield
+    # 後続テストへ再生成スレッドが残らないようにする。
+    assert background_refresher.wait(timeout=5)
+
+
+def test_expired_value_is_served_while_single_refresh_runs() -> None:
+    """
+    正常系:
+    有効期限切れの値を猶予内はすぐに返し、再生成はキーごとに 1 本だけ行う
+    """
+    region = create_memory_region(stale_grace_time=60)
+    started = Event()
+    release = Event()
+    calls = 0
+
+    @query_cache(
+        region=region, key_func="counter", expiration_time=0.05, stale_while_revalidate=True
+    )
+    def load_counter() -> int:
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            # 再生成中に届いた参照が待たされないことを見るため、再生成を止めておく。
+            started.set()
+            assert release.wait(timeout=5)
+        return calls
+
+    assert load_counter() == 1
+    sleep(0.1)
+
+    # 再生成が終わるまでは何度呼んでも古い値が返り、再生成は 1 回だけ起動する。
+    assert [load_counter() for _ in range(3)] == [1, 1, 1]
+    assert started.wait(timeout=5)
+    assert calls == 2
+
+    release.set()
+    assert background_refresher.wait(timeout=5)
+    assert load_counter() == 2
+
+
+def test_value_past_grace_time_is_recreated_synchronously() -> None:
+    """
+    正常系:
+    猶予を過ぎた値は返さず、呼び出し元で再生成する
+    """
+    region = create_memory_region(stale_grace_time=0.05)
+    calls = 0
+
+    @query_cache(
+        region=region, key_func="counter", expiration_time=0.05, stale_while_revalidate=True
+    )
+    def load_counter() -> int:
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert load_counter() == 1
+    sleep(0.15)
+
+    assert load_counter() == 2
+
+
+def test_previous_version_is_served_after_bump() -> None:
+    """
+    正常系:
+    version 更新直後は旧 version の値を返し、新しい値はバックグラウンドで作る
+    """
+    region = create_memory_region(stale_grace_time=60)
+    source = {"value": "before"}
+
+    @query_cache(
+        region=region,
+        key_func=lambda: VersionedCacheKey(("version",), lambda versions: f"list:{versions[0]}"),
+        stale_while_revalidate=True,
+    )
+    def load_list() -> str:
+        return source["value"]
+
+    assert load_list() == "before"
+
+    # 書き込み後の version 更新を再現する。
+    source["value"] = "after"
+    region.set("version", new_cache_version())
+
+    assert load_list() == "before"
+    assert background_refresher.wait(timeout=5)
+    assert load_list() == "after"
+
+
+def test_previous_version_is_not_served_without_stale_option() -> None:
+    """
+    正常系:
+    stale_while_revalidate を指定しない場合は version 更新後すぐに作り直す
+    """
+    region = create_memory_region(stale_grace_time=60)
+    source = {"value": "before"}
+
+    @query_cache(
+        region=region,
+        key_func=lambda: VersionedCacheKey(("version",), lambda versions: f"list:{versions[0]}"),
+    )
+    def load_list() -> str:
+        return source["value"]
+
+    assert load_list() == "before"
+    source["value"] = "after"
+    region.set("version", new_cache_version())
+
+    assert load_list() == "after"
+
+
+class ListRepository:
+    """
+    Session を保持し、version 付きキーで一覧を読むテスト用レポジトリ。
+    """
+
+    def __init__(self, session: Session, region, source: dict[str, str]) -> None:
+        self.session = session
+        self.region = region
+        self.source = source
+
+    def with_session(self, session: Session) -> "ListRepository":
+        return ListRepository(session, self.region, self.source)
+
+    @query_cache(
+        key_func=lambda self: VersionedCacheKey(
+            ("version",), lambda versions: f"list:{versions[0]}"
+        ),
+        stale_while_revalidate=True,
+    )
+    def load(self) -> str:
+        return self.source["value"]
+
+
+def test_own_version_bump_is_not_served_stale(sqlite_session_factory) -> None:
+    """
+    正常系:
+    自分の commit で version を進めたセッションには、旧 version の値を返さず作り直す
+    """
+    region = create_memory_region(stale_grace_time=60)
+    source = {"value": "before"}
+    install_session_cache_invalidation_listeners()
+
+    with sqlite_session_factory(BaseDao.metadata) as session:
+        repository = ListRepository(session, region, source)
+        assert repository.load() == "before"
+
+        # 関数の実行
+        source["value"] = "after"
+        with session.begin():
+            schedule_cache_version_bumps(session, region, "version")
+        value = repository.load()
+
+    # 書き込んだセッションは新しい値を読むことを検証
+    assert value == "after"
+
+
+class Repository:
+    """
+    Session を保持し、別 Session へ載せ替えられるテスト用レポジトリ。
+    """
+
+    def __init__(self, session: Session, region, sessions: list[Session]) -> None:
+        self.session = session
+        self.region = region
+        self.sessions = sessions
+
+    def with_session(self, session: Session) -> "Repository":
+        return Repository(session, self.region, self.sessions)
+
+    @query_cache(key_func="repository", expiration_time=0.05, stale_while_revalidate=True)
+    def load(self) -> int:
+        self.sessions.append(self.session)
+        return len(self.sessions)
+
+
+def test_background_refresh_uses_new_session() -> None:
+    """
+    正常系:
+    バックグラウンド再生成はリクエストの Session ではなく新しい Session で行う
+    """
+    # 別スレッドからも同じ in-memory DB を使えるよう接続を共有する。
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    sessions: list[Session] = []
+    with Session(engine) as session:
+        repository = Repository(session, create_memory_region(stale_grace_time=60), sessions)
+        assert repository.load() == 1
+        sleep(0.1)
+
+        assert repository.load() == 1
+        assert background_refresher.wait(timeout=5)
+        assert repository.load() == 2
+
+    assert sessions[0] is session
+    assert sessions[1] is not session
@@ -0,0 +1,418 @@
+import json
+from collections.abc import Iterable, Iterator
+from datetime import UTC, datetime
+
+import pytest
+from dogpile.cache.api import NO_VALUE
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from sqlalchemy.orm import Session
+
+from src.dao.models.base import BaseDao
+from src.entities.bookmark import BookmarkEntity
+from src.libs.cache import (
+    LocalCache,
+    LocalCacheInvalidator,
+    TwoTierCacheRegion,
+    create_memory_region,
+    create_redis_region,
+    invalidation as cache_invalidation,
+    query_cache,
+)
+
+
+@pytest.fixture
+def session(sqlite_session_factory) -> Iterator[Session]:
+    with sqlite_session_factory(BaseDao.metadata) as db_session:
+        yield db_session
+
+
+class RecordingInvalidator:
+    """
+    publish されたキーを記録するだけのテスト用 invalidator。
+    """
+
+    def __init__(self) -> None:
+        self.published: list[set[str]] = []
+
+    def publish(self, keys: Iterable[str]) -> None:
+        self.published.append(set(keys))
+
+
+def _two_tier_region(max_entries: int = 16) -> TwoTierCacheRegion:
+    region = create_memory_region(local_max_entries=max_entries)
+    assert isinstance(region, TwoTierCacheRegion)
+    return region
+
+
+def test_local_cache_evicts_least_recently_used_entry() -> None:
+    """
+    正常系:
+    L1 は件数上限を超えると最も古く使われたエントリから追い出す
+    """
+    local_cache = LocalCache(max_entries=2, expiration_time=30)
+    local_cache.set("a", 1)
+    local_cache.set("b", 2)
+
+    # a を参照して最近使われた扱いにしてから c を追加する。
+    assert local_cache.get("a") == 1
+    local_cache.set("c", 3)
+
+    assert local_cache.get("a") == 1
+    assert local_cache.get("b") is NO_VALUE
+    assert local_cache.get("c") == 3
+    assert len(local_cache) == 2
+
+
+def test_local_cache_expires_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    正常系:
+    L1 のエントリは保持秒数を過ぎると破棄される
+    """
+    now = 100.0
+    monkeypatch.setattr("src.libs.cache.local.monotonic", lambda: now)
+    local_cache = LocalCache(max_entries=2, expiration_time=5)
+    local_cache.set("a", 1)
+
+    now = 106.0
+
+    assert local_cache.get("a") is NO_VALUE
+
+
+def test_two_tier_region_serves_hits_from_local_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    正常系:
+    L1 に載った値は backend を参照せずに返す
+    """
+    region = _two_tier_region()
+    calls = 0
+    original = region.backend.get_serialized
+
+    def wrapped(key: str) -> object:
+        nonlocal calls
+        calls += 1
+        return original(key)
+
+    monkeypatch.setattr(region.backend, "get_serialized", wrapped)
+
+    @query_cache(region=region, key_func="value:{value}")
+    def double(value: int) -> list[int]:
+        return [value, value]
+
+    # 1 回目は L1/L2 とも MISS、2 回目以降は L1 の復元済みオブジェクトの複製を返す。
+    first = double(3)
+    calls_after_miss = calls
+    second = double(3)
+    third = double(3)
+
+    assert first == second == third == [3, 3]
+    assert second is not third
+    assert calls == calls_after_miss
+
+
+def test_local_cache_copies_values_on_set_and_get() -> None:
+    """
+    正常系:
+    L1 から取得した値や保存元の値を書き換えても、保持している値は変わらない
+    """
+    entity = BookmarkEntity(
+        hashed_id="0" * 64,
+        url="https://example.com/",
+        memo="memo",
+        created_at=datetime(2024, 1, 1, tzinfo=UTC),
+        tags=["python"],
+    )
+    local_cache = LocalCache(max_entries=2, expiration_time=30)
+
+    # 関数の実行
+    local_cache.set("key", [entity])
+    entity.memo = "changed before get"
+    fetched = local_cache.get("key")
+    fetched[0].memo = "changed after get"
+    fetched[0].tags.append("cache")
+    fetched.append(entity)
+
+    # 保持している値を検証
+    cached = local_cache.get("key")
+    assert len(cached) == 1
+    assert cached[0].memo == "memo"
+    assert cached[0].tags == ["python"]
+    assert cached[0].created_at is fetched[0].created_at
+
+
+def test_two_tier_region_delete_evicts_local_cache() -> None:
+    """
+    正常系:
+    delete は L2 だけでなく L1 からもキーを取り除く
+    """
+    region = _two_tier_region()
+    region.set("key", {"value": 1})
+    assert region.get("key") == {"value": 1}
+
+    region.delete("key")
+
+    assert region.local_cache.get("key") is NO_VALUE
+    assert region.get("key") is NO_VALUE
+
+
+def test_two_tier_region_get_multi_fetches_only_local_misses(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    get_multi は L1 に無いキーだけを backend から取得する
+    """
+    region = _two_tier_region()
+    region.set("a", 1)
+    region.backend.set_serialized("b", region._serialized_payload(2))
+    requested: list[list[str]] = []
+    original = region.backend.get_serialized_multi
+
+    def wrapped(keys: Iterable[str]) -> object:
+        key_list = list(keys)
+        requested.append(key_list)
+        return original(key_list)
+
+    monkeypatch.setattr(region.backend, "get_serialized_multi", wrapped)
+
+    assert region.get_multi(["a", "b", "c"]) == [1, 2, NO_VALUE]
+    assert requested == [["b", "c"]]
+
+
+def test_after_commit_publishes_deleted_and_bumped_keys(session: Session) -> None:
+    """
+    正常系:
+    commit 後の無効化では削除キーと version キーを他プロセスへ通知する
+    """
+    region = _two_tier_region()
+    invalidator = RecordingInvalidator()
+    region.invalidator = invalidator  # type: ignore[assignment]
+    region.set("user:detail:alice", {"name": "alice"})
+
+    with session.begin():
+        cache_invalidation.schedule_cache_key_deletes(session, region, "user:detail:alice")
+        cache_invalidation.schedule_cache_version_bumps(session, region, "user:version:list")
+
+    assert invalidator.published == [{"user:detail:alice", "user:version:list"}]
+    assert region.local_cache.get("user:detail:alice") is NO_VALUE
+
+
+def test_after_commit_publishes_mangled_keys(session: Session) -> None:
+    """
+    正常系:
+    key_mangler 設定時は、他プロセスの L1 と同じ変換後のキーで無効化を通知する
+    """
+    region = _two_tier_region()
+    region.key_mangler = lambda key: f"mangled:{key}"
+    invalidator = RecordingInvalidator()
+    region.invalidator = invalidator  # type: ignore[assignment]
+    region.set("user:detail:alice", {"name": "alice"})
+    other_process_cache = LocalCache(max_entries=4, expiration_time=30)
+    other_process_cache.set("mangled:user:detail:alice", {"name": "alice"})
+    other_process_cache.set("mangled:user:version:list", "old")
+    receiver = LocalCacheInvalidator(
+        client=None,  # type: ignore[arg-type]
+        channel="test",
+        local_cache=other_process_cache,
+    )
+
+    # 関数の実行
+    with session.begin():
+        cache_invalidation.schedule_cache_key_deletes(session, region, "user:detail:alice")
+        cache_invalidation.schedule_cache_version_bumps(session, region, "user:version:list")
+
+    # 通知内容を検証
+    assert invalidator.published == [{"mangled:user:detail:alice", "mangled:user:version:list"}]
+    assert region.local_cache.get("mangled:user:detail:alice") is NO_VALUE
+
+    # 他プロセスの L1 への反映を検証
+    for keys in invalidator.published:
+        payload = {"origin": "other", "keys": sorted(keys)}
+        receiver._handle_message({"data": json.dumps(payload)})
+    assert other_process_cache.get("mangled:user:detail:alice") is NO_VALUE
+    assert other_process_cache.get("mangled:user:version:list") is NO_VALUE
+
+
+def test_invalidator_applies_messages_from_other_processes() -> None:
+    """
+    正常系:
+    他プロセスからの通知だけを L1 に反映する
+    """
+    local_cache = LocalCache(max_entries=4, expiration_time=30)
+    local_cache.set("a", 1)
+    local_cache.set("b", 2)
+    invalidator = LocalCacheInvalidator(
+        client=None,  # type: ignore[arg-type]
+        channel="test",
+        local_cache=local_cache,
+    )
+
+    own_message = json.loads(invalidator._encode(["a"]))
+    invalidator._handle_message({"data": json.dumps(own_message)})
+    invalidator._handle_message({"data": json.dumps({"origin": "other", "keys": ["b"]})})
+
+    assert local_cache.get("a") == 1
+    assert local_cache.get("b") is NO_VALUE
+
+
+class RecordingPipeline:
+    """
+    送信されたコマンドを記録するテスト用 Redis pipeline。
+    """
+
+    def __init__(
+        self,
+        executed: list[list[tuple[str, tuple[object, ...]]]],
+        results: list[object] | None = None,
+    ) -> None:
+        self.commands: list[tuple[str, tuple[object, ...]]] = []
+        self._executed = executed
+        self._results = results
+
+    def delete(self, *keys: str) -> None:
+        self.commands.append(("delete", keys))
+
+    def set(self, key: str, value: bytes, ex: int | None = None) -> None:
+        self.commands.append(("set", (key,)))
+
+    def publish(self, channel: str, message: str) -> None:
+        self.commands.append(("publish", (channel, json.loads(message)["keys"])))
+
+    def smembers(self, key: str) -> None:
+        self.commands.append(("smembers", (key,)))
+
+    def execute(self) -> list[object] | None:
+        self._executed.append(self.commands)
+        return self._results
+
+
+def test_after_commit_applies_region_invalidation_in_one_batch(
+    session: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    正常系:
+    commit 後の削除と version 更新はリージョン単位でまとめて反映し、所要時間を記録する
+    """
+    region = create_memory_region()
+    region.set("user:detail:alice", {"name": "alice"})
+    region.set("user:detail:bob", {"name": "bob"})
+    calls: list[str] = []
+
+    def fail_delete(key: str) -> None:
+        raise AssertionError(f"delete should be batched: {key}")
+
+    original_delete_multi = region.backend.delete_multi
+    original_set_multi = region.backend.set_serialized_multi
+
+    def wrapped_delete_multi(keys: list[str]) -> None:
+        calls.append("delete_multi")
+        original_delete_multi(keys)
+
+    def wrapped_set_multi(mapping: dict[str, bytes]) -> None:
+        calls.append("set_multi")
+        original_set_multi(mapping)
+
+    monkeypatch.setattr(region.backend, "delete", fail_delete)
+    monkeypatch.setattr(region.backend, "delete_multi", wrapped_delete_multi)
+    monkeypatch.setattr(region.backend, "set_serialized_multi", wrapped_set_multi)
+    stats = cache_invalidation.get_invalidation_stats()
+    commits = stats.commits
+
+    with session.begin():
+        cache_invalidation.schedule_cache_key_deletes(
+            session, region, "user:detail:alice", "user:detail:bob"
+        )
+        cache_invalidation.schedule_cache_version_bumps(
+            session, region, "user:version:list", "user:version:tag-list"
+        )
+
+    assert calls == ["delete_multi", "set_multi"]
+    assert region.get("user:detail:alice") is NO_VALUE
+    assert region.get("user:version:list") is not NO_VALUE
+    assert stats.commits == commits + 1
+
+
+def test_redis_invalidation_sends_deletes_bumps_and_publish_in_one_pipeline(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    Redis リージョンでは削除・version 更新・L1 無効化通知を 1 回の pipeline で送る
+    """
+    region = create_redis_region(
+        host="127.0.0.1",
+        port=1,
+        connection_kwargs={
+            "retry": Retry(NoBackoff(), 0),
+            "socket_connect_timeout": 0.01,
+            "socket_timeout": 0.01,
+        },
+        local_max_entries=16,
+        invalidation_channel="test:invalidate",
+    )
+    assert isinstance(region, TwoTierCacheRegion)
+    executed: list[list[tuple[str, tuple[object, ...]]]] = []
+    monkeypatch.setattr(
+        region.backend.writer_client,
+        "pipeline",
+        lambda *args, **kwargs: RecordingPipeline(executed),
+    )
+    region.local_cache.set("user:detail:alice", "cached")
+
+    region.apply_invalidation({"user:detail:alice"}, {"user:version:list": "v2"})
+
+    assert executed == [
+        [
+            ("delete", ("user:detail:alice",)),
+            ("set", ("user:version:list",)),
+            ("publish", ("test:invalidate", ["user:detail:alice", "user:version:list"])),
+        ]
+    ]
+    assert region.local_cache.get("user:detail:alice") is NO_VALUE
+
+
+def test_redis_invalidation_deletes_keys_registered_in_reverse_index(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    正常系:
+    逆引きインデックスを取り出して削除し、登録されていたキーも無効化する
+    """
+    region = create_redis_region(
+        host="127.0.0.1",
+        port=1,
+        connection_kwargs={
+            "retry": Retry(NoBackoff(), 0),
+            "socket_connect_timeout": 0.01,
+            "socket_timeout": 0.01,
+        },
+        local_max_entries=16,
+        invalidation_channel="test:invalidate",
+    )
+    assert isinstance(region, TwoTierCacheRegion)
+    executed: list[list[tuple[str, tuple[object, ...]]]] = []
+    # 1 本目はインデックスの取り出し、2 本目は無効化の pipeline。
+    pipelines = iter(
+        [
+            RecordingPipeline(executed, results=[{b"bookmark:list:all:v:1:1:10"}, 1]),
+            RecordingPipeline(executed),
+        ]
+    )
+    monkeypatch.setattr(
+        region.backend.writer_client, "pipeline", lambda *args, **kwargs: next(pipelines)
+    )
+    region.local_cache.set("bookmark:list:all:v:1:1:10", "cached")
+
+    region.apply_invalidation(set(), {}, {"bookmark:list-index:a"})
+
+    assert executed == [
+        [
+            ("smembers", ("bookmark:list-index:a",)),
+            ("delete", ("bookmark:list-index:a",)),
+        ],
+        [
+            ("delete", ("bookmark:list:all:v:1:1:10",)),
+            ("publish", ("test:invalidate", ["bookmark:list:all:v:1:1:10"])),
+        ],
+    ]
+    assert region.local_cache.get("bookmark:list:all:v:1:1:10") is NO_VALUE
@@ -0,0 +1,143 @@
+import pickle  # nosec B403
+
+import pytest
+import zstandard as zstd
+from dogpile.cache.api import NO_VALUE
+
+from src.libs.cache import create_memory_region
+from src.libs.cache.dictionaries import (
+    DEFAULT_DICTIONARY_NAMESPACES,
+    ZstdDictionaryCodec,
+    train_dictionary,
+)
+
+
+class InMemoryDictionarySource:
+    """
+    Redis の代わりに辞書を保持するテスト用の取得元。
+    """
+
+    def __init__(self) -> None:
+        self.current: dict[str, int] = {}
+        self.dictionaries: dict[int, bytes] = {}
+        self.loaded: list[int] = []
+
+    def publish(self, namespace: str, dictionary: zstd.ZstdCompressionDict) -> None:
+        self.dictionaries[dictionary.dict_id()] = dictionary.as_bytes()
+        self.current[namespace] = dictionary.dict_id()
+
+    def load_current(self) -> dict[str, int]:
+        return dict(self.current)
+
+    def load(self, dict_id: int) -> bytes | None:
+        self.loaded.append(dict_id)
+        return self.dictionaries.get(dict_id)
+
+
+def _bookmark_payload(index: int) -> bytes:
+    return pickle.dumps(
+        {
+            "id": index,
+            "url": f"https://example.com/articles/{index}",
+            "title": f"Example article {index}",
+            "memo": "",
+            "tags": ["python", "cache"],
+        }
+    )
+
+
+@pytest.fixture(scope="module")
+def bookmark_dictionary() -> zstd.ZstdCompressionDict:
+    samples = [_bookmark_payload(index) for index in range(1000)]
+    return train_dictionary(samples, dict_id=40000, dict_size=4096, level=3)
+
+
+def test_memory_region_compresses_with_namespace_dictionary(
+    bookmark_dictionary: zstd.ZstdCompressionDict,
+) -> None:
+    """
+    正常系:
+    キーの prefix に対応する辞書で圧縮し、辞書なしより小さく保存する
+    """
+    region = create_memory_region(
+        zstd_dictionary_namespaces=DEFAULT_DICTIONARY_NAMESPACES,
+        zstd_dictionaries={"bookmark-detail": bookmark_dictionary.as_bytes()},
+    )
+    payload = {
+        "id": 5000,
+        "url": "https://example.com/articles/5000",
+        "title": "Example article 5000",
+        "memo": "",
+        "tags": ["python", "cache"],
+    }
+
+    region.set("bookmark:detail:5000", payload)
+    region.set("other:5000", payload)
+
+    # 辞書対象の namespace だけフレームに辞書 ID が記録される。
+    stored = region.backend._cache["bookmark:detail:5000"]
+    plain = region.backend._cache["other:5000"]
+    assert zstd.get_frame_parameters(stored).dict_id == 40000
+    assert zstd.get_frame_parameters(plain).dict_id == 0
+    assert len(stored) < len(plain)
+    assert region.get("bookmark:detail:5000") == payload
+
+
+def test_codec_reads_values_written_with_previous_dictionary(
+    bookmark_dictionary: zstd.ZstdCompressionDict,
+) -> None:
+    """
+    正常系:
+    現行辞書の切り替え後も、旧辞書 ID で圧縮された値を展開できる
+    """
+    source = InMemoryDictionarySource()
+    source.publish("bookmark-detail", bookmark_dictionary)
+    writer = ZstdDictionaryCodec(3, DEFAULT_DICTIONARY_NAMESPACES, source)
+    writer.refresh()
+    old_value = writer.compress("bookmark:detail:1", _bookmark_payload(1))
+
+    # 新しい辞書へ切り替える。
+    samples = [_bookmark_payload(index) for index in range(1000, 2000)]
+    source.publish(
+        "bookmark-detail", train_dictionary(samples, dict_id=40001, dict_size=4096, level=3)
+    )
+    writer.refresh()
+    new_value = writer.compress("bookmark:detail:1", _bookmark_payload(1))
+
+    # 別プロセス相当のコーデックは未知の辞書 ID を取得元から読み込んで展開する。
+    reader = ZstdDictionaryCodec(3, DEFAULT_DICTIONARY_NAMESPACES, source)
+    assert zstd.get_frame_parameters(new_value).dict_id == 40001
+    assert writer.decompress(old_value) == _bookmark_payload(1)
+    assert reader.decompress(old_value) == _bookmark_payload(1)
+    assert reader.decompress(new_value) == _bookmark_payload(1)
+    assert source.loaded[-2:] == [40000, 40001]
+
+
+def test_value_with_unknown_dictionary_is_cache_miss(
+    bookmark_dictionary: zstd.ZstdCompressionDict,
+) -> None:
+    """
+    異常系:
+    辞書が見つからない値はキャッシュミスとして扱う
+    """
+    writer = create_memory_region(
+        zstd_dictionary_namespaces=DEFAULT_DICTIONARY_NAMESPACES,
+        zstd_dictionaries={"bookmark-detail": bookmark_dictionary.as_bytes()},
+    )
+    writer.set("bookmark:detail:1", {"id": 1})
+    reader = create_memory_region(zstd_dictionary_namespaces=DEFAULT_DICTIONARY_NAMESPACES)
+    reader.backend._cache["bookmark:detail:1"] = writer.backend._cache["bookmark:detail:1"]
+
+    assert reader.get("bookmark:detail:1") is NO_VALUE
+
+
+def test_codec_matches_longest_prefix() -> None:
+    """
+    正常系:
+    namespace は最も長く一致する prefix で決まる
+    """
+    codec = ZstdDictionaryCodec(3, {"bookmark:": "bookmark", "bookmark:list:": "bookmark-list"})
+
+    assert codec.namespace_of("bookmark:list:all:v:1:1") == "bookmark-list"
+    assert codec.namespace_of("bookmark:detail:1") == "bookmark"
+    assert codec.namespace_of("user:detail:alice") is None